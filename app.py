@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import sqlite3
 import os
@@ -7,6 +8,24 @@ import hashlib
 import json
 from streamlit_option_menu import option_menu
 import random
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from db_pool import get_pool
+from write_queue import get_write_queue
+from space_index import find_space_ids
+from routing import get_routing_table
+from waitlist import get_waitlist
+from scheduler import SCHEDULER_ENABLED, get_scheduler
+from migrations import migrate
+from allocation import AllocationRequest, SpaceFeatures, score_spaces
+from billing import PricingEngine
+from cache import cached_query, bump_generation
+from components.space_grid import grid_cell, space_grid
+from components.query_report import query_report
+
+logger = logging.getLogger(__name__)
 
 # Page configuration
 # Set page title and configuration
@@ -221,235 +240,223 @@ css = """
 st.markdown(css, unsafe_allow_html=True)
 
 # Database setup
+DB_FILE = 'parking.db'
+
+def get_db_connection():
+    """Borrow a pooled connection to the parking database as a context manager"""
+    return get_pool(DB_FILE).connection()
+
+# Spot rows as the pages expect them: legacy status names derived from the
+# unified parking_spaces columns
+SPOT_COLUMNS = """
+    p.id, p.space_number AS spot_number, p.section, CAST(p.floor AS INTEGER) AS floor, p.hourly_rate,
+    CASE WHEN p.status = 'maintenance' THEN 'maintenance'
+         WHEN p.is_available = 0 THEN 'booked'
+         ELSE 'available'
+    END AS status
+"""
+
+# Spot status shown in the app -> occupancy state in the space index
+SPOT_STATUS_STATES = {"Available": "available", "Booked": "occupied", "Maintenance": "maintenance"}
+
+# Off-peak rate of seeded spaces; time-of-day tariffs scale it per section
+HOURLY_RATE = 2.0
+
+# Stays pay their space's rate through the section tariff, prorated by the minute
+PRICING = PricingEngine({"car": HOURLY_RATE}, billing_increment=60, duration_discounts=())
+
+@st.cache_resource
 def init_db():
-    conn = None
-    try:
-        conn = sqlite3.connect('parking.db', check_same_thread=False)
+    """
+    Migrate the database to the current schema and seed sample data (once per process).
+
+    Errors propagate so that st.cache_resource keeps nothing and the next
+    rerun tries again.
+    """
+    migrate(DB_FILE)
+    with get_db_connection() as conn:
         c = conn.cursor()
         
-        # Create users table
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            password TEXT,
-            email TEXT,
-            is_admin INTEGER DEFAULT 0
-        )
-        ''')
-        
-        # Create parking_spots table
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS parking_spots (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            spot_number TEXT,
-            status TEXT,
-            section TEXT,
-            floor INTEGER
-        )
-        ''')
-        
-        # Create bookings table
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            spot_id INTEGER,
-            start_time TEXT,
-            end_time TEXT,
-            status TEXT,
-            payment_status TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (spot_id) REFERENCES parking_spots (id)
-        )
-        ''')
-        
         # Check if we need to create sample data
         c.execute("SELECT COUNT(*) FROM users")
         if c.fetchone()[0] == 0:
             # Create admin user
             hashed_password = hashlib.sha256("admin123".encode()).hexdigest()
-            c.execute("INSERT INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
-                     ("admin", hashed_password, "admin@example.com", 1))
+            c.execute("INSERT INTO users (username, password, email, full_name, is_admin) VALUES (?, ?, ?, ?, ?)",
+                     ("admin", hashed_password, "admin@example.com", "admin", 1))
             
             # Create regular user
             hashed_password = hashlib.sha256("password123".encode()).hexdigest()
-            c.execute("INSERT INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
-                     ("john_doe", hashed_password, "john@example.com", 0))
+            c.execute("INSERT INTO users (username, password, email, full_name, is_admin) VALUES (?, ?, ?, ?, ?)",
+                     ("john_doe", hashed_password, "john@example.com", "john_doe", 0))
             
-            # Create parking spots
-            sections = ['A', 'B', 'C']
-            floors = [1, 2, 3]
-            for section in sections:
-                for floor in floors:
+            # Create parking spots in one executemany
+            spots = []
+            for section in ['A', 'B', 'C']:
+                for floor in [1, 2, 3]:
                     for i in range(1, 6):
-                        spot_number = f"{section}{floor}-{i}"
                         status = random.choice(['available', 'booked', 'maintenance'])
-                        c.execute("INSERT INTO parking_spots (spot_number, status, section, floor) VALUES (?, ?, ?, ?)",
-                                 (spot_number, status, section, floor))
+                        spots.append((f"{section}{floor}-{i}", f"Section {section}, Floor {floor}", str(floor),
+                                      section, HOURLY_RATE, status == 'available',
+                                      'maintenance' if status == 'maintenance' else 'active'))
+            c.executemany("""
+            INSERT INTO parking_spaces (space_number, location, floor, section, hourly_rate, is_available, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, spots)
         
         conn.commit()
-        return True
-        
-    except sqlite3.Error as e:
-        st.error(f"Database initialization error: {e}")
-        if conn:
-            conn.rollback()
-        return False
-        
-    finally:
-        if conn:
-            conn.close()
-init_db()
+    return True
+try:
+    init_db()
+except sqlite3.Error as e:
+    st.error(f"Database initialization error: {e}")
+    st.stop()
+# Completes finished bookings and releases no-shows in the background
+if SCHEDULER_ENABLED:
+    get_scheduler(DB_FILE).start()
 
 # Helper functions for database operations
-def get_db_connection():
-    conn = None
-    try:
-        conn = sqlite3.connect('parking.db', check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        st.error(f"Database connection error: {e}")
-        if conn:
-            conn.close()
-        return None
-
 def validate_login(username, password):
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return None
-        
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        user = conn.execute("SELECT * FROM users WHERE username = ? AND password = ?", 
-                           (username, hashed_password)).fetchone()
-        return user
+        with get_db_connection() as conn:
+            hashed_password = hashlib.sha256(password.encode()).hexdigest()
+            user = conn.execute("SELECT * FROM users WHERE username = ? AND password = ?", 
+                               (username, hashed_password)).fetchone()
+            return user
     except Exception as e:
         st.error(f"Login validation error: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def register_user(username, password, email):
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        conn.execute("INSERT INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
-                    (username, hashed_password, email, 0))
-        conn.commit()
-        return True
+        with get_db_connection() as conn:
+            hashed_password = hashlib.sha256(password.encode()).hexdigest()
+            conn.execute("INSERT INTO users (username, password, email, full_name, is_admin) VALUES (?, ?, ?, ?, ?)",
+                        (username, hashed_password, email, username, 0))
+            conn.commit()
+            return True
     except sqlite3.IntegrityError:
         return False
     except Exception as e:
         st.error(f"Registration error: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
+@cached_query
 def get_available_spots():
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return []
-        
-        spots = conn.execute("SELECT * FROM parking_spots WHERE status = 'available'").fetchall()
-        return spots
+        with get_db_connection() as conn:
+            spots = conn.execute(f"""
+            SELECT {SPOT_COLUMNS} FROM parking_spaces p
+            WHERE p.status = 'active' AND p.is_available = 1
+            """).fetchall()
+            return spots
     except Exception as e:
         st.error(f"Error fetching available spots: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
+def get_busy_spot_ids(start_str, end_str):
+    """IDs of spots with an active booking overlapping [start, end)"""
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute("""
+            SELECT DISTINCT space_id FROM bookings
+            WHERE status = 'active' AND start_time < ? AND end_time > ?
+            """, (end_str, start_str)).fetchall()
+            return {row['space_id'] for row in rows}
+    except Exception as e:
+        st.error(f"Error fetching booked spots: {e}")
+        return set()
+
+@cached_query
 def get_all_spots():
-    conn = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return []
-        
-        spots = conn.execute("SELECT * FROM parking_spots").fetchall()
-        return spots
+        with get_db_connection() as conn:
+            spots = conn.execute(f"SELECT {SPOT_COLUMNS} FROM parking_spaces p").fetchall()
+            return spots
     except Exception as e:
         st.error(f"Error fetching all spots: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
-def get_user_bookings(user_id):
-    conn = None
+@cached_query
+def get_spots_by_id():
+    """All spots keyed by id, rebuilt once per write rather than per rerun"""
+    return {spot["id"]: dict(spot) for spot in get_all_spots.uncached()}
+
+@cached_query
+def get_occupancy_summary():
+    """Spot counts by state, read from the trigger-maintained space_counters table"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return []
-        
-        bookings = conn.execute("""
-        SELECT b.id, b.start_time, b.end_time, b.status, b.payment_status, p.spot_number, p.section, p.floor, b.spot_id
+        with get_db_connection() as conn:
+            rows = conn.execute("""
+            SELECT status, SUM(count) AS count FROM space_counters GROUP BY status
+            """).fetchall()
+            counts = {row['status']: row['count'] for row in rows}
+            counts['total'] = sum(counts.values())
+            return counts
+    except Exception as e:
+        st.error(f"Error fetching occupancy summary: {e}")
+        return {}
+
+BOOKINGS_PER_PAGE = 20
+
+@cached_query
+def get_user_bookings(user_id, limit=None, after=None):
+    """A user's bookings, newest first; `after` is the (start_time, id) of the previous page's last row"""
+    try:
+        query = """
+        SELECT b.id, b.start_time, b.end_time, b.status, b.checked_in_at,
+               CASE WHEN EXISTS (SELECT 1 FROM payments pm WHERE pm.booking_id = b.id AND pm.status = 'completed')
+                    THEN 'paid' ELSE 'pending'
+               END AS payment_status,
+               p.space_number AS spot_number, p.section, CAST(p.floor AS INTEGER) AS floor, b.space_id AS spot_id,
+               p.hourly_rate
         FROM bookings b
-        JOIN parking_spots p ON b.spot_id = p.id
+        JOIN parking_spaces p ON b.space_id = p.id
         WHERE b.user_id = ?
-        ORDER BY b.start_time DESC
-        """, (user_id,)).fetchall()
-        return bookings
+        """
+        params = [user_id]
+        if after is not None:
+            query += " AND (b.start_time, b.id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY b.start_time DESC, b.id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with get_db_connection() as conn:
+            bookings = conn.execute(query, params).fetchall()
+            return bookings
     except Exception as e:
         st.error(f"Error fetching user bookings: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
+
+def _write(fn):
+    """Run a write function on the serialized writer and wait for its commit"""
+    return get_write_queue(DB_FILE).write(fn)
 
 def book_spot(user_id, spot_id, start_time, end_time):
-    conn = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-            
-        # Start a transaction
-        conn.execute("BEGIN TRANSACTION")
-            
+    def write(conn):
         conn.execute("""
-        INSERT INTO bookings (user_id, spot_id, start_time, end_time, status, payment_status)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, spot_id, start_time, end_time, 'confirmed', 'pending'))
+        INSERT INTO bookings (user_id, space_id, start_time, end_time, vehicle_plate, vehicle_type, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, spot_id, start_time, end_time, 'UNKNOWN', 'car', 'active'))
         
         conn.execute("""
-        UPDATE parking_spots
-        SET status = 'booked'
+        UPDATE parking_spaces
+        SET is_available = 0
         WHERE id = ?
         """, (spot_id,))
-        
-        conn.commit()
+    
+    try:
+        _write(write)
+        bump_generation()
         return True
     except Exception as e:
         st.error(f"Error booking spot: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def cancel_booking(booking_id, spot_id):
-    conn = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-        
-        # Start a transaction to ensure both updates happen or none
-        conn.execute("BEGIN TRANSACTION")
-            
+    def write(conn):
+        # Both updates commit together or not at all
         conn.execute("""
         UPDATE bookings
         SET status = 'cancelled'
@@ -457,21 +464,57 @@ def cancel_booking(booking_id, spot_id):
         """, (booking_id,))
         
         conn.execute("""
-        UPDATE parking_spots
-        SET status = 'available'
+        UPDATE parking_spaces
+        SET is_available = 1
         WHERE id = ?
         """, (spot_id,))
-        
-        conn.commit()
-        return True
+    
+    try:
+        _write(write)
+        bump_generation()
     except Exception as e:
         st.error(f"Error cancelling booking: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
+    
+    # The cancellation has committed; a waitlist failure must not report it as failed
+    try:
+        # Hand the freed time to the first waiting driver it fits
+        if get_waitlist(DB_FILE).release(booking_id):
+            bump_generation()
+    except Exception:
+        logger.exception("Waitlist release of cancelled booking %s failed", booking_id)
+    return True
+
+def check_in(booking_id):
+    """Record arrival so the scheduler does not release the booking as a no-show"""
+    def write(conn):
+        conn.execute("""
+        UPDATE bookings SET checked_in_at = ?
+        WHERE id = ? AND status = 'active' AND checked_in_at IS NULL
+        """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), booking_id))
+    
+    _write(write)
+    bump_generation()
+
+def pay_booking(booking_id, payment_method='card'):
+    """Record a completed payment for a booking, priced by its section's tariff"""
+    def write(conn):
+        booking = conn.execute("""
+        SELECT b.start_time, b.end_time, p.section, p.hourly_rate
+        FROM bookings b JOIN parking_spaces p ON b.space_id = p.id WHERE b.id = ?
+        """, (booking_id,)).fetchone()
+        if booking is None:
+            return
+        start_time, end_time, section, hourly_rate = booking
+        amount = PRICING.quote(section, datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S'),
+                               datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S'), hourly_rate)
+        conn.execute("""
+        INSERT INTO payments (booking_id, amount, payment_method, status, payment_date)
+        VALUES (?, ?, ?, 'completed', CURRENT_TIMESTAMP)
+        """, (booking_id, round(amount, 2), payment_method))
+    
+    _write(write)
+    bump_generation()
 
 # Authentication pages
 def login_page():
@@ -572,20 +615,21 @@ def home_page():
         """, unsafe_allow_html=True)
         
     with col2:
-        st.markdown("""
+        counts = get_occupancy_summary()
+        st.markdown(f"""
         <div class="form-container">
             <h3 style="color: #1E3A8A; margin-bottom: 15px;">Current Stats</h3>
             <div style="background-color: #f0f9ff; border-left: 3px solid #0ea5e9; padding: 10px; margin-bottom: 10px; border-radius: 5px;">
                 <p style="margin: 0; color: #0c4a6e !important; font-weight: 600;">Available Spots</p>
-                <p style="margin: 0; font-size: 24px; color: #0c4a6e !important; font-weight: 700;">28</p>
+                <p style="margin: 0; font-size: 24px; color: #0c4a6e !important; font-weight: 700;">{counts.get('available', 0)}</p>
             </div>
             <div style="background-color: #fef2f2; border-left: 3px solid #ef4444; padding: 10px; margin-bottom: 10px; border-radius: 5px;">
                 <p style="margin: 0; color: #7f1d1d !important; font-weight: 600;">Occupied Spots</p>
-                <p style="margin: 0; font-size: 24px; color: #7f1d1d !important; font-weight: 700;">12</p>
+                <p style="margin: 0; font-size: 24px; color: #7f1d1d !important; font-weight: 700;">{counts.get('occupied', 0)}</p>
             </div>
             <div style="background-color: #fffbeb; border-left: 3px solid #f59e0b; padding: 10px; margin-bottom: 10px; border-radius: 5px;">
                 <p style="margin: 0; color: #78350f !important; font-weight: 600;">Under Maintenance</p>
-                <p style="margin: 0; font-size: 24px; color: #78350f !important; font-weight: 700;">5</p>
+                <p style="margin: 0; font-size: 24px; color: #78350f !important; font-weight: 700;">{counts.get('maintenance', 0)}</p>
             </div>
         </div>
         """, unsafe_allow_html=True)
@@ -614,47 +658,23 @@ def availability_page():
         st.markdown('<div class="important-info">No parking spots found.</div>', unsafe_allow_html=True)
         return
     
-    # Apply filters
-    filtered_spots = []
-    for spot in spots:
-        # Apply section filter
-        if section != "All" and spot["section"] != section:
-            continue
-            
-        # Apply floor filter
-        if floor != "All" and spot["floor"] != int(floor):
-            continue
-            
-        # Apply status filter
-        if status != "All" and spot["status"].lower() != status.lower():
-            continue
-            
-        filtered_spots.append(spot)
-    
-    # Display spots in a grid
-    st.markdown('<div style="margin-top: 20px;">', unsafe_allow_html=True)
-    
-    # Create rows with 5 spots each
-    for i in range(0, len(filtered_spots), 5):
-        row_spots = filtered_spots[i:i+5]
-        cols = st.columns(5)
-        
-        for j, spot in enumerate(row_spots):
-            with cols[j]:
-                status_class = spot["status"].lower()
-                spot_number = spot["spot_number"]
-                section = spot["section"]
-                floor = spot["floor"]
-                
-                st.markdown(f"""
-                <div class="{status_class}">
-                    <div style="font-size: 18px; margin-bottom: 5px;">{spot_number}</div>
-                    <div>Section {section}, Floor {floor}</div>
-                    <div style="font-size: 14px; margin-top: 5px; text-transform: uppercase;">{status_class}</div>
-                </div>
-                """, unsafe_allow_html=True)
+    # Resolve the filters on the space index instead of scanning every spot
+    criteria = {
+        "section": None if section == "All" else section,
+        "floor": None if floor == "All" else floor,
+        "state": None if status == "All" else SPOT_STATUS_STATES[status],
+    }
+    matching = find_space_ids(DB_FILE, **criteria)
+    spots_by_id = get_spots_by_id()
+    filtered_spots = [spots_by_id[i] for i in matching.tolist() if i in spots_by_id]
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    # Display spots as one virtualized grid
+    cells = [
+        grid_cell(spot["id"], spot["spot_number"], spot["status"],
+                  f"Section {spot['section']}, Floor {spot['floor']}")
+        for spot in filtered_spots
+    ]
+    space_grid(cells, key="availability_grid", columns=5, cell_height=90, height=600, selectable=())
     
     # Display legend
     st.markdown("""
@@ -682,17 +702,29 @@ def booking_page():
     available_spots = get_available_spots()
     
     if not available_spots:
-        st.markdown('<div class="important-info">No available parking spots at the moment. Please check back later.</div>', unsafe_allow_html=True)
+        st.markdown('<div class="important-info">No available parking spots at the moment. Join the waitlist and a spot will be booked for you as soon as one frees up.</div>', unsafe_allow_html=True)
+        waitlist_form()
         return
     
     st.markdown('<div class="form-container">', unsafe_allow_html=True)
     
+    # Nearest spots first when the garage layout is known
+    routing = get_routing_table(DB_FILE)
+    travel = None
+    if routing is not None:
+        entrance = None
+        if len(routing.entrances) > 1:
+            entrance = st.selectbox("Entrance", routing.entrances, key="entrance")
+        travel = routing.travel_times([spot['id'] for spot in available_spots], entrance)
+        order = travel.argsort(kind="stable")
+        available_spots = [available_spots[i] for i in order]
+        travel = travel[order]
+    
     # Convert spots to a format for the selectbox
     spot_options = [f"{spot['spot_number']} (Section {spot['section']}, Floor {spot['floor']})" for spot in available_spots]
-    
-    # Booking form
-    selected_spot_index = st.selectbox("Select Parking Spot", range(len(spot_options)), format_func=lambda x: spot_options[x], key="select_spot")
-    selected_spot = available_spots[selected_spot_index]
+    if travel is not None:
+        spot_options = [f"{option} ~{seconds / 60:.1f} min" if seconds != float('inf') else option
+                        for option, seconds in zip(spot_options, travel)]
     
     col1, col2 = st.columns(2)
     
@@ -706,10 +738,29 @@ def booking_page():
         end_date = st.date_input("End Date", start_date, key="end_date")
         end_time = st.time_input("End Time", default_end_time, key="end_time")
     
-    # Calculate duration and cost
     start_datetime = datetime.combine(start_date, start_time)
     end_datetime = datetime.combine(end_date, end_time)
     
+    # Pre-select the spot the allocator scores highest for the chosen window,
+    # ruling out spots already booked for part of it
+    recommended_index = 0
+    if end_datetime > start_datetime:
+        busy = get_busy_spot_ids(start_datetime.strftime('%Y-%m-%d %H:%M:%S'), end_datetime.strftime('%Y-%m-%d %H:%M:%S'))
+        free_mask = np.array([spot['id'] not in busy for spot in available_spots], dtype=bool)
+        spot_scores = score_spaces(SpaceFeatures.from_rows(available_spots), AllocationRequest(start_datetime, end_datetime), free_mask, travel=travel)
+        if np.isfinite(spot_scores).any():
+            recommended_index = int(spot_scores.argmax())
+            st.markdown(f'<p style="color: #475569;">Recommended spot: <strong>{spot_options[recommended_index]}</strong></p>', unsafe_allow_html=True)
+        else:
+            st.markdown('<div class="important-info">Every spot is already booked for part of this window. Try other times or join the waitlist.</div>', unsafe_allow_html=True)
+    
+    # Booking form
+    selected_spot_index = st.selectbox("Select Parking Spot", range(len(spot_options)), index=recommended_index, format_func=lambda x: spot_options[x], key="select_spot")
+    selected_spot = available_spots[selected_spot_index]
+    
+    # Calculate duration and cost
+    tariff = PRICING.tariff(selected_spot['section'])
+    
     if end_datetime <= start_datetime:
         st.markdown('<div class="important-info">End time must be after start time</div>', unsafe_allow_html=True)
         duration_hours = 0
@@ -717,7 +768,8 @@ def booking_page():
     else:
         duration = end_datetime - start_datetime
         duration_hours = duration.total_seconds() / 3600
-        cost = duration_hours * 2  # $2 per hour
+        cost = PRICING.quote(selected_spot['section'], start_datetime, end_datetime, selected_spot['hourly_rate'])
+    start_rate = selected_spot['hourly_rate'] * tariff.multiplier_at(start_datetime)
     
     # Display booking summary
     st.markdown(f"""
@@ -725,6 +777,7 @@ def booking_page():
         <h3 style="color: #1E3A8A; margin-bottom: 10px;">Booking Summary</h3>
         <p style="color: #333333;"><strong>Parking Spot:</strong> {selected_spot['spot_number']} (Section {selected_spot['section']}, Floor {selected_spot['floor']})</p>
         <p style="color: #333333;"><strong>Duration:</strong> {duration_hours:.2f} hours</p>
+        <p style="color: #333333;"><strong>Rate at start:</strong> ${start_rate:.2f}/hour ({tariff.period_at(start_datetime)})</p>
         <p style="color: #333333;"><strong>Cost:</strong> ${cost:.2f}</p>
     </div>
     """, unsafe_allow_html=True)
@@ -753,12 +806,54 @@ def booking_page():
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def waitlist_form():
+    """Join the waitlist for a time window, and list the user's waiting requests"""
+    waitlist = get_waitlist(DB_FILE)
+    user_id = st.session_state.user['id']
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Start Date", datetime.now().date(), key="waitlist_start_date")
+        start_time = st.time_input("Start Time", datetime.now().time(), key="waitlist_start_time")
+    with col2:
+        default_end_time = (datetime.now() + timedelta(hours=2)).time()
+        end_date = st.date_input("End Date", start_date, key="waitlist_end_date")
+        end_time = st.time_input("End Time", default_end_time, key="waitlist_end_time")
+    
+    if st.button("Join Waitlist", key="join_waitlist"):
+        try:
+            waitlist.join(user_id, datetime.combine(start_date, start_time), datetime.combine(end_date, end_time))
+            st.markdown('<div class="important-info" style="background-color: #d1fae5; border-left-color: #10b981; color: #065f46 !important;">You are on the waitlist. The booking will appear under My Bookings once a spot frees up.</div>', unsafe_allow_html=True)
+        except ValueError as e:
+            st.markdown(f'<div class="important-info">{e}</div>', unsafe_allow_html=True)
+    
+    for entry in waitlist.entries(user_id):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown(f"Waiting: {entry['start_time'][:16]} to {entry['end_time'][:16]}")
+        with col2:
+            if st.button("Leave", key=f"leave_waitlist_{entry['id']}"):
+                waitlist.leave(entry['id'])
+                st.experimental_rerun()
+
 def my_bookings_page():
     st.markdown('<h1 class="section-header">My Parkmate Bookings</h1>', unsafe_allow_html=True)
     st.markdown('<p style="text-align: center; color: #475569; margin-bottom: 20px;">Manage your parking reservations</p>', unsafe_allow_html=True)
     
-    # Get user bookings from database
-    bookings = get_user_bookings(st.session_state.user['id'])
+    # Get one page of user bookings from database. The cursor stack holds
+    # the (start_time, id) each page starts after, so paging back is free
+    cursors_key = f"booking_page_cursors_{st.session_state.user['id']}"
+    if cursors_key not in st.session_state:
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+    page = get_user_bookings(st.session_state.user['id'], limit=BOOKINGS_PER_PAGE + 1, after=cursors[-1])
+    has_next = len(page) > BOOKINGS_PER_PAGE
+    bookings = page[:BOOKINGS_PER_PAGE]
+    
+    if not bookings and len(cursors) > 1:
+        # The page emptied (e.g. after a cancellation); step back
+        cursors.pop()
+        st.experimental_rerun()
     
     if not bookings:
         st.markdown('<div class="important-info">You have no bookings yet. Book a parking spot to get started!</div>', unsafe_allow_html=True)
@@ -769,17 +864,17 @@ def my_bookings_page():
             st.experimental_rerun()
         return
     
-    # Separate active and past bookings
-    active_bookings = []
-    past_bookings = []
-    current_time = datetime.now()
+    # Separate active and past bookings; the scheduler completes bookings as they end
+    active_bookings = [booking for booking in bookings if booking['status'] == 'active']
+    past_bookings = [booking for booking in bookings if booking['status'] != 'active']
     
-    for booking in bookings:
-        end_time = datetime.strptime(booking['end_time'], '%Y-%m-%d %H:%M:%S')
-        if end_time > current_time and booking['status'] != 'cancelled':
-            active_bookings.append(booking)
-        else:
-            past_bookings.append(booking)
+    # Price the whole page at once
+    starts = pd.to_datetime([booking['start_time'] for booking in bookings])
+    ends = pd.to_datetime([booking['end_time'] for booking in bookings])
+    costs = dict(zip([booking['id'] for booking in bookings],
+                     PRICING.quote_batch([booking['section'] for booking in bookings],
+                                         starts.to_numpy(), ends.to_numpy(),
+                                         [booking['hourly_rate'] for booking in bookings])))
     
     # Display active bookings
     if active_bookings:
@@ -793,7 +888,7 @@ def my_bookings_page():
             # Calculate duration and cost
             duration = end_time - start_time
             duration_hours = duration.total_seconds() / 3600
-            cost = duration_hours * 2  # $2 per hour
+            cost = costs[booking['id']]
             
             payment_color = "#10B981" if booking['payment_status'] == 'paid' else "#F59E0B"
             st.markdown(f'''
@@ -810,7 +905,7 @@ def my_bookings_page():
             ''', unsafe_allow_html=True)
             
             # Cancel booking button
-            col1, col2 = st.columns([1, 3])
+            col1, col2, col3 = st.columns([1, 1, 2])
             with col1:
                 if st.button(f"Cancel Booking", key=f"cancel_{booking['id']}"):
                     try:
@@ -830,19 +925,17 @@ def my_bookings_page():
                         st.markdown(f'<div class="important-info">Error cancelling booking: {e}</div>', unsafe_allow_html=True)
             
             with col2:
+                if not booking['checked_in_at'] and start_time <= datetime.now() + timedelta(minutes=15):
+                    if st.button("Check In", key=f"check_in_{booking['id']}"):
+                        check_in(booking['id'])
+                        st.experimental_rerun()
+            
+            with col3:
                 if booking['payment_status'] == 'pending':
                     if st.button(f"Make Payment", key=f"pay_{booking['id']}"):
                         # This would normally connect to a payment processor
-                        conn = None
                         try:
-                            conn = get_db_connection()
-                            if not conn:
-                                st.markdown('<div class="important-info">Database connection error. Please try again.</div>', unsafe_allow_html=True)
-                                return
-                                
-                            conn.execute("BEGIN TRANSACTION")
-                            conn.execute("UPDATE bookings SET payment_status = 'paid' WHERE id = ?", (booking['id'],))
-                            conn.commit()
+                            pay_booking(booking['id'])
                             st.markdown('<div class="important-info" style="background-color: #d1fae5; border-left-color: #10b981; color: #065f46 !important;">Payment successful! Refreshing...</div>', unsafe_allow_html=True)
                             # Add JavaScript to refresh the page after 2 seconds
                             st.markdown("""
@@ -854,11 +947,6 @@ def my_bookings_page():
                             """, unsafe_allow_html=True)
                         except Exception as e:
                             st.markdown(f'<div class="important-info">Payment error: {e}</div>', unsafe_allow_html=True)
-                            if conn:
-                                conn.rollback()
-                        finally:
-                            if conn:
-                                conn.close()
     
     # Display past bookings
     if past_bookings:
@@ -884,7 +972,7 @@ def my_bookings_page():
             # Calculate duration and cost
             duration = end_time - start_time
             duration_hours = duration.total_seconds() / 3600
-            cost = duration_hours * 2  # $2 per hour
+            cost = costs[booking['id']]
             
             status_color = "#EF4444" if booking['status'] == 'cancelled' else "#10B981"
             
@@ -900,6 +988,19 @@ def my_bookings_page():
             ''', unsafe_allow_html=True)
         
         st.markdown('</table>', unsafe_allow_html=True)
+    
+    # Page navigation
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if len(cursors) > 1 and st.button("← Newer", key="bookings_newer"):
+            cursors.pop()
+            st.experimental_rerun()
+    with col2:
+        st.markdown(f'<p style="text-align: center; color: #475569;">Page {len(cursors)}</p>', unsafe_allow_html=True)
+    with col3:
+        if has_next and st.button("Older →", key="bookings_older"):
+            cursors.append((bookings[-1]['start_time'], bookings[-1]['id']))
+            st.experimental_rerun()
 
 # Add code for enhanced navigation and main application flow
 def admin_page():
@@ -908,6 +1009,10 @@ def admin_page():
     
     # Admin functionality would go here
     st.markdown('<div class="important-info">Admin functionality is currently under development.</div>', unsafe_allow_html=True)
+    
+    # Database query performance
+    st.markdown('<h2 style="color: #1E3A8A; margin-top: 20px;">Query Performance</h2>', unsafe_allow_html=True)
+    query_report()
 
 # Initialize session state for user management
 if 'user' not in st.session_state:
@@ -0,0 +1,301 @@
+"""
+Benchmarks for the database layer and booking hot paths.
+
+Seeds a database with src/datagen.py (10k spaces and 1M bookings by default),
+times each operation over many calls and writes throughput and latency
+percentiles to a JSON file. When a baseline file exists the run is compared
+against it and any case whose median latency grew by more than the tolerance
+is reported as a regression (and the exit code is 1).
+
+Usage::
+
+    python benchmarks/run_benchmarks.py                  # full scale
+    python benchmarks/run_benchmarks.py --spaces 1000 --bookings 100000
+    python benchmarks/run_benchmarks.py --save-baseline  # record a new baseline
+
+The ``app.py`` helpers are benchmarked when Streamlit is installed.
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import database  # noqa: E402
+from billing import get_pricing_engine  # noqa: E402
+from datagen import generate_dataset  # noqa: E402
+from space_index import find_space_ids  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+DEFAULT_SPACES = 10_000
+DEFAULT_BOOKINGS = 1_000_000
+DEFAULT_USERS = 1_000
+DEFAULT_TOLERANCE = 0.20       # 20% slower median counts as a regression
+BOOKING_HOURS = 2
+
+
+# ---- Seeding ----
+
+def seed_database(path: str, n_spaces: int, n_bookings: int, n_users: int, seed: int = 42) -> Dict:
+    """Fill a fresh database with synthetic data from datagen"""
+    stats = generate_dataset(path, spaces=n_spaces, users=n_users, bookings=n_bookings, seed=seed, offline=True)
+    last_end = datetime.datetime.strptime(stats['last_end'], database.DB_TIMESTAMP_FORMAT) if n_bookings \
+        else datetime.datetime.now()
+    return {'spaces': n_spaces, 'bookings': n_bookings, 'users': n_users,
+            'free_after': last_end + datetime.timedelta(hours=1)}
+
+
+# ---- Measurement ----
+
+def measure(name: str, fn: Callable[[int], object], iterations: int, warmup: int = 2) -> Dict:
+    """Call fn(i) `iterations` times and summarise the latencies"""
+    for i in range(warmup):
+        fn(-1 - i)
+    latencies = np.empty(iterations)
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies[i] = time.perf_counter() - t0
+    wall = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000.0
+    result = {
+        'name': name,
+        'iterations': iterations,
+        'ops_per_sec': iterations / wall if wall else float('inf'),
+        'mean_ms': float(latencies.mean() * 1000.0),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(latencies.max() * 1000.0),
+    }
+    print(f"  {name:<40} {result['ops_per_sec']:>10.1f} ops/s  "
+          f"p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms")
+    return result
+
+
+def database_cases(info: Dict, scale: float, rng: random.Random) -> List[tuple]:
+    """(name, fn, iterations) for the src/database.py operations"""
+    n_spaces, n_users = info['spaces'], info['users']
+    free_after = info['free_after']
+
+    def create_booking(i):
+        # Far-future windows nobody else books, one per call
+        start = free_after + datetime.timedelta(hours=BOOKING_HOURS * (i + 10))
+        database.create_booking(rng.randrange(n_users) + 1, rng.randrange(n_spaces) + 1,
+                                start, start + datetime.timedelta(hours=1), 'BENCH', 'car')
+
+    def update_booking(i):
+        booking_id = rng.randrange(info['bookings']) + 1
+        database.update_booking(booking_id, vehicle_plate=f'UPD{i}')
+
+    def find_conflicts(i):
+        start = free_after - datetime.timedelta(hours=BOOKING_HOURS * rng.randrange(1, 50))
+        database.find_conflicts(rng.randrange(n_spaces) + 1, start, start + datetime.timedelta(hours=3))
+
+    billed = {}
+
+    def price_active_bookings(i):
+        # Fetch once; time only the pricing of every active booking, as the app quotes them
+        if not billed:
+            billed.update(database.get_active_bookings(result='columns'))
+            billed['section'] = [None] * len(billed['id'])
+        get_pricing_engine().quote_batch(billed['section'], billed['start_time'], billed['end_time'],
+                                         billed['hourly_rate'])
+
+    def iterations(n):
+        return max(3, int(n * scale))
+
+    return [
+        ('create_booking', create_booking, iterations(500)),
+        ('update_booking', update_booking, iterations(500)),
+        ('find_conflicts', find_conflicts, iterations(2000)),
+        ('get_available_parking_spaces', lambda i: database.get_available_parking_spaces(), iterations(50)),
+        ('get_available_parking_spaces[record]',
+         lambda i: database.get_available_parking_spaces(result='record'), iterations(50)),
+        ('get_all_parking_spaces[columns]',
+         lambda i: database.get_all_parking_spaces(result='columns'), iterations(50)),
+        ('get_user_bookings', lambda i: database.get_user_bookings(rng.randrange(n_users) + 1), iterations(200)),
+        ('get_user_bookings_page',
+         lambda i: database.get_user_bookings_page(rng.randrange(n_users) + 1), iterations(1000)),
+        ('get_active_bookings', lambda i: database.get_active_bookings(), iterations(5)),
+        ('get_active_bookings[columns]', lambda i: database.get_active_bookings(result='columns'), iterations(5)),
+        ('get_active_bookings_page', lambda i: database.get_active_bookings_page(), iterations(1000)),
+        ('quote_batch[active bookings]', price_active_bookings, iterations(20)),
+        ('get_occupancy_summary', lambda i: database.get_occupancy_summary(), iterations(2000)),
+        ('find_space_ids', lambda i: find_space_ids(database.DB_PATH, floor=('1', '2'), state='available',
+                                                    ev=False, price_range=(1.5, 2.5)), iterations(2000)),
+    ]
+
+
+def load_app(db_path: str):
+    """Import the root app.py against the benchmark database, or None without Streamlit"""
+    try:
+        importlib.import_module('streamlit')
+    except ImportError:
+        return None
+    # app.py initialises its own database file in the working directory on import
+    # and would start the booking scheduler, which must not touch the seeded data
+    os.environ['PARKING_SCHEDULER'] = '0'
+    cwd = os.getcwd()
+    sys.path.insert(0, ROOT)
+    try:
+        os.chdir(os.path.dirname(db_path))
+        app = importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
+    app.DB_FILE = db_path
+    return app
+
+
+def app_cases(app, info: Dict, scale: float, rng: random.Random) -> List[tuple]:
+    """(name, fn, iterations) for the root app.py helpers, bypassing the Streamlit cache"""
+    n_spaces, n_users = info['spaces'], info['users']
+    free_after = info['free_after'] + datetime.timedelta(days=365)
+
+    def book_spot(i):
+        start = free_after + datetime.timedelta(hours=BOOKING_HOURS * (i + 10))
+        space_id = rng.randrange(n_spaces) + 1
+        app.book_spot(rng.randrange(n_users) + 1, space_id, start.strftime(database.DB_TIMESTAMP_FORMAT),
+                      (start + datetime.timedelta(hours=1)).strftime(database.DB_TIMESTAMP_FORMAT))
+
+    def iterations(n):
+        return max(3, int(n * scale))
+
+    return [
+        ('app.get_available_spots', lambda i: app.get_available_spots.uncached(), iterations(50)),
+        ('app.get_all_spots', lambda i: app.get_all_spots.uncached(), iterations(50)),
+        ('app.get_user_bookings',
+         lambda i: app.get_user_bookings.uncached(rng.randrange(n_users) + 1), iterations(200)),
+        ('app.get_user_bookings[page]',
+         lambda i: app.get_user_bookings.uncached(rng.randrange(n_users) + 1, limit=app.BOOKINGS_PER_PAGE + 1),
+         iterations(1000)),
+        ('app.book_spot', book_spot, iterations(500)),
+    ]
+
+
+# ---- Baseline comparison ----
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Cases whose median latency regressed beyond the tolerance"""
+    previous = {case['name']: case for case in baseline.get('cases', [])}
+    regressions = []
+    print(f"\n  {'case':<40} {'baseline p50':>14} {'current p50':>14} {'change':>9}")
+    for case in results['cases']:
+        before = previous.get(case['name'])
+        if before is None or not before['p50_ms']:
+            print(f"  {case['name']:<40} {'-':>14} {case['p50_ms']:>11.3f} ms {'new':>9}")
+            continue
+        change = case['p50_ms'] / before['p50_ms'] - 1.0
+        flag = '  REGRESSION' if change > tolerance else ''
+        print(f"  {case['name']:<40} {before['p50_ms']:>11.3f} ms {case['p50_ms']:>11.3f} ms "
+              f"{change:>+8.1%}{flag}")
+        if change > tolerance:
+            regressions.append({'name': case['name'], 'baseline_p50_ms': before['p50_ms'],
+                                'p50_ms': case['p50_ms'], 'change': change})
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--spaces', type=int, default=DEFAULT_SPACES)
+    parser.add_argument('--bookings', type=int, default=DEFAULT_BOOKINGS)
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for iteration counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='database file to seed (default: a temporary file)')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='also write the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db_path = os.path.abspath(args.db)
+        if os.path.exists(db_path):
+            parser.error(f'{db_path} already exists; benchmarks need a fresh database')
+        return run(args, db_path)
+
+    # The temporary database (and the app's own file beside it) go with the work dir
+    workdir = tempfile.mkdtemp(prefix='parking-bench-')
+    try:
+        return run(args, os.path.join(workdir, 'bench.db'))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args: argparse.Namespace, db_path: str) -> int:
+    """Seed db_path, run every case and write (and compare) the results"""
+    print(f'Seeding {args.spaces} spaces and {args.bookings} bookings into {db_path}')
+    started = time.perf_counter()
+    info = seed_database(db_path, args.spaces, args.bookings, args.users, args.seed)
+    seed_seconds = time.perf_counter() - started
+    print(f'  seeded in {seed_seconds:.1f} s')
+
+    database.DB_PATH = db_path
+    rng = random.Random(args.seed)
+    cases = database_cases(info, args.scale, rng)
+    app = load_app(db_path)
+    if app is not None:
+        cases += app_cases(app, info, args.scale, rng)
+    else:
+        print('  Streamlit not installed; skipping app.py helpers')
+
+    print('Running benchmarks')
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'dataset': {'spaces': args.spaces, 'bookings': args.bookings, 'users': args.users, 'seed': args.seed},
+        'seed_seconds': seed_seconds,
+        'cases': [measure(name, fn, iterations) for name, fn, iterations in cases],
+    }
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('dataset') != results['dataset']:
+            print('\nBaseline was recorded with a different dataset; comparison skipped')
+        else:
+            regressions = compare(results, baseline, args.tolerance)
+    results['regressions'] = regressions
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nResults written to {output}')
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+
+    if regressions:
+        print(f'{len(regressions)} regression(s) beyond {args.tolerance:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
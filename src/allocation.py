@@ -0,0 +1,354 @@
+"""
+Dynamic parking slot allocation.
+
+Scores every parking space for a booking request in one vectorized pass and
+picks the best one. Hard constraints (the space is bookable, free for the
+whole window, accessible / EV charging when required) rule spaces out;
+soft preferences add or subtract points:
+
+* keep accessible and EV charging spaces for the drivers who need them
+* honour floor and section preferences
+* keep larger vehicles on lower floors
+* prefer spaces a short drive from the entrance and walk from a lift, when
+  a facility layout is available (see routing.py)
+* best fit in time: prefer spaces where the booking sits flush against
+  existing bookings, and avoid leaving gaps too short for anyone else to use
+
+Batch mode assigns several simultaneous requests at once by solving the
+assignment problem over the score matrix, so one request never grabs the
+space another request needs far more.
+"""
+
+import re
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+import database
+from availability import AvailabilityMatrix, get_availability_engine
+from routing import RoutingTable, get_routing_table
+
+# Score weights (higher scores win)
+PREFERRED_FLOOR_BONUS = 3.0
+PREFERRED_SECTION_BONUS = 2.0
+ACCESSIBLE_WASTE_PENALTY = 4.0   # giving an accessible space to someone who does not need it
+EV_WASTE_PENALTY = 3.0           # giving a charging space to a non-electric vehicle
+EV_MATCH_BONUS = 1.0             # electric vehicle gets a charging space without requiring one
+ADJACENCY_BONUS = 1.0            # per side flush against another booking
+SLIVER_PENALTY = 1.5             # per side leaving a gap shorter than MIN_USEFUL_GAP_SLOTS
+TRAVEL_TIME_PENALTY = 0.5        # per minute of drive plus walk time
+
+# Penalty per floor level; large vehicles should not climb ramps
+VEHICLE_FLOOR_PENALTY = {
+    "motorcycle": 0.0,
+    "car": 0.1,
+    "ev": 0.1,
+    "suv": 0.3,
+    "van": 0.6,
+    "truck": 1.0,
+}
+
+MIN_USEFUL_GAP_SLOTS = 4         # one hour of 15-minute slots
+GAP_LOOKAHEAD_SLOTS = 16         # how far around the window gaps are measured
+
+# Cost given to infeasible pairs in the assignment problem
+INFEASIBLE_COST = 1e9
+
+
+class AllocationRequest(NamedTuple):
+    """What a driver asks for"""
+    start_time: object
+    end_time: object
+    vehicle_type: str = "car"
+    needs_accessible: bool = False
+    needs_ev: bool = False
+    preferred_floor: Optional[str] = None
+    preferred_section: Optional[str] = None
+    entrance: Optional[str] = None
+
+
+class SpaceFeatures:
+    """Space attributes as NumPy arrays, aligned with a list of space IDs"""
+
+    def __init__(self, space_ids: np.ndarray, floor: np.ndarray, level: np.ndarray,
+                 section: np.ndarray, accessible: np.ndarray, ev: np.ndarray,
+                 bookable: np.ndarray):
+        self.space_ids = space_ids
+        self.floor = floor
+        self.level = level
+        self.section = section
+        self.accessible = accessible
+        self.ev = ev
+        self.bookable = bookable
+
+    def __len__(self) -> int:
+        return len(self.space_ids)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable, order: Optional[Sequence[int]] = None) -> "SpaceFeatures":
+        """
+        Build features from space rows (dicts or sqlite3.Row).
+
+        If `order` is given the arrays follow that sequence of space IDs;
+        IDs without a row are marked as not bookable.
+        """
+        by_id = {}
+        for row in rows:
+            row = dict(row)
+            by_id[row["id"]] = row
+        ids = list(order) if order is not None else list(by_id)
+
+        def column(key, default):
+            return [by_id[i].get(key, default) if i in by_id else default for i in ids]
+
+        floors = [str(f) if f is not None else "" for f in column("floor", None)]
+        return cls(
+            space_ids=np.array(ids, dtype=np.int64),
+            floor=np.array(floors, dtype=object),
+            level=np.array([_floor_level(f) for f in floors], dtype=float),
+            section=np.array([s or "" for s in column("section", None)], dtype=object),
+            accessible=np.array(column("is_accessible", False), dtype=bool),
+            ev=np.array(column("is_ev_charging", False), dtype=bool),
+            bookable=np.array(
+                [i in by_id and by_id[i].get("status", "active") in ("active", "available") for i in ids],
+                dtype=bool
+            ),
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray],
+                     order: Optional[Sequence[int]] = None) -> "SpaceFeatures":
+        """
+        Build features from columnar space data (database result='columns').
+
+        Same semantics as from_rows, without materialising a row per space.
+        """
+        ids = columns["id"]
+        if order is None:
+            order = ids
+            positions = np.arange(len(ids))
+            present = np.ones(len(ids), dtype=bool)
+        else:
+            order = np.asarray(order, dtype=np.int64)
+            if len(ids):
+                sorter = np.argsort(ids, kind="stable")
+                found = np.minimum(np.searchsorted(ids, order, sorter=sorter), len(ids) - 1)
+                positions = sorter[found]
+                present = ids[positions] == order
+            else:
+                positions = np.zeros(len(order), dtype=np.int64)
+                present = np.zeros(len(order), dtype=bool)
+
+        def column(key, default, dtype):
+            if not len(ids):
+                return np.full(len(order), default, dtype=dtype)
+            return np.where(present, columns[key][positions], default).astype(dtype)
+
+        floors = np.array(["" if f is None else str(f) for f in column("floor", "", object)], dtype=object)
+        labels, inverse = np.unique(floors.astype(str), return_inverse=True)
+        levels = np.array([_floor_level(label) for label in labels], dtype=float)
+        sections = np.array(["" if s is None else s for s in column("section", "", object)], dtype=object)
+        return cls(
+            space_ids=np.asarray(order, dtype=np.int64),
+            floor=floors,
+            level=levels[inverse] if len(floors) else np.zeros(0),
+            section=sections,
+            accessible=column("is_accessible", False, bool),
+            ev=column("is_ev_charging", False, bool),
+            bookable=present & np.isin(column("status", "", object).astype(str), ["active", "available"]),
+        )
+
+
+def _floor_level(floor: str) -> float:
+    """Numeric level of a floor label ('2', 'L2', 'B1' -> 2, 2, -1)"""
+    match = re.search(r"-?\d+", floor or "")
+    if not match:
+        return 0.0
+    level = float(match.group())
+    return -abs(level) if floor.strip().upper().startswith("B") else level
+
+
+def score_spaces(features: SpaceFeatures, request: AllocationRequest,
+                 free_mask: Optional[np.ndarray] = None,
+                 gaps: Optional[Sequence[np.ndarray]] = None,
+                 travel: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Score every space for a request.
+
+    Args:
+        features: Space attributes
+        request: The booking request
+        free_mask: Spaces free for the requested window (all if None)
+        gaps: (before, after) free-slot run lengths around the window
+        travel: Travel time in seconds per space; spaces the layout does
+            not reach count as the slowest reachable one
+
+    Returns:
+        Array of scores aligned with features.space_ids; -inf where infeasible
+    """
+    vehicle_type = (request.vehicle_type or "car").lower()
+    score = np.zeros(len(features), dtype=float)
+    feasible = features.bookable.copy()
+    if free_mask is not None:
+        feasible &= free_mask
+
+    if request.needs_accessible:
+        feasible &= features.accessible
+    else:
+        score -= ACCESSIBLE_WASTE_PENALTY * features.accessible
+
+    if request.needs_ev:
+        feasible &= features.ev
+    elif vehicle_type == "ev":
+        score += EV_MATCH_BONUS * features.ev
+    else:
+        score -= EV_WASTE_PENALTY * features.ev
+
+    if request.preferred_floor is not None:
+        score += PREFERRED_FLOOR_BONUS * (features.floor == str(request.preferred_floor))
+    if request.preferred_section is not None:
+        score += PREFERRED_SECTION_BONUS * (features.section == str(request.preferred_section))
+
+    score -= VEHICLE_FLOOR_PENALTY.get(vehicle_type, VEHICLE_FLOOR_PENALTY["car"]) * np.maximum(features.level, 0)
+
+    if gaps is not None:
+        for gap in gaps:
+            score += ADJACENCY_BONUS * (gap == 0)
+            score -= SLIVER_PENALTY * ((gap > 0) & (gap < MIN_USEFUL_GAP_SLOTS))
+
+    if travel is not None and len(travel):
+        reachable = np.isfinite(travel)
+        slowest = travel[reachable].max() if reachable.any() else 0.0
+        score -= TRAVEL_TIME_PENALTY * np.where(reachable, travel, slowest) / 60.0
+
+    return np.where(feasible, score, -np.inf)
+
+
+class SpaceAllocator:
+    """Chooses parking spaces using the availability matrix and space attributes"""
+
+    def __init__(self, matrix: AvailabilityMatrix, spaces, routing: Optional[RoutingTable] = None,
+                 generation: Optional[int] = None):
+        self.matrix = matrix
+        self.routing = routing
+        # Space catalog generation the features were read at
+        self.generation = _space_generation if generation is None else generation
+        if isinstance(spaces, dict):
+            self.features = SpaceFeatures.from_columns(spaces, order=matrix.space_ids)
+        else:
+            self.features = SpaceFeatures.from_rows(spaces, order=matrix.space_ids)
+
+    def is_stale(self) -> bool:
+        """Whether spaces were written or added to the matrix after the features were built"""
+        return self.generation != _space_generation or len(self.features) != len(self.matrix.space_ids)
+
+    def scores(self, request: AllocationRequest) -> np.ndarray:
+        """Scores of every space (aligned with matrix.space_ids) for one request"""
+        free = self.matrix.free_mask(request.start_time, request.end_time)
+        gaps = self.matrix.gap_lengths(request.start_time, request.end_time, GAP_LOOKAHEAD_SLOTS)
+        travel = None
+        if self.routing is not None:
+            travel = self.routing.travel_times(self.matrix.space_ids, request.entrance)
+        return score_spaces(self.features, request, free, gaps, travel)
+
+    def rank(self, request: AllocationRequest, limit: int = 10) -> List[int]:
+        """IDs of the best feasible spaces for a request, best first"""
+        scores = self.scores(request)
+        feasible = np.flatnonzero(np.isfinite(scores))
+        # Stable sort so ties go to the lowest column, matching allocate()
+        best = feasible[np.argsort(-scores[feasible], kind="stable")[:limit]]
+        return [int(i) for i in self.matrix.space_ids[best]]
+
+    def allocate(self, request: AllocationRequest) -> Optional[int]:
+        """ID of the best space for a request, or None if nothing fits"""
+        scores = self.scores(request)
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return None
+        return int(self.matrix.space_ids[best])
+
+    def allocate_batch(self, requests: Sequence[AllocationRequest]) -> List[Optional[int]]:
+        """
+        Assign spaces to several simultaneous requests, maximising total score.
+
+        Each space is given to at most one request of the batch. Requests that
+        cannot be served get None.
+        """
+        if not requests:
+            return []
+        scores = np.vstack([self.scores(request) for request in requests])
+
+        # An optimal assignment only ever uses each request's len(requests)
+        # best spaces, so the solver can work on that union of columns
+        k = min(len(requests), scores.shape[1])
+        if k == 0:
+            return [None] * len(requests)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        columns = np.unique(top)
+        sub = scores[:, columns]
+
+        cost = np.where(np.isfinite(sub), -sub, INFEASIBLE_COST)
+        rows, cols = linear_sum_assignment(cost)
+
+        assigned: List[Optional[int]] = [None] * len(requests)
+        for row, col in zip(rows, cols):
+            if np.isfinite(sub[row, col]):
+                assigned[row] = int(self.matrix.space_ids[columns[col]])
+        return assigned
+
+    def allocate_and_book(self, user_id: int, request: AllocationRequest,
+                          vehicle_plate: str, attempts: int = 3) -> Optional[Dict]:
+        """
+        Book the best space for a request.
+
+        If another session takes the chosen space first, the next best space
+        is tried, up to `attempts` times. Returns {'booking_id', 'space_id'}
+        or None if no space could be booked.
+        """
+        for space_id in self.rank(request, limit=attempts):
+            try:
+                booking_id = database.create_booking(
+                    user_id, space_id, request.start_time, request.end_time,
+                    vehicle_plate, request.vehicle_type
+                )
+            except ValueError:
+                continue
+            return {"booking_id": booking_id, "space_id": space_id}
+        return None
+
+
+_allocator: Optional[SpaceAllocator] = None
+_allocator_lock = threading.Lock()
+
+# Bumped on every committed parking space write, so attribute edits (floor,
+# section, accessibility, status) rebuild the features and not only new spaces
+_space_generation = 0
+
+
+def _on_space_change(event: str, space: Dict) -> None:
+    global _space_generation
+    _space_generation += 1
+
+
+def get_allocator() -> SpaceAllocator:
+    """Return the process-wide allocator, rebuilding it when spaces or the layout changed"""
+    global _allocator
+    database.add_space_listener(_on_space_change)
+    matrix = get_availability_engine()
+    routing = get_routing_table(database.DB_PATH)
+    if _allocator is None or _allocator.is_stale() or _allocator.routing is not routing:
+        with _allocator_lock:
+            if _allocator is None or _allocator.is_stale() or _allocator.routing is not routing:
+                # Read the generation first: a write landing during the read
+                # leaves the new allocator stale rather than silently outdated
+                generation = _space_generation
+                _allocator = SpaceAllocator(matrix, database.get_all_parking_spaces(result='columns'),
+                                            routing, generation)
+    return _allocator
+
+
+def invalidate_allocator() -> None:
+    """Rebuild the allocator on next use, after writes that bypassed the listeners"""
+    _on_space_change('reloaded', {})
@@ -7,6 +7,17 @@ from datetime import datetime, timedelta
 import json
 import os
 
+from database import DB_PATH, init_db, get_occupancy_summary
+from cache import bump_generation, get_archive_stats, get_booking_counts, get_bookings_page, get_occupancy_timeline
+from datagen import generate_dataset
+from availability import reload_availability_engine
+from allocation import invalidate_allocator
+from waitlist import get_waitlist
+from recurrence import extend_series
+from billing import get_pricing_engine
+from archive import ARCHIVE_AFTER_DAYS, archive_old_bookings, get_archiver
+from components.query_report import query_report
+
 # Set page configuration
 st.set_page_config(
     page_title="Smart Parking System",
@@ -15,6 +26,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+init_db()
+# Archived rows leave the cached booking pages and counts
+get_archiver(on_archived=lambda moved: bump_generation()).start()
+# Books recurring series occurrences that entered the horizon; a no-op most reruns
+extend_series()
+
 # Initialize session state variables if they don't exist
 if 'user' not in st.session_state:
     st.session_state.user = None
@@ -35,6 +52,13 @@ if 'parking_data' not in st.session_state:
 if 'bookings' not in st.session_state:
     st.session_state.bookings = []
 
+def reload_after_bulk_load():
+    """Refresh the in-memory engines and cached reads after datagen wrote past the listeners"""
+    reload_availability_engine()
+    invalidate_allocator()
+    get_waitlist(DB_PATH).load()
+    bump_generation()
+
 # Tailwind CSS integration
 def load_tailwind():
     return """
@@ -234,12 +258,13 @@ def home_page():
         """, unsafe_allow_html=True)
     
     with col2:
-        st.markdown("""
+        summary = get_occupancy_summary()
+        st.markdown(f"""
         <div class="card">
             <h2 class="subheader">Current Status</h2>
-            <p style="color: #333333; margin-bottom: 5px;"><strong>Total Spaces:</strong> 24</p>
-            <p style="color: #333333; margin-bottom: 5px;"><strong>Available:</strong> <span style="color: #10b981; font-weight: bold;">18</span></p>
-            <p style="color: #333333; margin-bottom: 5px;"><strong>Occupied:</strong> <span style="color: #ef4444; font-weight: bold;">6</span></p>
+            <p style="color: #333333; margin-bottom: 5px;"><strong>Total Spaces:</strong> {summary['total']}</p>
+            <p style="color: #333333; margin-bottom: 5px;"><strong>Available:</strong> <span style="color: #10b981; font-weight: bold;">{summary['available']}</span></p>
+            <p style="color: #333333; margin-bottom: 5px;"><strong>Occupied:</strong> <span style="color: #ef4444; font-weight: bold;">{summary['occupied']}</span></p>
         </div>
         """, unsafe_allow_html=True)
         
@@ -255,6 +280,9 @@ def home_page():
             st.session_state.page = "View Availability"
             st.experimental_rerun()
 
+# Off-peak hourly rate per parking type; the tariff scales it by time of day
+PARKING_TYPE_RATES = {"Standard": 10.0, "Premium": 15.0, "Disabled": 8.0}
+
 # Book Parking page
 def book_parking_page():
     st.markdown("<h1 class='main-header'>Book a Parking Spot</h1>", unsafe_allow_html=True)
@@ -280,8 +308,10 @@ def book_parking_page():
         st.markdown("<h2 class='section-header'>Payment Method</h2>", unsafe_allow_html=True)
         payment_method = st.selectbox("Payment Method", options=["Credit Card", "Debit Card", "Mobile Payment", "Cash"])
         
-        total_cost = duration * (10 if parking_type == "Standard" else 15 if parking_type == "Premium" else 8)
-        st.markdown(f"<h3>Total Cost: ${total_cost}</h3>", unsafe_allow_html=True)
+        entry = datetime.combine(date, time_in)
+        total_cost = round(get_pricing_engine().quote(None, entry, entry + timedelta(hours=duration),
+                                                      PARKING_TYPE_RATES[parking_type]), 2)
+        st.markdown(f"<h3>Total Cost: ${total_cost:.2f}</h3>", unsafe_allow_html=True)
     
     if st.button("Book Now"):
         if not license_plate:
@@ -311,32 +341,29 @@ def view_availability_page():
     
     date = st.date_input("Select Date", min_value=datetime.today())
     time_slot = st.selectbox("Select Time Slot", options=[f"{i:02d}:00" for i in range(24)])
+    hour = int(time_slot[:2])
+    
+    # Computed once per date and write; changing the hour reuses it
+    timeline = get_occupancy_timeline(date)
+    states = timeline.states(hour)
     
-    st.markdown("<h2 class='section-header'>Current Availability</h2>", unsafe_allow_html=True)
+    st.markdown("<h2 class='section-header'>Availability at " + time_slot + "</h2>", unsafe_allow_html=True)
     
     # Display parking lot visualization
     col1, col2 = st.columns([3, 1])
     
     with col1:
-        # Mock visualization of parking spaces
-        st.markdown("<div style='background-color: #e5e7eb; padding: 20px; border-radius: 10px;'>", unsafe_allow_html=True)
-        for row in ["A", "B", "C"]:
-            for i in range(1, 5):
-                space_id = f"{row}{i}"
-                status = "available"
-                space_type = "standard"
-                
-                if space_id in st.session_state.parking_data:
-                    status = st.session_state.parking_data[space_id]['status']
-                    space_type = st.session_state.parking_data[space_id]['type']
-                
-                st.markdown(f"""
-                <div class="parking-space {status} {space_type}">
-                    {space_id}
-                </div>
-                """, unsafe_allow_html=True)
-            st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
+        # One row of spaces per floor and section
+        rows = {}
+        for space, state in zip(timeline.spaces, states):
+            status = "available" if state == "available" else "occupied"
+            space_type = "disabled" if space['is_accessible'] else "premium" if space['is_ev_charging'] else "standard"
+            rows.setdefault((space['floor'] or "", space['section'] or ""), []).append(
+                f'<div class="parking-space {status} {space_type}">{space["space_number"]}</div>'
+            )
+        grid = "".join("".join(cells) + "<br>" for _, cells in sorted(rows.items()))
+        st.markdown(f"<div style='background-color: #e5e7eb; padding: 20px; border-radius: 10px;'>{grid}</div>",
+                    unsafe_allow_html=True)
     
     with col2:
         st.markdown("""
@@ -344,21 +371,26 @@ def view_availability_page():
             <h3 style="color: #1e40af; font-weight: 600; margin-bottom: 10px;">Legend</h3>
             <div class="parking-space available">Available</div>
             <div class="parking-space occupied">Occupied</div>
-            <div class="parking-space available premium">Premium</div>
+            <div class="parking-space available premium">EV Charging</div>
             <div class="parking-space available disabled">Disabled</div>
         </div>
         """, unsafe_allow_html=True)
         
         st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("""
+        summary = timeline.summary(hour)
+        st.markdown(f"""
         <div style='background-color: white; padding: 15px; border-radius: 10px; box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);'>
             <h3 style="color: #1e40af; font-weight: 600; margin-bottom: 10px;">Statistics</h3>
-            <p style="color: #333333; margin-bottom: 5px;"><strong>Total Spaces:</strong> 24</p>
-            <p style="color: #333333; margin-bottom: 5px;"><strong>Available:</strong> <span style="color: #10b981; font-weight: bold;">18</span></p>
-            <p style="color: #333333; margin-bottom: 5px;"><strong>Occupied:</strong> <span style="color: #ef4444; font-weight: bold;">6</span></p>
+            <p style="color: #333333; margin-bottom: 5px;"><strong>Total Spaces:</strong> {summary['total']}</p>
+            <p style="color: #333333; margin-bottom: 5px;"><strong>Available:</strong> <span style="color: #10b981; font-weight: bold;">{summary['available']}</span></p>
+            <p style="color: #333333; margin-bottom: 5px;"><strong>Occupied:</strong> <span style="color: #ef4444; font-weight: bold;">{summary['occupied']}</span></p>
         </div>
         """, unsafe_allow_html=True)
     
+    st.markdown("<h2 class='section-header'>Occupied Spaces Through the Day</h2>", unsafe_allow_html=True)
+    st.bar_chart(pd.DataFrame({"Occupied": timeline.occupied_counts()},
+                              index=[f"{i:02d}:00" for i in range(24)]))
+    
     if st.session_state.user is not None:
         if st.button("Book Selected Space"):
             st.session_state.page = "Book Parking"
@@ -417,6 +449,8 @@ def my_bookings_page():
                         st.success("This booking has been completed successfully.")
 
 # Admin page
+ADMIN_BOOKINGS_PER_PAGE = 50
+
 def admin_page():
     st.markdown("<h1 class='main-header'>Admin Dashboard</h1>", unsafe_allow_html=True)
     
@@ -426,151 +460,82 @@ def admin_page():
     
     st.markdown("<h2 class='section-header'>System Overview</h2>", unsafe_allow_html=True)
     
+    booking_counts = get_booking_counts()
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total Bookings", len(st.session_state.bookings))
+        st.metric("Total Bookings", booking_counts['total'])
     with col2:
-        active_bookings = len([b for b in st.session_state.bookings if b['status'] == "Confirmed"])
-        st.metric("Active Bookings", active_bookings)
+        st.metric("Active Bookings", booking_counts.get('active', 0))
     with col3:
-        st.metric("Available Spaces", 18)  # In a real system, this would be calculated
+        st.metric("Available Spaces", get_occupancy_summary()['available'])
     
-    # All bookings
+    # All bookings, one page at a time. The cursor stack holds the id each
+    # page starts below, so paging back is free
     st.markdown("<h2 class='section-header'>All Bookings</h2>", unsafe_allow_html=True)
-    if not st.session_state.bookings:
+    cursors = st.session_state.setdefault("admin_booking_cursors", [None])
+    page = get_bookings_page(ADMIN_BOOKINGS_PER_PAGE + 1, cursors[-1])
+    has_next = len(page) > ADMIN_BOOKINGS_PER_PAGE
+    bookings = page[:ADMIN_BOOKINGS_PER_PAGE]
+    if not bookings and len(cursors) > 1:
+        # The page emptied (e.g. after archiving); step back
+        cursors.pop()
+        st.experimental_rerun()
+    if not bookings:
         st.info("No bookings available in the system.")
     else:
-        df = pd.DataFrame(st.session_state.bookings)
-        st.dataframe(df)
+        st.dataframe(pd.DataFrame(bookings))
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if len(cursors) > 1 and st.button("← Newer", key="admin_bookings_newer"):
+                cursors.pop()
+                st.experimental_rerun()
+        with col2:
+            st.markdown(f"<p style='text-align: center;'>Page {len(cursors)}</p>", unsafe_allow_html=True)
+        with col3:
+            if has_next and st.button("Older →", key="admin_bookings_older"):
+                cursors.append(bookings[-1]['id'])
+                st.experimental_rerun()
 
     # Database management
     st.markdown("<h2 class='section-header'>Database Management</h2>", unsafe_allow_html=True)
     col1, col2 = st.columns(2)
     
     with col1:
+        sample_spaces = st.number_input("Sample parking spaces", min_value=1, value=200, step=50)
+        sample_users = st.number_input("Sample users", min_value=1, value=100, step=50)
+        sample_bookings = st.number_input("Sample bookings", min_value=0, value=5000, step=1000)
         if st.button("Initialize Database"):
             try:
-                # This is where the database initialization would go
-                # For this mock app, we'll just reset our session state data
-                
-                # Initialize parking spaces
-                parking_data = {}
-                for row in ["A", "B", "C", "D", "E"]:
-                    for i in range(1, 10):
-                        space_id = f"{row}{i}"
-                        # Randomly set some spaces as occupied for demo
-                        status = "available" if np.random.rand() > 0.3 else "occupied"
-                        # Randomly assign space types
-                        type_rand = np.random.rand()
-                        if type_rand < 0.7:
-                            space_type = "standard"
-                        elif type_rand < 0.9:
-                            space_type = "premium"
-                        else:
-                            space_type = "disabled"
-                        
-                        parking_data[space_id] = {"status": status, "type": space_type}
-                
-                st.session_state.parking_data = parking_data
-                
-                # Initialize users (in a real app, this would go to a database)
-                # We're not storing this in session for simplicity
-                
-                # Initialize sample bookings
-                sample_bookings = []
-                users = ["john_doe", "jane_smith", "admin"]
-                statuses = ["Confirmed", "Cancelled", "Completed"]
-                
-                for i in range(1, 11):
-                    booking_date = (datetime.today() - timedelta(days=np.random.randint(0, 10))).strftime("%Y-%m-%d")
-                    booking_time = f"{np.random.randint(8, 20):02d}:00"
-                    duration = np.random.choice([1, 2, 3, 4, 6, 12])
-                    vehicle_type = np.random.choice(["Car", "Motorcycle", "Van", "Truck"])
-                    license_plate = f"ABC{np.random.randint(1000, 9999)}"
-                    parking_type = np.random.choice(["Standard", "Premium", "Disabled"])
-                    payment_method = np.random.choice(["Credit Card", "Debit Card", "Mobile Payment", "Cash"])
-                    total_cost = duration * (10 if parking_type == "Standard" else 15 if parking_type == "Premium" else 8)
-                    status = np.random.choice(statuses, p=[0.5, 0.2, 0.3])
-                    
-                    booking = {
-                        "id": i,
-                        "user": np.random.choice(users),
-                        "date": booking_date,
-                        "time_in": booking_time,
-                        "duration": duration,
-                        "vehicle_type": vehicle_type,
-                        "license_plate": license_plate,
-                        "parking_type": parking_type,
-                        "payment_method": payment_method,
-                        "total_cost": total_cost,
-                        "status": status
-                    }
-                    sample_bookings.append(booking)
-                
-                # Add completed bookings with proper error handling
-                try:
-                    for i in range(11, 16):
-                        # Create completed bookings from 5-15 days ago
-                        days_ago = np.random.randint(5, 16)
-                        booking_date = (datetime.today() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
-                        booking_time = f"{np.random.randint(8, 20):02d}:00"
-                        duration = np.random.choice([1, 2, 3, 4])
-                        vehicle_type = np.random.choice(["Car", "Motorcycle"])
-                        license_plate = f"XYZ{np.random.randint(1000, 9999)}"
-                        parking_type = np.random.choice(["Standard", "Premium"])
-                        payment_method = np.random.choice(["Credit Card", "Mobile Payment"])
-                        total_cost = duration * (10 if parking_type == "Standard" else 15)
-                        
-                        completed_booking = {
-                            "id": i,
-                            "user": np.random.choice(users),
-                            "date": booking_date,
-                            "time_in": booking_time,
-                            "duration": duration,
-                            "vehicle_type": vehicle_type,
-                            "license_plate": license_plate,
-                            "parking_type": parking_type,
-                            "payment_method": payment_method,
-                            "total_cost": total_cost,
-                            "status": "Completed"
-                        }
-                        sample_bookings.append(completed_booking)
-                except Exception as e:
-                    st.error(f"Error creating completed bookings: {str(e)}", icon="❌")
-                    
-                st.session_state.bookings = sample_bookings
-                
-                st.success("Database initialized successfully with sample data!", icon="✅")
+                # Vectorized generator writing straight into the database in bulk
+                stats = generate_dataset(DB_PATH, spaces=int(sample_spaces), users=int(sample_users),
+                                         bookings=int(sample_bookings))
+                reload_after_bulk_load()
+                st.success(f"Database initialized with {stats['spaces']} spaces, {stats['users']} users "
+                           f"and {stats['bookings']} bookings in {stats['seconds']:.1f} s!", icon="✅")
+            except ValueError as e:
+                st.error(str(e), icon="❌")
             except Exception as e:
                 st.error(f"Error initializing database: {str(e)}", icon="❌")
     
     with col2:
+        archive_days = st.number_input("Archive finished bookings older than (days)", min_value=1,
+                                       value=ARCHIVE_AFTER_DAYS)
         if st.button("Clean Database"):
             try:
-                # In a real app, this would perform database cleanup
-                # For our mock app, let's remove old completed and cancelled bookings
-                
-                # Remove bookings older than 30 days
-                thirty_days_ago = datetime.today() - timedelta(days=30)
-                
-                new_bookings = []
-                cleaned_count = 0
-                
-                for booking in st.session_state.bookings:
-                    # Parse the date
-                    booking_date = datetime.strptime(booking['date'], "%Y-%m-%d")
-                    
-                    # Keep booking if it's newer than 30 days or it's still confirmed
-                    if (booking_date >= thirty_days_ago) or (booking['status'] == "Confirmed"):
-                        new_bookings.append(booking)
-                    else:
-                        cleaned_count += 1
-                
-                st.session_state.bookings = new_bookings
-                
-                st.success(f"Database cleaned successfully! Removed {cleaned_count} old bookings.", icon="✅")
+                # Move old completed and cancelled bookings to the archive
+                # tier in small batches; history queries still see them
+                archived_count = archive_old_bookings(int(archive_days))
+                if archived_count:
+                    bump_generation()
+                st.success(f"Database cleaned successfully! Archived {archived_count} old bookings.", icon="✅")
             except Exception as e:
                 st.error(f"Error cleaning database: {str(e)}", icon="❌")
+        stats = get_archive_stats()
+        st.caption(f"{stats['hot']} bookings in the live table, {stats['archived']} archived")
+
+    # Query performance
+    st.markdown("<h2 class='section-header'>Query Performance</h2>", unsafe_allow_html=True)
+    query_report()
 
 # Main app logic
 def main():
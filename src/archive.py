@@ -0,0 +1,255 @@
+"""
+Hot/cold archive for finished bookings.
+
+The ``bookings`` table only ever grows, and every overlap check, history
+query and index maintenance pays for rows that will never change again.
+The archiver moves completed and cancelled bookings that ended more than
+``ARCHIVE_AFTER_DAYS`` ago into ``bookings_archive``, a small batch per
+transaction, so writers are never blocked for long. It can run on demand
+or on a background thread.
+
+Booking IDs stay unique across both tiers (the hot table uses
+AUTOINCREMENT, and bulk loaders number from the highest ID of either), so the history functions here can merge the two with
+UNION ALL and page through them with the same (start_time, id) keyset as
+``database.get_user_bookings_page``.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import database
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_BATCH_SIZE = 500            # stays below SQLite's bound parameter limit
+ARCHIVE_INTERVAL_SECONDS = 3600
+ARCHIVE_BATCH_PAUSE_SECONDS = 0.05  # lets other writers in between batches
+
+FINISHED_STATUSES = ('completed', 'cancelled')
+
+BOOKING_COLUMNS = ('id, user_id, space_id, start_time, end_time, '
+                   'vehicle_plate, vehicle_type, status, created_at, checked_in_at, series_id')
+
+
+def _cutoff(older_than_days: int) -> str:
+    """Timestamp before which finished bookings are archived"""
+    return database.to_db_timestamp(datetime.datetime.now() - datetime.timedelta(days=older_than_days))
+
+
+def archive_batch(older_than_days: int = ARCHIVE_AFTER_DAYS,
+                  batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move one batch of old finished bookings to the archive.
+
+    Args:
+        older_than_days: Only bookings that ended this many days ago move
+        batch_size: Maximum rows moved in this transaction
+
+    Returns:
+        Number of bookings archived
+
+    Raises:
+        sqlite3.IntegrityError: A booking's ID is already in the archive;
+            the batch is rolled back and nothing is lost
+    """
+    cutoff = _cutoff(older_than_days)
+    with database.db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # end_time >= start_time, so the start_time bound lets the seek
+            # on (status, start_time) stop early
+            ids = []
+            for status in FINISHED_STATUSES:
+                ids.extend(row[0] for row in conn.execute('''
+                SELECT id FROM bookings
+                WHERE status = ? AND start_time < ? AND end_time < ?
+                ORDER BY start_time LIMIT ?
+                ''', (status, cutoff, cutoff, batch_size - len(ids))))
+                if len(ids) >= batch_size:
+                    break
+
+            if ids:
+                placeholders = ', '.join('?' * len(ids))
+                conn.execute(f'''
+                INSERT INTO bookings_archive ({BOOKING_COLUMNS})
+                SELECT {BOOKING_COLUMNS} FROM bookings WHERE id IN ({placeholders})
+                ''', ids)
+                conn.execute(f'DELETE FROM bookings WHERE id IN ({placeholders})', ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(ids)
+
+
+def archive_old_bookings(older_than_days: int = ARCHIVE_AFTER_DAYS,
+                         batch_size: int = ARCHIVE_BATCH_SIZE,
+                         pause: float = ARCHIVE_BATCH_PAUSE_SECONDS,
+                         stop_event: Optional[threading.Event] = None) -> int:
+    """
+    Archive every eligible booking, one short transaction per batch.
+
+    Returns:
+        Total number of bookings archived
+    """
+    total = 0
+    while stop_event is None or not stop_event.is_set():
+        moved = archive_batch(older_than_days, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def get_archive_stats() -> Dict:
+    """Row counts of the hot and archive tiers"""
+    with database.db_connection() as conn:
+        hot = conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
+        archived = conn.execute('SELECT COUNT(*) FROM bookings_archive').fetchone()[0]
+    return {'hot': hot, 'archived': archived}
+
+
+# ---- Queries across both tiers ----
+
+def get_booking_any_tier(booking_id: int) -> Optional[Dict]:
+    """Get a booking by ID from the hot table, falling back to the archive"""
+    with database.db_connection() as conn:
+        for table, tier in (('bookings', 'hot'), ('bookings_archive', 'archive')):
+            row = conn.execute(f'''
+            SELECT {BOOKING_COLUMNS}, ? AS tier FROM {table} WHERE id = ?
+            ''', (tier, booking_id)).fetchone()
+            if row:
+                return dict(row)
+    return None
+
+
+def get_user_booking_history(user_id: int, limit: int = database.BOOKING_PAGE_SIZE,
+                             after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+    """
+    Get one page of a user's bookings from both tiers, newest first.
+
+    Each tier is read with its own index seek limited to `limit` rows and
+    the two runs are merged, so a page costs the same however much history
+    has been archived. Rows carry a 'tier' of 'hot' or 'archive'; pass
+    database.booking_cursor() of the last row as `after` for the next page.
+    """
+    keyset = ''
+    params: List = []
+    if after is not None:
+        keyset = 'AND (start_time, id) < (?, ?)'
+        params = [database.to_db_timestamp(after[0]), after[1]]
+
+    tiers = []
+    tier_params: List = []
+    for table, tier in (('bookings', 'hot'), ('bookings_archive', 'archive')):
+        tiers.append(f'''
+        SELECT * FROM (
+            SELECT {BOOKING_COLUMNS}, '{tier}' AS tier FROM {table}
+            WHERE user_id = ? {keyset}
+            ORDER BY start_time DESC, id DESC LIMIT ?
+        )''')
+        tier_params.extend([user_id, *params, limit])
+
+    with database.db_connection() as conn:
+        rows = conn.execute(f'''
+        SELECT h.*, p.space_number, p.location, p.hourly_rate
+        FROM ({' UNION ALL '.join(tiers)}) h
+        JOIN parking_spaces p ON h.space_id = p.id
+        ORDER BY h.start_time DESC, h.id DESC
+        LIMIT ?
+        ''', [*tier_params, limit]).fetchall()
+    return [dict(row) for row in rows]
+
+
+def iter_user_booking_history(user_id: int,
+                              batch_size: int = database.BOOKING_STREAM_BATCH) -> Iterator[Dict]:
+    """Stream a user's bookings from both tiers, newest first"""
+    after = None
+    while True:
+        page = get_user_booking_history(user_id, batch_size, after)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after = database.booking_cursor(page[-1])
+
+
+# ---- Background archiver ----
+
+class BookingArchiver:
+    """Daemon thread that periodically archives old finished bookings"""
+
+    def __init__(self, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                 interval: float = ARCHIVE_INTERVAL_SECONDS,
+                 batch_size: int = ARCHIVE_BATCH_SIZE,
+                 on_archived: Optional[Callable[[int], None]] = None):
+        self.older_than_days = older_than_days
+        self.on_archived = on_archived      # called with the count after a run that moved rows
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_run: Optional[datetime.datetime] = None
+        self.last_archived = 0
+        self.total_archived = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def run_once(self) -> int:
+        """Archive everything currently eligible"""
+        moved = archive_old_bookings(self.older_than_days, self.batch_size, stop_event=self._stop)
+        self.last_run = datetime.datetime.now()
+        self.last_archived = moved
+        self.total_archived += moved
+        if moved and self.on_archived is not None:
+            self.on_archived(moved)
+        return moved
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Booking archive run failed")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Start the background thread (no-op if already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="booking-archiver", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the thread to stop after its current batch and wait for it"""
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+_archiver: Optional[BookingArchiver] = None
+_archiver_lock = threading.Lock()
+
+
+def get_archiver(on_archived: Optional[Callable[[int], None]] = None) -> BookingArchiver:
+    """Return the process-wide archiver (not started)
+
+    on_archived is only used by the call that creates the archiver.
+    """
+    global _archiver
+    if _archiver is None:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = BookingArchiver(on_archived=on_archived)
+    return _archiver
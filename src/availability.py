@@ -0,0 +1,386 @@
+"""
+Time-slot availability engine.
+
+Parking time is divided into fixed slots (15 minutes by default) over a
+rolling horizon starting at the current slot. The engine keeps a NumPy
+matrix with one row per slot and one column per parking space whose cells
+count the active bookings touching that slot. Rows are contiguous, so "which
+spaces are free for the whole window?" is a single vectorized reduction over
+a slice of consecutive rows.
+
+Counts rather than booleans are stored so that cancelling one of two bookings
+sharing a partially used slot leaves the slot occupied. A booking occupies
+every slot it touches, i.e. start is rounded down and end rounded up.
+
+Columns are allocated with spare capacity, so spaces added after the initial
+load take a free column instead of copying the whole matrix.
+
+The engine is built from the ``bookings`` table and kept current through the
+booking and space listeners in ``database``.
+"""
+
+import datetime
+import functools
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import database
+
+SLOT_MINUTES = 15
+DEFAULT_HORIZON_DAYS = 14
+INITIAL_SPACE_CAPACITY = 256    # columns allocated up front; doubled when full
+
+TimeLike = Union[datetime.datetime, str]
+
+
+def _to_datetime64(value: TimeLike) -> np.datetime64:
+    """Convert a datetime or stored timestamp string to datetime64[s]"""
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None)
+        return np.datetime64(value, 's')
+    return np.datetime64(value, 's')
+
+
+class AvailabilityMatrix:
+    """Time-slots x spaces occupancy matrix over a rolling horizon"""
+
+    def __init__(self, origin: Optional[TimeLike] = None,
+                 horizon_days: int = DEFAULT_HORIZON_DAYS,
+                 slot_minutes: int = SLOT_MINUTES):
+        self.slot = np.timedelta64(slot_minutes, 'm')
+        self.slot_minutes = slot_minutes
+        self.n_slots = int(horizon_days * 24 * 60 // slot_minutes)
+        self.origin = self._floor(origin if origin is not None else datetime.datetime.now())
+
+        self._lock = threading.RLock()
+        self._columns: Dict[int, int] = {}
+        self._allocate(0, INITIAL_SPACE_CAPACITY)
+        # booking_id -> (space_id, first_slot, end_slot) in absolute slot numbers
+        self._marks: Dict[int, Tuple[int, int, int]] = {}
+
+    # ---- Slot arithmetic ----
+
+    def _floor(self, value: TimeLike) -> np.datetime64:
+        """Round a time down to a slot boundary"""
+        t = _to_datetime64(value).astype('datetime64[m]')
+        minutes = t.astype(np.int64)
+        return np.datetime64(int(minutes - minutes % self.slot_minutes), 'm')
+
+    def _slot_of(self, value: TimeLike, round_up: bool = False) -> int:
+        """Absolute slot number (relative to the epoch) containing a time"""
+        seconds = _to_datetime64(value).astype(np.int64)
+        size = self.slot_minutes * 60
+        return int(-(-seconds // size) if round_up else seconds // size)
+
+    @property
+    def _origin_slot(self) -> int:
+        return self._slot_of(self.origin)
+
+    @property
+    def horizon_end(self) -> np.datetime64:
+        """First instant past the horizon"""
+        return self.origin + self.n_slots * self.slot
+
+    def _window(self, start: TimeLike, end: TimeLike) -> Tuple[int, int]:
+        """Slot row range [lo, hi) covering [start, end); raises outside the horizon"""
+        lo = self._slot_of(start) - self._origin_slot
+        hi = self._slot_of(end, round_up=True) - self._origin_slot
+        if hi <= lo:
+            raise ValueError("End time must be after start time")
+        if lo < 0 or hi > self.n_slots:
+            raise ValueError("Requested window is outside the availability horizon")
+        return lo, hi
+
+    # ---- Building ----
+
+    def _allocate(self, n_spaces: int, capacity: int) -> None:
+        """Fresh, empty buffers with room for `capacity` columns, `n_spaces` in use"""
+        self._space_buffer = np.zeros(capacity, dtype=np.int64)
+        self._bookable_buffer = np.zeros(capacity, dtype=bool)
+        self._counts_buffer = np.zeros((self.n_slots, capacity), dtype=np.uint16)
+        self._use_columns(n_spaces)
+
+    def _use_columns(self, n_spaces: int) -> None:
+        """Point space_ids, bookable and counts at the first n_spaces columns"""
+        self.space_ids = self._space_buffer[:n_spaces]
+        self.bookable = self._bookable_buffer[:n_spaces]
+        self.counts = self._counts_buffer[:, :n_spaces]
+
+    @property
+    def capacity(self) -> int:
+        """Columns allocated, used or not"""
+        return len(self._space_buffer)
+
+    def _ensure_space(self, space_id: int, bookable: bool) -> int:
+        """Column index of a space, taking the next free column if the space is new"""
+        column = self._columns.get(space_id)
+        if column is None:
+            column = len(self.space_ids)
+            if column == self.capacity:
+                space_ids, bookable_flags, counts = self.space_ids, self.bookable, self.counts
+                self._allocate(column, max(2 * self.capacity, INITIAL_SPACE_CAPACITY))
+                self.space_ids[:] = space_ids
+                self.bookable[:] = bookable_flags
+                self.counts[:] = counts
+            self._use_columns(column + 1)
+            self._columns[space_id] = column
+            self.space_ids[column] = space_id
+            self.bookable[column] = bookable
+        return column
+
+    def _apply_marks(self, columns: np.ndarray, first: np.ndarray, last: np.ndarray, delta: int) -> None:
+        """Add `delta` to counts[first:last, column] for many intervals at once"""
+        base = self._origin_slot
+        lo = np.clip(first - base, 0, self.n_slots)
+        hi = np.clip(last - base, 0, self.n_slots)
+        keep = hi > lo
+        columns, lo, hi = columns[keep], lo[keep], hi[keep]
+        if len(columns) <= 64:
+            # A handful of intervals (the incremental case): plain slices
+            for column, a, b in zip(columns, lo, hi):
+                if delta > 0:
+                    self.counts[a:b, column] += delta
+                else:
+                    self.counts[a:b, column] -= -delta
+            return
+        # Difference array over the touched columns: +delta at the first slot,
+        # -delta past the last, then a running sum down the slots
+        touched, local = np.unique(columns, return_inverse=True)
+        diff = np.zeros((self.n_slots + 1, len(touched)), dtype=np.int32)
+        np.add.at(diff, (lo, local), delta)
+        np.add.at(diff, (hi, local), -delta)
+        updated = self.counts[:, touched].astype(np.int32) + np.cumsum(diff[:-1], axis=0)
+        self.counts[:, touched] = updated.astype(self.counts.dtype)
+
+    def load(self, spaces: Iterable[Dict], bookings: Iterable[Dict]) -> None:
+        """Rebuild the matrix from space rows (id, status) and active booking rows"""
+        spaces = list(spaces)
+        bookings = list(bookings)
+        with self._lock:
+            self._allocate(len(spaces), max(INITIAL_SPACE_CAPACITY, len(spaces)))
+            self.space_ids[:] = [s['id'] for s in spaces]
+            self.bookable[:] = [s['status'] == 'active' for s in spaces]
+            self._columns = {int(space_id): i for i, space_id in enumerate(self.space_ids)}
+            self._marks = {}
+
+            bookings = [b for b in bookings if b['space_id'] in self._columns]
+            if not bookings:
+                return
+            size = self.slot_minutes * 60
+            starts = np.array([b['start_time'] for b in bookings], dtype='datetime64[s]').astype(np.int64)
+            ends = np.array([b['end_time'] for b in bookings], dtype='datetime64[s]').astype(np.int64)
+            first = starts // size
+            last = -(-ends // size)
+            columns = np.array([self._columns[b['space_id']] for b in bookings], dtype=np.int64)
+            self._apply_marks(columns, first, last, 1)
+            self._marks = {
+                b['id']: (b['space_id'], int(f), int(l))
+                for b, f, l in zip(bookings, first, last)
+            }
+
+    def advance(self, now: Optional[TimeLike] = None) -> int:
+        """
+        Roll the horizon forward so it starts at the slot containing `now`.
+
+        Returns the number of slots shifted. Newly exposed slots at the end of
+        the horizon are filled from the bookings already tracked.
+        """
+        new_origin = self._floor(now if now is not None else datetime.datetime.now())
+        with self._lock:
+            shift = int((new_origin - self.origin) // self.slot)
+            if shift <= 0:
+                return 0
+            old_end_slot = self._origin_slot + self.n_slots
+            self.origin = new_origin
+            if shift >= self.n_slots:
+                self.counts[:] = 0
+                exposed_from = self._origin_slot
+            else:
+                self.counts[:-shift] = self.counts[shift:]
+                self.counts[-shift:] = 0
+                exposed_from = old_end_slot
+
+            # Forget bookings that ended before the new origin
+            origin_slot = self._origin_slot
+            self._marks = {k: v for k, v in self._marks.items() if v[2] > origin_slot}
+            if self._marks:
+                marks = np.array([(self._columns[s], f, l) for s, f, l in self._marks.values()], dtype=np.int64)
+                self._apply_marks(marks[:, 0], np.maximum(marks[:, 1], exposed_from), marks[:, 2], 1)
+            return shift
+
+    # ---- Incremental updates ----
+
+    def add_booking(self, booking_id: int, space_id: int, start: TimeLike, end: TimeLike) -> None:
+        """Mark the slots of an active booking as occupied"""
+        with self._lock:
+            self.remove_booking(booking_id)
+            # A space the matrix has not seen stays unbookable until its
+            # status arrives through the space listener
+            column = self._ensure_space(space_id, bookable=False)
+            first, last = self._slot_of(start), self._slot_of(end, round_up=True)
+            self._apply_marks(np.array([column]), np.array([first]), np.array([last]), 1)
+            self._marks[booking_id] = (space_id, first, last)
+
+    def remove_booking(self, booking_id: int) -> bool:
+        """Release the slots held by a booking"""
+        with self._lock:
+            mark = self._marks.pop(booking_id, None)
+            if mark is None:
+                return False
+            space_id, first, last = mark
+            column = self._columns[space_id]
+            self._apply_marks(np.array([column]), np.array([first]), np.array([last]), -1)
+            return True
+
+    def set_space_status(self, space_id: int, status: Optional[str]) -> None:
+        """Update whether a space can be booked at all (only 'active' spaces can; None: deleted)"""
+        with self._lock:
+            column = self._ensure_space(space_id, bookable=False)
+            self.bookable[column] = status == 'active'
+
+    def handle_booking_event(self, event: str, booking: Dict) -> None:
+        """Booking listener keeping the matrix in sync with database writes"""
+        if event == 'deleted' or booking.get('status') != 'active':
+            self.remove_booking(booking['id'])
+        else:
+            self.add_booking(booking['id'], booking['space_id'], booking['start_time'], booking['end_time'])
+
+    # ---- Queries ----
+
+    def free_mask(self, start: TimeLike, end: TimeLike) -> np.ndarray:
+        """Boolean mask over space_ids: bookable and unbooked for all of [start, end)"""
+        lo, hi = self._window(start, end)
+        with self._lock:
+            return self.bookable & (self.counts[lo:hi].max(axis=0) == 0)
+
+    def free_spaces(self, start: TimeLike, end: TimeLike) -> np.ndarray:
+        """IDs of spaces free for the whole window [start, end)"""
+        with self._lock:
+            return self.space_ids[self.free_mask(start, end)]
+
+    def is_free(self, space_id: int, start: TimeLike, end: TimeLike) -> bool:
+        """Whether one space is free for the whole window [start, end)"""
+        lo, hi = self._window(start, end)
+        with self._lock:
+            column = self._columns.get(space_id)
+            if column is None:
+                return False
+            return bool(self.bookable[column] and not self.counts[lo:hi, column].any())
+
+    def free_mask_windows(self, windows: Sequence[Tuple[TimeLike, TimeLike]]) -> np.ndarray:
+        """
+        Boolean mask over space_ids: bookable and unbooked in every window.
+
+        All windows are checked in one reduction over the union of their
+        slots. Windows (or parts of them) outside the horizon are not checked.
+        """
+        base = self._origin_slot
+        with self._lock:
+            if not len(windows):
+                return self.bookable.copy()
+            first = np.array([self._slot_of(start) for start, _ in windows]) - base
+            last = np.array([self._slot_of(end, round_up=True) for _, end in windows]) - base
+            # Difference array marking the slots any window touches
+            diff = np.zeros(self.n_slots + 1, dtype=np.int32)
+            np.add.at(diff, np.clip(first, 0, self.n_slots), 1)
+            np.add.at(diff, np.clip(last, 0, self.n_slots), -1)
+            rows = np.cumsum(diff[:-1]) > 0
+            if not rows.any():
+                return self.bookable.copy()
+            return self.bookable & (self.counts[rows].max(axis=0) == 0)
+
+    def free_counts(self, start: TimeLike, end: TimeLike) -> np.ndarray:
+        """Number of free bookable spaces in each slot of [start, end)"""
+        lo, hi = self._window(start, end)
+        with self._lock:
+            return (self.counts[lo:hi][:, self.bookable] == 0).sum(axis=1)
+
+    def gap_lengths(self, start: TimeLike, end: TimeLike, max_slots: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Free slots immediately before and after [start, end) for every space.
+
+        Counts stop at the first occupied slot and are capped at `max_slots`.
+        The start of the horizon (the present) counts as occupied, the end of
+        the horizon as free.
+        """
+        lo, hi = self._window(start, end)
+        with self._lock:
+            before = self.counts[max(lo - max_slots, 0):lo][::-1] > 0
+            after = self.counts[hi:hi + max_slots] > 0
+
+        def run_length(occupied: np.ndarray, limit: int, edge_occupied: bool) -> np.ndarray:
+            n_spaces = len(self.space_ids)
+            if occupied.shape[0] == 0:
+                return np.zeros(n_spaces, dtype=np.int64) if edge_occupied else np.full(n_spaces, limit)
+            hit = occupied.any(axis=0)
+            first = occupied.argmax(axis=0)
+            edge = occupied.shape[0] if edge_occupied and occupied.shape[0] < limit else limit
+            return np.where(hit, first, edge)
+
+        return run_length(before, max_slots, True), run_length(after, max_slots, False)
+
+
+def sync_space_statuses(matrix: AvailabilityMatrix, space_ids: Optional[Sequence[int]] = None) -> None:
+    """Copy the status of some spaces (all if None) from the database into a matrix"""
+    with database.db_connection() as conn:
+        if space_ids is None:
+            rows = conn.execute('SELECT id, status FROM parking_spaces').fetchall()
+        else:
+            placeholders = ', '.join('?' * len(space_ids))
+            rows = conn.execute(f'SELECT id, status FROM parking_spaces WHERE id IN ({placeholders})',
+                                list(space_ids)).fetchall()
+    statuses = {row['id']: row['status'] for row in rows}
+    # Deleted spaces (asked for but gone) become unbookable
+    for space_id in statuses if space_ids is None else space_ids:
+        matrix.set_space_status(space_id, statuses.get(space_id))
+
+
+def _on_space_change(matrix: AvailabilityMatrix, event: str, space: Dict) -> None:
+    """Space listener: reread the status of the changed space, or of all after a bulk insert"""
+    space_id = space.get('id')
+    sync_space_statuses(matrix, None if space_id is None else [space_id])
+
+
+def load_from_db(matrix: AvailabilityMatrix) -> AvailabilityMatrix:
+    """Fill a matrix with the spaces and relevant active bookings in the database"""
+    # Bookings past the horizon are tracked too, so advance() can fill the
+    # slots it exposes without going back to the database
+    origin = str(matrix.origin.astype('datetime64[s]')).replace('T', ' ')
+    with database.db_connection() as conn:
+        spaces = conn.execute('SELECT id, status FROM parking_spaces ORDER BY id').fetchall()
+        bookings = conn.execute('''
+        SELECT id, space_id, start_time, end_time FROM bookings
+        WHERE status = 'active' AND end_time > ?
+        ''', (origin,)).fetchall()
+    matrix.load(spaces, bookings)
+    return matrix
+
+
+_engine: Optional[AvailabilityMatrix] = None
+_engine_lock = threading.Lock()
+
+
+def get_availability_engine() -> AvailabilityMatrix:
+    """Return the process-wide availability matrix, rolled forward to now"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = AvailabilityMatrix()
+                database.add_booking_listener(engine.handle_booking_event)
+                database.add_space_listener(functools.partial(_on_space_change, engine))
+                with engine._lock:
+                    load_from_db(engine)
+                _engine = engine
+    _engine.advance()
+    return _engine
+
+
+def reload_availability_engine() -> None:
+    """Rebuild the process-wide matrix after writes that bypassed the listeners"""
+    if _engine is not None:
+        with _engine._lock:
+            load_from_db(_engine)
@@ -0,0 +1,263 @@
+"""
+Parking fee engine.
+
+A fee is the hourly rate of the vehicle type (times a multiplier on premium
+spaces) for the parked time rounded up to the billing increment, reduced
+for long stays and then by any discount::
+
+    engine = PricingEngine()
+    engine.price("suv", timedelta(hours=13), is_premium=True, discount=0.1)
+    engine.price_batch(types, durations, premium, discounts)   # NumPy arrays
+
+Stays with a start and end are quoted through the time-of-day tariffs
+(src/tariffs.py): the charged window is weighted by the multipliers in force
+and priced at a space's off-peak rate, then the same long-stay tiers and
+discounts apply::
+
+    engine.quote("A", start, end, hourly_rate=2.0)
+    engine.quote_batch(sections, starts, ends, hourly_rates)
+
+:meth:`PricingEngine.price_batch` prices whole arrays of sessions (e.g. a
+monthly billing run) in a few vectorized operations. It performs the same
+float64 operations in the same order as :meth:`PricingEngine.price`, so both
+paths return identical amounts.
+"""
+
+import datetime
+import math
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from tariffs import Tariff, TariffTable, get_tariffs
+
+# Base hourly rates by vehicle type
+HOURLY_RATES: Dict[str, float] = {
+    "motorcycle": 2.0,
+    "car": 5.0,
+    "suv": 7.0,
+    "truck": 10.0,
+}
+DEFAULT_VEHICLE_TYPE = "car"
+PREMIUM_MULTIPLIER = 1.5
+BILLING_INCREMENT_SECONDS = 3600        # parked time is charged in whole hours
+
+# (charged hours above which it applies, fee multiplier), longest stays first
+DURATION_DISCOUNTS: Tuple[Tuple[float, float], ...] = (
+    (24, 0.8),      # 20% off for more than 24 hours
+    (12, 0.9),      # 10% off for more than 12 hours
+)
+
+# Fraction taken off by each discount code
+DISCOUNT_CODES: Dict[str, float] = {
+    "NEWUSER": 0.20,
+    "WEEKEND": 0.15,
+    "LOYALTY": 0.10,
+}
+
+DurationLike = Union[datetime.timedelta, float, int]
+
+
+def _seconds(duration: DurationLike) -> float:
+    if isinstance(duration, datetime.timedelta):
+        return duration.total_seconds()
+    return float(duration)
+
+
+class PricingEngine:
+    """Prices parking sessions one at a time or as arrays"""
+
+    def __init__(self, hourly_rates: Optional[Dict[str, float]] = None,
+                 default_vehicle_type: str = DEFAULT_VEHICLE_TYPE,
+                 premium_multiplier: float = PREMIUM_MULTIPLIER,
+                 billing_increment: int = BILLING_INCREMENT_SECONDS,
+                 duration_discounts: Sequence[Tuple[float, float]] = DURATION_DISCOUNTS,
+                 tariffs: Optional[TariffTable] = None):
+        self.hourly_rates = {k.lower(): float(v) for k, v in (hourly_rates or HOURLY_RATES).items()}
+        if default_vehicle_type.lower() not in self.hourly_rates:
+            raise ValueError(f"No hourly rate for the default vehicle type {default_vehicle_type!r}")
+        if billing_increment <= 0:
+            raise ValueError("Billing increment must be positive")
+        self.default_vehicle_type = default_vehicle_type.lower()
+        self.premium_multiplier = float(premium_multiplier)
+        self.billing_increment = billing_increment
+        self.duration_discounts = tuple(sorted(duration_discounts, reverse=True))
+        self._tariffs = tariffs             # None: the tariff file, reloaded when it changes
+
+    @property
+    def tariffs(self) -> TariffTable:
+        return self._tariffs if self._tariffs is not None else get_tariffs()
+
+    def tariff(self, section: Optional[str]) -> Tariff:
+        """The tariff stays in a section are quoted with"""
+        return self.tariffs.tariff(section)
+
+    def hourly_rate(self, vehicle_type: Optional[str]) -> float:
+        """Rate for a vehicle type; unknown types pay the default type's rate"""
+        return self.hourly_rates.get((vehicle_type or "").lower(), self.hourly_rates[self.default_vehicle_type])
+
+    # ---- Scalar ----
+
+    def charged_hours(self, duration: DurationLike) -> float:
+        """Hours billed for a duration, rounded up to the billing increment"""
+        return math.ceil(_seconds(duration) / self.billing_increment) * self.billing_increment / 3600
+
+    def price(self, vehicle_type: str, duration: DurationLike, is_premium: bool = False,
+              discount: float = 0.0) -> float:
+        """
+        Fee for one parking session.
+
+        Args:
+            vehicle_type: Type of vehicle (car, motorcycle, suv, truck, ...)
+            duration: Parked time as a timedelta or seconds
+            is_premium: Whether a premium space is used
+            discount: Fraction taken off the fee (e.g. 0.1 for 10%)
+
+        Returns:
+            The fee
+        """
+        rate = self.hourly_rate(vehicle_type)
+        if is_premium:
+            rate = rate * self.premium_multiplier
+        hours = self.charged_hours(duration)
+        return self._adjust(hours, hours * rate, discount)
+
+    def quote(self, section: Optional[str], start: datetime.datetime, end: datetime.datetime,
+              hourly_rate: Optional[float] = None, vehicle_type: Optional[str] = None,
+              is_premium: bool = False, discount: float = 0.0) -> float:
+        """
+        Fee for a stay, priced through the section's time-of-day tariff.
+
+        Args:
+            section: Section of the space (None or unknown: the default tariff)
+            start: Start of the stay
+            end: End of the stay
+            hourly_rate: The space's off-peak rate (default: the vehicle type's rate)
+            vehicle_type: Type of vehicle, used when no hourly_rate is given
+            is_premium: Whether a premium space is used
+            discount: Fraction taken off the fee
+
+        Returns:
+            The fee
+        """
+        rate = self.hourly_rate(vehicle_type) if hourly_rate is None else float(hourly_rate)
+        if is_premium:
+            rate = rate * self.premium_multiplier
+        # The rounded-up window is weighted by the multipliers in force
+        hours = self.charged_hours(max(end - start, datetime.timedelta(0)))
+        weighted = self.tariffs.weighted_hours(section, start, start + datetime.timedelta(hours=hours))
+        return self._adjust(hours, weighted * rate, discount)
+
+    def _adjust(self, hours: float, amount: float, discount: float) -> float:
+        """Long-stay tier for the charged hours, then the discount"""
+        for threshold, factor in self.duration_discounts:
+            if hours > threshold:
+                amount = amount * factor
+                break
+        if discount:
+            amount = amount - amount * discount
+        return amount
+
+    # ---- Batch ----
+
+    def hourly_rates_for(self, vehicle_types: Sequence[str]) -> np.ndarray:
+        """Rate per element of an array of vehicle types, resolving each distinct type once"""
+        types = np.asarray(vehicle_types)
+        if types.size == 0:
+            return np.zeros(0)
+        distinct, inverse = np.unique(types, return_inverse=True)
+        return np.array([self.hourly_rate(str(t)) for t in distinct], dtype=np.float64)[inverse]
+
+    def price_batch(self, vehicle_types: Sequence[str], durations,
+                    premium: Optional[Sequence[bool]] = None,
+                    discounts: Optional[Sequence[float]] = None) -> np.ndarray:
+        """
+        Fees for many sessions at once; identical to calling price() per row.
+
+        Args:
+            vehicle_types: Vehicle type per session
+            durations: Parked time per session as seconds or timedelta64
+            premium: Whether each session used a premium space (none if omitted)
+            discounts: Fraction taken off each fee (none if omitted)
+
+        Returns:
+            float64 array of fees
+        """
+        durations = np.asarray(durations)
+        if np.issubdtype(durations.dtype, np.timedelta64):
+            seconds = durations / np.timedelta64(1, 's')
+        else:
+            seconds = durations.astype(np.float64)
+        rates = self.hourly_rates_for(vehicle_types)
+        if len(rates) != len(seconds):
+            raise ValueError("vehicle_types and durations must have the same length")
+        if premium is not None:
+            rates = np.where(np.asarray(premium, dtype=bool), rates * self.premium_multiplier, rates)
+
+        hours = self._charged_hours_batch(seconds)
+        return self._adjust_batch(hours, hours * rates, discounts)
+
+    def quote_batch(self, sections: Sequence[Optional[str]], starts, ends,
+                    hourly_rates: Optional[Sequence[float]] = None,
+                    vehicle_types: Optional[Sequence[str]] = None,
+                    premium: Optional[Sequence[bool]] = None,
+                    discounts: Optional[Sequence[float]] = None) -> np.ndarray:
+        """
+        Fees for many stays at once, as quote() per row.
+
+        Args:
+            sections: Section per stay
+            starts: Start per stay as datetime64
+            ends: End per stay as datetime64
+            hourly_rates: Off-peak rate per stay (default: the vehicle type rates)
+            vehicle_types: Vehicle type per stay, used when no hourly_rates are given
+            premium: Whether each stay used a premium space (none if omitted)
+            discounts: Fraction taken off each fee (none if omitted)
+
+        Returns:
+            float64 array of fees
+        """
+        starts = np.asarray(starts, dtype="datetime64[s]")
+        ends = np.asarray(ends, dtype="datetime64[s]")
+        if hourly_rates is not None:
+            rates = np.asarray(hourly_rates, dtype=np.float64)
+        else:
+            rates = self.hourly_rates_for(vehicle_types if vehicle_types is not None else [""] * len(starts))
+        if not (len(rates) == len(starts) == len(ends) == len(sections)):
+            raise ValueError("sections, starts, ends and rates must have the same length")
+        if premium is not None:
+            rates = np.where(np.asarray(premium, dtype=bool), rates * self.premium_multiplier, rates)
+
+        seconds = np.maximum((ends - starts) / np.timedelta64(1, "s"), 0.0)
+        hours = self._charged_hours_batch(seconds)
+        charged_ends = starts + np.round(hours * 3600).astype("timedelta64[s]")
+        weighted = self.tariffs.weighted_hours_batch(sections, starts, charged_ends)
+        return self._adjust_batch(hours, weighted * rates, discounts)
+
+    def _charged_hours_batch(self, seconds: np.ndarray) -> np.ndarray:
+        return np.ceil(seconds / self.billing_increment) * self.billing_increment / 3600
+
+    def _adjust_batch(self, hours: np.ndarray, amount: np.ndarray,
+                      discounts: Optional[Sequence[float]]) -> np.ndarray:
+        """_adjust() over arrays"""
+        if self.duration_discounts:
+            factor = np.select([hours > threshold for threshold, _ in self.duration_discounts],
+                               [factor for _, factor in self.duration_discounts], 1.0)
+            amount = np.where(factor != 1.0, amount * factor, amount)
+        if discounts is not None:
+            discounts = np.asarray(discounts, dtype=np.float64)
+            amount = np.where(discounts != 0, amount - amount * discounts, amount)
+        return amount
+
+
+def discount_rate(code: Optional[str]) -> float:
+    """Fraction taken off by a discount code (0 for unknown codes)"""
+    return DISCOUNT_CODES.get((code or "").upper(), 0.0)
+
+
+_default_engine = PricingEngine()
+
+
+def get_pricing_engine() -> PricingEngine:
+    """The engine with the standard rates"""
+    return _default_engine
@@ -0,0 +1,120 @@
+"""
+Shared query cache for the Streamlit apps.
+
+Streamlit reruns the whole script on every widget interaction, so without a
+cache every session re-reads the parking tables on every click. Queries
+wrapped with :func:`cached_query` are cached process-wide with
+``st.cache_data`` and keyed by a global *generation* number kept in
+``st.cache_resource``. Every write bumps the generation, after which the
+first rerun in any session performs one fresh read that all other sessions
+then share. The TTL only bounds staleness from writes made by other
+processes.
+"""
+
+import functools
+import sqlite3
+import threading
+from typing import Any, Callable, Dict
+
+import streamlit as st
+
+import archive
+import database
+import timeline
+
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1000
+
+
+class GenerationCounter:
+    """Monotonic counter identifying the current version of the data"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def bump(self) -> int:
+        with self._lock:
+            self.value += 1
+            return self.value
+
+
+@st.cache_resource
+def _generation_counter() -> GenerationCounter:
+    """The process-wide counter, shared by every session"""
+    return GenerationCounter()
+
+
+def get_generation() -> int:
+    """Current data generation"""
+    return _generation_counter().value
+
+
+def bump_generation() -> int:
+    """Invalidate every cached query; call after committing a write"""
+    return _generation_counter().bump()
+
+
+def _on_booking_change(event: str, booking: Dict) -> None:
+    """Booking listener: any booking write invalidates the cache"""
+    bump_generation()
+
+
+def _on_space_change(event: str, space: Dict) -> None:
+    """Space listener: any parking space write invalidates the cache"""
+    bump_generation()
+
+
+database.add_booking_listener(_on_booking_change)
+database.add_space_listener(_on_space_change)
+
+
+# ---- Cached calls ----
+
+_queries: Dict[str, Callable] = {}
+
+
+def _to_plain(value: Any) -> Any:
+    """Convert sqlite3.Row results to dicts so st.cache_data can pickle them"""
+    if isinstance(value, sqlite3.Row):
+        return dict(value)
+    if isinstance(value, list):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_call(generation: int, name: str, args: tuple, kwargs: tuple) -> Any:
+    """Run a registered query; cached per (generation, query, arguments)"""
+    return _to_plain(_queries[name](*args, **dict(kwargs)))
+
+
+def cached_query(func: Callable) -> Callable:
+    """
+    Decorator caching a read-only query until the next write.
+
+    Arguments must be hashable by ``st.cache_data`` (ints, strings, ...);
+    sqlite3.Row results are returned as dicts.
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+    _queries[name] = func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _cached_call(get_generation(), name, args, tuple(sorted(kwargs.items())))
+
+    wrapper.uncached = func
+    return wrapper
+
+
+# Cached versions of the database reads the pages issue on every rerun
+get_all_parking_spaces = cached_query(database.get_all_parking_spaces)
+get_available_parking_spaces = cached_query(database.get_available_parking_spaces)
+get_user_bookings = cached_query(database.get_user_bookings)
+get_user_bookings_page = cached_query(database.get_user_bookings_page)
+get_bookings_page = cached_query(database.get_bookings_page)
+get_booking_counts = cached_query(database.get_booking_counts)
+get_archive_stats = cached_query(archive.get_archive_stats)
+
+# One occupancy timeline per (date, generation); hours are read from it
+get_occupancy_timeline = cached_query(timeline.compute_timeline)
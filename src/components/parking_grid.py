@@ -7,53 +7,27 @@ import os
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database import get_all_parking_spaces, update_parking_space_status
+from database import DB_PATH, update_parking_space_status
+from cache import get_all_parking_spaces
 from utils import format_time, get_status_color, calculate_price
+from components.space_grid import GRID_GAP, grid_cell, space_grid
+from space_index import find_space_ids, get_space_index, space_state
 
-def create_parking_grid(num_rows=5, num_cols=6):
+# Filter form feature labels -> space index filters
+FEATURE_FILTERS = {"EV Charging": "ev", "Handicap Accessible": "accessible"}
+
+def create_parking_grid(num_rows=5, num_cols=6, filters=None):
     """
     Creates a grid visualization of parking spaces
     
     Args:
-        num_rows (int): Number of rows in the parking grid
+        num_rows (int): Number of rows visible before the grid scrolls
         num_cols (int): Number of columns in the parking grid
+        filters (dict, optional): Filters returned by filter_parking_spaces
         
     Returns:
         None: Displays the grid in the Streamlit app
     """
-    st.markdown("""
-    <style>
-        .parking-spot {
-            width: 100%;
-            height: 100px;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            border-radius: 0.5rem;
-            box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1), 0 1px 2px 0 rgba(0, 0, 0, 0.06);
-            margin: 0.25rem;
-            cursor: pointer;
-            text-align: center;
-            font-weight: bold;
-        }
-        .available {
-            background-color: #10B981;
-            color: white;
-        }
-        .occupied {
-            background-color: #EF4444;
-            color: white;
-        }
-        .reserved {
-            background-color: #F59E0B;
-            color: white;
-        }
-        .selected {
-            border: 3px solid #3B82F6;
-        }
-    </style>
-    """, unsafe_allow_html=True)
-    
     st.markdown("## Parking Space Availability")
     st.markdown("### Click on an available space to select it for booking")
     
@@ -63,70 +37,35 @@ def create_parking_grid(num_rows=5, num_cols=6):
     except:
         # If database not set up yet, use dummy data
         parking_spaces = [
-            {"id": i, "status": np.random.choice(["available", "occupied", "reserved"], p=[0.6, 0.3, 0.1]), 
-             "price_per_hour": 2.0 + (i % 3), "location": f"Zone {(i // 10) + 1}", "size": "Standard"} 
+            {"id": i, "status": np.random.choice(["active", "maintenance"], p=[0.9, 0.1]),
+             "is_available": bool(np.random.random() < 0.6),
+             "hourly_rate": 2.0 + (i % 3), "location": f"Zone {(i // 10) + 1}", "size": "Standard"} 
             for i in range(num_rows * num_cols)
         ]
     
-    # Create the grid
-    for row in range(num_rows):
-        cols = st.columns(num_cols)
-        for col in range(num_cols):
-            index = row * num_cols + col
-            if index < len(parking_spaces):
-                space = parking_spaces[index]
-                status = space.get("status", "available")
-                space_id = space.get("id", index)
-                
-                # Determine the color based on status
-                color_class = "available" if status == "available" else "occupied" if status == "occupied" else "reserved"
-                
-                # Create the parking spot
-                with cols[col]:
-                    spot_html = f"""
-                    <div id="spot-{space_id}" class="parking-spot {color_class}" 
-                         onclick="handleSpotClick({space_id}, '{status}')">
-                        <div>
-                            <div>Spot {space_id}</div>
-                            <div>{space.get('location', 'Zone A')}</div>
-                            <div>${space.get('price_per_hour', 2.00)}/hr</div>
-                        </div>
-                    </div>
-                    """
-                    st.markdown(spot_html, unsafe_allow_html=True)
-                    
-                    # Add JavaScript for interactivity
-                    if status == "available":
-                        if st.button(f"Book #{space_id}", key=f"book_{space_id}"):
-                            st.session_state.selected_space = space_id
-                            st.session_state.selected_space_details = space
-                            st.rerun()
-
-    # JavaScript to handle spot selection
-    st.markdown("""
-    <script>
-        function handleSpotClick(spotId, status) {
-            if (status === "available") {
-                // Communicate with Streamlit
-                const selection = {
-                    spot_id: spotId,
-                    selected: true
-                };
-                window.parent.postMessage({
-                    type: "streamlit:setComponentValue",
-                    value: selection
-                }, "*");
-                
-                // Visual feedback
-                document.querySelectorAll(".parking-spot").forEach(spot => {
-                    spot.classList.remove("selected");
-                });
-                document.getElementById(`spot-${spotId}`).classList.add("selected");
-            }
-        }
-    </script>
-    """, unsafe_allow_html=True)
+    if filters:
+        matching = set(apply_space_filters(filters).tolist())
+        parking_spaces = [space for space in parking_spaces if space.get("id") in matching]
     
+    # Render the whole lot as one virtualized grid
+    cells = []
+    for index, space in enumerate(parking_spaces):
+        cells.append(grid_cell(
+            space.get("id", index),
+            f"Spot {space.get('id', index)}",
+            space_state(space),
+            f"{space.get('location', 'Zone A')} · ${space.get('hourly_rate', 2.00)}/hr"
+        ))
+
+    selected = space_grid(cells, key="parking_grid", columns=num_cols,
+                          height=num_rows * (100 + GRID_GAP) + GRID_GAP, cell_height=100)
+    if selected is not None and selected != st.session_state.get("selected_space"):
+        st.session_state.selected_space = selected
+        st.session_state.selected_space_details = next(
+            (space for space in parking_spaces if space.get("id") == selected), None
+        )
+        st.rerun()
+
     return
 
 def update_grid_status():
@@ -177,8 +116,9 @@ def display_parking_details(space_id):
         # Dummy data if database not set up
         space = {
             "id": space_id,
-            "status": "available",
-            "price_per_hour": 2.5,
+            "status": "active",
+            "is_available": True,
+            "hourly_rate": 2.5,
             "location": f"Zone {(space_id // 10) + 1}",
             "size": "Standard",
             "features": ["Security Camera", "Covered"]
@@ -189,8 +129,8 @@ def display_parking_details(space_id):
         <div class="p-4 bg-white rounded-lg shadow-md">
             <h3 class="text-xl font-bold">Parking Space #{space_id}</h3>
             <p><strong>Location:</strong> {space.get('location', 'Unknown')}</p>
-            <p><strong>Status:</strong> {space.get('status', 'Unknown')}</p>
-            <p><strong>Price:</strong> ${space.get('price_per_hour', 0.0)}/hour</p>
+            <p><strong>Status:</strong> {space_state(space).capitalize()}</p>
+            <p><strong>Price:</strong> ${space.get('hourly_rate', 0.0)}/hour</p>
             <p><strong>Size:</strong> {space.get('size', 'Standard')}</p>
             <p><strong>Features:</strong> {', '.join(space.get('features', ['None']))}</p>
         </div>
@@ -213,16 +153,21 @@ def filter_parking_spaces(location=None, status=None, price_range=None, features
     """
     st.markdown("### Filter Parking Spaces")
     
+    try:
+        locations = get_space_index(DB_PATH).values("location")
+    except Exception:
+        locations = []
+    
     with st.form(key="filter_form"):
         col1, col2 = st.columns(2)
         
         with col1:
-            location_filter = st.selectbox("Location", ["All", "Zone 1", "Zone 2", "Zone 3"], index=0)
-            status_filter = st.selectbox("Status", ["All", "Available", "Occupied", "Reserved"], index=0)
+            location_filter = st.selectbox("Location", ["All"] + locations, index=0)
+            status_filter = st.selectbox("Status", ["All", "Available", "Occupied", "Reserved", "Maintenance"], index=0)
         
         with col2:
             price_range = st.slider("Price Range ($ per hour)", 1.0, 10.0, (1.0, 10.0), step=0.5)
-            features_filter = st.multiselect("Features", ["Security Camera", "Covered", "Near Entrance", "EV Charging", "Handicap Accessible"])
+            features_filter = st.multiselect("Features", list(FEATURE_FILTERS))
         
         submit_button = st.form_submit_button(label="Apply Filters")
     
@@ -237,3 +182,22 @@ def filter_parking_spaces(location=None, status=None, price_range=None, features
     
     return None
 
+def apply_space_filters(filters):
+    """
+    Resolves filters from filter_parking_spaces against the space index
+    
+    Args:
+        filters (dict): Filters with location, status, price_range and features
+        
+    Returns:
+        numpy.ndarray: Sorted IDs of the matching parking spaces
+    """
+    criteria = {
+        "location": filters.get("location"),
+        "state": filters.get("status"),
+        "price_range": filters.get("price_range"),
+    }
+    for feature in filters.get("features") or []:
+        if feature in FEATURE_FILTERS:
+            criteria[FEATURE_FILTERS[feature]] = True
+    return find_space_ids(DB_PATH, **criteria)
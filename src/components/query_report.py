@@ -0,0 +1,51 @@
+import streamlit as st
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from query_trace import get_query_tracer
+
+def query_report(limit=25):
+    """
+    Displays per-query timings and the slow-query log of this process
+
+    Args:
+        limit (int): Number of query shapes to list, by total time
+
+    Returns:
+        None: Displays the report in the Streamlit app
+    """
+    tracer = get_query_tracer()
+    stats = tracer.stats()
+
+    if not stats:
+        st.info("No queries recorded yet.")
+    else:
+        scans = [row for row in stats if row["full_scan"]]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Query Shapes", len(stats))
+        col2.metric("Statements", sum(row["count"] for row in stats))
+        col3.metric("Full-Scan Shapes", len(scans))
+
+        df = pd.DataFrame(stats[:limit])[
+            ["shape", "count", "total_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "full_scan"]
+        ]
+        st.dataframe(df.round(3), use_container_width=True)
+
+        for row in scans:
+            with st.expander(f"Full scan: {row['shape'][:100]}"):
+                st.code("\n".join(row["plan"]), language="text")
+
+    slow = tracer.slow_queries()
+    st.markdown(f"**Slow queries** (over {tracer.slow_threshold_ms:.0f} ms): {len(slow)}")
+    for entry in slow[:limit]:
+        label = f"{entry['time']} · {entry['elapsed_ms']:.1f} ms · {entry['shape'][:80]}"
+        with st.expander(label):
+            st.code(entry["shape"], language="sql")
+            st.code("\n".join(entry["plan"]) or "No plan captured", language="text")
+
+    if st.button("Reset Query Statistics"):
+        tracer.reset()
+        st.experimental_rerun()
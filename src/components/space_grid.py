@@ -0,0 +1,102 @@
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "space_grid_frontend")
+_space_grid = components.declare_component("space_grid", path=_FRONTEND_DIR)
+
+GRID_GAP = 6
+
+DEFAULT_STATUS_COLORS = {
+    "available": "#10B981",
+    "active": "#10B981",
+    "occupied": "#EF4444",
+    "booked": "#EF4444",
+    "reserved": "#F59E0B",
+    "maintenance": "#F59E0B",
+    "inactive": "#9CA3AF",
+}
+
+
+def grid_cell(space_id: int, label: str, status: str, detail: str = "") -> List:
+    """
+    Build one grid cell.
+
+    Args:
+        space_id (int): ID reported back when the cell is clicked
+        label (str): Main text of the cell
+        status (str): Status key, used for the cell colour
+        detail (str): Smaller second line of text
+
+    Returns:
+        list: Compact [id, label, detail, status] cell
+    """
+    return [space_id, str(label), str(detail), str(status).lower()]
+
+
+def space_grid(cells: Iterable[List], key: str, columns: int = 10, cell_height: int = 64,
+               height: int = 480, selectable: Sequence[str] = ("available",),
+               status_colors: Optional[Dict[str, str]] = None) -> Optional[int]:
+    """
+    Render a parking lot as one virtualized grid component.
+
+    The whole lot is a single component rather than one element per space,
+    and the browser only draws the rows scrolled into view. The browser
+    keeps the cells between reruns, so after the first render only the
+    cells that changed are sent. If the browser lost its copy (the iframe
+    was remounted) it asks for a full resend.
+
+    Args:
+        cells (iterable): Cells built with grid_cell(), in display order
+        key (str): Unique key of the grid on the page
+        columns (int): Cells per row
+        cell_height (int): Height of a cell in pixels
+        height (int): Maximum height of the scrolling viewport in pixels
+        selectable (sequence): Statuses that can be clicked
+        status_colors (dict): Status to colour overrides
+
+    Returns:
+        int: ID of the selected space, or None
+    """
+    cells = [list(cell) for cell in cells]
+    order = [cell[0] for cell in cells]
+    current = {cell[0]: cell for cell in cells}
+
+    state = st.session_state.setdefault(f"_space_grid_{key}", {
+        "version": 0, "order": [], "cells": {}, "resync": None,
+    })
+    event = st.session_state.get(key) or {}
+
+    resync = event.get("resync")
+    full = None
+    changes = []
+    base = state["version"]
+    if state["version"] == 0 or order != state["order"] or (resync is not None and resync != state["resync"]):
+        full = cells
+    else:
+        changes = [current[space_id] for space_id in order if state["cells"].get(space_id) != current[space_id]]
+    if full is not None or changes:
+        state["version"] += 1
+    state.update(order=order, cells=current, resync=resync)
+
+    colors = dict(DEFAULT_STATUS_COLORS)
+    colors.update(status_colors or {})
+
+    value = _space_grid(
+        version=state["version"],
+        base=base,
+        full=full,
+        changes=changes,
+        columns=columns,
+        cell_height=cell_height,
+        height=height,
+        gap=GRID_GAP,
+        colors=colors,
+        selectable=list(selectable),
+        selected=event.get("selected"),
+        key=key,
+        default=None,
+    )
+    return (value or {}).get("selected")
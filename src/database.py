@@ -1,7 +1,15 @@
 import sqlite3
 import os
 import datetime
-from typing import List, Dict, Tuple, Optional, Any, Union
+import logging
+import re
+from itertools import islice
+from typing import List, Dict, Tuple, Optional, Any, Union, Iterable, Iterator
+
+from db_pool import get_pool
+from migrations import migrate
+from records import BookingDetail, ParkingSpace, Payment, User, fetch, sql_columns
+from query_trace import get_query_tracer
 
 # Database setup
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'parking.db')
@@ -11,114 +19,143 @@ def ensure_db_directory():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 def get_db_connection():
-    """Create a connection to the SQLite database"""
+    """Create a standalone (unpooled) connection to the SQLite database"""
     ensure_db_directory()
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+def db_connection():
+    """Borrow a pooled connection to the SQLite database as a context manager"""
+    return get_pool(DB_PATH).connection()
+
+def get_db_pool_stats() -> Dict:
+    """Get usage statistics for the database connection pool"""
+    return get_pool(DB_PATH).stats()
+
+def get_query_stats() -> List[Dict]:
+    """Get per-query-shape timings (count, p50/p95/p99, plan, full-scan flag) for this process"""
+    return get_query_tracer().stats()
+
+def get_slow_queries() -> List[Dict]:
+    """Get the slow-query log, newest first"""
+    return get_query_tracer().slow_queries()
+
+logger = logging.getLogger(__name__)
+
+# Timestamps are stored as fixed-width text so that string comparison in SQL
+# (and in the in-memory indexes) matches chronological order
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def to_db_timestamp(value: Union[datetime.datetime, str]) -> str:
+    """Normalize a datetime (or timestamp string) to the stored text format"""
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DB_TIMESTAMP_FORMAT)
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time()).strftime(DB_TIMESTAMP_FORMAT)
+    return value
+
+# ---- Booking change listeners ----
+
+# Listeners of DB_PATH, and of other database files by absolute path
+_booking_listeners = []
+_file_booking_listeners: Dict[str, List] = {}
+
+def _booking_listeners_of(path: Optional[str]) -> List:
+    if path is None or os.path.abspath(path) == os.path.abspath(DB_PATH):
+        return _booking_listeners
+    return _file_booking_listeners.setdefault(os.path.abspath(path), [])
+
+def add_booking_listener(callback, path: Optional[str] = None) -> None:
+    """Register callback(event, booking) to run after booking writes commit.
+
+    event is one of 'created', 'updated' or 'deleted' and booking is a dict
+    with at least id, space_id, start_time, end_time and status. Listeners
+    follow DB_PATH unless another database file is given as path.
+    """
+    listeners = _booking_listeners_of(path)
+    if callback not in listeners:
+        listeners.append(callback)
+
+def remove_booking_listener(callback, path: Optional[str] = None) -> None:
+    """Unregister a booking change listener"""
+    listeners = _booking_listeners_of(path)
+    if callback in listeners:
+        listeners.remove(callback)
+
+def notify_booking_listeners(event: str, booking: Dict, path: Optional[str] = None) -> None:
+    """
+    Run the booking listeners of a database file after a committed write.
+
+    For writers outside this module (the scheduler, the waitlist, series
+    cancellation); listener failures are logged, not raised.
+    """
+    for callback in list(_booking_listeners_of(path)):
+        try:
+            callback(event, booking)
+        except Exception:
+            logger.exception("Booking listener %r failed on %s event", callback, event)
+
+def _notify_booking_listeners(event: str, booking: Dict) -> None:
+    notify_booking_listeners(event, booking)
+
+# ---- Parking space change listeners ----
+
+_space_listeners = []
+
+def add_space_listener(callback) -> None:
+    """Register callback(event, space) to run after parking space writes commit.
+
+    event is one of 'created', 'updated' or 'deleted' and space is a dict
+    with the space id (None after a bulk insert, which adds a 'count') and
+    any updated fields. Occupancy flips made by booking writes are reported
+    to booking listeners instead.
+    """
+    if callback not in _space_listeners:
+        _space_listeners.append(callback)
+
+def remove_space_listener(callback) -> None:
+    """Unregister a parking space change listener"""
+    if callback in _space_listeners:
+        _space_listeners.remove(callback)
+
+def _notify_space_listeners(event: str, space: Dict) -> None:
+    """Run every space listener, logging (not raising) listener failures"""
+    for callback in list(_space_listeners):
+        try:
+            callback(event, space)
+        except Exception:
+            logger.exception("Space listener %r failed on %s event", callback, event)
+
 def init_db():
-    """Initialize the database with all required tables"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        full_name TEXT NOT NULL,
-        phone TEXT,
-        is_admin BOOLEAN DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create parking_spaces table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS parking_spaces (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        space_number TEXT UNIQUE NOT NULL,
-        location TEXT NOT NULL,
-        floor TEXT,
-        section TEXT,
-        is_accessible BOOLEAN DEFAULT 0,
-        is_ev_charging BOOLEAN DEFAULT 0,
-        hourly_rate REAL NOT NULL,
-        is_available BOOLEAN DEFAULT 1,
-        status TEXT DEFAULT 'active' CHECK(status IN ('active', 'maintenance', 'reserved', 'inactive')),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create bookings table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS bookings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        space_id INTEGER NOT NULL,
-        start_time TIMESTAMP NOT NULL,
-        end_time TIMESTAMP NOT NULL,
-        vehicle_plate TEXT NOT NULL,
-        vehicle_type TEXT NOT NULL,
-        status TEXT DEFAULT 'active' CHECK(status IN ('active', 'completed', 'cancelled')),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id),
-        FOREIGN KEY (space_id) REFERENCES parking_spaces (id)
-    )
-    ''')
-    
-    # Create payments table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS payments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        booking_id INTEGER NOT NULL,
-        amount REAL NOT NULL,
-        payment_method TEXT NOT NULL,
-        transaction_id TEXT,
-        status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'completed', 'failed', 'refunded')),
-        payment_date TIMESTAMP,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (booking_id) REFERENCES bookings (id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Initialize the database, applying any pending schema migrations"""
+    migrate(DB_PATH)
 
 # ---- User CRUD Operations ----
 
 def create_user(username: str, password: str, email: str, full_name: str, 
                 phone: str = None, is_admin: bool = False) -> int:
     """Create a new user and return the user ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-        INSERT INTO users (username, password, email, full_name, phone, is_admin)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (username, password, email, full_name, phone, is_admin))
+    with db_connection() as conn:
+        cursor = conn.cursor()
         
-        user_id = cursor.lastrowid
-        conn.commit()
-        return user_id
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        raise ValueError("Username or email already exists")
-    finally:
-        conn.close()
+        try:
+            cursor.execute('''
+            INSERT INTO users (username, password, email, full_name, phone, is_admin)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (username, password, email, full_name, phone, is_admin))
+            
+            user_id = cursor.lastrowid
+            conn.commit()
+            return user_id
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise ValueError("Username or email already exists")
 
 def get_user(user_id: int) -> Dict:
     """Get user by ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
     
     if user:
         return dict(user)
@@ -126,12 +163,8 @@ def get_user(user_id: int) -> Dict:
 
 def get_user_by_username(username: str) -> Dict:
     """Get user by username"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-    user = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
     
     if user:
         return dict(user)
@@ -145,33 +178,28 @@ def update_user(user_id: int, **kwargs) -> bool:
     if not update_data:
         return False
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     set_clause = ', '.join([f"{field} = ?" for field in update_data.keys()])
     values = list(update_data.values())
     values.append(user_id)
     
-    try:
-        cursor.execute(f"UPDATE users SET {set_clause} WHERE id = ?", values)
-        conn.commit()
-        success = cursor.rowcount > 0
-        return success
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        raise ValueError("Username or email already exists")
-    finally:
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"UPDATE users SET {set_clause} WHERE id = ?", values)
+            conn.commit()
+            success = cursor.rowcount > 0
+            return success
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise ValueError("Username or email already exists")
 
 def delete_user(user_id: int) -> bool:
     """Delete a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        conn.commit()
+        success = cursor.rowcount > 0
     
     return success
 
@@ -181,63 +209,50 @@ def create_parking_space(space_number: str, location: str, hourly_rate: float,
                          floor: str = None, section: str = None, 
                          is_accessible: bool = False, is_ev_charging: bool = False) -> int:
     """Create a new parking space and return the ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-        INSERT INTO parking_spaces (
-            space_number, location, floor, section, 
-            is_accessible, is_ev_charging, hourly_rate
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (space_number, location, floor, section, is_accessible, is_ev_charging, hourly_rate))
+    with db_connection() as conn:
+        cursor = conn.cursor()
         
-        space_id = cursor.lastrowid
-        conn.commit()
-        return space_id
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        raise ValueError("Space number already exists")
-    finally:
-        conn.close()
+        try:
+            cursor.execute('''
+            INSERT INTO parking_spaces (
+                space_number, location, floor, section, 
+                is_accessible, is_ev_charging, hourly_rate
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (space_number, location, floor, section, is_accessible, is_ev_charging, hourly_rate))
+            
+            space_id = cursor.lastrowid
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise ValueError("Space number already exists")
+    
+    _notify_space_listeners('created', {'id': space_id})
+    return space_id
 
 def get_parking_space(space_id: int) -> Dict:
     """Get parking space by ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM parking_spaces WHERE id = ?', (space_id,))
-    space = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        space = conn.execute('SELECT * FROM parking_spaces WHERE id = ?', (space_id,)).fetchone()
     
     if space:
         return dict(space)
     return None
 
-def get_all_parking_spaces() -> List[Dict]:
-    """Get all parking spaces"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM parking_spaces ORDER BY space_number')
-    spaces = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return spaces
+def get_all_parking_spaces(result: str = 'dict') -> Union[List, Dict]:
+    """Get all parking spaces as dicts, ParkingSpace records or columns"""
+    with db_connection() as conn:
+        return fetch(conn, ParkingSpace,
+                     f'SELECT {sql_columns(ParkingSpace)} FROM parking_spaces ORDER BY space_number',
+                     result=result)
 
-def get_available_parking_spaces() -> List[Dict]:
-    """Get all available parking spaces"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'SELECT * FROM parking_spaces WHERE is_available = 1 AND status = "active" ORDER BY space_number'
-    )
-    spaces = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return spaces
+def get_available_parking_spaces(result: str = 'dict') -> Union[List, Dict]:
+    """Get all available parking spaces as dicts, ParkingSpace records or columns"""
+    with db_connection() as conn:
+        return fetch(conn, ParkingSpace, f'''
+        SELECT {sql_columns(ParkingSpace)} FROM parking_spaces
+        WHERE is_available = 1 AND status = 'active' ORDER BY space_number
+        ''', result=result)
 
 def update_parking_space(space_id: int, **kwargs) -> bool:
     """Update parking space information"""
@@ -249,59 +264,116 @@ def update_parking_space(space_id: int, **kwargs) -> bool:
     if not update_data:
         return False
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     set_clause = ', '.join([f"{field} = ?" for field in update_data.keys()])
     values = list(update_data.values())
     values.append(space_id)
     
-    try:
-        cursor.execute(f"UPDATE parking_spaces SET {set_clause} WHERE id = ?", values)
-        conn.commit()
-        success = cursor.rowcount > 0
-        return success
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        raise ValueError("Space number already exists")
-    finally:
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"UPDATE parking_spaces SET {set_clause} WHERE id = ?", values)
+            conn.commit()
+            success = cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise ValueError("Space number already exists")
+    
+    if success:
+        _notify_space_listeners('updated', {'id': space_id, **update_data})
+    return success
 
 def delete_parking_space(space_id: int) -> bool:
     """Delete a parking space"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM parking_spaces WHERE id = ?', (space_id,))
-    conn.commit()
-    success = cursor.rowcount > 0
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM parking_spaces WHERE id = ?', (space_id,))
+        conn.commit()
+        success = cursor.rowcount > 0
     
+    if success:
+        _notify_space_listeners('deleted', {'id': space_id})
     return success
 
+SPACE_STATES = ('available', 'occupied', 'maintenance', 'reserved', 'inactive')
+
+def get_occupancy_summary(floor: Optional[str] = None, section: Optional[str] = None) -> Dict:
+    """
+    Get space counts by occupancy state from the trigger-maintained counters.
+
+    Reads the small space_counters table instead of scanning parking_spaces,
+    so the cost does not grow with the size of the lot. Returns a dict with
+    'total', one count per state in SPACE_STATES, and 'by_floor' mapping each
+    floor to its per-state counts.
+    """
+    query = 'SELECT floor, status, SUM(count) AS count FROM space_counters WHERE count > 0'
+    params = []
+    if floor is not None:
+        query += ' AND floor = ?'
+        params.append(str(floor))
+    if section is not None:
+        query += ' AND section = ?'
+        params.append(section)
+
+    with db_connection() as conn:
+        rows = conn.execute(query + ' GROUP BY floor, status', params).fetchall()
+
+    summary = dict.fromkeys(SPACE_STATES, 0)
+    summary['total'] = 0
+    by_floor = {}
+    for row in rows:
+        summary[row['status']] = summary.get(row['status'], 0) + row['count']
+        summary['total'] += row['count']
+        counts = by_floor.setdefault(row['floor'], dict.fromkeys(SPACE_STATES, 0))
+        counts[row['status']] = counts.get(row['status'], 0) + row['count']
+    summary['by_floor'] = by_floor
+    return summary
+
 # ---- Booking CRUD Operations ----
 
+def _find_conflicts(conn: sqlite3.Connection, space_id: int, start_time: str, end_time: str,
+                    exclude_booking_id: Optional[int] = None) -> List[sqlite3.Row]:
+    """Find active bookings on a space overlapping the half-open window [start, end)"""
+    query = '''
+    SELECT id, user_id, space_id, start_time, end_time, status FROM bookings
+    WHERE space_id = ? AND status = 'active'
+      AND end_time > ? AND start_time < ?
+    '''
+    params = [space_id, start_time, end_time]
+    if exclude_booking_id is not None:
+        query += ' AND id != ?'
+        params.append(exclude_booking_id)
+    # The unary + keeps the planner from choosing idx_bookings_status_start
+    # just to skip sorting the handful of matches
+    return conn.execute(query + ' ORDER BY +start_time', params).fetchall()
+
+def find_conflicts(space_id: int, start_time: Union[datetime.datetime, str],
+                   end_time: Union[datetime.datetime, str],
+                   exclude_booking_id: Optional[int] = None) -> List[Dict]:
+    """Get active bookings on a space that overlap the window [start_time, end_time)"""
+    with db_connection() as conn:
+        rows = _find_conflicts(conn, space_id, to_db_timestamp(start_time),
+                               to_db_timestamp(end_time), exclude_booking_id)
+    return [dict(row) for row in rows]
+
 def create_booking(user_id: int, space_id: int, start_time: datetime.datetime,
                    end_time: datetime.datetime, vehicle_plate: str, 
                    vehicle_type: str) -> int:
     """Create a new booking and return the booking ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if the space is available for the requested time period
-    cursor.execute('''
-    SELECT id FROM bookings 
-    WHERE space_id = ? AND status = 'active' AND 
-          ((start_time <= ? AND end_time >= ?) OR
-           (start_time <= ? AND end_time >= ?) OR
-           (start_time >= ? AND end_time <= ?))
-    ''', (space_id, start_time, start_time, end_time, end_time, start_time, end_time))
-    
-    if cursor.fetchone():
-        conn.close()
-        raise ValueError("Parking space is not available for the requested time period")
-    
-    try:
+    start_time = to_db_timestamp(start_time)
+    end_time = to_db_timestamp(end_time)
+    if end_time <= start_time:
+        raise ValueError("End time must be after start time")
+    
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # Take the write lock before the check, so no other booking can
+        # slip in between the check and the insert
+        conn.execute('BEGIN IMMEDIATE')
+        
+        # Check if the space is available for the requested time period
+        if _find_conflicts(conn, space_id, start_time, end_time):
+            raise ValueError("Parking space is not available for the requested time period")
+        
         cursor.execute('''
         INSERT INTO bookings (user_id, space_id, start_time, end_time, vehicle_plate, vehicle_type)
         VALUES (?, ?, ?, ?, ?, ?)
@@ -313,71 +385,178 @@ def create_booking(user_id: int, space_id: int, start_time: datetime.datetime,
         cursor.execute('UPDATE parking_spaces SET is_available = 0 WHERE id = ?', (space_id,))
         
         conn.commit()
-        return booking_id
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    
+    _notify_booking_listeners('created', {
+        'id': booking_id, 'user_id': user_id, 'space_id': space_id,
+        'start_time': start_time, 'end_time': end_time, 'status': 'active',
+    })
+    return booking_id
 
 def get_booking(booking_id: int) -> Dict:
     """Get booking by ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT b.*, p.space_number, p.location, p.hourly_rate,
-           u.username, u.full_name, u.email, u.phone
-    FROM bookings b
-    JOIN parking_spaces p ON b.space_id = p.id
-    JOIN users u ON b.user_id = u.id
-    WHERE b.id = ?
-    ''', (booking_id,))
-    
-    booking = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        booking = conn.execute('''
+        SELECT b.*, p.space_number, p.location, p.hourly_rate,
+               u.username, u.full_name, u.email, u.phone
+        FROM bookings b
+        JOIN parking_spaces p ON b.space_id = p.id
+        JOIN users u ON b.user_id = u.id
+        WHERE b.id = ?
+        ''', (booking_id,)).fetchone()
     
     if booking:
         return dict(booking)
     return None
 
-def get_user_bookings(user_id: int) -> List[Dict]:
-    """Get all bookings for a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT b.*, p.space_number, p.location, p.hourly_rate
-    FROM bookings b
-    JOIN parking_spaces p ON b.space_id = p.id
-    WHERE b.user_id = ?
-    ORDER BY b.start_time DESC
-    ''', (user_id,))
-    
-    bookings = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return bookings
-
-def get_active_bookings() -> List[Dict]:
-    """Get all active bookings"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT b.*, p.space_number, p.location, p.hourly_rate,
-           u.username, u.full_name, u.email, u.phone
-    FROM bookings b
-    JOIN parking_spaces p ON b.space_id = p.id
-    JOIN users u ON b.user_id = u.id
-    WHERE b.status = 'active'
-    ORDER BY b.start_time
-    ''')
-    
-    bookings = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return bookings
+# Columns of BookingDetail, joining a booking with its space and user
+BOOKING_DETAIL_SELECT = '''
+SELECT b.id, b.user_id, b.space_id, b.start_time, b.end_time, b.vehicle_plate,
+       b.vehicle_type, b.status, b.created_at, b.checked_in_at, b.series_id,
+       p.space_number, p.location, p.hourly_rate, u.username, u.full_name,
+       u.email, u.phone
+FROM bookings b
+JOIN parking_spaces p ON b.space_id = p.id
+JOIN users u ON b.user_id = u.id
+'''
+
+def get_user_bookings(user_id: int, result: str = 'dict') -> Union[List, Dict]:
+    """Get all bookings for a user as dicts, BookingDetail records or columns"""
+    with db_connection() as conn:
+        return fetch(conn, BookingDetail,
+                     BOOKING_DETAIL_SELECT + 'WHERE b.user_id = ? ORDER BY b.start_time DESC',
+                     (user_id,), result=result)
+
+def get_active_bookings(result: str = 'dict') -> Union[List, Dict]:
+    """Get all active bookings as dicts, BookingDetail records or columns"""
+    with db_connection() as conn:
+        return fetch(conn, BookingDetail,
+                     BOOKING_DETAIL_SELECT + "WHERE b.status = 'active' ORDER BY b.start_time",
+                     result=result)
+
+def get_all_users(result: str = 'dict') -> Union[List, Dict]:
+    """Get all users as dicts, User records or columns"""
+    with db_connection() as conn:
+        return fetch(conn, User, f'SELECT {sql_columns(User)} FROM users ORDER BY id', result=result)
+
+def get_payments(booking_id: Optional[int] = None, result: str = 'dict') -> Union[List, Dict]:
+    """Get all payments, or those of one booking, as dicts, Payment records or columns"""
+    query = f'SELECT {sql_columns(Payment)} FROM payments'
+    params = []
+    if booking_id is not None:
+        query += ' WHERE booking_id = ?'
+        params.append(booking_id)
+    with db_connection() as conn:
+        return fetch(conn, Payment, query + ' ORDER BY id', params, result=result)
+
+# ---- Paginated Booking Lists ----
+
+BOOKING_PAGE_SIZE = 50
+BOOKING_STREAM_BATCH = 500
+
+def booking_cursor(booking: Union[Dict, tuple]) -> Tuple[str, int]:
+    """Keyset cursor of a booking dict or record, to pass as `after` for the next page"""
+    if isinstance(booking, dict):
+        return (booking['start_time'], booking['id'])
+    return (booking.start_time, booking.id)
+
+def get_user_bookings_page(user_id: int, limit: int = BOOKING_PAGE_SIZE,
+                           after: Optional[Tuple[str, int]] = None, result: str = 'dict') -> Union[List, Dict]:
+    """
+    Get one page of a user's bookings, newest first.
+
+    Pass booking_cursor() of the last row as `after` to get the next page.
+    The seek uses idx_bookings_user_start, so every page costs the same
+    however long the history is.
+    """
+    query = BOOKING_DETAIL_SELECT + 'WHERE b.user_id = ?'
+    params: List[Any] = [user_id]
+    if after is not None:
+        query += ' AND (b.start_time, b.id) < (?, ?)'
+        params.extend((to_db_timestamp(after[0]), after[1]))
+    query += ' ORDER BY b.start_time DESC, b.id DESC LIMIT ?'
+    params.append(limit)
+
+    with db_connection() as conn:
+        return fetch(conn, BookingDetail, query, params, result=result)
+
+def get_active_bookings_page(limit: int = BOOKING_PAGE_SIZE,
+                             after: Optional[Tuple[str, int]] = None, result: str = 'dict') -> Union[List, Dict]:
+    """
+    Get one page of active bookings, earliest start first.
+
+    Pass booking_cursor() of the last row as `after` to get the next page.
+    """
+    query = BOOKING_DETAIL_SELECT + "WHERE b.status = 'active'"
+    params: List[Any] = []
+    if after is not None:
+        query += ' AND (b.start_time, b.id) > (?, ?)'
+        params.extend((to_db_timestamp(after[0]), after[1]))
+    query += ' ORDER BY b.start_time, b.id LIMIT ?'
+    params.append(limit)
+
+    with db_connection() as conn:
+        return fetch(conn, BookingDetail, query, params, result=result)
+
+def get_bookings_page(limit: int = BOOKING_PAGE_SIZE, before_id: Optional[int] = None,
+                      result: str = 'dict') -> Union[List, Dict]:
+    """
+    Get one page of all bookings, most recently made first.
+
+    Pass the id of the last row as `before_id` to get the next page. The
+    seek is on the rowid, so pages cost the same however many bookings
+    there are.
+    """
+    query = BOOKING_DETAIL_SELECT
+    params: List[Any] = []
+    if before_id is not None:
+        query += 'WHERE b.id < ? '
+        params.append(before_id)
+    query += 'ORDER BY b.id DESC LIMIT ?'
+    params.append(limit)
+
+    with db_connection() as conn:
+        return fetch(conn, BookingDetail, query, params, result=result)
+
+def get_booking_counts() -> Dict:
+    """
+    Get live booking counts by status, plus 'total'.
+
+    Counts from idx_bookings_status_start alone, without reading the
+    bookings rows. Archived bookings are not included.
+    """
+    with db_connection() as conn:
+        rows = conn.execute('SELECT status, COUNT(*) AS count FROM bookings GROUP BY status').fetchall()
+    counts = {row['status']: row['count'] for row in rows}
+    counts['total'] = sum(counts.values())
+    return counts
+
+def _iter_pages(fetch_page, batch_size: int) -> Iterator:
+    """Yield rows from a keyset-paginated fetch_page(limit, after) until exhausted"""
+    after = None
+    while True:
+        page = fetch_page(batch_size, after)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after = booking_cursor(page[-1])
+
+def iter_user_bookings(user_id: int, batch_size: int = BOOKING_STREAM_BATCH,
+                       result: str = 'dict') -> Iterator:
+    """
+    Stream a user's bookings, newest first, one page at a time.
+
+    No connection is held between pages, so slow consumers do not block
+    writers.
+    """
+    if result == 'columns':
+        raise ValueError("Streaming yields rows; use result='dict' or 'record'")
+    return _iter_pages(lambda limit, after: get_user_bookings_page(user_id, limit, after, result), batch_size)
+
+def iter_active_bookings(batch_size: int = BOOKING_STREAM_BATCH, result: str = 'dict') -> Iterator:
+    """Stream active bookings, earliest start first, one page at a time"""
+    if result == 'columns':
+        raise ValueError("Streaming yields rows; use result='dict' or 'record'")
+    return _iter_pages(lambda limit, after: get_active_bookings_page(limit, after, result), batch_size)
 
 def update_booking(booking_id: int, **kwargs) -> bool:
     """Update booking information"""
@@ -387,15 +566,18 @@ def update_booking(booking_id: int, **kwargs) -> bool:
     if not update_data:
         return False
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    for field in ('start_time', 'end_time'):
+        if field in update_data:
+            update_data[field] = to_db_timestamp(update_data[field])
     
     set_clause = ', '.join([f"{field} = ?" for field in update_data.keys()])
     values = list(update_data.values())
     values.append(booking_id)
     
-    try:
+    with db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute(f"UPDATE bookings SET {set_clause} WHERE id = ?", values)
+        success = cursor.rowcount > 0
         
         # If status is updated to 'completed' or 'cancelled', make the space available again
         if 'status' in update_data and update_data['status'] in ('completed', 'cancelled'):
@@ -405,19 +587,375 @@ def update_booking(booking_id: int, **kwargs) -> bool:
             WHERE id = (SELECT space_id FROM bookings WHERE id = ?)
             ''', (booking_id,))
         
+        booking = cursor.execute(
+            'SELECT id, user_id, space_id, start_time, end_time, status FROM bookings WHERE id = ?',
+            (booking_id,)
+        ).fetchone()
         conn.commit()
-        success = cursor.rowcount > 0
-        return success
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    
+    if success and booking:
+        _notify_booking_listeners('updated', dict(booking))
+    return success
+
+def check_in_booking(booking_id: int, when: Optional[datetime.datetime] = None) -> bool:
+    """Record the driver's arrival for an active booking so it is not released as a no-show"""
+    with db_connection() as conn:
+        cursor = conn.execute('''
+        UPDATE bookings SET checked_in_at = ?
+        WHERE id = ? AND status = 'active' AND checked_in_at IS NULL
+        ''', (to_db_timestamp(when or datetime.datetime.now()), booking_id))
+        conn.commit()
+    return cursor.rowcount > 0
 
 def delete_booking(booking_id: int) -> bool:
     """Delete a booking"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # First, get the space_id to update its availability
+        row = cursor.execute(
+            'SELECT id, user_id, space_id, start_time, end_time, status FROM bookings WHERE id = ?',
+            (booking_id,)
+        ).fetchone()
+        if not row:
+            return False
+        
+        cursor.execute('DELETE FROM bookings WHERE id = ?', (booking_id,))
+        
+        # Deleting an active booking frees the space
+        if row['status'] == 'active':
+            cursor.execute('UPDATE parking_spaces SET is_available = 1 WHERE id = ?', (row['space_id'],))
+        
+        conn.commit()
     
-    # First, get the space_id to update its availability
+    _notify_booking_listeners('deleted', dict(row))
+    return True
+
+# ---- Bulk Import Operations ----
+
+BULK_CHUNK_SIZE = 500
+
+def _chunked(rows: Iterable, size: int) -> Iterator[List]:
+    """Yield successive lists of up to `size` items from any iterable"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _missing_fields(row: Dict, required: Tuple[str, ...]) -> List[str]:
+    """Names of required fields that are absent or None in a row"""
+    return [field for field in required if row.get(field) is None]
+
+def create_parking_spaces_bulk(spaces: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> Dict:
+    """Insert many parking spaces in one transaction.
 
+    `spaces` may be any iterable (including a generator) of dicts with the
+    create_parking_space() fields. Invalid rows are skipped and reported
+    instead of aborting the batch.
+
+    Returns a dict with the number of rows 'inserted' and a list of
+    (row_index, error_message) 'errors'.
+    """
+    required = ('space_number', 'location', 'hourly_rate')
+    inserted = 0
+    errors = []
+    seen_numbers = set()
+    
+    with db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        offset = 0
+        for chunk in _chunked(spaces, chunk_size):
+            numbers = [row.get('space_number') for row in chunk]
+            placeholders = ', '.join('?' * len(numbers))
+            existing = {
+                r['space_number'] for r in conn.execute(
+                    f'SELECT space_number FROM parking_spaces WHERE space_number IN ({placeholders})',
+                    numbers
+                )
+            }
+            
+            values = []
+            for i, row in enumerate(chunk, start=offset):
+                missing = _missing_fields(row, required)
+                if missing:
+                    errors.append((i, f"Missing required fields: {', '.join(missing)}"))
+                    continue
+                number = row['space_number']
+                if number in existing or number in seen_numbers:
+                    errors.append((i, "Space number already exists"))
+                    continue
+                seen_numbers.add(number)
+                values.append((
+                    number, row['location'], row.get('floor'), row.get('section'),
+                    bool(row.get('is_accessible', False)), bool(row.get('is_ev_charging', False)),
+                    row['hourly_rate'],
+                ))
+            
+            conn.executemany('''
+            INSERT INTO parking_spaces (
+                space_number, location, floor, section,
+                is_accessible, is_ev_charging, hourly_rate
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', values)
+            inserted += len(values)
+            offset += len(chunk)
+        
+        conn.commit()
+    
+    if inserted:
+        _notify_space_listeners('created', {'id': None, 'count': inserted})
+    errors.sort()
+    return {'inserted': inserted, 'errors': errors}
+
+def create_bookings_bulk(bookings: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> Dict:
+    """Insert many bookings in one transaction.
+
+    `bookings` may be any iterable (including a generator) of dicts with the
+    create_booking() fields plus an optional 'status' so historical
+    'completed'/'cancelled' bookings can be imported, and an optional
+    'series_id' for occurrences of a recurring series. Active rows are checked
+    for overlaps, chunk by chunk, against the database (including rows from
+    earlier chunks) and against each other; rows that fail validation are
+    skipped and reported instead of aborting the batch.
+
+    Returns a dict with the number of rows 'inserted' and a list of
+    (row_index, error_message) 'errors'.
+    """
+    with db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        result = insert_bookings(conn, bookings, chunk_size)
+        conn.commit()
+    
+    for booking in result.pop('created'):
+        _notify_booking_listeners('created', booking)
+    return result
+
+def insert_bookings(conn: sqlite3.Connection, bookings: Iterable[Dict],
+                    chunk_size: int = BULK_CHUNK_SIZE) -> Dict:
+    """Insert many bookings as create_bookings_bulk() does, inside the caller's transaction.
+
+    The caller holds the write lock (BEGIN IMMEDIATE) and commits. Besides
+    'inserted' and 'errors' the result lists the 'created' bookings, to pass
+    to notify_booking_listeners() once the transaction has committed.
+    """
+    required = ('user_id', 'space_id', 'start_time', 'end_time', 'vehicle_plate', 'vehicle_type')
+    statuses = ('active', 'completed', 'cancelled')
+    inserted = 0
+    errors = []
+    created = []
+    
+    conn.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS bulk_booking_candidates (
+        idx INTEGER PRIMARY KEY,
+        space_id INTEGER NOT NULL,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL
+    )
+    ''')
+    
+    offset = 0
+    for chunk in _chunked(bookings, chunk_size):
+        # Field-level validation
+        candidates = {}
+        for i, row in enumerate(chunk, start=offset):
+            missing = _missing_fields(row, required)
+            if missing:
+                errors.append((i, f"Missing required fields: {', '.join(missing)}"))
+                continue
+            status = row.get('status', 'active')
+            if status not in statuses:
+                errors.append((i, f"Invalid status: {status}"))
+                continue
+            start_time = to_db_timestamp(row['start_time'])
+            end_time = to_db_timestamp(row['end_time'])
+            if end_time <= start_time:
+                errors.append((i, "End time must be after start time"))
+                continue
+            candidates[i] = (row, start_time, end_time, status)
+        
+        # Unknown spaces
+        space_ids = list({c[0]['space_id'] for c in candidates.values()})
+        known_spaces = set()
+        for start in range(0, len(space_ids), BULK_CHUNK_SIZE):
+            part = space_ids[start:start + BULK_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(part))
+            known_spaces.update(
+                r['id'] for r in conn.execute(
+                    f'SELECT id FROM parking_spaces WHERE id IN ({placeholders})', part
+                )
+            )
+        for i in [i for i, c in candidates.items() if c[0]['space_id'] not in known_spaces]:
+            errors.append((i, f"Parking space {candidates.pop(i)[0]['space_id']} does not exist"))
+        
+        # Overlaps with bookings already in the table, checked set-wise
+        active = {i: c for i, c in candidates.items() if c[3] == 'active'}
+        conn.execute('DELETE FROM bulk_booking_candidates')
+        conn.executemany(
+            'INSERT INTO bulk_booking_candidates (idx, space_id, start_time, end_time) VALUES (?, ?, ?, ?)',
+            [(i, c[0]['space_id'], c[1], c[2]) for i, c in active.items()]
+        )
+        conflicting = {
+            r['idx'] for r in conn.execute('''
+            SELECT DISTINCT c.idx FROM bulk_booking_candidates c
+            JOIN bookings b ON b.space_id = c.space_id AND b.status = 'active'
+             AND b.end_time > c.start_time AND b.start_time < c.end_time
+            ''')
+        }
+        
+        # Overlaps within the chunk: per space, in start order, reject any
+        # row starting before the latest end among the rows kept so far
+        last_end = {}
+        for i in sorted(active, key=lambda i: (active[i][0]['space_id'], active[i][1], i)):
+            if i in conflicting:
+                continue
+            space_id = active[i][0]['space_id']
+            if space_id in last_end and active[i][1] < last_end[space_id]:
+                conflicting.add(i)
+            else:
+                last_end[space_id] = max(last_end.get(space_id, ''), active[i][2])
+        
+        for i in sorted(conflicting):
+            candidates.pop(i)
+            errors.append((i, "Parking space is not available for the requested time period"))
+        
+        # Insert the surviving rows in input order
+        rows = [candidates[i] for i in sorted(candidates)]
+        max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM bookings').fetchone()[0]
+        conn.executemany('''
+        INSERT INTO bookings (user_id, space_id, start_time, end_time, vehicle_plate, vehicle_type, status,
+                              series_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (row['user_id'], row['space_id'], start_time, end_time,
+             row['vehicle_plate'], row['vehicle_type'], status, row.get('series_id'))
+            for row, start_time, end_time, status in rows
+        ])
+        
+        booked_spaces = sorted({row['space_id'] for row, _, _, status in rows if status == 'active'})
+        conn.executemany('UPDATE parking_spaces SET is_available = 0 WHERE id = ?',
+                         [(space_id,) for space_id in booked_spaces])
+        
+        if _booking_listeners:
+            # We hold the write lock, so the new rows are exactly those above max_id
+            new_ids = [r[0] for r in conn.execute(
+                'SELECT id FROM bookings WHERE id > ? ORDER BY id', (max_id,)
+            )]
+            created.extend(
+                {'id': booking_id, 'user_id': row['user_id'], 'space_id': row['space_id'],
+                 'start_time': start_time, 'end_time': end_time, 'status': status}
+                for booking_id, (row, start_time, end_time, status) in zip(new_ids, rows)
+            )
+        
+        inserted += len(rows)
+        offset += len(chunk)
+    
+    conn.execute('DROP TABLE IF EXISTS temp.bulk_booking_candidates')
+    errors.sort()
+    return {'inserted': inserted, 'errors': errors, 'created': created}
+
+# ---- Group Booking Operations ----
+
+def _natural_key(value: Optional[str]) -> List:
+    """Sort key that orders 'A2' before 'A10'"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', value or '')]
+
+def create_group_booking(user_id: int, count: int, start_time: Union[datetime.datetime, str],
+                         end_time: Union[datetime.datetime, str], vehicle_type: str = 'car',
+                         vehicle_plates: Optional[List[str]] = None, floor: str = None,
+                         section: str = None, contiguous: bool = False,
+                         allow_partial: bool = False) -> Dict:
+    """Reserve `count` parking spaces for one window in a single transaction.
+
+    Free spaces are found set-wise in SQL, optionally restricted to a floor
+    and/or section. With `contiguous`, the spaces form one unbroken run of
+    space numbers within a single floor and section. The call is
+    all-or-nothing: if fewer than `count` spaces are free a ValueError is
+    raised and nothing is booked, unless `allow_partial` is set, in which case
+    as many spaces as possible are booked (the longest run when contiguous).
+
+    Returns a dict with the 'booking_ids' and 'space_ids' reserved, in space order.
+    """
+    if count < 1:
+        raise ValueError("Group size must be at least 1")
+    if vehicle_plates is not None and len(vehicle_plates) < count:
+        raise ValueError("A vehicle plate is required for every space in the group")
+    
+    start_time = to_db_timestamp(start_time)
+    end_time = to_db_timestamp(end_time)
+    if end_time <= start_time:
+        raise ValueError("End time must be after start time")
+    
+    scope = ''
+    params = [start_time, end_time]
+    if floor is not None:
+        scope += ' AND p.floor = ?'
+        params.append(str(floor))
+    if section is not None:
+        scope += ' AND p.section = ?'
+        params.append(section)
+    
+    with db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        spaces = conn.execute(f'''
+        SELECT p.id, p.space_number, p.floor, p.section,
+               NOT EXISTS (
+                   SELECT 1 FROM bookings b
+                   WHERE b.space_id = p.id AND b.status = 'active'
+                     AND b.end_time > ? AND b.start_time < ?
+               ) AS is_free
+        FROM parking_spaces p
+        WHERE p.status = 'active'{scope}
+        ''', params).fetchall()
+        spaces.sort(key=lambda r: (_natural_key(r['floor']), _natural_key(r['section']),
+                                   _natural_key(r['space_number'])))
+        
+        if contiguous:
+            # Longest run of free spaces (capped at count) within one floor/section
+            chosen = []
+            run = []
+            group = None
+            for row in spaces:
+                if (row['floor'], row['section']) != group or not row['is_free']:
+                    run = []
+                    group = (row['floor'], row['section'])
+                if row['is_free']:
+                    run.append(row['id'])
+                    if len(run) > len(chosen):
+                        chosen = list(run)
+                    if len(chosen) == count:
+                        break
+        else:
+            chosen = [row['id'] for row in spaces if row['is_free']][:count]
+        
+        if len(chosen) < count and not (allow_partial and chosen):
+            raise ValueError(
+                f"Only {len(chosen)} of {count} requested parking spaces are available "
+                "for the requested time period"
+            )
+        
+        plates = vehicle_plates or ['TBD'] * count
+        max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM bookings').fetchone()[0]
+        conn.executemany('''
+        INSERT INTO bookings (user_id, space_id, start_time, end_time, vehicle_plate, vehicle_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(user_id, space_id, start_time, end_time, plates[i], vehicle_type)
+              for i, space_id in enumerate(chosen)])
+        conn.executemany('UPDATE parking_spaces SET is_available = 0 WHERE id = ?',
+                         [(space_id,) for space_id in chosen])
+        
+        # We hold the write lock, so the new rows are exactly those above max_id
+        booking_ids = [r[0] for r in conn.execute(
+            'SELECT id FROM bookings WHERE id > ? ORDER BY id', (max_id,)
+        )]
+        conn.commit()
+    
+    for booking_id, space_id in zip(booking_ids, chosen):
+        _notify_booking_listeners('created', {
+            'id': booking_id, 'user_id': user_id, 'space_id': space_id,
+            'start_time': start_time, 'end_time': end_time, 'status': 'active',
+        })
+    
+    return {'booking_ids': booking_ids, 'space_ids': chosen}
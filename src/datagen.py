@@ -0,0 +1,377 @@
+"""
+Synthetic parking data for load and capacity testing.
+
+Generates a lot (floors, sections, accessible and EV spaces, rates), a user
+base and a booking history with NumPy, one array per column, and bulk-loads
+them straight into the real schema. A million bookings and their payments
+load in about fifteen seconds, most of it in SQLite itself.
+
+The booking model:
+
+* arrivals are Poisson: each booking lands on a uniformly random day and an
+  hour drawn from a weekday or weekend arrival profile, on a space chosen
+  with lower floors more popular
+* durations follow a mix of short errands, half-day and all-day stays
+  (log-normal), rounded up to 15 minutes
+* a driver arriving while their space is still taken starts when it frees
+  up, so bookings on one space never overlap. Per space that is the queue
+  recursion ``end[i] = max(arrival[i], end[i-1]) + duration[i]``, solved for
+  all spaces at once with a running maximum
+* bookings that ended are completed (or cancelled), the rest active
+* a few users make most of the bookings (Zipf-like weights)
+
+Rows are written with explicit IDs after the current maximum, so generating
+into a database that already has data works. The loader bypasses booking
+listeners and the Streamlit cache, so a process serving the database must
+reload its engines afterwards (the admin page does). Offline runs (the CLI)
+also turn off syncing and rebuild the booking and payment indexes in bulk,
+which a served database must not see.
+
+Usage::
+
+    python src/datagen.py data/load.db --spaces 10000 --bookings 1000000
+"""
+
+import argparse
+import datetime
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from migrations import migrate
+from billing import get_pricing_engine
+
+DEFAULT_SPACES = 1000
+DEFAULT_USERS = 2000
+DEFAULT_BOOKINGS = 100_000
+DEFAULT_DAYS_BACK = 90
+DEFAULT_DAYS_AHEAD = 7
+DEFAULT_PASSWORD = "password123"
+
+SLOT_MINUTES = 15
+INSERT_CHUNK = 100_000
+LOADER_CACHE_KIB = -262144        # 256 MiB page cache while loading
+MAX_UTILISATION = 0.9             # beyond this the queues push bookings far into the future
+
+FLOORS = ("1", "2", "3", "4", "5")
+SECTIONS = ("A", "B", "C", "D", "E", "F")
+FLOOR_POPULARITY_DECAY = 0.75     # each floor up is this much less popular
+ACCESSIBLE_SHARE = 0.05
+EV_SHARE = 0.10
+BASE_RATE = 2.0
+RATE_STEP_PER_FLOOR = -0.25       # upper floors are cheaper
+EV_SURCHARGE = 1.0
+MAINTENANCE_SHARE = 0.01
+
+# Relative arrivals per hour of day
+WEEKDAY_ARRIVALS = np.array([1, 1, 1, 1, 2, 4, 10, 18, 20, 14, 10, 10,
+                             12, 10, 9, 9, 11, 12, 10, 7, 5, 3, 2, 1], dtype=float)
+WEEKEND_ARRIVALS = np.array([1, 1, 1, 1, 1, 1, 2, 4, 7, 10, 13, 14,
+                             14, 13, 12, 11, 10, 10, 9, 8, 6, 4, 2, 1], dtype=float)
+
+# (share, median hours, log-normal sigma)
+DURATION_MIX = ((0.55, 1.5, 0.6), (0.35, 4.0, 0.4), (0.10, 9.0, 0.25))
+MAX_DURATION_HOURS = 24
+
+VEHICLE_MIX = {"car": 0.62, "suv": 0.18, "ev": 0.10, "motorcycle": 0.05, "van": 0.04, "truck": 0.01}
+PAYMENT_METHODS = {"Credit Card": 0.5, "Debit Card": 0.25, "Mobile Payment": 0.2, "Cash": 0.05}
+CANCELLATION_RATE = 0.08
+ZIPF_EXPONENT = 1.1
+
+_PLATE_LETTERS = np.array(list("ABCDEFGHJKLMNPRSTUVWXYZ"))
+
+
+def _choice(rng: np.random.Generator, weights: Dict[str, float], size: int) -> np.ndarray:
+    """Draw labels by weight"""
+    labels = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return labels[rng.choice(len(labels), size=size, p=p / p.sum())]
+
+
+def _format_times(minutes: np.ndarray, epoch: np.datetime64) -> np.ndarray:
+    """Minutes after `epoch` as database timestamp strings"""
+    stamps = (epoch + minutes.astype("timedelta64[m]")).astype("datetime64[s]")
+    return np.char.replace(np.datetime_as_string(stamps, unit="s"), "T", " ")
+
+
+def _plates(rng: np.random.Generator, size: int) -> np.ndarray:
+    """Plates like 'ABC1234'"""
+    letters = _PLATE_LETTERS[rng.integers(len(_PLATE_LETTERS), size=(size, 3))]
+    prefix = np.char.add(np.char.add(letters[:, 0], letters[:, 1]), letters[:, 2])
+    return np.char.add(prefix, rng.integers(1000, 10000, size=size).astype("U4"))
+
+
+def generate_spaces(rng: np.random.Generator, count: int, first_id: int) -> Dict[str, np.ndarray]:
+    """Columns of a lot with `count` spaces, IDs starting at `first_id`"""
+    ids = np.arange(first_id, first_id + count)
+    position = np.arange(count)
+    floor_index = position * len(FLOORS) // max(count, 1)
+    section_index = position % len(SECTIONS)
+    floor = np.array(FLOORS)[floor_index]
+    section = np.array(SECTIONS)[section_index]
+    ev = rng.random(count) < EV_SHARE
+    return {
+        "id": ids,
+        "space_number": np.char.add(np.char.add(section, floor), np.char.add("-", ids.astype(str))),
+        "location": np.char.add(np.char.add("Section ", section), np.char.add(", Floor ", floor)),
+        "floor": floor,
+        "section": section,
+        "is_accessible": (floor_index == 0) & (rng.random(count) < ACCESSIBLE_SHARE * len(FLOORS)),
+        "is_ev_charging": ev,
+        "hourly_rate": np.round(BASE_RATE + RATE_STEP_PER_FLOOR * floor_index + EV_SURCHARGE * ev, 2),
+        "status": np.where(rng.random(count) < MAINTENANCE_SHARE, "maintenance", "active"),
+        "popularity": FLOOR_POPULARITY_DECAY ** floor_index,
+    }
+
+
+def generate_bookings(rng: np.random.Generator, spaces: Dict[str, np.ndarray], user_ids: np.ndarray,
+                      count: int, days_back: int, days_ahead: int,
+                      now: datetime.datetime) -> Dict[str, np.ndarray]:
+    """
+    Columns of `count` non-overlapping bookings over the given window.
+
+    Args:
+        rng: Random generator
+        spaces: Space columns from generate_spaces
+        user_ids: IDs of the users making bookings
+        count: Number of bookings
+        days_back: Days of history before `now`
+        days_ahead: Days of future bookings after `now`
+        now: Current time
+
+    Returns:
+        Booking columns; start/end are minutes after the window start
+    """
+    days = days_back + days_ahead
+    bookable = np.flatnonzero(spaces["status"] == "active")
+    if not len(bookable):
+        raise ValueError("No bookable spaces to generate bookings for")
+
+    # Durations first, so the load can be checked before queuing
+    component = rng.choice(len(DURATION_MIX), size=count, p=[m[0] for m in DURATION_MIX])
+    medians = np.array([m[1] for m in DURATION_MIX])[component]
+    sigmas = np.array([m[2] for m in DURATION_MIX])[component]
+    hours = np.minimum(rng.lognormal(np.log(medians), sigmas), MAX_DURATION_HOURS)
+    duration = np.ceil(hours * 60 / SLOT_MINUTES).astype(np.int64) * SLOT_MINUTES
+    utilisation = duration.sum() / (len(bookable) * days * 24 * 60)
+    if utilisation > MAX_UTILISATION:
+        raise ValueError(f"{count} bookings would keep the lot {utilisation:.0%} busy; "
+                         f"use more spaces or a longer window")
+
+    # Poisson arrivals: day uniform, hour from that day's profile
+    window_start = (now - datetime.timedelta(days=days_back)).replace(hour=0, minute=0, second=0,
+                                                                      microsecond=0)
+    day = rng.integers(days, size=count)
+    weekend = ((window_start.weekday() + day) % 7) >= 5
+    hour = np.empty(count, dtype=np.int64)
+    for profile, mask in ((WEEKDAY_ARRIVALS, ~weekend), (WEEKEND_ARRIVALS, weekend)):
+        hour[mask] = rng.choice(24, size=int(mask.sum()), p=profile / profile.sum())
+    slot = rng.integers(60 // SLOT_MINUTES, size=count)
+    arrival = day * 1440 + hour * 60 + slot * SLOT_MINUTES
+
+    weights = spaces["popularity"][bookable]
+    space = bookable[rng.choice(len(bookable), size=count, p=weights / weights.sum())]
+
+    # Per space, in arrival order: end[i] = max(arrival[i], end[i-1]) + duration[i],
+    # i.e. end = S + running max of (arrival - S_prev) where S is the cumulative
+    # duration. An offset per space keeps the running max from crossing spaces.
+    order = np.lexsort((arrival, space))
+    space, arrival, duration = space[order], arrival[order], duration[order]
+    total = np.cumsum(duration)
+    previous = total - duration
+    offset = space.astype(np.int64) * (int(arrival.max()) + int(total[-1]) + 1)
+    end = total + np.maximum.accumulate(arrival - previous + offset) - offset
+    start = end - duration
+
+    now_minutes = int((now - window_start).total_seconds() // 60)
+    cancelled = rng.random(count) < CANCELLATION_RATE
+    status = np.where(cancelled, "cancelled", np.where(end <= now_minutes, "completed", "active"))
+
+    # Heavy users book far more often than the rest
+    user_weights = 1.0 / np.arange(1, len(user_ids) + 1) ** ZIPF_EXPONENT
+    user = rng.permutation(user_ids)[rng.choice(len(user_ids), size=count, p=user_weights / user_weights.sum())]
+
+    # Emit in start order, as the IDs of a real table would be
+    chronological = np.argsort(start, kind="stable")
+    return {
+        "user_id": user,
+        "space_id": spaces["id"][space[chronological]],
+        "start": start[chronological],
+        "end": end[chronological],
+        "vehicle_plate": _plates(rng, count),
+        "vehicle_type": _choice(rng, VEHICLE_MIX, count),
+        "status": status[chronological],
+        "window_start": np.datetime64(window_start, "m"),
+        "rate": spaces["hourly_rate"][space[chronological]],
+        "section": spaces["section"][space[chronological]],
+    }
+
+
+def _drop_indexes(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Drop a table's secondary indexes, returning the SQL to recreate them"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in indexes]
+
+
+def _insert(conn: sqlite3.Connection, sql: str, columns, chunk: int = INSERT_CHUNK) -> None:
+    """executemany over column lists, `chunk` rows at a time"""
+    columns = [np.asarray(c) for c in columns]
+    for low in range(0, len(columns[0]), chunk):
+        conn.executemany(sql, zip(*(c[low:low + chunk].tolist() for c in columns)))
+
+
+def generate_dataset(path: str, spaces: int = DEFAULT_SPACES, users: int = DEFAULT_USERS,
+                     bookings: int = DEFAULT_BOOKINGS, days_back: int = DEFAULT_DAYS_BACK,
+                     days_ahead: int = DEFAULT_DAYS_AHEAD, seed: Optional[int] = None,
+                     now: Optional[datetime.datetime] = None, offline: bool = False) -> Dict:
+    """
+    Generate a synthetic lot, users, bookings and payments into a database.
+
+    Args:
+        path: SQLite database file (created and migrated if needed)
+        spaces: Number of parking spaces
+        users: Number of users
+        bookings: Number of bookings
+        days_back: Days of booking history before now
+        days_ahead: Days of future bookings after now
+        seed: Random seed for reproducible data
+        now: Reference time (defaults to the current time)
+        offline: Nothing else uses the database: skip fsyncs and drop the
+            booking and payment indexes for the load, rebuilding them after
+
+    Returns:
+        Dict with the row counts written, 'last_end' (latest booking end)
+        and 'seconds' taken
+    """
+    if spaces < 1 or users < 1 or bookings < 0:
+        raise ValueError("Need at least one space and one user, and a non-negative booking count")
+    if days_back < 0 or days_ahead < 0 or days_back + days_ahead == 0:
+        raise ValueError("The booking window must span at least one day")
+
+    started = time.perf_counter()
+    now = (now or datetime.datetime.now()).replace(second=0, microsecond=0)
+    rng = np.random.default_rng(seed)
+    migrate(path)
+
+    # A plain connection: the loader needs neither pooling nor query tracing
+    conn = sqlite3.connect(path)
+    try:
+        if offline:
+            conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA cache_size = {LOADER_CACHE_KIB}")
+        first_user, first_space, first_payment = (
+            conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+            for table in ("users", "parking_spaces", "payments")
+        )
+        # Booking IDs are unique across the hot table and the archive
+        first_booking = conn.execute(
+            "SELECT MAX((SELECT COALESCE(MAX(id), 0) FROM bookings),"
+            " (SELECT COALESCE(MAX(id), 0) FROM bookings_archive)) + 1"
+        ).fetchone()[0]
+
+        lot = generate_spaces(rng, spaces, first_space)
+        user_ids = np.arange(first_user, first_user + users)
+        generated = generate_bookings(rng, lot, user_ids, bookings, days_back, days_ahead, now) if bookings else None
+
+        with conn:
+            names = np.char.add("loaduser", user_ids.astype(str))
+            password = hashlib.sha256(DEFAULT_PASSWORD.encode()).hexdigest()
+            _insert(conn, "INSERT INTO users (id, username, password, email, full_name) VALUES (?, ?, ?, ?, ?)",
+                    (user_ids, names, np.full(users, password), np.char.add(names, "@example.com"),
+                     np.char.add("Load User ", user_ids.astype(str))))
+
+            _insert(conn, '''
+            INSERT INTO parking_spaces (id, space_number, location, floor, section, is_accessible,
+                                        is_ev_charging, hourly_rate, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [lot[key] for key in ("id", "space_number", "location", "floor", "section",
+                                       "is_accessible", "is_ev_charging", "hourly_rate", "status")])
+
+        stats = {"users": users, "spaces": spaces, "bookings": 0, "payments": 0, "last_end": None}
+        if generated is not None:
+            epoch = generated["window_start"]
+            booking_ids = np.arange(first_booking, first_booking + bookings)
+            start_text = _format_times(generated["start"], epoch)
+            end_text = _format_times(generated["end"], epoch)
+            with conn:
+                # Building indexes once from sorted data beats updating them
+                # row by row; the DDL is part of the transaction, so a failed
+                # load rolls back to the original indexes
+                recreate = _drop_indexes(conn, "bookings") + _drop_indexes(conn, "payments") if offline else []
+                _insert(conn, '''
+                INSERT INTO bookings (id, user_id, space_id, start_time, end_time,
+                                      vehicle_plate, vehicle_type, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (booking_ids, generated["user_id"], generated["space_id"], start_text, end_text,
+                      generated["vehicle_plate"], generated["vehicle_type"], generated["status"]))
+
+                # Completed bookings were paid when they ended
+                paid = np.flatnonzero(generated["status"] == "completed")
+                amount = np.round(get_pricing_engine().quote_batch(
+                    generated["section"][paid],
+                    epoch + generated["start"][paid].astype("timedelta64[m]"),
+                    epoch + generated["end"][paid].astype("timedelta64[m]"),
+                    generated["rate"][paid]), 2)
+                _insert(conn, '''
+                INSERT INTO payments (id, booking_id, amount, payment_method, transaction_id, status, payment_date)
+                VALUES (?, ?, ?, ?, ?, 'completed', ?)
+                ''', (np.arange(first_payment, first_payment + len(paid)), booking_ids[paid], amount,
+                      _choice(rng, PAYMENT_METHODS, len(paid)),
+                      np.char.add("TXN", booking_ids[paid].astype(str)), end_text[paid]))
+                for sql in recreate:
+                    conn.execute(sql)
+
+                # Spaces occupied right now are not available
+                now_text = now.strftime("%Y-%m-%d %H:%M:%S")
+                conn.execute('''
+                UPDATE parking_spaces SET is_available = 0
+                WHERE id >= ? AND id IN (
+                    SELECT space_id FROM bookings
+                    WHERE id >= ? AND status = 'active' AND start_time <= ? AND end_time > ?
+                )
+                ''', (first_space, first_booking, now_text, now_text))
+
+            stats.update(bookings=bookings, payments=len(paid),
+                         last_end=str(_format_times(generated["end"].max(keepdims=True), epoch)[0]))
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate synthetic parking data into a SQLite database")
+    parser.add_argument("path", help="database file (created if missing)")
+    parser.add_argument("--spaces", type=int, default=DEFAULT_SPACES)
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--bookings", type=int, default=DEFAULT_BOOKINGS)
+    parser.add_argument("--days-back", type=int, default=DEFAULT_DAYS_BACK)
+    parser.add_argument("--days-ahead", type=int, default=DEFAULT_DAYS_AHEAD)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.path)), exist_ok=True)
+    try:
+        stats = generate_dataset(args.path, args.spaces, args.users, args.bookings,
+                                 args.days_back, args.days_ahead, args.seed, offline=True)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {stats['spaces']} spaces, {stats['users']} users, {stats['bookings']} bookings "
+          f"and {stats['payments']} payments to {args.path} in {stats['seconds']:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
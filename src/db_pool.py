@@ -0,0 +1,233 @@
+"""
+SQLite connection pooling for the Smart Parking application.
+
+Streamlit reruns the whole script on every interaction, so opening a fresh
+connection per query quickly adds up. This module keeps a bounded set of
+long-lived connections per database file, configures them once when they are
+opened (WAL journaling, relaxed fsync, memory-mapped I/O, larger page cache)
+and hands them out through a context manager.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from query_trace import QUERY_TRACING, TracingConnection
+
+# Pragmas applied to every new connection, in order
+DEFAULT_PRAGMAS: Sequence[Tuple[str, Union[str, int]]] = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),  # 256 MiB
+    ("cache_size", -64 * 1024),        # negative means KiB, i.e. 64 MiB
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),            # milliseconds
+)
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_CHECKOUT_TIMEOUT = 30.0
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of SQLite connections to a single database file.
+
+    Connections are created lazily up to ``max_size`` and reused in LIFO order
+    so the most recently used (and therefore warmest) connection is handed out
+    first. Use :meth:`connection` to borrow one::
+
+        with pool.connection() as conn:
+            conn.execute(...)
+            conn.commit()
+
+    Any transaction left open when a connection is returned is rolled back.
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_CHECKOUT_TIMEOUT,
+                 pragmas: Sequence[Tuple[str, Union[str, int]]] = DEFAULT_PRAGMAS):
+        if max_size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = tuple(pragmas)
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open_count = 0
+        self._closed = False
+
+        # Statistics
+        self._checkouts = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._opened_total = 0
+
+    # ---- Connection lifecycle ----
+
+    def _open(self) -> sqlite3.Connection:
+        """Open and configure a new connection"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        factory = TracingConnection if QUERY_TRACING else sqlite3.Connection
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check a connection out of the pool, opening one if there is room"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._open_count < self.max_size
+                if can_open:
+                    self._open_count += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._open_count -= 1
+                    raise
+                with self._lock:
+                    self._opened_total += 1
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._checkouts += 1
+            self._wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # The connection is unusable; drop it instead of recycling it
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        """Close a connection and free its slot"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open_count -= 1
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of a ``with`` block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Close all idle connections; in-use connections close when released"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    # ---- Introspection ----
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Return a snapshot of pool usage statistics"""
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "path": self.path,
+                "max_size": self.max_size,
+                "open": self._open_count,
+                "idle": idle,
+                "in_use": self._open_count - idle,
+                "opened_total": self._opened_total,
+                "checkouts": self._checkouts,
+                "wait_time_total": self._wait_time,
+                "wait_time_max": self._max_wait_time,
+                "wait_time_avg": self._wait_time / self._checkouts if self._checkouts else 0.0,
+            }
+
+
+# ---- Process-wide pool registry ----
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str, max_size: Optional[int] = None) -> ConnectionPool:
+    """
+    Return the shared pool for a database file, creating it on first use.
+
+    Args:
+        path: Path to the SQLite database file
+        max_size: Pool size to use if the pool has to be created
+
+    Returns:
+        The ConnectionPool for that file
+    """
+    key = os.path.abspath(path)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(path, max_size=max_size or DEFAULT_POOL_SIZE)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools() -> None:
+    """Close every pool in the registry"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Union[int, float]]]:
+    """Return statistics for every registered pool, keyed by database path"""
+    with _pools_lock:
+        return {path: pool.stats() for path, pool in _pools.items()}
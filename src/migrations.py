@@ -0,0 +1,536 @@
+"""
+Versioned schema migrations for the Smart Parking database.
+
+Every database file carries a ``schema_version`` table listing the migrations
+already applied to it. :func:`migrate` applies the missing ones in order and
+then remembers (per process) that the file is current, so Streamlit reruns
+pay nothing once the schema is up to date.
+
+Migration 1 creates the unified schema used by ``database.py`` (users,
+parking_spaces, bookings, payments). If it finds the tables written by the
+original root ``app.py`` (parking_spots and bookings with spot_id /
+payment_status) it moves them aside as ``legacy_*`` tables, and migration 2
+copies their rows into the unified tables in small batches before dropping
+them. Each migration is idempotent, so an interrupted run simply resumes.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Callable, List, Set, Tuple
+
+from db_pool import get_pool
+
+# Rows copied per transaction when importing legacy data
+MIGRATION_BATCH_SIZE = 5000
+
+# Rate charged by the original app, used to price imported payments
+LEGACY_HOURLY_RATE = 2.0
+
+_migrated_paths: Set[str] = set()
+_migrate_lock = threading.Lock()
+
+
+# ---- Helpers ----
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    """Whether a table exists in the main database"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def _table_columns(conn: sqlite3.Connection, name: str) -> List[str]:
+    """Column names of a table (empty if it does not exist)"""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({name})")]
+
+
+def _copy_in_batches(conn: sqlite3.Connection, target: str, insert_sql: str,
+                     batch_size: int, after_batch: Callable = None) -> int:
+    """
+    Run an INSERT ... SELECT over id ranges until the source is exhausted.
+
+    `insert_sql` takes (last_copied_id, batch_size) and must copy source rows
+    with their original ids, in id order, so MAX(id) of the target tells
+    where to resume. `after_batch(conn, low, high)` runs inside the same
+    transaction for each copied id range.
+    """
+    copied = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        last_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {target}').fetchone()[0]
+        count = conn.execute(insert_sql, (last_id, batch_size)).rowcount
+        if count > 0 and after_batch is not None:
+            high = conn.execute(f'SELECT MAX(id) FROM {target}').fetchone()[0]
+            after_batch(conn, last_id, high)
+        conn.commit()
+        copied += max(count, 0)
+        if count <= 0:
+            return copied
+
+
+# ---- Migrations ----
+
+def _create_core_schema(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 1: create the unified schema, setting legacy tables aside"""
+    conn.execute('BEGIN IMMEDIATE')
+
+    # Tables written by the original root app.py share names with the
+    # unified schema but not its shape; keep them for migration 2
+    if 'spot_id' in _table_columns(conn, 'bookings'):
+        conn.execute('ALTER TABLE bookings RENAME TO legacy_bookings')
+    users_columns = _table_columns(conn, 'users')
+    if users_columns and 'full_name' not in users_columns:
+        conn.execute('ALTER TABLE users RENAME TO legacy_users')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        full_name TEXT NOT NULL,
+        phone TEXT,
+        is_admin BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS parking_spaces (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        space_number TEXT UNIQUE NOT NULL,
+        location TEXT NOT NULL,
+        floor TEXT,
+        section TEXT,
+        is_accessible BOOLEAN DEFAULT 0,
+        is_ev_charging BOOLEAN DEFAULT 0,
+        hourly_rate REAL NOT NULL,
+        is_available BOOLEAN DEFAULT 1,
+        status TEXT DEFAULT 'active' CHECK(status IN ('active', 'maintenance', 'reserved', 'inactive')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS bookings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        space_id INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        vehicle_plate TEXT NOT NULL,
+        vehicle_type TEXT NOT NULL,
+        status TEXT DEFAULT 'active' CHECK(status IN ('active', 'completed', 'cancelled')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (space_id) REFERENCES parking_spaces (id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        booking_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        payment_method TEXT NOT NULL,
+        transaction_id TEXT,
+        status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'completed', 'failed', 'refunded')),
+        payment_date TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (booking_id) REFERENCES bookings (id)
+    )
+    ''')
+
+    # Overlap checks seek on (space_id, status) and range-scan end_time, so
+    # only bookings that finish after the requested start are visited and
+    # the cost does not grow with booking history
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_bookings_space_status_end
+    ON bookings (space_id, status, end_time, start_time)
+    ''')
+
+    conn.commit()
+
+
+def _import_legacy_data(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 2: copy legacy app.py rows into the unified tables in batches"""
+    if _table_exists(conn, 'legacy_users'):
+        # Emails were optional and not unique in the legacy table
+        _copy_in_batches(conn, 'users', '''
+        INSERT INTO users (id, username, password, email, full_name, is_admin)
+        SELECT l.id,
+               COALESCE(l.username, 'user' || l.id),
+               COALESCE(l.password, ''),
+               CASE WHEN COALESCE(l.email, '') != ''
+                     AND NOT EXISTS (SELECT 1 FROM legacy_users d WHERE d.email = l.email AND d.id < l.id)
+                    THEN l.email
+                    ELSE COALESCE(l.username, 'user' || l.id) || '@legacy.invalid'
+               END,
+               COALESCE(l.username, 'user' || l.id),
+               COALESCE(l.is_admin, 0)
+        FROM legacy_users l
+        WHERE l.id > ?
+        ORDER BY l.id
+        LIMIT ?
+        ''', batch_size)
+
+    if _table_exists(conn, 'parking_spots'):
+        # Legacy statuses: available / booked / maintenance
+        _copy_in_batches(conn, 'parking_spaces', f'''
+        INSERT INTO parking_spaces (id, space_number, location, floor, section,
+                                    hourly_rate, is_available, status)
+        SELECT s.id,
+               CASE WHEN s.spot_number IS NOT NULL
+                     AND NOT EXISTS (SELECT 1 FROM parking_spots d WHERE d.spot_number = s.spot_number AND d.id < s.id)
+                    THEN s.spot_number
+                    ELSE COALESCE(s.spot_number, 'SPOT') || '-' || s.id
+               END,
+               'Section ' || COALESCE(s.section, '?') || ', Floor ' || COALESCE(s.floor, '?'),
+               CAST(s.floor AS TEXT),
+               s.section,
+               {LEGACY_HOURLY_RATE},
+               CASE WHEN s.status = 'available' THEN 1 ELSE 0 END,
+               CASE WHEN s.status = 'maintenance' THEN 'maintenance' ELSE 'active' END
+        FROM parking_spots s
+        WHERE s.id > ?
+        ORDER BY s.id
+        LIMIT ?
+        ''', batch_size)
+
+    if _table_exists(conn, 'legacy_bookings'):
+        def copy_payments(conn, low, high):
+            # Legacy bookings tracked payment inline as payment_status
+            conn.execute(f'''
+            INSERT INTO payments (booking_id, amount, payment_method, status, payment_date)
+            SELECT b.id,
+                   ROUND(MAX(julianday(b.end_time) - julianday(b.start_time), 0) * 24 * {LEGACY_HOURLY_RATE}, 2),
+                   'legacy', 'completed', b.end_time
+            FROM legacy_bookings b
+            WHERE b.id > ? AND b.id <= ? AND b.payment_status = 'paid'
+            ''', (low, high))
+
+        _copy_in_batches(conn, 'bookings', '''
+        INSERT INTO bookings (id, user_id, space_id, start_time, end_time,
+                              vehicle_plate, vehicle_type, status)
+        SELECT b.id, b.user_id, b.spot_id, b.start_time, b.end_time,
+               'UNKNOWN', 'car',
+               CASE b.status
+                   WHEN 'cancelled' THEN 'cancelled'
+                   WHEN 'completed' THEN 'completed'
+                   ELSE 'active'
+               END
+        FROM legacy_bookings b
+        WHERE b.id > ?
+        ORDER BY b.id
+        LIMIT ?
+        ''', batch_size, after_batch=copy_payments)
+
+    conn.execute('BEGIN IMMEDIATE')
+    for table in ('legacy_bookings', 'parking_spots', 'legacy_users'):
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.commit()
+
+
+def _space_state(row: str) -> str:
+    """SQL expression for the occupancy state of a parking_spaces row"""
+    return (f"CASE WHEN {row}.status = 'active' "
+            f"THEN CASE WHEN {row}.is_available THEN 'available' ELSE 'occupied' END "
+            f"ELSE {row}.status END")
+
+
+def _create_space_counters(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 3: per (floor, section, state) space counts kept by triggers"""
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS space_counters (
+        floor TEXT NOT NULL,
+        section TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (floor, section, status)
+    ) WITHOUT ROWID
+    ''')
+
+    # Booking writes flip parking_spaces.is_available, so triggers on the
+    # spaces table see every change of occupancy
+    increment = '''
+        INSERT INTO space_counters (floor, section, status, count)
+        VALUES (COALESCE(NEW.floor, ''), COALESCE(NEW.section, ''), {state}, 1)
+        ON CONFLICT (floor, section, status) DO UPDATE SET count = count + 1;
+    '''.format(state=_space_state('NEW'))
+    decrement = '''
+        UPDATE space_counters SET count = count - 1
+        WHERE floor = COALESCE(OLD.floor, '') AND section = COALESCE(OLD.section, '')
+          AND status = {state};
+    '''.format(state=_space_state('OLD'))
+
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_space_counters_insert
+    AFTER INSERT ON parking_spaces
+    BEGIN {increment} END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_space_counters_delete
+    AFTER DELETE ON parking_spaces
+    BEGIN {decrement} END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_space_counters_update
+    AFTER UPDATE OF floor, section, status, is_available ON parking_spaces
+    WHEN OLD.floor IS NOT NEW.floor OR OLD.section IS NOT NEW.section
+      OR ({_space_state('OLD')}) IS NOT ({_space_state('NEW')})
+    BEGIN {decrement} {increment} END
+    ''')
+
+    # Backfill from the current rows
+    conn.execute('DELETE FROM space_counters')
+    conn.execute(f'''
+    INSERT INTO space_counters (floor, section, status, count)
+    SELECT COALESCE(s.floor, ''), COALESCE(s.section, ''), {_space_state('s')}, COUNT(*)
+    FROM parking_spaces s
+    GROUP BY 1, 2, 3
+    ''')
+    conn.commit()
+
+
+def _create_booking_list_indexes(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 4: indexes serving keyset-paginated booking lists"""
+    conn.execute('BEGIN IMMEDIATE')
+    # The rowid trails every index entry, so both indexes are ordered by
+    # (start_time, id) within the leading column and serve the
+    # (start_time, id) keyset directly
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_start ON bookings (user_id, start_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bookings_status_start ON bookings (status, start_time)')
+    conn.commit()
+
+
+def _create_bookings_archive(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 5: cold tier for finished bookings moved out of the hot table"""
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS bookings_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        space_id INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        vehicle_plate TEXT NOT NULL,
+        vehicle_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_user_start ON bookings_archive (user_id, start_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_space_start ON bookings_archive (space_id, start_time)')
+    conn.commit()
+
+
+# Change-log rows kept for catching up in-memory space indexes
+SPACE_CHANGE_LOG_SIZE = 10000
+
+
+def _create_space_change_log(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 6: log of changed parking space IDs for incremental indexes"""
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS space_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        space_id INTEGER NOT NULL
+    )
+    ''')
+
+    # Every writer, including raw SQL outside database.py, goes through these
+    # triggers. The log is trimmed as it grows; a reader that fell further
+    # behind than the log reaches back reloads everything.
+    log = '''
+        INSERT INTO space_changes (space_id) VALUES ({row}.id);
+        DELETE FROM space_changes WHERE seq <= last_insert_rowid() - {keep};
+    '''
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_space_changes_{event.lower()}
+        AFTER {event} ON parking_spaces
+        BEGIN {log.format(row=row, keep=SPACE_CHANGE_LOG_SIZE)} END
+        ''')
+    conn.commit()
+
+
+def _create_waitlist(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 7: requests waiting for a space to free up"""
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS waitlist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        space_class TEXT NOT NULL DEFAULT 'standard',
+        priority INTEGER NOT NULL DEFAULT 0,
+        vehicle_plate TEXT NOT NULL DEFAULT 'UNKNOWN',
+        vehicle_type TEXT NOT NULL DEFAULT 'car',
+        status TEXT NOT NULL DEFAULT 'waiting' CHECK(status IN ('waiting', 'booked', 'cancelled', 'expired')),
+        booking_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (booking_id) REFERENCES bookings (id)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_status_start ON waitlist (status, start_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_user_status ON waitlist (user_id, status)')
+    conn.commit()
+
+
+def _add_booking_check_in(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 8: arrival time of each booking, for releasing no-shows"""
+    conn.execute('BEGIN IMMEDIATE')
+    if 'checked_in_at' not in _table_columns(conn, 'bookings'):
+        conn.execute('ALTER TABLE bookings ADD COLUMN checked_in_at TIMESTAMP')
+        # Bookings already under way predate check-in; treat them as arrived
+        conn.execute('''
+        UPDATE bookings SET checked_in_at = start_time
+        WHERE status = 'active' AND start_time <= strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')
+        ''')
+    conn.commit()
+
+
+def _create_booking_series(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 9: recurring booking series, with occurrences linked back to them"""
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS booking_series (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        space_id INTEGER NOT NULL,
+        rule TEXT NOT NULL,
+        starts_on DATE NOT NULL,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL,
+        vehicle_plate TEXT NOT NULL,
+        vehicle_type TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active', 'cancelled')),
+        materialized_until DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (space_id) REFERENCES parking_spaces (id)
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_booking_series_status_until
+    ON booking_series (status, materialized_until)
+    ''')
+    if 'series_id' not in _table_columns(conn, 'bookings'):
+        conn.execute('ALTER TABLE bookings ADD COLUMN series_id INTEGER REFERENCES booking_series (id)')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_bookings_series_start
+    ON bookings (series_id, start_time) WHERE series_id IS NOT NULL
+    ''')
+    conn.commit()
+
+
+def _add_archive_booking_columns(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 10: keep check-in times and series links of archived bookings"""
+    conn.execute('BEGIN IMMEDIATE')
+    columns = _table_columns(conn, 'bookings_archive')
+    if 'checked_in_at' not in columns:
+        conn.execute('ALTER TABLE bookings_archive ADD COLUMN checked_in_at TIMESTAMP')
+    if 'series_id' not in columns:
+        conn.execute('ALTER TABLE bookings_archive ADD COLUMN series_id INTEGER')
+    conn.commit()
+
+
+def _create_series_skips(conn: sqlite3.Connection, batch_size: int) -> None:
+    """Migration 11: series occurrences that could not be booked, and why"""
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS series_skips (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        series_id INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        reason TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (series_id) REFERENCES booking_series (id)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_series_skips_series ON series_skips (series_id, start_time)')
+    conn.commit()
+
+
+# Ordered list of (version, description, apply(conn, batch_size))
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection, int], None]]] = [
+    (1, 'Create unified core schema', _create_core_schema),
+    (2, 'Import legacy app.py tables', _import_legacy_data),
+    (3, 'Add trigger-maintained space counters', _create_space_counters),
+    (4, 'Add booking list indexes', _create_booking_list_indexes),
+    (5, 'Add bookings archive table', _create_bookings_archive),
+    (6, 'Add parking space change log', _create_space_change_log),
+    (7, 'Add booking waitlist', _create_waitlist),
+    (8, 'Add booking check-in time', _add_booking_check_in),
+    (9, 'Add recurring booking series', _create_booking_series),
+    (10, 'Add check-in and series columns to the bookings archive', _add_archive_booking_columns),
+    (11, 'Record skipped series occurrences', _create_series_skips),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ---- Runner ----
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Highest migration version applied to a database (0 if none)"""
+    if not _table_exists(conn, 'schema_version'):
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(path: str, batch_size: int = MIGRATION_BATCH_SIZE) -> List[int]:
+    """
+    Bring a database file up to the latest schema version.
+
+    Args:
+        path: Path to the SQLite database file
+        batch_size: Rows copied per transaction by data migrations
+
+    Returns:
+        Versions applied by this call (empty if the schema was already current)
+    """
+    key = os.path.abspath(path)
+    if key in _migrated_paths:
+        return []
+
+    with _migrate_lock:
+        if key in _migrated_paths:
+            return []
+
+        applied = []
+        with get_pool(path).connection() as conn:
+            current = get_schema_version(conn)
+            if current < LATEST_VERSION:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+                conn.commit()
+
+                for version, description, apply in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    apply(conn, batch_size)
+
+                    # Another process may have finished the same migration
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.execute(
+                        'INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)',
+                        (version, description)
+                    )
+                    conn.commit()
+                    applied.append(version)
+
+        _migrated_paths.add(key)
+        return applied
@@ -0,0 +1,271 @@
+"""
+Query tracing and slow-query log for SQLite connections.
+
+Connections opened by the pool use :class:`TracingConnection`, whose cursors
+time every statement from ``execute`` until its results are exhausted (so
+the time spent stepping through rows in ``fetchall`` is included). Timings
+are grouped by *query shape*, the SQL with literals and IN-lists folded, and
+kept in a bounded sample per shape for p50/p95/p99.
+
+The first time a shape is seen its ``EXPLAIN QUERY PLAN`` is captured, and
+shapes whose plan scans a table instead of searching an index are flagged.
+Statements slower than the threshold are logged with that plan and kept in
+a bounded slow-query log.
+
+``sqlite3``'s ``set_trace_callback`` reports statement text but no timing,
+which is why the cursor is wrapped instead. Set ``PARKING_QUERY_TRACING=0``
+to turn tracing off; ``PARKING_SLOW_QUERY_MS`` sets the threshold.
+"""
+
+import collections
+import datetime
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUERY_TRACING = os.environ.get("PARKING_QUERY_TRACING", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("PARKING_SLOW_QUERY_MS", "100"))
+SAMPLES_PER_SHAPE = 1000
+SLOW_LOG_SIZE = 200
+
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def query_shape(sql: str) -> str:
+    """Normalise SQL so statements differing only in literals group together"""
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _WHITESPACE.sub(" ", shape).strip()
+    return _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+
+
+def _is_full_scan(detail: str) -> bool:
+    """Whether an EXPLAIN QUERY PLAN step reads a whole table or index"""
+    return detail.startswith("SCAN ") and "CONSTANT ROW" not in detail
+
+
+class _ShapeStats:
+    """Timings and plan of one query shape"""
+
+    __slots__ = ("count", "total", "max", "samples", "plan", "full_scan")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = collections.deque(maxlen=SAMPLES_PER_SHAPE)
+        self.plan: Optional[List[str]] = None
+        self.full_scan = False
+
+
+class QueryTracer:
+    """Collects per-shape timings and the slow-query log"""
+
+    def __init__(self, slow_threshold_ms: float = SLOW_QUERY_MS):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, _ShapeStats] = {}
+        self._slow: Deque[Dict] = collections.deque(maxlen=SLOW_LOG_SIZE)
+
+    def needs_plan(self, shape: str) -> bool:
+        """Whether the plan of a shape has not been captured yet"""
+        stats = self._shapes.get(shape)
+        return stats is None or stats.plan is None
+
+    def set_plan(self, shape: str, plan: List[str]) -> None:
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = _ShapeStats()
+            stats.plan = plan
+            stats.full_scan = any(_is_full_scan(step) for step in plan)
+
+    def record(self, sql: str, elapsed: float) -> None:
+        """Record one finished statement (elapsed in seconds)"""
+        shape = query_shape(sql)
+        elapsed_ms = elapsed * 1000.0
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = _ShapeStats()
+            stats.count += 1
+            stats.total += elapsed_ms
+            stats.max = max(stats.max, elapsed_ms)
+            stats.samples.append(elapsed_ms)
+            slow = elapsed_ms >= self.slow_threshold_ms
+            if slow:
+                self._slow.append({
+                    "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "shape": shape,
+                    "elapsed_ms": elapsed_ms,
+                    "plan": list(stats.plan or []),
+                    "full_scan": stats.full_scan,
+                })
+        if slow:
+            logger.warning("Slow query (%.1f ms)%s: %s\n  plan: %s", elapsed_ms,
+                           " [full scan]" if stats.full_scan else "", shape,
+                           " | ".join(stats.plan or ["unknown"]))
+
+    def stats(self) -> List[Dict]:
+        """Per-shape statistics, most total time first"""
+        with self._lock:
+            items = [(shape, s.count, s.total, s.max, list(s.samples), s.plan, s.full_scan)
+                     for shape, s in self._shapes.items() if s.count]
+        report = []
+        for shape, count, total, max_ms, samples, plan, full_scan in items:
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            report.append({
+                "shape": shape,
+                "count": count,
+                "total_ms": total,
+                "mean_ms": total / count,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": max_ms,
+                "full_scan": full_scan,
+                "plan": list(plan or []),
+            })
+        report.sort(key=lambda row: row["total_ms"], reverse=True)
+        return report
+
+    def slow_queries(self) -> List[Dict]:
+        """Slow-query log, newest first"""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self) -> None:
+        """Forget all statistics"""
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+
+
+_tracer = QueryTracer()
+
+
+def get_query_tracer() -> QueryTracer:
+    """Return the process-wide query tracer"""
+    return _tracer
+
+
+def _capture_plan(conn: sqlite3.Connection, shape: str, sql: str, parameters) -> None:
+    """Store the EXPLAIN QUERY PLAN of a statement under its shape"""
+    try:
+        # A plain cursor, so the EXPLAIN itself is not traced
+        rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        plan = [row[3] for row in rows]
+    except sqlite3.Error:
+        plan = []
+    _tracer.set_plan(shape, plan)
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor timing each statement until its results are exhausted"""
+
+    _sql: Optional[str] = None
+    _elapsed = 0.0
+
+    def _finish(self) -> None:
+        if self._sql is not None:
+            _tracer.record(self._sql, self._elapsed)
+            self._sql = None
+
+    def _begin(self, sql: str, parameters) -> None:
+        self._finish()
+        shape = query_shape(sql)
+        if _tracer.needs_plan(shape) and sql.lstrip()[:7].upper().startswith(_EXPLAINABLE):
+            _capture_plan(self.connection, shape, sql, parameters)
+        self._sql = sql
+        self._elapsed = 0.0
+
+    def execute(self, sql: str, parameters: Sequence = ()):
+        self._begin(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql: str, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        self._begin(sql, seq_of_parameters[0] if seq_of_parameters else ())
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        if size is None:
+            size = self.arraysize
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._elapsed += time.perf_counter() - started
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Statements whose rows were never fully read are recorded here
+        self._finish()
+
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), are traced"""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters: Sequence = ()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
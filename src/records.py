@@ -0,0 +1,144 @@
+"""
+Compact row types for database reads.
+
+``dict(row)`` allocates a hash table per row, which dominates memory and CPU
+when the admin and analytics paths read whole tables. The record types
+here are typed ``NamedTuple`` classes: ``__slots__ = ()`` tuples with named
+fields, built from plain SQLite tuples by a single C-level call per row.
+
+:func:`fetch` runs a query in one of three result modes:
+
+* ``'record'``: a list of record instances
+* ``'columns'``: a dict of NumPy arrays, one per field, for bulk analytics
+* ``'dict'``: a list of dicts, kept so existing callers work unchanged
+"""
+
+import functools
+import sqlite3
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+RESULT_MODES = ('dict', 'record', 'columns')
+
+
+class User(NamedTuple):
+    id: int
+    username: str
+    password: str
+    email: str
+    full_name: str
+    phone: Optional[str]
+    is_admin: bool
+    created_at: str
+
+
+class ParkingSpace(NamedTuple):
+    id: int
+    space_number: str
+    location: str
+    floor: Optional[str]
+    section: Optional[str]
+    is_accessible: bool
+    is_ev_charging: bool
+    hourly_rate: float
+    is_available: bool
+    status: str
+    created_at: str
+
+
+class BookingDetail(NamedTuple):
+    """A booking joined with its space and user"""
+    id: int
+    user_id: int
+    space_id: int
+    start_time: str
+    end_time: str
+    vehicle_plate: str
+    vehicle_type: str
+    status: str
+    created_at: str
+    checked_in_at: Optional[str]
+    series_id: Optional[int]
+    space_number: str
+    location: str
+    hourly_rate: float
+    username: str
+    full_name: str
+    email: str
+    phone: Optional[str]
+
+
+class Payment(NamedTuple):
+    id: int
+    booking_id: int
+    amount: float
+    payment_method: str
+    transaction_id: Optional[str]
+    status: str
+    payment_date: Optional[str]
+    created_at: str
+
+
+# NumPy dtype per annotation in columnar mode; everything else stays object
+_COLUMN_DTYPES = {int: np.int64, float: np.float64, bool: np.bool_}
+
+# Timestamp fields become datetime64 columns
+_TIMESTAMP_FIELDS = {'start_time', 'end_time', 'created_at', 'checked_in_at', 'payment_date', 'archived_at'}
+
+
+def sql_columns(record_type: type, alias: Optional[str] = None) -> str:
+    """SELECT list producing a record type's fields in order"""
+    prefix = f"{alias}." if alias else ""
+    return ', '.join(prefix + field for field in record_type._fields)
+
+
+@functools.lru_cache(maxsize=None)
+def _maker(record_type: type):
+    """C-level constructor building a record from a row tuple"""
+    return functools.partial(tuple.__new__, record_type)
+
+
+def to_columns(record_type: type, rows: Sequence[tuple]) -> Dict[str, np.ndarray]:
+    """Transpose row tuples into one NumPy array per record field"""
+    fields = record_type._fields
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    result = {}
+    for field, values in zip(fields, columns):
+        if field in _TIMESTAMP_FIELDS:
+            dtype = 'datetime64[s]'
+        else:
+            dtype = _COLUMN_DTYPES.get(record_type.__annotations__.get(field), object)
+        result[field] = np.array(values, dtype=dtype)
+    return result
+
+
+def fetch(conn: sqlite3.Connection, record_type: type, query: str, params: Sequence = (),
+          result: str = 'dict') -> Union[List[Any], Dict[str, np.ndarray]]:
+    """
+    Run a query whose columns match a record type's fields, in order.
+
+    Args:
+        conn: Database connection
+        record_type: Record class describing the selected columns
+        query: SQL query
+        params: Query parameters
+        result: 'dict', 'record' or 'columns'
+
+    Returns:
+        List of dicts or records, or a dict of column arrays
+    """
+    if result not in RESULT_MODES:
+        raise ValueError(f"Unknown result mode {result!r}; expected one of {RESULT_MODES}")
+
+    # Plain tuples skip building a sqlite3.Row per row
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(query, params).fetchall()
+
+    if result == 'record':
+        return list(map(_maker(record_type), rows))
+    if result == 'columns':
+        return to_columns(record_type, rows)
+    fields = record_type._fields
+    return [dict(zip(fields, row)) for row in rows]
@@ -0,0 +1,341 @@
+"""
+Recurring booking series.
+
+A series is one ``booking_series`` row (migration 9): a space, a daily time
+window and an RRULE-like recurrence, e.g. every weekday 08:00-18:00::
+
+    create_series(user_id, "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR", "08:00", "18:00",
+                  starts_on=date.today(), vehicle_plate="AB12CDE", vehicle_type="car",
+                  section="B")
+
+Occurrences become ordinary bookings (linked by ``bookings.series_id``) only
+over a rolling horizon of ``HORIZON_DAYS``; :func:`extend_series` moves the
+horizon forward and is cheap to call often, since it only touches series
+whose horizon has fallen behind. Occurrences that clash with other
+bookings are skipped and recorded in ``series_skips`` (migration 11).
+Occurrence dates are computed with NumPy
+over the date range, and the space is chosen by checking every occurrence
+in the horizon against the availability matrix in one pass.
+
+Supported rule parts: FREQ (DAILY or WEEKLY), INTERVAL, BYDAY, UNTIL and
+COUNT. A window whose end is not after its start runs past midnight.
+"""
+
+import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+import database
+from availability import DEFAULT_HORIZON_DAYS, get_availability_engine
+from space_index import find_space_ids
+
+HORIZON_DAYS = DEFAULT_HORIZON_DAYS
+
+DAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = ('DAILY', 'WEEKLY')
+
+SERIES_COLUMNS = ('id, user_id, space_id, rule, starts_on, start_time, end_time, vehicle_plate, '
+                  'vehicle_type, status, materialized_until, created_at')
+
+DateLike = Union[datetime.date, str]
+TimeOfDay = Union[datetime.time, str]
+
+
+class Recurrence(NamedTuple):
+    """A parsed recurrence rule"""
+    freq: str = 'WEEKLY'
+    interval: int = 1
+    by_day: Tuple[int, ...] = ()             # weekdays, Monday = 0
+    until: Optional[datetime.date] = None
+    count: Optional[int] = None
+
+
+def parse_rule(text: str) -> Recurrence:
+    """
+    Parse a rule such as 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20261231'.
+
+    Raises:
+        ValueError: For unknown parts or values
+    """
+    parts = {}
+    for item in filter(None, (part.strip() for part in text.upper().split(';'))):
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Malformed recurrence rule part {item!r}")
+        parts[key] = value
+
+    unknown = set(parts) - {'FREQ', 'INTERVAL', 'BYDAY', 'UNTIL', 'COUNT'}
+    if unknown:
+        raise ValueError(f"Unsupported recurrence rule parts: {', '.join(sorted(unknown))}")
+    freq = parts.get('FREQ', 'WEEKLY')
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Unsupported recurrence frequency {freq!r}")
+    try:
+        by_day = tuple(sorted({DAY_CODES.index(day) for day in parts['BYDAY'].split(',')})) \
+            if parts.get('BYDAY') else ()
+    except ValueError:
+        raise ValueError(f"Invalid BYDAY {parts['BYDAY']!r}")
+    interval = int(parts.get('INTERVAL', 1))
+    count = int(parts['COUNT']) if 'COUNT' in parts else None
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("INTERVAL and COUNT must be positive")
+    until = None
+    if 'UNTIL' in parts:
+        until = datetime.datetime.strptime(parts['UNTIL'].replace('-', '')[:8], '%Y%m%d').date()
+    return Recurrence(freq, interval, by_day, until, count)
+
+
+def format_rule(rule: Recurrence) -> str:
+    """Inverse of parse_rule"""
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.by_day:
+        parts.append("BYDAY=" + ",".join(DAY_CODES[day] for day in rule.by_day))
+    if rule.until is not None:
+        parts.append(f"UNTIL={rule.until:%Y%m%d}")
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    return ";".join(parts)
+
+
+def _to_date(value: DateLike) -> datetime.date:
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+
+
+def _to_time(value: TimeOfDay) -> datetime.time:
+    return value if isinstance(value, datetime.time) else datetime.time.fromisoformat(value)
+
+
+def occurrence_dates(rule: Recurrence, starts_on: DateLike, first: DateLike, last: DateLike) -> np.ndarray:
+    """
+    Dates in [first, last] on which a series starting on `starts_on` occurs.
+
+    Returns:
+        Sorted datetime64[D] array
+    """
+    starts_on = np.datetime64(_to_date(starts_on), 'D')
+    last = np.datetime64(_to_date(last), 'D')
+    if rule.until is not None:
+        last = min(last, np.datetime64(rule.until, 'D'))
+    if last < starts_on:
+        return np.empty(0, dtype='datetime64[D]')
+
+    # COUNT is numbered from the first occurrence, so it needs the whole run
+    days = np.arange(starts_on, last + 1)
+    offset = (days - starts_on).astype(np.int64)
+    weekday = (days.astype(np.int64) + 3) % 7          # 1970-01-01 was a Thursday
+    if rule.freq == 'DAILY':
+        keep = offset % rule.interval == 0
+        if rule.by_day:
+            keep &= np.isin(weekday, rule.by_day)
+    else:
+        by_day = rule.by_day or (int(weekday[0]),)
+        week = (offset + int(weekday[0])) // 7           # weeks since the Monday of starts_on
+        keep = (week % rule.interval == 0) & np.isin(weekday, by_day)
+
+    dates = days[keep]
+    if rule.count is not None:
+        dates = dates[:rule.count]
+    return dates[dates >= np.datetime64(_to_date(first), 'D')]
+
+
+def occurrence_windows(dates: np.ndarray, start_time: TimeOfDay,
+                       end_time: TimeOfDay) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """(start, end) datetimes of the occurrences on each date"""
+    start_time, end_time = _to_time(start_time), _to_time(end_time)
+    overnight = datetime.timedelta(days=1 if end_time <= start_time else 0)
+    windows = []
+    for day in dates.astype(datetime.date):
+        windows.append((datetime.datetime.combine(day, start_time),
+                        datetime.datetime.combine(day, end_time) + overnight))
+    return windows
+
+
+def _choose_space(windows: List[Tuple[datetime.datetime, datetime.datetime]], space_id: Optional[int],
+                  floor: Optional[str], section: Optional[str]) -> int:
+    """A space free for every window in the availability horizon"""
+    engine = get_availability_engine()
+    free = engine.free_mask_windows(windows)
+    if space_id is not None:
+        candidates = np.array([space_id], dtype=np.int64)
+    else:
+        candidates = find_space_ids(database.DB_PATH, floor=floor, section=section)
+    free &= np.isin(engine.space_ids, candidates)
+    if not free.any():
+        raise ValueError("No parking space is available for every occurrence of the series")
+    return int(engine.space_ids[free].min())
+
+
+def _occurrence_rows(series: Dict, windows) -> List[Dict]:
+    return [{'user_id': series['user_id'], 'space_id': series['space_id'], 'start_time': start,
+             'end_time': end, 'vehicle_plate': series['vehicle_plate'],
+             'vehicle_type': series['vehicle_type'], 'series_id': series['id']}
+            for start, end in windows]
+
+
+def _record_skips(conn, rows: List[Dict], errors: List[Tuple[int, str]]) -> None:
+    """Log the occurrences insert_bookings refused against their series"""
+    conn.executemany(
+        'INSERT INTO series_skips (series_id, start_time, end_time, reason) VALUES (?, ?, ?, ?)',
+        [(rows[i]['series_id'], database.to_db_timestamp(rows[i]['start_time']),
+          database.to_db_timestamp(rows[i]['end_time']), reason) for i, reason in errors]
+    )
+
+
+def create_series(user_id: int, rule: str, start_time: TimeOfDay, end_time: TimeOfDay,
+                  starts_on: DateLike, vehicle_plate: str, vehicle_type: str,
+                  space_id: Optional[int] = None, floor: Optional[str] = None,
+                  section: Optional[str] = None, today: Optional[datetime.date] = None) -> Dict:
+    """
+    Create a recurring booking series and book its occurrences in the horizon.
+
+    Args:
+        user_id: Booking user
+        rule: Recurrence rule, see parse_rule
+        start_time: Daily start ('HH:MM' or time)
+        end_time: Daily end; not after start_time means the next day
+        starts_on: Date of the first possible occurrence
+        vehicle_plate: Plate for every occurrence
+        vehicle_type: Vehicle type for every occurrence
+        space_id: Space to book, or None to pick one free for every occurrence
+        floor: Restrict the automatic choice to a floor
+        section: Restrict the automatic choice to a section
+        today: Current date (for tests)
+
+    Returns:
+        {'series_id', 'space_id', 'inserted', 'skipped'}; occurrences that
+        clash with bookings made meanwhile are skipped and recorded
+    """
+    recurrence = parse_rule(rule)
+    start_time, end_time = _to_time(start_time), _to_time(end_time)
+    starts_on = _to_date(starts_on)
+    today = today or datetime.date.today()
+    horizon = today + datetime.timedelta(days=HORIZON_DAYS)
+
+    windows = occurrence_windows(occurrence_dates(recurrence, starts_on, max(starts_on, today), horizon),
+                                 start_time, end_time)
+    space_id = _choose_space(windows, space_id, floor, section)
+
+    # The series and its first occurrences commit together, so a failed
+    # insert cannot leave a series marked as booked up to the horizon
+    with database.db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        series_id = conn.execute('''
+        INSERT INTO booking_series (user_id, space_id, rule, starts_on, start_time, end_time,
+                                    vehicle_plate, vehicle_type, materialized_until)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, space_id, format_rule(recurrence), starts_on.isoformat(),
+              start_time.strftime('%H:%M'), end_time.strftime('%H:%M'), vehicle_plate, vehicle_type,
+              horizon.isoformat())).lastrowid
+        series = {'id': series_id, 'user_id': user_id, 'space_id': space_id,
+                  'vehicle_plate': vehicle_plate, 'vehicle_type': vehicle_type}
+        rows = _occurrence_rows(series, windows)
+        result = database.insert_bookings(conn, rows)
+        _record_skips(conn, rows, result['errors'])
+        conn.commit()
+
+    for booking in result['created']:
+        database.notify_booking_listeners('created', booking)
+    return {'series_id': series_id, 'space_id': space_id,
+            'inserted': result['inserted'], 'skipped': len(result['errors'])}
+
+
+def extend_series(today: Optional[datetime.date] = None, horizon_days: int = HORIZON_DAYS) -> Dict:
+    """
+    Book the occurrences that entered the rolling horizon since the last call.
+
+    Series whose space is not active (e.g. under maintenance) wait until it
+    is. The occurrences, the skips and the new horizon commit together, and
+    concurrent callers serialize on the write lock, so each occurrence is
+    booked once.
+
+    Returns:
+        {'series', 'inserted', 'skipped'}
+    """
+    today = today or datetime.date.today()
+    horizon = today + datetime.timedelta(days=horizon_days)
+    query = f'''
+    SELECT {', '.join('s.' + column for column in SERIES_COLUMNS.split(', '))}
+    FROM booking_series s JOIN parking_spaces p ON p.id = s.space_id
+    WHERE s.status = 'active' AND s.materialized_until < ? AND p.status = 'active'
+    '''
+    nothing = {'series': 0, 'inserted': 0, 'skipped': 0}
+    with database.db_connection() as conn:
+        # Most calls find nothing due; only take the write lock when something is
+        if conn.execute(query + ' LIMIT 1', (horizon.isoformat(),)).fetchone() is None:
+            return nothing
+        conn.execute('BEGIN IMMEDIATE')
+        due = [dict(row) for row in conn.execute(query, (horizon.isoformat(),))]
+        if not due:
+            # Another session extended them first
+            conn.rollback()
+            return nothing
+
+        rows = []
+        for series in due:
+            first = datetime.date.fromisoformat(series['materialized_until']) + datetime.timedelta(days=1)
+            dates = occurrence_dates(parse_rule(series['rule']), series['starts_on'], max(first, today), horizon)
+            rows.extend(_occurrence_rows(series, occurrence_windows(dates, series['start_time'],
+                                                                    series['end_time'])))
+        result = database.insert_bookings(conn, rows)
+        _record_skips(conn, rows, result['errors'])
+        conn.executemany('UPDATE booking_series SET materialized_until = ? WHERE id = ?',
+                         [(horizon.isoformat(), series['id']) for series in due])
+        conn.commit()
+
+    for booking in result['created']:
+        database.notify_booking_listeners('created', booking)
+    return {'series': len(due), 'inserted': result['inserted'], 'skipped': len(result['errors'])}
+
+
+def cancel_series(series_id: int, after: Optional[datetime.datetime] = None) -> int:
+    """
+    Stop a series and cancel its occurrences starting from `after` (now by default).
+
+    Returns:
+        Number of occurrences cancelled
+    """
+    after = database.to_db_timestamp(after or datetime.datetime.now())
+    with database.db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("UPDATE booking_series SET status = 'cancelled' WHERE id = ?", (series_id,))
+        cancelled = [dict(row) for row in conn.execute('''
+        SELECT id, user_id, space_id, start_time, end_time FROM bookings
+        WHERE series_id = ? AND status = 'active' AND start_time >= ?
+        ''', (series_id, after))]
+        conn.execute('''
+        UPDATE bookings SET status = 'cancelled'
+        WHERE series_id = ? AND status = 'active' AND start_time >= ?
+        ''', (series_id, after))
+        # Same rule as the scheduler: taken while any active booking has not ended
+        conn.execute('''
+        UPDATE parking_spaces SET is_available = NOT EXISTS (
+            SELECT 1 FROM bookings b
+            WHERE b.space_id = parking_spaces.id AND b.status = 'active' AND b.end_time > ?
+        )
+        WHERE id = (SELECT space_id FROM booking_series WHERE id = ?)
+        ''', (database.to_db_timestamp(datetime.datetime.now()), series_id))
+        conn.commit()
+
+    for booking in cancelled:
+        database.notify_booking_listeners('updated', dict(booking, status='cancelled'))
+    return len(cancelled)
+
+
+def get_series_skips(series_id: int) -> List[Dict]:
+    """Occurrences of a series that were not booked, earliest first"""
+    with database.db_connection() as conn:
+        return [dict(row) for row in conn.execute('''
+        SELECT start_time, end_time, reason, created_at FROM series_skips
+        WHERE series_id = ? ORDER BY start_time
+        ''', (series_id,))]
+
+
+def get_user_series(user_id: int) -> List[Dict]:
+    """A user's booking series, newest first"""
+    with database.db_connection() as conn:
+        return [dict(row) for row in conn.execute(f'''
+        SELECT {SERIES_COLUMNS} FROM booking_series WHERE user_id = ? ORDER BY id DESC
+        ''', (user_id,))]
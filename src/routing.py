@@ -0,0 +1,365 @@
+"""
+In-garage routing: travel times from entrances and lifts to every space.
+
+A layout file describes the facility as a weighted graph. Nodes are
+entrances, junctions, ramps, aisles, lifts and pedestrian exits, and each
+edge carries a ``drive`` and/or ``walk`` time in seconds. Aisles attach the
+catalog's spaces, matched by floor and section or listed by number, one
+``spacing`` further along the aisle per space. An example::
+
+    {
+      "nodes": [
+        {"id": "gate", "type": "entrance"},
+        {"id": "lift", "type": "lift"},
+        {"id": "ramp-1", "type": "junction"},
+        {"id": "1A", "type": "aisle"}
+      ],
+      "edges": [
+        {"from": "gate", "to": "ramp-1", "drive": 10},
+        {"from": "ramp-1", "to": "1A", "drive": 8, "walk": 15},
+        {"from": "lift", "to": "ramp-1", "walk": 5}
+      ],
+      "aisles": [
+        {"node": "1A", "floor": "1", "section": "A", "spacing": {"drive": 2, "walk": 2}}
+      ]
+    }
+
+Edges are two-way unless ``"oneway": true`` (driving only; people can walk
+either way). Drive times are measured from each entrance and walk times to
+each lift or exit, with one shortest-path run per source over the
+aisle-level graph. Spaces are then an offset along their aisle, so the
+graph stays small however many spaces there are.
+
+The resulting source x space table is cached on disk, keyed by a hash of
+the layout and the space catalog, and answers any per-space lookup with an
+array index. Tables are cached beside the database (or in
+``$PARKING_ROUTING_CACHE``), and only the newest table per layout is kept.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+import database
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAYOUT_PATH = os.environ.get(
+    "PARKING_LAYOUT", os.path.join(os.path.dirname(__file__), "layouts", "parkmate.json")
+)
+CACHE_DIR_NAME = "routing_cache"
+# Shared cache directory; unset caches beside each database
+ROUTING_CACHE_DIR = os.environ.get("PARKING_ROUTING_CACHE")
+WALK_WEIGHT = 1.0           # a second walking counts as much as a second driving
+
+ENTRANCE_TYPES = ("entrance",)
+WALK_TARGET_TYPES = ("lift", "elevator", "exit", "stairs")
+MODES = ("drive", "walk")
+
+
+class RoutingTable:
+    """Precomputed drive and walk times per space"""
+
+    def __init__(self, space_ids: np.ndarray, entrances: List[str], walk_targets: List[str],
+                 drive: np.ndarray, walk: np.ndarray):
+        self.space_ids = np.asarray(space_ids, dtype=np.int64)
+        self.entrances = list(entrances)
+        self.walk_targets = list(walk_targets)
+        self.drive = drive              # (entrances, spaces) seconds, inf if unreachable
+        self.walk = walk                # (walk_targets, spaces) seconds
+        self._columns = {int(space_id): i for i, space_id in enumerate(self.space_ids)}
+        unreachable = np.full(len(self.space_ids), np.inf, dtype=np.float32)
+        self._best_drive = drive.min(axis=0) if len(drive) else unreachable
+        self._best_walk = walk.min(axis=0) if len(walk) else unreachable
+
+    def __len__(self) -> int:
+        return len(self.space_ids)
+
+    def _drive_row(self, entrance: Optional[str]) -> np.ndarray:
+        if entrance is None:
+            return self._best_drive
+        try:
+            return self.drive[self.entrances.index(entrance)]
+        except ValueError:
+            raise ValueError(f"Unknown entrance {entrance!r}; expected one of {self.entrances}")
+
+    def columns(self, space_ids: Sequence[int]) -> np.ndarray:
+        """Column of each space ID, -1 for spaces the layout does not cover"""
+        return np.array([self._columns.get(int(space_id), -1) for space_id in space_ids], dtype=np.int64)
+
+    def drive_time(self, space_id: int, entrance: Optional[str] = None) -> float:
+        """Seconds to drive to a space (from the nearest entrance by default)"""
+        column = self._columns.get(int(space_id))
+        return float(self._drive_row(entrance)[column]) if column is not None else float("inf")
+
+    def walk_time(self, space_id: int) -> float:
+        """Seconds to walk from a space to the nearest lift or exit"""
+        column = self._columns.get(int(space_id))
+        return float(self._best_walk[column]) if column is not None else float("inf")
+
+    def travel_times(self, space_ids: Sequence[int], entrance: Optional[str] = None,
+                     walk_weight: float = WALK_WEIGHT) -> np.ndarray:
+        """
+        Drive plus weighted walk time for each space.
+
+        Args:
+            space_ids: Spaces to look up
+            entrance: Entrance the driver uses (nearest if None)
+            walk_weight: Weight of walking seconds relative to driving
+
+        Returns:
+            Seconds per space, inf for spaces the layout does not reach
+        """
+        columns = self.columns(space_ids)
+        known = columns >= 0
+        times = np.full(len(columns), np.inf)
+        times[known] = self._drive_row(entrance)[columns[known]] + walk_weight * self._best_walk[columns[known]]
+        return times
+
+    def rank(self, space_ids: Sequence[int], entrance: Optional[str] = None) -> List[int]:
+        """Space IDs ordered by travel time, unreachable spaces last"""
+        space_ids = list(space_ids)
+        order = np.argsort(self.travel_times(space_ids, entrance), kind="stable")
+        return [space_ids[i] for i in order]
+
+    # ---- Disk cache ----
+
+    def save(self, path: str) -> None:
+        """Write the table atomically as .npz"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, space_ids=self.space_ids, entrances=np.array(self.entrances, dtype=str),
+                         walk_targets=np.array(self.walk_targets, dtype=str), drive=self.drive, walk=self.walk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "RoutingTable":
+        with np.load(path) as data:
+            return cls(data["space_ids"], data["entrances"].tolist(), data["walk_targets"].tolist(),
+                       data["drive"], data["walk"])
+
+
+# ---- Building ----
+
+def _aisle_members(aisle: Dict, spaces: Sequence[Tuple]) -> List[Tuple]:
+    """Spaces attached to an aisle, in order along it"""
+    if "spaces" in aisle:
+        by_number = {space[1]: space for space in spaces}
+        return [by_number[number] for number in aisle["spaces"] if number in by_number]
+    floor, section = aisle.get("floor"), aisle.get("section")
+    members = [space for space in spaces
+               if (floor is None or str(space[2]) == str(floor))
+               and (section is None or space[3] == section)]
+    return sorted(members, key=lambda space: database._natural_key(space[1]))
+
+
+def build_routing_table(layout: Dict, spaces: Sequence[Tuple]) -> RoutingTable:
+    """
+    Compute travel times for every space.
+
+    Args:
+        layout: Parsed layout (nodes, edges, aisles)
+        spaces: (id, space_number, floor, section) of every catalog space
+
+    Returns:
+        RoutingTable over the spaces, in the given order
+    """
+    nodes = layout.get("nodes", [])
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    if len(index) != len(nodes):
+        raise ValueError("Layout node ids must be unique")
+
+    # Cheapest edge per (from, to) and mode; csr_matrix would sum duplicates
+    weights: Dict[str, Dict[Tuple[int, int], float]] = {mode: {} for mode in MODES}
+    for edge in layout.get("edges", []):
+        try:
+            a, b = index[edge["from"]], index[edge["to"]]
+        except KeyError as e:
+            raise ValueError(f"Layout edge refers to unknown node {e.args[0]!r}")
+        for mode in MODES:
+            if mode not in edge:
+                continue
+            cost = float(edge[mode])
+            if cost < 0:
+                raise ValueError("Layout edge times must not be negative")
+            pairs = [(a, b)]
+            if mode == "walk" or not edge.get("oneway", False):
+                pairs.append((b, a))
+            for pair in pairs:
+                weights[mode][pair] = min(cost, weights[mode].get(pair, np.inf))
+
+    entrances = [node["id"] for node in nodes if node.get("type") in ENTRANCE_TYPES]
+    walk_targets = [node["id"] for node in nodes if node.get("type") in WALK_TARGET_TYPES]
+
+    def distances(mode: str, sources: List[str]) -> np.ndarray:
+        if not sources:
+            return np.zeros((0, len(nodes)))
+        pairs = weights[mode]
+        rows = [a for a, _ in pairs]
+        cols = [b for _, b in pairs]
+        graph = csr_matrix((list(pairs.values()), (rows, cols)), shape=(len(nodes), len(nodes)))
+        # Walking is symmetric, so distance from a lift equals distance to it
+        return dijkstra(graph, directed=True, indices=[index[s] for s in sources])
+
+    node_drive = distances("drive", entrances)
+    node_walk = distances("walk", walk_targets)
+
+    # Each space takes the best of the aisles it is attached to
+    drive = np.full((len(entrances), len(spaces)), np.inf)
+    walk = np.full((len(walk_targets), len(spaces)), np.inf)
+    column_of = {space[0]: i for i, space in enumerate(spaces)}
+    for aisle in layout.get("aisles", []):
+        if aisle.get("node") not in index:
+            raise ValueError(f"Layout aisle refers to unknown node {aisle.get('node')!r}")
+        node = index[aisle["node"]]
+        spacing = aisle.get("spacing", {})
+        members = _aisle_members(aisle, spaces)
+        if not members:
+            continue
+        columns = np.array([column_of[space[0]] for space in members])
+        steps = np.arange(1, len(members) + 1)
+        drive[:, columns] = np.minimum(drive[:, columns],
+                                       node_drive[:, [node]] + steps * float(spacing.get("drive", 0)))
+        walk[:, columns] = np.minimum(walk[:, columns],
+                                      node_walk[:, [node]] + steps * float(spacing.get("walk", 0)))
+
+    return RoutingTable(np.array([space[0] for space in spaces], dtype=np.int64), entrances, walk_targets,
+                        drive.astype(np.float32), walk.astype(np.float32))
+
+
+def _cache_prefix(layout_bytes: bytes) -> str:
+    """File name prefix shared by every cached table of a layout"""
+    return f"routing-{hashlib.sha256(layout_bytes).hexdigest()[:12]}-"
+
+
+def _cache_path(layout_bytes: bytes, spaces: Sequence[Tuple], cache_dir: str) -> str:
+    """Cache file for a layout and space catalog"""
+    digest = hashlib.sha256(json.dumps([list(space) for space in spaces], default=str).encode())
+    return os.path.join(cache_dir, f"{_cache_prefix(layout_bytes)}{digest.hexdigest()[:12]}.npz")
+
+
+def _prune_cache(cache_dir: str, layout_bytes: bytes, keep: str) -> None:
+    """Delete the tables cached for older catalogs of a layout"""
+    prefix = _cache_prefix(layout_bytes)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and name.endswith(".npz") and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_routing_table(layout_path: str, spaces: Sequence[Tuple], cache_dir: str) -> RoutingTable:
+    """
+    Routing table for a layout file and space catalog, cached on disk.
+
+    Args:
+        layout_path: JSON layout file
+        spaces: (id, space_number, floor, section) of every catalog space
+        cache_dir: Where tables are cached
+
+    Returns:
+        The RoutingTable, computed only if no cached copy matches
+    """
+    with open(layout_path, "rb") as f:
+        layout_bytes = f.read()
+    cache_path = _cache_path(layout_bytes, spaces, cache_dir)
+    if os.path.exists(cache_path):
+        try:
+            return RoutingTable.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            logger.warning("Ignoring unreadable routing cache %s", cache_path)
+
+    table = build_routing_table(json.loads(layout_bytes), spaces)
+    try:
+        table.save(cache_path)
+        # The catalog moved on; earlier tables of this layout are dead weight
+        _prune_cache(cache_dir, layout_bytes, cache_path)
+    except OSError:
+        logger.warning("Could not cache routing table at %s", cache_path, exc_info=True)
+    return table
+
+
+# ---- Process-wide tables ----
+
+# (db path, layout path) -> (space change seq, layout mtime, catalog by id, table)
+_tables: Dict[Tuple[str, str], Tuple[int, float, Dict[int, Tuple], RoutingTable]] = {}
+_tables_lock = threading.Lock()
+
+_CATALOG_SELECT = "SELECT id, space_number, COALESCE(floor, ''), COALESCE(section, '') FROM parking_spaces"
+
+
+def _read_whole_catalog(conn) -> Dict[int, Tuple]:
+    """Every space's (id, space_number, floor, section), by id"""
+    return {row[0]: tuple(row) for row in conn.execute(_CATALOG_SELECT)}
+
+
+def _read_catalog(conn, cached: Optional[Tuple], seq: int) -> Dict[int, Tuple]:
+    """The space catalog at seq, re-reading only the spaces changed since the cached copy"""
+    if cached is not None:
+        last_seq, catalog = cached[0], cached[2]
+        oldest = conn.execute("SELECT MIN(seq) FROM space_changes").fetchone()[0]
+        # Unless the log was trimmed past the cached position
+        if oldest is not None and oldest <= last_seq + 1:
+            changed = sorted({row[0] for row in conn.execute(
+                "SELECT space_id FROM space_changes WHERE seq > ? AND seq <= ?", (last_seq, seq)
+            )})
+            placeholders = ", ".join("?" * len(changed))
+            rows = {row[0]: tuple(row) for row in conn.execute(
+                f"{_CATALOG_SELECT} WHERE id IN ({placeholders})", changed
+            )}
+            catalog = dict(catalog)
+            for space_id in changed:
+                if space_id in rows:
+                    catalog[space_id] = rows[space_id]
+                else:
+                    catalog.pop(space_id, None)
+            return catalog
+    return _read_whole_catalog(conn)
+
+
+def get_routing_table(db_path: str, layout_path: str = DEFAULT_LAYOUT_PATH,
+                      cache_dir: Optional[str] = None) -> Optional[RoutingTable]:
+    """
+    Routing table for a database's spaces, or None without a layout file.
+
+    Reused until a parking space changes. Most space changes are occupancy
+    flips, so only the changed spaces are re-read and the table is only
+    replaced if space numbers, floors or sections changed. Tables are cached
+    on disk in cache_dir, ROUTING_CACHE_DIR or beside the database.
+    """
+    if not os.path.exists(layout_path):
+        return None
+    key = (os.path.abspath(db_path), os.path.abspath(layout_path))
+    mtime = os.path.getmtime(layout_path)
+    with get_pool(db_path).connection() as conn:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM space_changes").fetchone()[0]
+        cached = _tables.get(key)
+        if cached is not None and cached[:2] == (seq, mtime):
+            return cached[3]
+        catalog = _read_catalog(conn, cached, seq)
+    with _tables_lock:
+        if cached is not None and cached[1] == mtime and cached[2] == catalog:
+            table = cached[3]
+        else:
+            cache_dir = cache_dir or ROUTING_CACHE_DIR or os.path.join(os.path.dirname(key[0]), CACHE_DIR_NAME)
+            table = load_routing_table(layout_path, [catalog[space_id] for space_id in sorted(catalog)],
+                                       cache_dir)
+        _tables[key] = (seq, mtime, catalog, table)
+    return table
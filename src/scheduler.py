@@ -0,0 +1,320 @@
+"""
+Background scheduler for time-driven booking changes.
+
+Three things happen at a known time rather than in response to a request:
+
+* completion: an active booking reaching its end time becomes 'completed'
+  and its space is available again unless another active booking holds it
+* no-show release: an active booking nobody checked in to within
+  ``no_show_grace`` of its start is cancelled, and the rest of its window
+  goes to the waitlist
+* expiry: waitlist requests whose window has ended are marked 'expired'
+
+Each is an event on a heap ordered by due time. One daemon thread sleeps
+until the earliest event, pops everything due and applies it in batched
+write-queue transactions that touch only the bookings concerned. Each
+batch re-checks its conditions in SQL, so events for bookings changed since
+they were scheduled (extended, checked in, cancelled) are dropped or
+rescheduled instead of applied blindly.
+
+State lives in the database only. On start the heap is rebuilt from the
+active bookings and waiting requests, and new rows are picked up by polling
+for IDs past the highest one seen, which also covers writers in other
+processes.
+"""
+
+import datetime
+import heapq
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import database
+from db_pool import get_pool
+from waitlist import get_waitlist
+from write_queue import get_write_queue
+
+try:
+    from cache import bump_generation
+except ImportError:
+    # The query cache needs Streamlit; without it there is nothing to invalidate
+    def bump_generation() -> int:
+        return 0
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.environ.get("PARKING_SCHEDULER", "1") != "0"
+NO_SHOW_GRACE_MINUTES = int(os.environ.get("PARKING_NO_SHOW_GRACE_MINUTES", "30"))
+POLL_INTERVAL_SECONDS = 5.0      # how often new bookings and requests are picked up
+EVENT_BATCH_SIZE = 500           # events per transaction; stays below SQLite's parameter limit
+
+COMPLETE = 'complete'
+NO_SHOW = 'no_show'
+EXPIRE = 'expire'
+
+# Heap item: (due, sequence, kind, row id)
+Event = Tuple[datetime.datetime, int, str, int]
+
+
+def _parse(timestamp: str) -> datetime.datetime:
+    return datetime.datetime.strptime(timestamp, database.DB_TIMESTAMP_FORMAT)
+
+
+def _placeholders(ids: List[int]) -> str:
+    return ', '.join('?' * len(ids))
+
+
+class BookingScheduler:
+    """Daemon thread firing completion, no-show and expiry events for one database"""
+
+    def __init__(self, path: str, no_show_grace: Optional[datetime.timedelta] =
+                 datetime.timedelta(minutes=NO_SHOW_GRACE_MINUTES),
+                 poll_interval: float = POLL_INTERVAL_SECONDS, batch_size: int = EVENT_BATCH_SIZE):
+        self.path = path
+        self.no_show_grace = no_show_grace      # None disables no-show release
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+
+        self._heap: List[Event] = []
+        self._seq = 0
+        self._last_booking_id = 0
+        self._last_waitlist_id = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Statistics
+        self.completed = 0
+        self.no_shows = 0
+        self.expired = 0
+
+    # ---- Scheduling ----
+
+    def _push(self, due: datetime.datetime, kind: str, row_id: int) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, kind, row_id))
+
+    def _schedule_booking(self, booking_id: int, start_time: str, end_time: str,
+                          checked_in_at: Optional[str]) -> None:
+        self._push(_parse(end_time), COMPLETE, booking_id)
+        if self.no_show_grace is not None and checked_in_at is None:
+            self._push(_parse(start_time) + self.no_show_grace, NO_SHOW, booking_id)
+
+    def _poll(self) -> int:
+        """Schedule bookings and waitlist requests created since the last poll"""
+        with get_pool(self.path).connection() as conn:
+            if not self._loaded:
+                # Every active booking and waiting request, once
+                bookings = conn.execute('''
+                SELECT id, start_time, end_time, checked_in_at FROM bookings WHERE status = 'active'
+                ''').fetchall()
+                requests = conn.execute("SELECT id, end_time FROM waitlist WHERE status = 'waiting'").fetchall()
+                last_booking = conn.execute('SELECT COALESCE(MAX(id), 0) FROM bookings').fetchone()[0]
+                last_request = conn.execute('SELECT COALESCE(MAX(id), 0) FROM waitlist').fetchone()[0]
+            else:
+                bookings = conn.execute('''
+                SELECT id, start_time, end_time, checked_in_at FROM bookings
+                WHERE id > ? AND status = 'active' ORDER BY id
+                ''', (self._last_booking_id,)).fetchall()
+                requests = conn.execute('''
+                SELECT id, end_time FROM waitlist WHERE id > ? AND status = 'waiting' ORDER BY id
+                ''', (self._last_waitlist_id,)).fetchall()
+                last_booking = max([self._last_booking_id] + [row[0] for row in bookings])
+                last_request = max([self._last_waitlist_id] + [row[0] for row in requests])
+
+        with self._lock:
+            for row in bookings:
+                self._schedule_booking(row[0], row[1], row[2], row[3])
+            for row in requests:
+                self._push(_parse(row[1]), EXPIRE, row[0])
+            self._last_booking_id = max(self._last_booking_id, last_booking)
+            self._last_waitlist_id = max(self._last_waitlist_id, last_request)
+            self._loaded = True
+        return len(bookings) + len(requests)
+
+    def _due(self, now: datetime.datetime) -> List[Event]:
+        """Pop up to one batch of events due at `now`"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                due.append(heapq.heappop(self._heap))
+        return due
+
+    def next_due(self) -> Optional[datetime.datetime]:
+        """When the earliest pending event is due"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+    # ---- Applying events ----
+
+    def _apply(self, events: List[Event], now: datetime.datetime) -> Dict[str, List]:
+        """Apply one batch of due events in a single transaction"""
+        now_text = database.to_db_timestamp(now)
+        complete = [e[3] for e in events if e[2] == COMPLETE]
+        no_show = [e[3] for e in events if e[2] == NO_SHOW]
+        expire = [e[3] for e in events if e[2] == EXPIRE]
+
+        def write(conn):
+            result = {'completed': [], 'no_shows': [], 'expired': [], 'reschedule': []}
+            if complete:
+                result['completed'] = [row[0] for row in conn.execute(f'''
+                SELECT id FROM bookings WHERE id IN ({_placeholders(complete)})
+                  AND status = 'active' AND end_time <= ?
+                ''', complete + [now_text])]
+            if no_show and self.no_show_grace is not None:
+                # A booking both ended and never arrived counts as completed
+                done = set(result['completed'])
+                cutoff = database.to_db_timestamp(now - self.no_show_grace)
+                result['no_shows'] = [row[0] for row in conn.execute(f'''
+                SELECT id FROM bookings WHERE id IN ({_placeholders(no_show)})
+                  AND status = 'active' AND checked_in_at IS NULL AND start_time <= ?
+                ''', no_show + [cutoff]) if row[0] not in done]
+            if expire:
+                result['expired'] = [row[0] for row in conn.execute(f'''
+                SELECT id FROM waitlist WHERE id IN ({_placeholders(expire)})
+                  AND status = 'waiting' AND end_time <= ?
+                ''', expire + [now_text])]
+
+            # Bookings moved since they were scheduled get their events again
+            fired = set(result['completed']) | set(result['no_shows'])
+            missed = sorted(set(complete + no_show) - fired)
+            if missed:
+                result['reschedule'] = [tuple(row) for row in conn.execute(f'''
+                SELECT id, start_time, end_time, checked_in_at FROM bookings
+                WHERE id IN ({_placeholders(missed)}) AND status = 'active'
+                ''', missed)]
+
+            for status, ids in (('completed', result['completed']), ('cancelled', result['no_shows'])):
+                if ids:
+                    conn.execute(f"UPDATE bookings SET status = ? WHERE id IN ({_placeholders(ids)})",
+                                 [status] + ids)
+            if result['expired']:
+                conn.execute(f"UPDATE waitlist SET status = 'expired' WHERE id IN ({_placeholders(result['expired'])})",
+                             result['expired'])
+
+            # Same rule as book/cancel: a space is taken while any active booking has not ended
+            if fired:
+                ids = sorted(fired)
+                conn.execute(f'''
+                UPDATE parking_spaces SET is_available = NOT EXISTS (
+                    SELECT 1 FROM bookings b
+                    WHERE b.space_id = parking_spaces.id AND b.status = 'active' AND b.end_time > ?
+                )
+                WHERE id IN (SELECT space_id FROM bookings WHERE id IN ({_placeholders(ids)}))
+                ''', [now_text] + ids)
+            return result
+
+        return get_write_queue(self.path).write(write)
+
+    def _after_commit(self, result: Dict[str, List]) -> None:
+        """Notify listeners, invalidate cached queries and reschedule moved bookings"""
+        # The shared waitlist of this file hears about no-shows through its listeners
+        get_waitlist(self.path).discard(result['expired'])
+
+        ids = result['completed'] + result['no_shows']
+        if ids:
+            with get_pool(self.path).connection() as conn:
+                rows = conn.execute(f'''
+                SELECT id, user_id, space_id, start_time, end_time, status FROM bookings
+                WHERE id IN ({_placeholders(ids)})
+                ''', ids).fetchall()
+            for row in rows:
+                database.notify_booking_listeners('updated', dict(row), self.path)
+        if ids or result['expired']:
+            bump_generation()
+
+        with self._lock:
+            for row in result['reschedule']:
+                self._schedule_booking(*row)
+            self.completed += len(result['completed'])
+            self.no_shows += len(result['no_shows'])
+            self.expired += len(result['expired'])
+
+    def run_once(self, now: Optional[datetime.datetime] = None) -> Dict[str, int]:
+        """Pick up new rows and apply every event due at `now`"""
+        now = now or datetime.datetime.now()
+        self._poll()
+        counts = {'completed': 0, 'no_shows': 0, 'expired': 0}
+        while True:
+            events = self._due(now)
+            if not events:
+                return counts
+            try:
+                result = self._apply(events, now)
+            except Exception:
+                # Put the batch back and try again on the next run
+                with self._lock:
+                    for event in events:
+                        heapq.heappush(self._heap, event)
+                raise
+            self._after_commit(result)
+            for key in counts:
+                counts[key] += len(result[key])
+
+    # ---- Thread ----
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                counts = self.run_once()
+                if any(counts.values()):
+                    logger.info("Scheduler applied %s", counts)
+            except Exception:
+                logger.exception("Booking scheduler run failed")
+            # Sleep until the next event or poll, whichever is first
+            timeout = self.poll_interval
+            due = self.next_due()
+            if due is not None:
+                timeout = min(timeout, max((due - datetime.datetime.now()).total_seconds(), 0))
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def wake(self) -> None:
+        """Run the next pass now, e.g. right after a booking was created"""
+        self._wake.set()
+
+    def start(self) -> None:
+        """Start the background thread (no-op if already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="booking-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the thread to stop after its current pass and wait for it"""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+# ---- Process-wide registry ----
+
+_schedulers: Dict[str, BookingScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(path: str) -> BookingScheduler:
+    """Return the shared scheduler of a database file (not started)"""
+    key = os.path.abspath(path)
+    scheduler = _schedulers.get(key)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(key)
+            if scheduler is None:
+                scheduler = _schedulers[key] = BookingScheduler(path)
+    return scheduler
@@ -0,0 +1,335 @@
+"""
+In-memory attribute index over the parking space catalog.
+
+Every space gets a slot, and for each value of each filterable attribute
+(floor, section, location, occupancy state, accessible, EV charging and a
+price bucket) the index keeps a bitset of the slots holding that value,
+packed into ``uint64`` words. A filter is then a handful of word-wise
+operations: OR the bitsets of the values accepted for one attribute, AND
+across attributes. Price ranges OR the buckets they overlap and check the
+exact rate only for the survivors.
+
+The index follows writes incrementally through the ``space_changes`` log
+that triggers append to (migration 6), so writes from raw SQL, other
+processes or the bulk loaders are seen too: before each query it re-reads
+just the spaces changed since its last look. If it fell further behind than
+the log reaches, it reloads the catalog.
+
+:func:`find_space_ids` answers from the index and falls back to an
+equivalent SQL query when the index is disabled (``PARKING_SPACE_INDEX=0``)
+or cannot be loaded.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+SPACE_INDEX_ENABLED = os.environ.get("PARKING_SPACE_INDEX", "1") != "0"
+PRICE_BUCKET_WIDTH = 0.5
+INITIAL_CAPACITY = 1024
+
+# Filter name -> indexed attribute; values are a single value or a collection
+FILTERS = ("floor", "section", "location", "state", "accessible", "ev")
+
+# Same rule as the space_counters triggers
+_STATE_SQL = ("CASE WHEN status = 'active' THEN CASE WHEN is_available THEN 'available' "
+              "ELSE 'occupied' END ELSE status END")
+_SPACE_COLUMNS = f"id, floor, section, location, {_STATE_SQL} AS state, is_accessible, is_ev_charging, hourly_rate"
+
+FilterValue = Union[None, str, int, bool, Iterable]
+
+
+def space_state(space: Dict) -> str:
+    """Occupancy state of a parking_spaces row, by the same rule as _STATE_SQL"""
+    status = space.get("status") or "active"
+    if status == "active":
+        return "available" if space.get("is_available") else "occupied"
+    return status
+
+
+def _price_bucket(rate: float) -> int:
+    return int(math.floor(rate / PRICE_BUCKET_WIDTH))
+
+
+def _accepted(value: FilterValue) -> Optional[List]:
+    """Normalise a filter value to the list of accepted values (None: no filter)"""
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes, bool, int, float)):
+        return [value]
+    return list(value)
+
+
+def _key(name: str, value) -> object:
+    """Value as stored in the index for an attribute"""
+    if name in ("accessible", "ev"):
+        return bool(value)
+    return "" if value is None else str(value)
+
+
+class SpaceIndex:
+    """Bitset index of one database's parking spaces"""
+
+    def __init__(self, path: str, capacity: int = INITIAL_CAPACITY):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_seq = 0
+        self._reset(capacity)
+
+    def _reset(self, capacity: int) -> None:
+        self._words = max(1, -(-capacity // 64))
+        self._ids = np.zeros(self._words * 64, dtype=np.int64)
+        self._rates = np.zeros(self._words * 64, dtype=np.float64)
+        self._live = np.zeros(self._words, dtype=np.uint64)
+        self._slot_of: Dict[int, int] = {}
+        self._free_slots: List[int] = []
+        self._row_keys: Dict[int, Tuple] = {}
+        self._bitsets: Dict[str, Dict[object, np.ndarray]] = {name: {} for name in FILTERS + ("price",)}
+
+    # ---- Bit helpers ----
+
+    def _grow(self) -> None:
+        """Double the number of slots"""
+        self._words *= 2
+        size = self._words * 64
+        self._ids = np.resize(self._ids, size)
+        self._rates = np.resize(self._rates, size)
+        self._live = np.concatenate([self._live, np.zeros(len(self._live), dtype=np.uint64)])
+        for values in self._bitsets.values():
+            for value, bits in values.items():
+                values[value] = np.concatenate([bits, np.zeros(len(bits), dtype=np.uint64)])
+
+    @staticmethod
+    def _set(bits: np.ndarray, slot: int, on: bool) -> None:
+        mask = np.uint64(1 << (slot % 64))
+        if on:
+            bits[slot // 64] |= mask
+        else:
+            bits[slot // 64] &= ~mask
+
+    def _bitset(self, name: str, value) -> np.ndarray:
+        values = self._bitsets[name]
+        bits = values.get(value)
+        if bits is None:
+            bits = values[value] = np.zeros(self._words, dtype=np.uint64)
+        return bits
+
+    # ---- Maintenance ----
+
+    def _remove(self, space_id: int) -> None:
+        slot = self._slot_of.pop(space_id, None)
+        if slot is None:
+            return
+        for name, value in zip(FILTERS + ("price",), self._row_keys.pop(slot)):
+            self._set(self._bitsets[name][value], slot, False)
+        self._set(self._live, slot, False)
+        self._free_slots.append(slot)
+
+    def _put(self, row: Sequence) -> None:
+        """Insert or replace one space from an _SPACE_COLUMNS row"""
+        space_id, floor, section, location, state, accessible, ev, rate = row
+        self._remove(space_id)
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slot_of)
+            while slot >= self._words * 64:
+                self._grow()
+        keys = (_key("floor", floor), _key("section", section), _key("location", location),
+                _key("state", state), bool(accessible), bool(ev), _price_bucket(rate or 0.0))
+        for name, value in zip(FILTERS + ("price",), keys):
+            self._set(self._bitset(name, value), slot, True)
+        self._set(self._live, slot, True)
+        self._slot_of[space_id] = slot
+        self._row_keys[slot] = keys
+        self._ids[slot] = space_id
+        self._rates[slot] = rate or 0.0
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+        """Rebuild from the whole catalog"""
+        self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM space_changes").fetchone()[0]
+        rows = conn.execute(f"SELECT {_SPACE_COLUMNS} FROM parking_spaces").fetchall()
+        self._reset(max(len(rows), INITIAL_CAPACITY))
+        for row in rows:
+            self._put(tuple(row))
+        self._loaded = True
+
+    def _sync(self, conn: sqlite3.Connection) -> None:
+        """Apply the spaces changed since the last sync"""
+        if not self._loaded:
+            self._load(conn)
+            return
+        changes = conn.execute(
+            "SELECT seq, space_id FROM space_changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+        ).fetchall()
+        if not changes:
+            return
+        if changes[0][0] != self._last_seq + 1:
+            oldest = conn.execute("SELECT MIN(seq) FROM space_changes").fetchone()[0]
+            if oldest > self._last_seq + 1:
+                # Trimmed past our position; some changes are gone
+                self._load(conn)
+                return
+        changed = sorted({row[1] for row in changes})
+        placeholders = ", ".join("?" * len(changed))
+        rows = conn.execute(f"SELECT {_SPACE_COLUMNS} FROM parking_spaces WHERE id IN ({placeholders})",
+                            changed).fetchall()
+        present = set()
+        for row in rows:
+            self._put(tuple(row))
+            present.add(row[0])
+        for space_id in changed:
+            if space_id not in present:
+                self._remove(space_id)
+        self._last_seq = changes[-1][0]
+
+    def refresh(self) -> None:
+        """Bring the index up to date with the database"""
+        with get_pool(self.path).connection() as conn, self._lock:
+            self._sync(conn)
+
+    # ---- Queries ----
+
+    def _match(self, filters: Dict[str, FilterValue],
+               price_range: Optional[Tuple[float, float]]) -> np.ndarray:
+        """Slots matching the filters"""
+        result = self._live.copy()
+        for name, value in filters.items():
+            accepted = _accepted(value)
+            if accepted is None:
+                continue
+            values = self._bitsets[name]
+            union = np.zeros(self._words, dtype=np.uint64)
+            for wanted in accepted:
+                bits = values.get(_key(name, wanted))
+                if bits is not None:
+                    union |= bits
+            result &= union
+
+        if price_range is not None:
+            low, high = price_range
+            union = np.zeros(self._words, dtype=np.uint64)
+            for bucket, bits in self._bitsets["price"].items():
+                if _price_bucket(low) <= bucket <= _price_bucket(high):
+                    union |= bits
+            result &= union
+
+        slots = np.flatnonzero(np.unpackbits(result.view(np.uint8), bitorder="little"))
+        if price_range is not None:
+            rates = self._rates[slots]
+            slots = slots[(rates >= price_range[0]) & (rates <= price_range[1])]
+        return slots
+
+    def find(self, price_range: Optional[Tuple[float, float]] = None, **filters: FilterValue) -> np.ndarray:
+        """
+        IDs of the spaces matching every given filter, in ascending order.
+
+        Args:
+            price_range: Inclusive (min, max) hourly rate
+            **filters: Any of floor, section, location, state, accessible and
+                ev, each a single value or a collection of accepted values
+
+        Returns:
+            Sorted array of space IDs
+        """
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown space filters: {', '.join(sorted(unknown))}")
+        with get_pool(self.path).connection() as conn, self._lock:
+            self._sync(conn)
+            ids = self._ids[self._match(filters, price_range)]
+        return np.sort(ids)
+
+    def count(self, price_range: Optional[Tuple[float, float]] = None, **filters: FilterValue) -> int:
+        """Number of spaces matching the filters"""
+        return len(self.find(price_range, **filters))
+
+    def values(self, name: str) -> List:
+        """Distinct values of an attribute present in the catalog, sorted"""
+        self.refresh()
+        with self._lock:
+            return sorted(value for value, bits in self._bitsets[name].items() if bits.any())
+
+
+# ---- SQL fallback ----
+
+def find_space_ids_sql(conn: sqlite3.Connection, price_range: Optional[Tuple[float, float]] = None,
+                       **filters: FilterValue) -> np.ndarray:
+    """Same result as SpaceIndex.find, computed by a SQL query"""
+    columns = {"floor": "COALESCE(floor, '')", "section": "COALESCE(section, '')",
+               "location": "location", "state": _STATE_SQL,
+               "accessible": "is_accessible", "ev": "is_ev_charging"}
+    unknown = set(filters) - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown space filters: {', '.join(sorted(unknown))}")
+
+    clauses, params = [], []
+    for name, value in filters.items():
+        accepted = _accepted(value)
+        if accepted is None:
+            continue
+        keys = sorted({_key(name, v) for v in accepted}, key=str)
+        if not keys:
+            clauses.append("0")
+            continue
+        clauses.append(f"{columns[name]} IN ({', '.join('?' * len(keys))})")
+        params.extend(int(k) if isinstance(k, bool) else k for k in keys)
+    if price_range is not None:
+        clauses.append("hourly_rate BETWEEN ? AND ?")
+        params.extend(price_range)
+
+    where = " AND ".join(clauses) or "1"
+    rows = conn.execute(f"SELECT id FROM parking_spaces WHERE {where} ORDER BY id", params).fetchall()
+    return np.array([row[0] for row in rows], dtype=np.int64)
+
+
+# ---- Process-wide registry ----
+
+_indexes: Dict[str, SpaceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_space_index(path: str) -> SpaceIndex:
+    """Return the shared space index for a database file, creating it on first use"""
+    key = os.path.abspath(path)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = SpaceIndex(path)
+    return index
+
+
+def find_space_ids(path: str, price_range: Optional[Tuple[float, float]] = None,
+                   **filters: FilterValue) -> np.ndarray:
+    """
+    IDs of the spaces in a database matching the filters.
+
+    Uses the in-memory index, or SQL when the index is disabled or fails.
+
+    Args:
+        path: Database file
+        price_range: Inclusive (min, max) hourly rate
+        **filters: See SpaceIndex.find
+
+    Returns:
+        Sorted array of space IDs
+    """
+    if SPACE_INDEX_ENABLED:
+        try:
+            return get_space_index(path).find(price_range, **filters)
+        except sqlite3.Error:
+            logger.exception("Space index unavailable, filtering in SQL")
+    with get_pool(path).connection() as conn:
+        return find_space_ids_sql(conn, price_range, **filters)
@@ -0,0 +1,246 @@
+"""
+Time-of-day and day-of-week tariffs compiled into cumulative price lookups.
+
+A tariff file gives rate multipliers for periods of the week, for the whole
+garage and per section. A space's ``hourly_rate`` is the off-peak price and
+each rule scales it while it applies::
+
+    {
+      "default": [
+        {"name": "peak", "days": ["mon", "tue", "wed", "thu", "fri"],
+         "start": "07:00", "end": "19:00", "multiplier": 1.5},
+        {"name": "overnight", "start": "22:00", "end": "06:00", "multiplier": 0.5}
+      ],
+      "sections": {
+        "A": [{"name": "peak", "days": ["mon", "tue", "wed", "thu", "fri"],
+               "start": "07:00", "end": "19:00", "multiplier": 2.0}]
+      }
+    }
+
+Rules without ``days`` apply every day, and an ``end`` at or before
+``start`` runs past midnight into the next day. Later rules win where rules
+overlap. Section rules are laid over the default ones, so a section only
+lists what it changes.
+
+Each tariff is compiled once into the multiplier of every minute of the
+week plus its running sum in rate-hours. The weighted hours of any
+[start, end) are then two lookups and a subtraction, whatever the number of
+rules or the length of the stay. Array versions answer whole columns of
+bookings at once. The billing engine (src/billing.py) turns weighted hours
+into fees.
+"""
+
+import datetime
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_TARIFF_PATH = os.environ.get(
+    "PARKING_TARIFFS", os.path.join(os.path.dirname(__file__), "tariff_tables", "parkmate.json")
+)
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+BASE_PERIOD = "off-peak"
+
+# A Monday midnight; weeks are counted from here
+_EPOCH = datetime.datetime(2001, 1, 1)
+_EPOCH64 = np.datetime64(_EPOCH, "s")
+
+
+def _minute_of_day(text: str) -> int:
+    try:
+        hours, minutes = (int(part) for part in text.split(":"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid time {text!r}; expected HH:MM")
+    if not (0 <= minutes < 60 and 0 <= hours * 60 + minutes <= DAY_MINUTES):
+        raise ValueError(f"Invalid time {text!r}; expected HH:MM between 00:00 and 24:00")
+    return hours * 60 + minutes
+
+
+class TariffRule:
+    """A multiplier applying between two times of day on some days of the week"""
+
+    def __init__(self, name: str, multiplier: float, start: str = "00:00", end: str = "24:00",
+                 days: Optional[Sequence[str]] = None):
+        if multiplier < 0:
+            raise ValueError(f"Tariff rule {name!r} has a negative multiplier")
+        unknown = [day for day in days or () if day.lower() not in DAYS]
+        if unknown:
+            raise ValueError(f"Tariff rule {name!r} has unknown days {unknown}; use {', '.join(DAYS)}")
+        self.name = name
+        self.multiplier = float(multiplier)
+        self.start = _minute_of_day(start)
+        self.end = _minute_of_day(end)
+        if self.start == self.end:
+            raise ValueError(f"Tariff rule {name!r} starts and ends at the same time")
+        self.days = tuple(sorted({DAYS.index(day.lower()) for day in days})) if days else tuple(range(7))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TariffRule":
+        if "name" not in data or "multiplier" not in data:
+            raise ValueError(f"Tariff rule needs a name and a multiplier: {data}")
+        return cls(data["name"], data["multiplier"], data.get("start", "00:00"), data.get("end", "24:00"),
+                   data.get("days"))
+
+    def spans(self) -> List[Tuple[int, int]]:
+        """[start, end) minutes of the week covered, split at the end of the week"""
+        spans = []
+        for day in self.days:
+            start = day * DAY_MINUTES + self.start
+            end = day * DAY_MINUTES + self.end + (DAY_MINUTES if self.end < self.start else 0)
+            if end > WEEK_MINUTES:      # Sunday night runs into Monday morning
+                spans.append((0, end - WEEK_MINUTES))
+                end = WEEK_MINUTES
+            spans.append((start, end))
+        return spans
+
+
+class Tariff:
+    """Rules compiled into per-minute multipliers and their cumulative sum over one week"""
+
+    def __init__(self, rules: Sequence[TariffRule] = ()):
+        self.rules = list(rules)
+        self.periods = [BASE_PERIOD] + [rule.name for rule in self.rules]
+        self.period = np.zeros(WEEK_MINUTES, dtype=np.int16)     # index into periods
+        self.multipliers = np.ones(WEEK_MINUTES)
+        for index, rule in enumerate(self.rules, 1):
+            for start, end in rule.spans():
+                self.period[start:end] = index
+                self.multipliers[start:end] = rule.multiplier
+        # cumulative[m]: rate-hours from Monday 00:00 to minute m of the week
+        self.cumulative = np.concatenate(([0.0], np.cumsum(self.multipliers / 60)))
+        self.week_hours = float(self.cumulative[-1])
+
+    # ---- Scalar ----
+
+    @staticmethod
+    def _minutes(when: datetime.datetime) -> float:
+        return (when - _EPOCH).total_seconds() / 60
+
+    def _cumulative_at(self, minutes: float) -> float:
+        weeks, offset = divmod(minutes, WEEK_MINUTES)
+        minute = int(offset)
+        return (weeks * self.week_hours + self.cumulative[minute]
+                + (offset - minute) * self.multipliers[minute] / 60)
+
+    def weighted_hours(self, start: datetime.datetime, end: datetime.datetime) -> float:
+        """Hours in [start, end), each weighted by the multiplier in force"""
+        if end <= start:
+            return 0.0
+        return float(self._cumulative_at(self._minutes(end)) - self._cumulative_at(self._minutes(start)))
+
+    def multiplier_at(self, when: datetime.datetime) -> float:
+        return float(self.multipliers[int(self._minutes(when) % WEEK_MINUTES)])
+
+    def period_at(self, when: datetime.datetime) -> str:
+        """Name of the rule in force at a time, or 'off-peak'"""
+        return self.periods[self.period[int(self._minutes(when) % WEEK_MINUTES)]]
+
+    # ---- Arrays ----
+
+    def _cumulative_at_batch(self, minutes: np.ndarray) -> np.ndarray:
+        weeks, offset = np.divmod(minutes, WEEK_MINUTES)
+        minute = offset.astype(np.int64)
+        return (weeks * self.week_hours + self.cumulative[minute]
+                + (offset - minute) * self.multipliers[minute] / 60)
+
+    def weighted_hours_batch(self, starts, ends) -> np.ndarray:
+        """weighted_hours() over arrays of datetime64 starts and ends"""
+        start_minutes = (np.asarray(starts, dtype="datetime64[s]") - _EPOCH64) / np.timedelta64(60, "s")
+        end_minutes = (np.asarray(ends, dtype="datetime64[s]") - _EPOCH64) / np.timedelta64(60, "s")
+        hours = self._cumulative_at_batch(end_minutes) - self._cumulative_at_batch(start_minutes)
+        return np.where(end_minutes > start_minutes, hours, 0.0)
+
+
+class TariffTable:
+    """The default tariff and the per-section ones"""
+
+    def __init__(self, default: Optional[Tariff] = None, sections: Optional[Dict[str, Tariff]] = None):
+        self.default = default or Tariff()
+        self.sections = dict(sections or {})
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TariffTable":
+        default_rules = [TariffRule.from_dict(rule) for rule in data.get("default", [])]
+        sections = {
+            str(section): Tariff(default_rules + [TariffRule.from_dict(rule) for rule in rules])
+            for section, rules in data.get("sections", {}).items()
+        }
+        return cls(Tariff(default_rules), sections)
+
+    def tariff(self, section: Optional[str]) -> Tariff:
+        return self.sections.get(section or "", self.default)
+
+    def weighted_hours(self, section: Optional[str], start: datetime.datetime,
+                       end: datetime.datetime) -> float:
+        """
+        Hours of a stay in a section, weighted by the multipliers in force.
+
+        Args:
+            section: Section of the space (None or unknown: the default tariff)
+            start: Start of the stay
+            end: End of the stay
+
+        Returns:
+            Weighted hours; times the off-peak hourly rate gives the price
+        """
+        return self.tariff(section).weighted_hours(start, end)
+
+    def weighted_hours_batch(self, sections: Sequence[Optional[str]], starts, ends) -> np.ndarray:
+        """
+        Weighted hours of many stays at once, one pass per section.
+
+        Args:
+            sections: Section per stay
+            starts: Start per stay as datetime64
+            ends: End per stay as datetime64
+
+        Returns:
+            float64 array of weighted hours
+        """
+        starts = np.asarray(starts, dtype="datetime64[s]")
+        ends = np.asarray(ends, dtype="datetime64[s]")
+        hours = np.zeros(len(starts))
+        if len(starts):
+            keys = np.array([section or "" for section in sections], dtype=str)
+            for section in np.unique(keys):
+                rows = keys == section
+                hours[rows] = self.tariff(section).weighted_hours_batch(starts[rows], ends[rows])
+        return hours
+
+
+def load_tariffs(path: str) -> TariffTable:
+    """Tariff table from a JSON file"""
+    with open(path) as f:
+        return TariffTable.from_dict(json.load(f))
+
+
+# ---- Process-wide table ----
+
+# path -> (file mtime, table)
+_tables: Dict[str, Tuple[float, TariffTable]] = {}
+_tables_lock = threading.Lock()
+
+
+def get_tariffs(path: str = DEFAULT_TARIFF_PATH) -> TariffTable:
+    """
+    Compiled tariffs of a file, reloaded when the file changes.
+
+    Without the file every section pays its flat hourly rate.
+    """
+    if not os.path.exists(path):
+        return TariffTable()
+    key = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    cached = _tables.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _tables_lock:
+        cached = _tables.get(key)
+        if cached is None or cached[0] != mtime:
+            cached = _tables[key] = (mtime, load_tariffs(path))
+    return cached[1]
@@ -0,0 +1,150 @@
+"""
+Hourly occupancy timeline for one day.
+
+For a given date the timeline holds a spaces x 24 matrix with the minutes
+of each hour every space is booked, computed from the ``bookings`` table in
+one query and one vectorized pass. Any hour's per-space state and the
+occupied count of every hour then come from the matrix, so scrubbing
+through the hours of a day does not touch the database again.
+
+``cache.get_occupancy_timeline`` caches timelines per (date, generation),
+so a day is recomputed only after a write.
+"""
+
+import datetime
+from typing import Dict, List, Union
+
+import numpy as np
+
+import database
+
+HOURS = 24
+# Longest booking utils.validate_booking_times accepts; bounds how far back
+# before the day a booking that overlaps it can start
+MAX_BOOKING_DAYS = 7
+
+# Bookings that hold a space: active ones and those that ran to completion
+OCCUPYING_STATUSES = ('active', 'completed')
+
+DateLike = Union[datetime.date, str]
+
+
+class OccupancyTimeline:
+    """Minutes booked per space and hour of one day"""
+
+    def __init__(self, day: datetime.date, spaces: List[Dict], minutes: np.ndarray):
+        self.day = day
+        self.spaces = spaces                                    # id, space_number, floor, section, ...
+        self.space_ids = np.array([s['id'] for s in spaces], dtype=np.int64)
+        self.bookable = np.array([s['status'] == 'active' for s in spaces], dtype=bool)
+        self.minutes = minutes                                  # (spaces, 24) uint8, 0..60
+
+    def __len__(self) -> int:
+        return len(self.spaces)
+
+    def occupied(self, hour: int) -> np.ndarray:
+        """Boolean mask over spaces booked at any point during an hour"""
+        return self.minutes[:, hour] > 0
+
+    def states(self, hour: int) -> np.ndarray:
+        """'available', 'occupied' or 'maintenance' per space for an hour"""
+        states = np.where(self.occupied(hour), 'occupied', 'available').astype(object)
+        states[~self.bookable] = 'maintenance'
+        return states
+
+    def occupied_counts(self) -> np.ndarray:
+        """Number of bookable spaces occupied in each hour"""
+        return (self.minutes[self.bookable] > 0).sum(axis=0)
+
+    def utilisation(self) -> np.ndarray:
+        """Share of bookable space-minutes booked in each hour"""
+        total = self.bookable.sum() * 60
+        if not total:
+            return np.zeros(HOURS)
+        return self.minutes[self.bookable].sum(axis=0, dtype=np.int64) / total
+
+    def summary(self, hour: int) -> Dict:
+        """Space counts by state for an hour, shaped like database.get_occupancy_summary"""
+        occupied = int((self.occupied(hour) & self.bookable).sum())
+        maintenance = int((~self.bookable).sum())
+        return {
+            'total': len(self),
+            'available': len(self) - occupied - maintenance,
+            'occupied': occupied,
+            'maintenance': maintenance,
+        }
+
+
+def _to_date(day: DateLike) -> datetime.date:
+    if isinstance(day, datetime.datetime):
+        return day.date()
+    if isinstance(day, datetime.date):
+        return day
+    return datetime.date.fromisoformat(day)
+
+
+def occupancy_minutes(columns: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                      day_start: np.datetime64, n_spaces: int) -> np.ndarray:
+    """
+    Minutes booked per space and hour, for bookings given as arrays.
+
+    Args:
+        columns: Space column of each booking
+        starts: Booking starts as datetime64[s]
+        ends: Booking ends as datetime64[s]
+        day_start: Midnight of the day
+        n_spaces: Number of space columns
+
+    Returns:
+        (n_spaces, 24) uint8 array; overlapping bookings count once per minute
+        at most, so no cell exceeds 60
+    """
+    minutes = np.zeros((n_spaces, HOURS), dtype=np.int32)
+    if len(columns):
+        hour_starts = (np.arange(HOURS) * 3600)[np.newaxis, :]
+        start = (starts - day_start).astype(np.int64)[:, np.newaxis]
+        end = (ends - day_start).astype(np.int64)[:, np.newaxis]
+        # Seconds of each booking inside each hour, bookings x hours
+        seconds = np.clip(np.minimum(end, hour_starts + 3600) - np.maximum(start, hour_starts), 0, 3600)
+        np.add.at(minutes, columns, -(-seconds // 60))
+    return np.minimum(minutes, 60).astype(np.uint8)
+
+
+def compute_timeline(day: DateLike) -> OccupancyTimeline:
+    """
+    Build the occupancy timeline of a day from the database.
+
+    Args:
+        day: The date (date, datetime or 'YYYY-MM-DD')
+
+    Returns:
+        OccupancyTimeline over every parking space
+    """
+    day = _to_date(day)
+    day_start = datetime.datetime.combine(day, datetime.time())
+    window = (
+        database.to_db_timestamp(day_start - datetime.timedelta(days=MAX_BOOKING_DAYS)),
+        database.to_db_timestamp(day_start + datetime.timedelta(days=1)),
+        database.to_db_timestamp(day_start),
+    )
+    with database.db_connection() as conn:
+        spaces = [dict(row) for row in conn.execute(
+            'SELECT id, space_number, floor, section, is_accessible, is_ev_charging, status '
+            'FROM parking_spaces ORDER BY space_number'
+        )]
+        # Per status so each range is one seek on idx_bookings_status_start
+        bookings = []
+        for status in OCCUPYING_STATUSES:
+            bookings.extend(conn.execute(
+                'SELECT space_id, start_time, end_time FROM bookings '
+                'WHERE status = ? AND start_time >= ? AND start_time < ? AND end_time > ?',
+                (status,) + window
+            ).fetchall())
+
+    column_of = {space['id']: i for i, space in enumerate(spaces)}
+    bookings = [b for b in bookings if b[0] in column_of]
+    columns = np.array([column_of[b[0]] for b in bookings], dtype=np.int64)
+    starts = np.array([b[1] for b in bookings], dtype='datetime64[s]')
+    ends = np.array([b[2] for b in bookings], dtype='datetime64[s]')
+    minutes = occupancy_minutes(columns, starts, ends, np.datetime64(day_start, 's'), len(spaces))
+    return OccupancyTimeline(day, spaces, minutes)
@@ -10,6 +10,8 @@ import datetime
 from typing import Dict, List, Optional, Union, Tuple
 import pytz
 
+from billing import PricingEngine, discount_rate, get_pricing_engine
+
 # ------------------------------
 # Time formatting and conversion
 # ------------------------------
@@ -185,34 +187,28 @@ def calculate_parking_fee(
     Returns:
         The calculated fee
     """
-    # Base hourly rates
-    hourly_rates = {
-        "motorcycle": 2.0,
-        "car": 5.0,
-        "suv": 7.0,
-        "truck": 10.0
-    }
-    
-    # Get base rate or default to car rate if type not found
-    base_hourly_rate = hourly_rates.get(vehicle_type.lower(), hourly_rates["car"])
-    
-    # Premium spaces cost extra
-    if is_premium:
-        base_hourly_rate *= 1.5
-    
-    # Calculate hours, rounded up
-    hours = duration.total_seconds() / 3600
-    charged_hours = math.ceil(hours)
+    return get_pricing_engine().price(vehicle_type, duration, is_premium)
+
+def calculate_price(
+    price_per_hour: float,
+    duration: datetime.timedelta,
+    is_premium: bool = False
+) -> float:
+    """
+    Calculate the fee for a space with its own hourly price.
     
-    # Apply discounts for longer durations
-    if charged_hours > 12:
-        # 10% discount for more than 12 hours
-        return charged_hours * base_hourly_rate * 0.9
-    if charged_hours > 24:
-        # 20% discount for more than 24 hours
-        return charged_hours * base_hourly_rate * 0.8
+    Same rules as calculate_parking_fee (whole hours, long-stay discounts),
+    with the space's price in place of the vehicle type rate.
     
-    return charged_hours * base_hourly_rate
+    Args:
+        price_per_hour: Hourly price of the space
+        duration: Parking duration
+        is_premium: Whether premium parking space is used
+        
+    Returns:
+        The calculated fee
+    """
+    return PricingEngine({"car": price_per_hour}).price("car", duration, is_premium)
 
 def apply_discount(amount: float, discount_code: str) -> Tuple[float, float]:
     """
@@ -225,14 +221,7 @@ def apply_discount(amount: float, discount_code: str) -> Tuple[float, float]:
     Returns:
         Tuple of (discounted_amount, discount_amount)
     """
-    # Example discount codes
-    discounts = {
-        "NEWUSER": 0.20,  # 20% off
-        "WEEKEND": 0.15,  # 15% off
-        "LOYALTY": 0.10,  # 10% off
-    }
-    
-    discount_percentage = discounts.get(discount_code.upper(), 0)
+    discount_percentage = discount_rate(discount_code)
     discount_amount = amount * discount_percentage
     discounted_amount = amount - discount_amount
     
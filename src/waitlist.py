@@ -0,0 +1,387 @@
+"""
+Waitlist with automatic reassignment of freed spaces.
+
+When nothing is free, a driver can join the waitlist for a time window and
+a space class ('standard', 'accessible' or 'ev'). Requests are stored in
+the ``waitlist`` table (migration 7), so they survive restarts, and are
+mirrored in memory as one priority queue per (space class, window):
+highest priority first, then first come, first served. Each class also
+keeps its queued windows sorted by start time.
+
+When a booking is cancelled or completed early, :meth:`Waitlist.release`
+finds the queues whose window overlaps the freed time with a binary search
+and offers the space to the best request at the head of those queues. One
+write transaction checks the space is still free for that window, books it
+and marks the request as booked, then repeats while other waiting windows
+still fit around the new booking. A queue whose window does not fit the
+space is skipped as a whole, since all its requests ask for the same
+window.
+
+The shared waitlist of a database file (:func:`get_waitlist`) follows the
+booking listeners of that file: writes made through ``database`` and those
+announced with ``database.notify_booking_listeners``. Other writers call
+:meth:`release`.
+"""
+
+import bisect
+import datetime
+import heapq
+import logging
+import os
+import threading
+from typing import Collection, Dict, List, Optional, Set, Tuple
+
+import database
+from db_pool import get_pool
+from write_queue import get_write_queue
+
+logger = logging.getLogger(__name__)
+
+SPACE_CLASSES = ('standard', 'accessible', 'ev')
+
+# Booking statuses that give the rest of a booking's window back
+RELEASING_STATUSES = ('cancelled', 'completed')
+
+WAITLIST_COLUMNS = ('id, user_id, start_time, end_time, space_class, priority, vehicle_plate, '
+                    'vehicle_type, status, booking_id, created_at')
+
+QueueKey = Tuple[str, str, str]         # (space class, start, end)
+
+
+def space_classes(accessible: bool, ev: bool) -> Tuple[str, ...]:
+    """Request classes a space can serve; every space serves 'standard'"""
+    classes = ('standard',)
+    if accessible:
+        classes += ('accessible',)
+    if ev:
+        classes += ('ev',)
+    return classes
+
+
+def _parse(timestamp: str) -> datetime.datetime:
+    return datetime.datetime.strptime(timestamp, database.DB_TIMESTAMP_FORMAT)
+
+
+class Waitlist:
+    """Waiting requests of one database, indexed by space class and window"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Dict] = {}
+        # Heaps of (-priority, entry id); removed entries are skipped lazily
+        self._queues: Dict[QueueKey, List[Tuple[int, int]]] = {}
+        self._windows: Dict[str, List[Tuple[str, str]]] = {c: [] for c in SPACE_CLASSES}
+        self._longest: Dict[str, datetime.timedelta] = {c: datetime.timedelta(0) for c in SPACE_CLASSES}
+        self.load()
+
+    # ---- In-memory queues ----
+
+    def _index(self, entry: Dict) -> None:
+        key = (entry['space_class'], entry['start_time'], entry['end_time'])
+        self._entries[entry['id']] = entry
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = []
+            bisect.insort(self._windows[key[0]], key[1:])
+            self._longest[key[0]] = max(self._longest[key[0]], _parse(key[2]) - _parse(key[1]))
+        heapq.heappush(queue, (-entry['priority'], entry['id']))
+
+    def _unindex(self, entry_id: int) -> None:
+        # The heap item stays until it reaches the head
+        self._entries.pop(entry_id, None)
+
+    def _head(self, key: QueueKey, skip: Collection[int] = ()) -> Optional[Dict]:
+        """Best live entry of a queue not in skip, dropping the queue once it is empty"""
+        queue = self._queues.get(key)
+        while queue and queue[0][1] not in self._entries:
+            heapq.heappop(queue)
+        if queue:
+            if queue[0][1] not in skip:
+                return self._entries[queue[0][1]]
+            # Entries claimed by an uncommitted transaction stay queued until it commits
+            live = [item for item in queue if item[1] in self._entries and item[1] not in skip]
+            return self._entries[min(live)[1]] if live else None
+        if queue is not None:
+            del self._queues[key]
+            windows = self._windows[key[0]]
+            del windows[bisect.bisect_left(windows, key[1:])]
+        return None
+
+    def _candidates(self, classes: Tuple[str, ...], start: str, end: str,
+                    skip: Collection[int] = ()) -> List[QueueKey]:
+        """Queues of the given classes whose window overlaps [start, end), best head first"""
+        keys = []
+        for space_class in classes:
+            windows = self._windows[space_class]
+            # Windows starting before `end`, and late enough to still reach `start`
+            earliest = database.to_db_timestamp(_parse(start) - self._longest[space_class])
+            lo = bisect.bisect_left(windows, (earliest,))
+            hi = bisect.bisect_left(windows, (end,))
+            keys.extend((space_class,) + window for window in windows[lo:hi] if window[1] > start)
+
+        ranked = []
+        for key in keys:
+            head = self._head(key, skip)
+            if head is not None:
+                # Requests needing a special space go before 'standard' ones that could park anywhere
+                ranked.append(((-head['priority'], key[0] == 'standard', head['id']), key))
+        return [key for _, key in sorted(ranked)]
+
+    def load(self) -> int:
+        """(Re)build the in-memory queues from the waiting requests in the database"""
+        with get_pool(self.path).connection() as conn, self._lock:
+            rows = conn.execute(f"SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE status = 'waiting'").fetchall()
+            self._entries.clear()
+            self._queues.clear()
+            for windows in self._windows.values():
+                windows.clear()
+            for row in rows:
+                self._index(dict(row))
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---- Requests ----
+
+    def join(self, user_id: int, start_time, end_time, space_class: str = 'standard',
+             priority: int = 0, vehicle_plate: str = 'UNKNOWN', vehicle_type: str = 'car') -> int:
+        """
+        Add a request to the waitlist.
+
+        Args:
+            user_id: Requesting user
+            start_time: Start of the wanted window
+            end_time: End of the wanted window
+            space_class: 'standard', 'accessible' or 'ev'
+            priority: Higher priorities are served first
+            vehicle_plate: Plate recorded on the booking
+            vehicle_type: Vehicle type recorded on the booking
+
+        Returns:
+            The waitlist entry ID
+        """
+        if space_class not in SPACE_CLASSES:
+            raise ValueError(f"Unknown space class {space_class!r}")
+        start_time = database.to_db_timestamp(start_time)
+        end_time = database.to_db_timestamp(end_time)
+        if end_time <= start_time:
+            raise ValueError("End time must be after start time")
+
+        entry = {'user_id': user_id, 'start_time': start_time, 'end_time': end_time,
+                 'space_class': space_class, 'priority': int(priority),
+                 'vehicle_plate': vehicle_plate, 'vehicle_type': vehicle_type}
+
+        def write(conn):
+            return conn.execute('''
+            INSERT INTO waitlist (user_id, start_time, end_time, space_class, priority, vehicle_plate, vehicle_type)
+            VALUES (:user_id, :start_time, :end_time, :space_class, :priority, :vehicle_plate, :vehicle_type)
+            ''', entry).lastrowid
+
+        entry['id'] = get_write_queue(self.path).write(write)
+        entry['status'] = 'waiting'
+        with self._lock:
+            self._index(entry)
+        return entry['id']
+
+    def leave(self, entry_id: int) -> bool:
+        """Withdraw a waiting request; False if it was no longer waiting"""
+        def write(conn):
+            return conn.execute(
+                "UPDATE waitlist SET status = 'cancelled' WHERE id = ? AND status = 'waiting'", (entry_id,)
+            ).rowcount > 0
+
+        left = get_write_queue(self.path).write(write)
+        with self._lock:
+            self._unindex(entry_id)
+        return left
+
+    def expire(self, now: Optional[datetime.datetime] = None) -> int:
+        """Mark requests whose window has ended as expired; returns how many"""
+        cutoff = database.to_db_timestamp(now or datetime.datetime.now())
+
+        def write(conn):
+            rows = conn.execute(
+                "SELECT id FROM waitlist WHERE status = 'waiting' AND end_time <= ?", (cutoff,)
+            ).fetchall()
+            conn.execute("UPDATE waitlist SET status = 'expired' WHERE status = 'waiting' AND end_time <= ?",
+                         (cutoff,))
+            return [row[0] for row in rows]
+
+        expired = get_write_queue(self.path).write(write)
+        with self._lock:
+            for entry_id in expired:
+                self._unindex(entry_id)
+        return len(expired)
+
+    def discard(self, entry_ids: List[int]) -> None:
+        """Drop requests closed by another writer (e.g. the scheduler) from the queues"""
+        with self._lock:
+            for entry_id in entry_ids:
+                self._unindex(entry_id)
+
+    def entries(self, user_id: Optional[int] = None, status: Optional[str] = 'waiting') -> List[Dict]:
+        """Waitlist entries from the database, oldest first"""
+        query = f'SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE 1'
+        params = []
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            params.append(user_id)
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        with get_pool(self.path).connection() as conn:
+            return [dict(row) for row in conn.execute(query + ' ORDER BY id', params)]
+
+    # ---- Reassignment ----
+
+    def _reassign(self, conn, space_id: int, classes: Tuple[str, ...], start: str, end: str,
+                  taken: Set[int]) -> Optional[Dict]:
+        """
+        Book the freed space for the best waiting request that fits; inside a write transaction.
+
+        Requests it closes are added to taken rather than dropped from the
+        queues, so a transaction that rolls back or is retried still finds
+        them. The caller unindexes them once the transaction commits.
+        """
+        with self._lock:
+            keys = self._candidates(classes, start, end, taken)
+        for key in keys:
+            _, window_start, window_end = key
+            if database._find_conflicts(conn, space_id, window_start, window_end):
+                continue
+            while True:
+                with self._lock:
+                    entry = self._head(key, taken)
+                if entry is None:
+                    break
+                claimed = conn.execute(
+                    "UPDATE waitlist SET status = 'booked' WHERE id = ? AND status = 'waiting'", (entry['id'],)
+                ).rowcount
+                # Leaves the queues either way once the transaction commits
+                taken.add(entry['id'])
+                if not claimed:
+                    # Withdrawn or booked by another process since we loaded it
+                    continue
+                booking_id = conn.execute('''
+                INSERT INTO bookings (user_id, space_id, start_time, end_time, vehicle_plate, vehicle_type, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'active')
+                ''', (entry['user_id'], space_id, window_start, window_end,
+                      entry['vehicle_plate'], entry['vehicle_type'])).lastrowid
+                conn.execute('UPDATE parking_spaces SET is_available = 0 WHERE id = ?', (space_id,))
+                conn.execute('UPDATE waitlist SET booking_id = ? WHERE id = ?', (booking_id, entry['id']))
+                return {'waitlist_id': entry['id'], 'booking_id': booking_id, 'user_id': entry['user_id'],
+                        'space_id': space_id, 'start_time': window_start, 'end_time': window_end}
+        return None
+
+    def _release(self, read_window, now: Optional[datetime.datetime]) -> List[Dict]:
+        now = database.to_db_timestamp(now or datetime.datetime.now())
+        taken: Set[int] = set()
+
+        def write(conn):
+            # A busy retry starts over, with every request still queued
+            taken.clear()
+            window = read_window(conn)
+            if window is None:
+                return []
+            space_id, start, end = window
+            space = conn.execute(
+                'SELECT is_accessible, is_ev_charging, status FROM parking_spaces WHERE id = ?', (space_id,)
+            ).fetchone()
+            if space is None or space[2] != 'active':
+                return []
+            # Only the part of the window still ahead is given back
+            start = max(start, now)
+            if start >= end:
+                return []
+            matches = []
+            classes = space_classes(space[0], space[1])
+            while True:
+                match = self._reassign(conn, space_id, classes, start, end, taken)
+                if match is None:
+                    return matches
+                matches.append(match)
+
+        def unindex_taken(matches):
+            with self._lock:
+                for entry_id in taken:
+                    self._unindex(entry_id)
+
+        try:
+            matches = get_write_queue(self.path).write(write, after_commit=unindex_taken)
+        except Exception:
+            self.load()
+            raise
+        for match in matches:
+            logger.info("Waitlist entry %d booked space %d as booking %d",
+                        match['waitlist_id'], match['space_id'], match['booking_id'])
+            database.notify_booking_listeners('created', {
+                'id': match['booking_id'], 'user_id': match['user_id'], 'space_id': match['space_id'],
+                'start_time': match['start_time'], 'end_time': match['end_time'], 'status': 'active',
+            }, self.path)
+        return matches
+
+    def release(self, booking_id: int, now: Optional[datetime.datetime] = None) -> List[Dict]:
+        """
+        Offer the time a cancelled or completed booking gave back to the waitlist.
+
+        Args:
+            booking_id: The booking, already cancelled or completed
+            now: Current time; only the part of the booking after it is offered
+
+        Returns:
+            One {'waitlist_id', 'booking_id', 'user_id', 'space_id',
+            'start_time', 'end_time'} per request that got the space, best first
+        """
+        def read_window(conn):
+            row = conn.execute('SELECT space_id, start_time, end_time, status FROM bookings WHERE id = ?',
+                               (booking_id,)).fetchone()
+            if row is None or row[3] not in RELEASING_STATUSES:
+                return None
+            return row[0], row[1], row[2]
+
+        return self._release(read_window, now)
+
+    def release_space(self, space_id: int, start_time, end_time,
+                      now: Optional[datetime.datetime] = None) -> List[Dict]:
+        """Offer a space for a window that has just been freed (e.g. a deleted booking)"""
+        window = (space_id, database.to_db_timestamp(start_time), database.to_db_timestamp(end_time))
+        return self._release(lambda conn: window, now)
+
+    def handle_booking_event(self, event: str, booking: Dict) -> None:
+        """Booking listener: reassign the time freed by cancellations, completions and deletions"""
+        if event == 'updated' and booking.get('status') in RELEASING_STATUSES:
+            self.release(booking['id'])
+        elif event == 'deleted' and booking.get('status') == 'active':
+            self.release_space(booking['space_id'], booking['start_time'], booking['end_time'])
+
+
+# ---- Process-wide registry ----
+
+_waitlists: Dict[str, Waitlist] = {}
+_waitlists_lock = threading.Lock()
+
+
+def get_waitlist(path: str) -> Waitlist:
+    """
+    Return the shared waitlist of a database file, loading it on first use.
+
+    Args:
+        path: Path to the SQLite database file
+
+    Returns:
+        The Waitlist for that file
+    """
+    key = os.path.abspath(path)
+    waitlist = _waitlists.get(key)
+    if waitlist is not None:
+        return waitlist
+
+    with _waitlists_lock:
+        waitlist = _waitlists.get(key)
+        if waitlist is None:
+            waitlist = Waitlist(path)
+            database.add_booking_listener(waitlist.handle_booking_event, path)
+            _waitlists[key] = waitlist
+        return waitlist
@@ -0,0 +1,291 @@
+"""
+Serialized writer with group commit.
+
+SQLite allows one writer at a time. When many Streamlit sessions each open
+their own write transaction, bursts pile up on the lock and callers fail
+with ``database is locked`` once the busy timeout runs out. Here every
+write is instead handed to a single writer thread per database file::
+
+    future = get_write_queue(path).submit(lambda conn: conn.execute(...).lastrowid)
+    booking_id = future.result()
+
+The writer takes whatever requests are pending (up to ``max_batch``), runs
+them in one ``BEGIN IMMEDIATE`` transaction and commits once, so one fsync
+and one lock acquisition are shared by the whole batch and throughput grows
+with batch size. Requests that arrive while a batch commits form the next
+batch, so batches grow with load without delaying a lone write. Each
+request runs inside its own savepoint: one that raises is rolled back alone
+and its future gets the exception, while the rest of the batch still
+commits. If the lock cannot be taken or the commit fails because the
+database is busy, the whole batch is retried with exponential backoff, a
+bounded number of times.
+
+Write functions receive the connection and must not commit or roll back.
+They must be pure database work: a busy retry runs them again from the
+start, and a rolled back attempt leaves nothing behind only if all they
+changed was the database. Anything with effects outside the transaction
+(caches, in-memory indexes, notifications) goes in an ``after_commit``
+callback, which is called with the write's result once it has committed::
+
+    get_write_queue(path).write(fn, after_commit=lambda result: index.discard(result))
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from db_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_BATCH_WINDOW = 0.0       # extra seconds to wait for more requests; 0 takes what is queued
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.01           # first retry delay in seconds, doubled each time
+MAX_BACKOFF = 0.5
+DEFAULT_WRITE_TIMEOUT = 30.0     # how long callers of write() wait for the result
+
+WriteFunction = Callable[[sqlite3.Connection], Any]
+AfterCommit = Optional[Callable[[Any], None]]
+Request = Tuple[WriteFunction, Future, AfterCommit]
+
+_STOP = object()
+
+
+def _is_busy(error: sqlite3.Error) -> bool:
+    """Whether an error means another connection holds the write lock"""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteQueue:
+    """
+    A writer thread committing queued write functions in batches.
+
+    Use :func:`get_write_queue` for the shared queue of a database file.
+    """
+
+    def __init__(self, path: str, max_batch: int = DEFAULT_MAX_BATCH,
+                 batch_window: float = DEFAULT_BATCH_WINDOW, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF):
+        if max_batch < 1:
+            raise ValueError("Batch size must be at least 1")
+        self.path = path
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.retries = retries
+        self.backoff = backoff
+
+        self._requests: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        # Statistics
+        self._batches = 0
+        self._writes = 0
+        self._failed = 0
+        self._retries = 0
+        self._max_batch_seen = 0
+        self._commit_time = 0.0
+
+    # ---- Submitting ----
+
+    def submit(self, fn: WriteFunction, after_commit: AfterCommit = None) -> Future:
+        """
+        Queue a write function; the future resolves to its return value after commit.
+
+        after_commit, if given, is called with that value on the writer
+        thread once the write has committed and before the future resolves.
+        It is not called if the write fails. Its own errors are logged.
+        """
+        if self._closed:
+            raise RuntimeError("Write queue is closed")
+        self._ensure_thread()
+        future: Future = Future()
+        self._requests.put((fn, future, after_commit))
+        return future
+
+    def write(self, fn: WriteFunction, timeout: Optional[float] = DEFAULT_WRITE_TIMEOUT,
+              after_commit: AfterCommit = None) -> Any:
+        """Queue a write function and wait for its committed result"""
+        return self.submit(fn, after_commit).result(timeout)
+
+    # ---- Writer thread ----
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> Tuple[List[Request], bool]:
+        """Block for one request, then gather whatever else arrives within the window"""
+        first = self._requests.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.perf_counter()
+                item = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            # Requests cancelled while queued are dropped
+            batch = [request for request in batch if request[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[Request]) -> None:
+        """Run a batch in one transaction, retrying it while the database is busy"""
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                outcomes = self._apply(batch)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == self.retries:
+                    self._fail(batch, e)
+                    return
+                with self._lock:
+                    self._retries += 1
+                logger.info("Write batch of %d busy, retrying in %.3f s", len(batch), delay)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_BACKOFF)
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            else:
+                break
+
+        failed = 0
+        for (_, future, after_commit), (ok, value) in zip(batch, outcomes):
+            if ok:
+                if after_commit is not None:
+                    try:
+                        after_commit(value)
+                    except Exception:
+                        logger.exception("After-commit callback %r failed", after_commit)
+                future.set_result(value)
+            else:
+                failed += 1
+                future.set_exception(value)
+        with self._lock:
+            self._batches += 1
+            self._writes += len(batch)
+            self._failed += failed
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+
+    def _apply(self, batch: List[Request]) -> List[Tuple[bool, Any]]:
+        """One transaction: each write in its own savepoint, then a single commit"""
+        outcomes = []
+        with get_pool(self.path).connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, _, _ in batch:
+                conn.execute("SAVEPOINT write_request")
+                try:
+                    outcomes.append((True, fn(conn)))
+                except sqlite3.OperationalError as e:
+                    if _is_busy(e):
+                        raise
+                    conn.execute("ROLLBACK TO write_request")
+                    outcomes.append((False, e))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_request")
+                    outcomes.append((False, e))
+                conn.execute("RELEASE write_request")
+            started = time.perf_counter()
+            conn.commit()
+            with self._lock:
+                self._commit_time += time.perf_counter() - started
+        return outcomes
+
+    def _fail(self, batch: List[Request], error: Exception) -> None:
+        logger.error("Write batch of %d failed: %s", len(batch), error)
+        for _, future, _ in batch:
+            future.set_exception(error)
+        with self._lock:
+            self._batches += 1
+            self._writes += len(batch)
+            self._failed += len(batch)
+
+    # ---- Lifecycle ----
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting writes, finish the queued ones and stop the thread"""
+        self._closed = True
+        self._requests.put(_STOP)
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    # ---- Introspection ----
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Return a snapshot of writer statistics"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "pending": self._requests.qsize(),
+                "batches": self._batches,
+                "writes": self._writes,
+                "failed": self._failed,
+                "retries": self._retries,
+                "max_batch": self._max_batch_seen,
+                "avg_batch": self._writes / self._batches if self._batches else 0.0,
+                "commit_time_total": self._commit_time,
+            }
+
+
+# ---- Process-wide registry ----
+
+_queues: Dict[str, WriteQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(path: str) -> WriteQueue:
+    """
+    Return the shared write queue for a database file, creating it on first use.
+
+    Args:
+        path: Path to the SQLite database file
+
+    Returns:
+        The WriteQueue for that file
+    """
+    key = os.path.abspath(path)
+    write_queue = _queues.get(key)
+    if write_queue is not None:
+        return write_queue
+
+    with _queues_lock:
+        write_queue = _queues.get(key)
+        if write_queue is None:
+            write_queue = WriteQueue(path)
+            _queues[key] = write_queue
+        return write_queue
+
+
+def close_all_write_queues(timeout: Optional[float] = None) -> None:
+    """Drain and stop every write queue in the registry"""
+    with _queues_lock:
+        for write_queue in _queues.values():
+            write_queue.close(timeout)
+        _queues.clear()
@@ -0,0 +1,32 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, initialized database file standing in for database.DB_PATH"""
+    path = str(tmp_path / "parking.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    monkeypatch.setattr(database, "_booking_listeners", [])
+    monkeypatch.setattr(database, "_space_listeners", [])
+    database.init_db()
+    return path
+
+
+def clock(origin):
+    """at(hours, minutes=0, seconds=0): the time that long after origin"""
+    def at(hours=0, minutes=0, seconds=0):
+        return origin + datetime.timedelta(hours=hours, minutes=minutes, seconds=seconds)
+    return at
+
+
+def stamp(value):
+    """A datetime as stored in the database"""
+    return value.strftime(database.DB_TIMESTAMP_FORMAT)
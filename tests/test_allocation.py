@@ -0,0 +1,121 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import allocation
+import availability
+import database
+from allocation import AllocationRequest, SpaceAllocator, SpaceFeatures, get_allocator, score_spaces
+from availability import AvailabilityMatrix, get_availability_engine, load_from_db
+from conftest import clock, stamp
+
+ORIGIN = datetime.datetime(2030, 1, 7, 8)
+
+
+at = clock(ORIGIN)
+
+
+def space(space_id, floor="1", section="A", accessible=False, ev=False, status="active"):
+    return {"id": space_id, "floor": floor, "section": section, "is_accessible": accessible,
+            "is_ev_charging": ev, "status": status}
+
+
+def allocator(spaces, bookings=()):
+    matrix = AvailabilityMatrix(origin=ORIGIN, horizon_days=2)
+    matrix.load(spaces, [
+        {"id": i, "space_id": space_id, "start_time": stamp(start), "end_time": stamp(end)}
+        for i, (space_id, start, end) in enumerate(bookings)
+    ])
+    return SpaceAllocator(matrix, spaces)
+
+
+def test_hard_constraints_rule_spaces_out():
+    alloc = allocator([space(1), space(2, accessible=True), space(3, ev=True), space(4, status="maintenance")],
+                      bookings=[(1, at(1), at(3))])
+    assert alloc.allocate(AllocationRequest(at(2), at(4), needs_accessible=True)) == 2
+    assert alloc.allocate(AllocationRequest(at(2), at(4), needs_ev=True)) == 3
+    assert alloc.rank(AllocationRequest(at(2), at(4))) == [3, 2]        # 1 is booked, 4 in maintenance
+    assert alloc.allocate(AllocationRequest(at(2), at(4), needs_accessible=True, needs_ev=True)) is None
+
+
+def test_special_spaces_are_kept_for_drivers_who_need_them():
+    alloc = allocator([space(1, accessible=True), space(2, ev=True), space(3)])
+    assert alloc.rank(AllocationRequest(at(2), at(4))) == [3, 2, 1]
+    assert alloc.allocate(AllocationRequest(at(2), at(4), vehicle_type="ev")) == 2
+
+
+def test_preferences_and_vehicle_size_move_the_ranking():
+    alloc = allocator([space(1, floor="3"), space(2, floor="1", section="B"), space(3, floor="B1")])
+    assert alloc.allocate(AllocationRequest(at(2), at(4), preferred_floor="3")) == 1
+    assert alloc.allocate(AllocationRequest(at(2), at(4), preferred_section="B", vehicle_type="truck")) == 2
+    # Basement and ground levels carry no climb penalty for large vehicles
+    assert alloc.rank(AllocationRequest(at(2), at(4), vehicle_type="truck"))[-1] == 1
+
+
+def test_best_fit_prefers_flush_windows_and_avoids_slivers():
+    alloc = allocator([space(1), space(2), space(3)], bookings=[
+        (1, at(1), at(1, 30)),     # leaves a 30 minute sliver before a 2:00 start
+        (3, at(1), at(2)),         # ends exactly at 2:00
+    ])
+    assert alloc.rank(AllocationRequest(at(2), at(4))) == [3, 2, 1]
+
+
+def test_batch_assignment_maximises_the_total_score():
+    # Greedy would give the only EV space to the first (non-EV) request
+    alloc = allocator([space(1, ev=True), space(2)])
+    requests = [AllocationRequest(at(2), at(4)), AllocationRequest(at(2), at(4), needs_ev=True)]
+    assert alloc.allocate_batch(requests) == [2, 1]
+    assert alloc.allocate_batch(requests + [AllocationRequest(at(2), at(4))]) == [2, 1, None]
+    assert alloc.allocate_batch([]) == []
+
+
+def test_scores_match_constraints_without_a_matrix():
+    features = SpaceFeatures.from_rows([space(1), space(2, status="maintenance")], order=[1, 2, 3])
+    scores = score_spaces(features, AllocationRequest(None, None))
+    assert np.isfinite(scores).tolist() == [True, False, False]
+
+
+def test_allocate_and_book_falls_back_when_a_space_is_taken(db, monkeypatch):
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    first = database.create_parking_space("A1", "Lot", 2.0)
+    second = database.create_parking_space("A2", "Lot", 2.0)
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=1)
+    end = start + datetime.timedelta(hours=2)
+    alloc = SpaceAllocator(load_from_db(AvailabilityMatrix()), database.get_all_parking_spaces())
+
+    # Another session books the best space behind the allocator's back
+    database.create_booking(user_id, first, start, end, "OTHER", "car")
+    result = alloc.allocate_and_book(user_id, AllocationRequest(start, end), "ABC123")
+    assert result["space_id"] == second
+    assert database.get_booking(result["booking_id"])["vehicle_plate"] == "ABC123"
+
+
+def test_spaces_put_under_maintenance_are_not_allocated(db, monkeypatch):
+    monkeypatch.setattr(availability, "_engine", None)
+    first = database.create_parking_space("A1", "Lot", 2.0)
+    second = database.create_parking_space("A2", "Lot", 2.0)
+    alloc = SpaceAllocator(get_availability_engine(), database.get_all_parking_spaces())
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=1)
+    request = AllocationRequest(start, start + datetime.timedelta(hours=1))
+    assert alloc.allocate(request) == first
+
+    database.update_parking_space(first, status="maintenance")
+    assert alloc.allocate(request) == second
+
+
+def test_allocator_is_rebuilt_after_space_edits(db, monkeypatch):
+    monkeypatch.setattr(availability, "_engine", None)
+    monkeypatch.setattr(allocation, "_allocator", None)
+    first = database.create_parking_space("A1", "Lot", 2.0)
+    database.create_parking_space("A2", "Lot", 2.0)
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=1)
+    request = AllocationRequest(start, start + datetime.timedelta(hours=1), needs_accessible=True)
+    alloc = get_allocator()
+    assert alloc.allocate(request) is None
+    assert get_allocator() is alloc
+
+    # Same number of spaces, so only the catalog generation shows the edit
+    database.update_parking_space(first, is_accessible=True)
+    assert alloc.is_stale()
+    assert get_allocator().allocate(request) == first
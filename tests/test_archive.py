@@ -0,0 +1,112 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import archive
+import database
+
+NOW = datetime.datetime.now().replace(microsecond=0)
+OLD = NOW - datetime.timedelta(days=60)
+
+
+@pytest.fixture
+def user(db):
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    space = database.create_parking_space("A1", "Lot", 2.0)
+    rows = []
+    for i, status in enumerate(["completed", "cancelled", "active", "completed", "cancelled"]):
+        start = OLD + datetime.timedelta(hours=i)
+        rows.append(dict(user_id=user_id, space_id=space, start_time=start,
+                         end_time=start + datetime.timedelta(minutes=30), vehicle_plate="P",
+                         vehicle_type="car", status=status))
+    # Finished, but too recent to archive
+    rows.append(dict(user_id=user_id, space_id=space, start_time=NOW - datetime.timedelta(days=2),
+                     end_time=NOW - datetime.timedelta(days=2, minutes=-30), vehicle_plate="P",
+                     vehicle_type="car", status="completed"))
+    database.create_bookings_bulk(rows)
+    return user_id
+
+
+def test_only_old_finished_bookings_move(user):
+    assert archive.archive_old_bookings(batch_size=2, pause=0) == 4
+    assert archive.get_archive_stats() == {"hot": 2, "archived": 4}
+    hot = {b["status"] for b in database.get_user_bookings(user)}
+    assert hot == {"active", "completed"}
+    assert archive.archive_old_bookings(pause=0) == 0
+
+
+def test_batches_are_bounded(user):
+    assert archive.archive_batch(batch_size=3) == 3
+    assert archive.archive_batch(batch_size=3) == 1
+    assert archive.archive_batch(batch_size=3) == 0
+
+
+def test_stop_event_ends_the_run(user):
+    stop = archive.threading.Event()
+    stop.set()
+    assert archive.archive_old_bookings(batch_size=1, stop_event=stop) == 0
+
+
+def test_bookings_are_found_in_either_tier(user):
+    ids = [b["id"] for b in database.get_user_bookings(user)]
+    archive.archive_old_bookings(pause=0)
+    tiers = {booking_id: archive.get_booking_any_tier(booking_id)["tier"] for booking_id in ids}
+    assert sorted(tiers.values()) == ["archive"] * 4 + ["hot"] * 2
+    assert archive.get_booking_any_tier(max(ids) + 1) is None
+
+
+def test_history_merges_tiers_newest_first(user):
+    before = [b["id"] for b in database.get_user_bookings_page(user, limit=100)]
+    archive.archive_old_bookings(pause=0)
+
+    history = list(archive.iter_user_booking_history(user, batch_size=2))
+    assert [b["id"] for b in history] == before
+    assert {b["tier"] for b in history} == {"hot", "archive"}
+    assert all(b["space_number"] == "A1" for b in history)
+
+    first = archive.get_user_booking_history(user, limit=3)
+    rest = archive.get_user_booking_history(user, limit=10, after=database.booking_cursor(first[-1]))
+    assert [b["id"] for b in first + rest] == before
+
+
+def test_archiver_run_once_tracks_totals(user):
+    archiver = archive.BookingArchiver(batch_size=2)
+    assert archiver.run_once() == 4
+    assert archiver.last_archived == 4 and archiver.total_archived == 4
+    assert archiver.last_run is not None
+    assert not archiver.is_running()
+
+
+def test_check_in_and_series_survive_archiving(user):
+    booking = database.get_user_bookings_page(user, limit=100)[-1]
+    when = OLD + datetime.timedelta(minutes=5)
+    with database.db_connection() as conn:
+        conn.execute("UPDATE bookings SET checked_in_at = ?, series_id = 7 WHERE id = ?",
+                     (when, booking["id"]))
+        conn.commit()
+    archive.archive_old_bookings(pause=0)
+    archived = archive.get_booking_any_tier(booking["id"])
+    assert archived["tier"] == "archive"
+    assert archived["series_id"] == 7 and archived["checked_in_at"] is not None
+
+
+def test_id_collision_rolls_the_batch_back(user):
+    booking = database.get_user_bookings_page(user, limit=100)[-1]
+    with database.db_connection() as conn:
+        conn.execute("INSERT INTO bookings_archive (id, user_id, space_id, start_time, end_time, "
+                     "vehicle_plate, vehicle_type, status) VALUES (?, 0, 0, ?, ?, 'X', 'car', 'completed')",
+                     (booking["id"], OLD, OLD))
+        conn.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        archive.archive_old_bookings(pause=0)
+    # Nothing left the hot table
+    assert archive.get_archive_stats() == {"hot": 6, "archived": 1}
+
+
+def test_archiver_reports_moved_rows(user):
+    moved = []
+    archiver = archive.BookingArchiver(batch_size=2, on_archived=moved.append)
+    archiver.run_once()
+    archiver.run_once()
+    assert moved == [4]
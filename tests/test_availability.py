@@ -0,0 +1,149 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import availability
+import database
+from availability import AvailabilityMatrix, get_availability_engine
+from conftest import clock, stamp
+
+ORIGIN = datetime.datetime(2030, 1, 7, 8)
+
+
+at = clock(ORIGIN)
+
+
+@pytest.fixture
+def matrix():
+    matrix = AvailabilityMatrix(origin=ORIGIN, horizon_days=2)
+    spaces = [{"id": 1, "status": "active"}, {"id": 2, "status": "active"}, {"id": 3, "status": "maintenance"}]
+    bookings = [
+        {"id": 10, "space_id": 1, "start_time": stamp(at(1)), "end_time": stamp(at(3))},
+        {"id": 11, "space_id": 2, "start_time": stamp(at(2, 10)), "end_time": stamp(at(2, 20))},
+        {"id": 12, "space_id": 99, "start_time": stamp(at(1)), "end_time": stamp(at(3))},   # unknown space
+    ]
+    matrix.load(spaces, bookings)
+    return matrix
+
+
+def test_free_spaces_for_a_window(matrix):
+    assert matrix.free_spaces(at(0), at(1)).tolist() == [1, 2]
+    assert matrix.free_spaces(at(0), at(2)).tolist() == [2]
+    assert matrix.free_spaces(at(3), at(4)).tolist() == [1, 2]     # back to back with booking 10
+    assert not matrix.is_free(3, at(5), at(6))                      # maintenance
+    assert not matrix.is_free(42, at(5), at(6))
+
+
+def test_bookings_hold_every_slot_they_touch(matrix):
+    # 10:10-10:20 touches the 10:00-10:15 and 10:15-10:30 slots
+    assert not matrix.is_free(2, at(2), at(2, 15))
+    assert not matrix.is_free(2, at(2, 15), at(2, 30))
+    assert matrix.is_free(2, at(2, 30), at(3))
+    assert matrix.free_counts(at(2), at(3)).tolist() == [0, 0, 1, 1]
+
+
+def test_shared_slot_stays_taken_until_both_bookings_go(matrix):
+    matrix.add_booking(20, 2, at(2, 20), at(2, 30))
+    matrix.remove_booking(11)
+    assert not matrix.is_free(2, at(2, 15), at(2, 30))
+    matrix.remove_booking(20)
+    assert matrix.is_free(2, at(2), at(3))
+    assert not matrix.remove_booking(20)
+
+
+def test_booking_events_keep_the_matrix_current(matrix):
+    booking = {"id": 30, "space_id": 2, "start_time": stamp(at(5)), "end_time": stamp(at(6)), "status": "active"}
+    matrix.handle_booking_event("created", booking)
+    assert not matrix.is_free(2, at(5), at(6))
+    matrix.handle_booking_event("updated", dict(booking, start_time=stamp(at(7)), end_time=stamp(at(8))))
+    assert matrix.is_free(2, at(5), at(6))
+    assert not matrix.is_free(2, at(7), at(8))
+    matrix.handle_booking_event("updated", dict(booking, status="cancelled"))
+    assert matrix.is_free(2, at(7), at(8))
+
+
+def test_space_status_controls_bookability(matrix):
+    matrix.set_space_status(1, "maintenance")
+    assert 1 not in matrix.free_spaces(at(5), at(6))
+    matrix.set_space_status(3, "active")
+    assert 3 in matrix.free_spaces(at(5), at(6))
+
+
+def test_windows_outside_the_horizon_are_refused(matrix):
+    with pytest.raises(ValueError):
+        matrix.free_spaces(at(-1), at(1))
+    with pytest.raises(ValueError):
+        matrix.free_spaces(at(47), at(49))
+    with pytest.raises(ValueError):
+        matrix.free_spaces(at(2), at(2))
+
+
+def test_advance_rolls_the_horizon_and_fills_new_slots(matrix):
+    matrix.add_booking(40, 2, at(47), at(52))       # runs past the current horizon
+    assert matrix.advance(at(24)) == 96
+    assert matrix.is_free(1, at(24), at(25))
+    assert not matrix.is_free(2, at(50), at(51))
+    assert matrix.is_free(2, at(52), at(53))
+    assert matrix.advance(at(24, 5)) == 0
+
+
+def test_bulk_load_matches_incremental_marks():
+    rng = np.random.default_rng(0)
+    spaces = [{"id": i, "status": "active"} for i in range(1, 21)]
+    bookings = []
+    for i in range(300):
+        start = at(0, int(rng.integers(0, 46 * 60)))
+        bookings.append({"id": i, "space_id": int(rng.integers(1, 21)), "start_time": stamp(start),
+                         "end_time": stamp(start + datetime.timedelta(minutes=int(rng.integers(1, 180))))})
+    bulk = AvailabilityMatrix(origin=ORIGIN, horizon_days=2)
+    bulk.load(spaces, bookings)
+    incremental = AvailabilityMatrix(origin=ORIGIN, horizon_days=2)
+    incremental.load(spaces, [])
+    for b in bookings:
+        incremental.add_booking(b["id"], b["space_id"], b["start_time"], b["end_time"])
+    assert np.array_equal(bulk.counts, incremental.counts)
+
+
+def test_new_spaces_take_preallocated_columns(monkeypatch, matrix):
+    monkeypatch.setattr(availability, "INITIAL_SPACE_CAPACITY", 4)
+    matrix.load([{"id": i, "status": "active"} for i in (1, 2, 3)], [])
+    matrix.add_booking(10, 1, at(1), at(3))
+    buffer = matrix._counts_buffer
+    matrix.set_space_status(4, "active")
+    assert matrix.capacity == 4 and matrix._counts_buffer is buffer
+
+    for space_id in range(5, 10):
+        matrix.set_space_status(space_id, "maintenance" if space_id == 9 else "active")
+    assert matrix.capacity == 16 and matrix.counts.shape == (matrix.n_slots, 9)
+    assert matrix.free_spaces(at(1), at(2)).tolist() == [2, 3, 4, 5, 6, 7, 8]
+    matrix.add_booking(11, 8, at(1), at(2))
+    assert not matrix.is_free(8, at(1), at(2)) and matrix.is_free(1, at(3), at(4))
+
+
+def test_unseen_spaces_wait_for_their_status(matrix):
+    matrix.add_booking(50, 7, at(1), at(2))
+    assert not matrix.is_free(7, at(5), at(6))
+    matrix.set_space_status(7, "active")
+    assert matrix.is_free(7, at(5), at(6)) and not matrix.is_free(7, at(1), at(2))
+    matrix.set_space_status(7, None)
+    assert 7 not in matrix.free_spaces(at(5), at(6))
+
+
+def test_engine_follows_space_writes(db, monkeypatch):
+    monkeypatch.setattr(availability, "_engine", None)
+    first = database.create_parking_space("A1", "Lot", 2.0)
+    engine = get_availability_engine()
+    start = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(days=1)
+    end = start + datetime.timedelta(hours=1)
+
+    second = database.create_parking_space("A2", "Lot", 2.0)
+    assert engine.free_spaces(start, end).tolist() == [first, second]
+    database.update_parking_space(first, status="maintenance")
+    assert engine.free_spaces(start, end).tolist() == [second]
+    database.update_parking_space(first, status="active")
+    database.create_parking_spaces_bulk([{"space_number": f"B{i}", "location": "Lot", "hourly_rate": 1.0}
+                                         for i in range(3)])
+    assert len(engine.free_spaces(start, end)) == 5
+    database.delete_parking_space(second)
+    assert second not in engine.free_spaces(start, end)
@@ -0,0 +1,114 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import utils
+from billing import DISCOUNT_CODES, PricingEngine, discount_rate
+from tariffs import TariffTable
+
+ENGINES = [
+    PricingEngine(),
+    PricingEngine(billing_increment=60),
+    PricingEngine(hourly_rates={"car": 3.3, "van": 4.1}, premium_multiplier=1.25,
+                  billing_increment=900, duration_discounts=((6, 0.95), (48, 0.7))),
+]
+
+
+def test_scalar_prices():
+    engine = PricingEngine()
+    assert engine.price("car", datetime.timedelta(minutes=30)) == 5.0
+    assert engine.price("car", datetime.timedelta(hours=2, seconds=1)) == 15.0
+    # 13 charged hours: the 12-hour tier
+    assert engine.price("suv", datetime.timedelta(hours=13), is_premium=True) == pytest.approx(13 * 10.5 * 0.9)
+    # 25 charged hours: the 24-hour tier, not the 12-hour one
+    assert engine.price("truck", 25 * 3600) == pytest.approx(250 * 0.8)
+    assert engine.price("car", 3600, discount=0.2) == 4.0
+    assert engine.price("hovercraft", 3600) == engine.price("car", 3600)
+    assert engine.price("car", 0) == 0.0
+
+
+def test_configuration_is_validated():
+    with pytest.raises(ValueError):
+        PricingEngine(hourly_rates={"suv": 7.0})
+    with pytest.raises(ValueError):
+        PricingEngine(billing_increment=0)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_batch_is_bit_identical_to_scalar(engine):
+    rng = np.random.default_rng(11)
+    n = 20_000
+    types = rng.choice(["car", "CAR", "suv", "truck", "motorcycle", "van", "unknown", ""], n)
+    seconds = rng.integers(0, 60 * 3600, n).astype(np.float64)
+    seconds[:50] = np.arange(50) * 3600.0       # exact increments around every tier boundary
+    premium = rng.random(n) < 0.3
+    discounts = rng.choice([0.0, *DISCOUNT_CODES.values()], n)
+
+    batch = engine.price_batch(types, seconds, premium, discounts)
+    scalar = np.array([engine.price(t, s, p, d) for t, s, p, d in zip(types, seconds, premium, discounts)])
+    assert batch.dtype == np.float64
+    assert np.array_equal(batch, scalar)
+
+
+def test_batch_accepts_timedeltas_and_optional_columns():
+    engine = PricingEngine()
+    durations = np.array([30, 90, 13 * 60], dtype="timedelta64[m]")
+    assert list(engine.price_batch(["car", "suv", "car"], durations)) == \
+        [engine.price("car", 1800), engine.price("suv", 5400), engine.price("car", 13 * 3600)]
+    assert len(engine.price_batch([], [])) == 0
+    with pytest.raises(ValueError):
+        engine.price_batch(["car"], [1.0, 2.0])
+
+
+def test_utils_share_the_engine_and_codes():
+    assert utils.calculate_parking_fee("car", datetime.timedelta(hours=25)) == pytest.approx(25 * 5.0 * 0.8)
+    assert discount_rate("newuser") == 0.2 and discount_rate(None) == 0.0
+    assert utils.apply_discount(100.0, "LOYALTY") == pytest.approx((90.0, 10.0))
+
+
+def flat_engine(table):
+    return PricingEngine({"car": 2.0}, billing_increment=60, duration_discounts=(), tariffs=table)
+
+
+TUESDAY_9 = datetime.datetime(2030, 1, 8, 9)
+TARIFFS = TariffTable.from_dict({"default": [{"name": "peak", "start": "07:00", "end": "19:00", "multiplier": 1.5}],
+                                 "sections": {"A": [{"name": "all", "multiplier": 2.0}]}})
+
+
+def test_quotes_weight_the_charged_window_by_the_tariff():
+    engine = PricingEngine(tariffs=TARIFFS)
+    # 90 minutes charge two hours; the rounded-up window is all peak
+    assert engine.quote(None, TUESDAY_9, TUESDAY_9 + datetime.timedelta(minutes=90), 4.0) == 2 * 1.5 * 4.0
+    assert engine.quote("A", TUESDAY_9, TUESDAY_9 + datetime.timedelta(hours=1), 4.0) == 8.0
+    # Without a rate the vehicle type's applies; tiers and discounts come on top
+    stay = (TUESDAY_9, TUESDAY_9 + datetime.timedelta(hours=13))
+    assert engine.quote("A", *stay, vehicle_type="suv", discount=0.1) == \
+        pytest.approx(13 * 2.0 * 7.0 * 0.9 * 0.9)
+    assert engine.quote(None, TUESDAY_9, TUESDAY_9, 4.0) == 0.0
+
+
+def test_flat_tariff_quotes_match_duration_prices():
+    engine = PricingEngine(tariffs=TariffTable())
+    for hours in (0.5, 2, 13, 25):
+        end = TUESDAY_9 + datetime.timedelta(hours=hours)
+        assert engine.quote(None, TUESDAY_9, end, vehicle_type="truck") == \
+            pytest.approx(engine.price("truck", end - TUESDAY_9))
+
+
+@pytest.mark.parametrize("engine", [PricingEngine(tariffs=TARIFFS), flat_engine(TARIFFS)])
+def test_quote_batch_matches_quote(engine):
+    rng = np.random.default_rng(3)
+    n = 2000
+    starts = np.datetime64(TUESDAY_9, "s") + rng.integers(0, 14 * 86400, n).astype("timedelta64[s]")
+    ends = starts + rng.integers(-600, 30 * 3600, n).astype("timedelta64[s]")
+    sections = rng.choice(["A", "Z", None], n)
+    rates = rng.choice([1.0, 2.5], n)
+    discounts = rng.choice([0.0, 0.1], n)
+    batch = engine.quote_batch(sections, starts, ends, rates, discounts=discounts)
+    scalar = [engine.quote(s, a.astype(datetime.datetime), b.astype(datetime.datetime), r, discount=d)
+              for s, a, b, r, d in zip(sections, starts, ends, rates, discounts)]
+    np.testing.assert_allclose(batch, scalar, rtol=1e-12, atol=1e-9)
+    assert len(engine.quote_batch([], [], [], [])) == 0
+    with pytest.raises(ValueError):
+        engine.quote_batch(["A"], starts[:2], ends[:2], rates[:2])
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+import database
+from conftest import clock
+
+T0 = datetime.datetime(2030, 1, 1, 9)
+
+
+hours = clock(T0)
+
+
+def space_rows(n, prefix="S"):
+    for i in range(n):
+        yield {"space_number": f"{prefix}{i}", "location": "Lot", "hourly_rate": 2.0, "floor": "1", "section": "A"}
+
+
+@pytest.fixture
+def lot(db):
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    result = database.create_parking_spaces_bulk(space_rows(3))
+    assert result == {"inserted": 3, "errors": []}
+    return user_id, [space["id"] for space in database.get_all_parking_spaces()]
+
+
+def booking(user_id, space_id, start, end, **extra):
+    return dict(user_id=user_id, space_id=space_id, start_time=hours(start), end_time=hours(end),
+                vehicle_plate="ABC123", vehicle_type="car", **extra)
+
+
+def test_space_import_streams_chunks_and_skips_bad_rows(db):
+    rows = list(space_rows(5)) + [{"space_number": "S1", "location": "Lot", "hourly_rate": 1.0},
+                                  {"space_number": "X", "location": "Lot"}]
+    result = database.create_parking_spaces_bulk(iter(rows), chunk_size=2)
+    assert result["inserted"] == 5
+    assert [i for i, _ in result["errors"]] == [5, 6]
+    assert "already exists" in result["errors"][0][1]
+    assert "hourly_rate" in result["errors"][1][1]
+    # Numbers already in the table are refused too
+    assert database.create_parking_spaces_bulk(space_rows(1))["inserted"] == 0
+
+
+def test_booking_import_rejects_overlaps_in_and_across_chunks(lot):
+    user_id, (a, b, c) = lot
+    database.create_booking(user_id, a, hours(0), hours(2), "OLD", "car")
+    rows = [
+        booking(user_id, a, 1, 3),                          # overlaps the existing booking
+        booking(user_id, a, 2, 4),                          # back to back: fine
+        booking(user_id, b, 0, 5),
+        booking(user_id, b, 4, 6),                          # overlaps row 2 in the same chunk
+        booking(user_id, b, 3, 6),                          # overlaps row 2 from an earlier chunk
+        booking(user_id, c, 0, 5, status="completed"),      # history never conflicts
+        booking(user_id, c, 1, 2, status="cancelled"),
+        booking(user_id, c, 1, 2),
+    ]
+    result = database.create_bookings_bulk(rows, chunk_size=4)
+    assert [i for i, _ in result["errors"]] == [0, 3, 4]
+    assert result["inserted"] == 5
+    assert len(database.find_conflicts(b, hours(0), hours(10))) == 1
+
+
+def test_booking_import_validates_rows(lot):
+    user_id, (a, _, _) = lot
+    rows = [
+        booking(user_id, a, 2, 1),
+        booking(user_id, 9999, 0, 1),
+        booking(user_id, a, 0, 1, status="lost"),
+        {"user_id": user_id, "space_id": a},
+    ]
+    result = database.create_bookings_bulk(rows)
+    assert result["inserted"] == 0
+    messages = dict(result["errors"])
+    assert "after start" in messages[0]
+    assert "does not exist" in messages[1]
+    assert "Invalid status" in messages[2]
+    assert "Missing required fields" in messages[3]
+
+
+def test_booking_import_notifies_listeners_after_commit(lot):
+    user_id, (a, b, _) = lot
+    events = []
+    database.add_booking_listener(lambda event, row: events.append((event, row["id"], row["space_id"])))
+    database.create_bookings_bulk([booking(user_id, a, 0, 1), booking(user_id, b, 0, 1)])
+    ids = sorted(row["id"] for row in database.get_active_bookings())
+    assert events == [("created", ids[0], a), ("created", ids[1], b)]
@@ -0,0 +1,51 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+import cache  # noqa: E402
+import database  # noqa: E402
+
+
+@pytest.fixture
+def counted(db):
+    calls = []
+
+    def spaces_on_floor(floor):
+        calls.append(floor)
+        return database.get_all_parking_spaces()
+
+    spaces_on_floor.__qualname__ = f"spaces_on_floor_{id(calls)}"   # one registry entry per test
+    return cache.cached_query(spaces_on_floor), calls
+
+
+def test_reads_are_shared_until_a_write(counted):
+    query, calls = counted
+    database.create_parking_space("A1", "Lot", 2.0)
+    first = query("1")
+    assert query("1") == first
+    assert calls == ["1"]
+    query("2")
+    assert calls == ["1", "2"]
+
+    cache.bump_generation()
+    query("1")
+    assert calls == ["1", "2", "1"]
+
+
+def test_rows_come_back_as_dicts(counted):
+    query, _ = counted
+    database.create_parking_space("A1", "Lot", 2.0)
+    assert isinstance(query("1")[0], dict)
+    assert query.uncached("1")[0]["space_number"] == "A1"
+
+
+def test_booking_writes_bump_the_generation(db):
+    database.add_booking_listener(cache._on_booking_change)
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    space_id = database.create_parking_space("A1", "Lot", 2.0)
+    before = cache.get_generation()
+    start = datetime.datetime(2030, 1, 1, 9)
+    database.create_booking(user_id, space_id, start, start + datetime.timedelta(hours=1), "ABC123", "car")
+    assert cache.get_generation() > before
@@ -0,0 +1,113 @@
+import datetime
+import threading
+
+import pytest
+
+import database
+from db_pool import get_pool
+from conftest import clock
+
+T0 = datetime.datetime(2030, 1, 1, 9)
+
+
+hours = clock(T0)
+
+
+@pytest.fixture
+def space(db):
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    space_id = database.create_parking_space("A1", "Section A", 2.0)
+    return user_id, space_id
+
+
+def book(space, start, end):
+    user_id, space_id = space
+    return database.create_booking(user_id, space_id, start, end, "ABC123", "car")
+
+
+def test_back_to_back_bookings_do_not_conflict(space):
+    book(space, hours(0), hours(2))
+    book(space, hours(2), hours(4))
+    book(space, hours(-1), hours(0))
+
+
+@pytest.mark.parametrize("start, end", [(0, 2), (1, 3), (-1, 1), (0.5, 1.5), (-1, 3)])
+def test_overlapping_bookings_are_refused(space, start, end):
+    book(space, hours(0), hours(2))
+    with pytest.raises(ValueError):
+        book(space, hours(start), hours(end))
+
+
+@pytest.mark.parametrize("start, end", [(1, 1), (2, 1)])
+def test_empty_and_inverted_windows_are_refused(space, start, end):
+    with pytest.raises(ValueError):
+        book(space, hours(start), hours(end))
+    assert database.get_active_bookings() == []
+
+
+def test_concurrent_bookings_cannot_both_pass_the_check(space, monkeypatch):
+    find_conflicts = database._find_conflicts
+    first_checked, second_checked = threading.Event(), threading.Event()
+
+    def slow_check(conn, *args):
+        conflicts = find_conflicts(conn, *args)
+        if threading.current_thread().name == "first":
+            first_checked.set()
+            # Give the second booking every chance to check before we insert
+            second_checked.wait(0.5)
+        else:
+            second_checked.set()
+        return conflicts
+
+    monkeypatch.setattr(database, "_find_conflicts", slow_check)
+    outcomes = []
+
+    def attempt():
+        try:
+            outcomes.append(book(space, hours(0), hours(2)))
+        except ValueError as e:
+            outcomes.append(e)
+
+    first = threading.Thread(target=attempt, name="first")
+    first.start()
+    first_checked.wait(5)
+    attempt()
+    first.join(5)
+    assert sum(isinstance(outcome, int) for outcome in outcomes) == 1
+    assert len(database.get_active_bookings()) == 1
+
+
+def test_find_conflicts_uses_half_open_windows(space):
+    first = book(space, hours(0), hours(2))
+    second = book(space, hours(2), hours(4))
+    _, space_id = space
+    assert [b["id"] for b in database.find_conflicts(space_id, hours(1), hours(3))] == [first, second]
+    assert [b["id"] for b in database.find_conflicts(space_id, hours(2), hours(3))] == [second]
+    assert database.find_conflicts(space_id, hours(4), hours(5)) == []
+    assert [b["id"] for b in database.find_conflicts(space_id, hours(1), hours(3),
+                                                     exclude_booking_id=first)] == [second]
+    # Strings in the stored format work too
+    assert len(database.find_conflicts(space_id, database.to_db_timestamp(hours(1)),
+                                       database.to_db_timestamp(hours(3)))) == 2
+
+
+def test_cancelled_bookings_free_their_window(space):
+    booking_id = book(space, hours(0), hours(2))
+    database.update_booking(booking_id, status="cancelled")
+    book(space, hours(0), hours(2))
+
+
+def test_listeners_hear_committed_writes(space):
+    events = []
+    database.add_booking_listener(lambda event, booking: events.append((event, booking["id"], booking["status"])))
+    booking_id = book(space, hours(0), hours(2))
+    database.update_booking(booking_id, status="cancelled")
+    assert events == [("created", booking_id, "active"), ("updated", booking_id, "cancelled")]
+
+
+def test_conflict_check_is_an_index_range_scan(space):
+    with get_pool(database.DB_PATH).connection() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM bookings WHERE space_id = ? AND status = 'active' "
+            "AND end_time > ? AND start_time < ?", (1, "a", "b")))
+    assert "idx_bookings_space_status_end" in plan
@@ -0,0 +1,125 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import allocation
+import availability
+import database
+import datagen
+from conftest import stamp
+
+NOW = datetime.datetime(2030, 3, 6, 12, 0)
+
+
+def generate(path, **kwargs):
+    options = dict(spaces=40, users=30, bookings=2000, days_back=10, days_ahead=2, seed=7, now=NOW)
+    options.update(kwargs)
+    return datagen.generate_dataset(path, **options)
+
+
+def count(conn, sql):
+    return conn.execute(sql).fetchone()[0]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = str(tmp_path / "gen.db")
+    stats = generate(path)
+    conn = sqlite3.connect(path)
+    yield stats, conn
+    conn.close()
+
+
+def test_counts_match_the_stats(dataset):
+    stats, conn = dataset
+    assert (stats["spaces"], stats["users"], stats["bookings"]) == (40, 30, 2000)
+    assert count(conn, "SELECT COUNT(*) FROM parking_spaces") == 40
+    assert count(conn, "SELECT COUNT(*) FROM users") == 30
+    assert count(conn, "SELECT COUNT(*) FROM bookings") == 2000
+    assert count(conn, "SELECT COUNT(*) FROM payments") == stats["payments"] == \
+        count(conn, "SELECT COUNT(*) FROM bookings WHERE status = 'completed'")
+    assert stats["last_end"] == count(conn, "SELECT MAX(end_time) FROM bookings")
+
+
+def test_bookings_on_a_space_never_overlap(dataset):
+    _, conn = dataset
+    assert count(conn, '''
+    SELECT COUNT(*) FROM bookings a JOIN bookings b
+    ON a.space_id = b.space_id AND a.id < b.id
+    AND a.start_time < b.end_time AND b.start_time < a.end_time
+    ''') == 0
+    assert count(conn, "SELECT COUNT(*) FROM bookings WHERE end_time <= start_time") == 0
+
+
+def test_indexes_are_rebuilt(dataset, tmp_path):
+    _, conn = dataset
+    empty = str(tmp_path / "empty.db")
+    generate(empty, bookings=0, offline=True)
+    with sqlite3.connect(empty) as reference:
+        expected = reference.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name").fetchall()
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name").fetchall() == expected
+
+
+def test_spaces_in_use_now_are_unavailable(dataset):
+    _, conn = dataset
+    now = stamp(NOW)
+    busy = {row[0] for row in conn.execute(
+        "SELECT space_id FROM bookings WHERE status = 'active' AND start_time <= ? AND end_time > ?", (now, now))}
+    unavailable = {row[0] for row in conn.execute("SELECT id FROM parking_spaces WHERE is_available = 0")}
+    assert busy and busy == unavailable
+
+
+def test_a_seed_reproduces_the_data(tmp_path):
+    rows = []
+    for name in ("a.db", "b.db"):
+        path = str(tmp_path / name)
+        generate(path, bookings=300)
+        with sqlite3.connect(path) as conn:
+            rows.append(conn.execute("SELECT space_id, start_time, end_time, vehicle_type FROM bookings").fetchall())
+    assert rows[0] == rows[1]
+
+
+def test_generating_again_appends(dataset):
+    stats, conn = dataset
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    generate(path, spaces=5, users=5, bookings=100, seed=8)
+    assert count(conn, "SELECT COUNT(*) FROM parking_spaces") == 45
+    assert count(conn, "SELECT COUNT(*) FROM bookings") == 2100
+
+
+def test_new_booking_ids_skip_archived_ones(dataset):
+    stats, conn = dataset
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    # Archive the newest bookings, leaving their IDs free in the hot table
+    conn.execute("INSERT INTO bookings_archive (id, user_id, space_id, start_time, end_time, vehicle_plate, "
+                 "vehicle_type, status) SELECT id, user_id, space_id, start_time, end_time, vehicle_plate, "
+                 "vehicle_type, status FROM bookings WHERE id > 1900")
+    conn.execute("DELETE FROM bookings WHERE id > 1900")
+    conn.commit()
+    generate(path, spaces=5, users=5, bookings=100, seed=8)
+    assert count(conn, "SELECT MIN(id) FROM bookings WHERE id > 1900") == 2001
+
+
+def test_engines_reload_after_loading_into_a_served_database(db, monkeypatch):
+    monkeypatch.setattr(availability, "_engine", None)
+    monkeypatch.setattr(allocation, "_allocator", None)
+    database.create_parking_space("A1", "Lot", 2.0)
+    before = allocation.get_allocator()
+    engine = availability.get_availability_engine()
+
+    datagen.generate_dataset(db, spaces=20, users=5, bookings=200, days_back=2, days_ahead=2, seed=3)
+    assert len(engine.space_ids) == 1
+    availability.reload_availability_engine()
+    allocation.invalidate_allocator()
+    assert len(engine.space_ids) == 21
+    assert engine._marks
+    after = allocation.get_allocator()
+    assert after is not before and len(after.features) == 21
+
+
+@pytest.mark.parametrize("kwargs", [dict(spaces=0), dict(users=0), dict(bookings=-1),
+                                    dict(days_back=0, days_ahead=0)])
+def test_invalid_arguments(tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        generate(str(tmp_path / "bad.db"), **kwargs)
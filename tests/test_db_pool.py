@@ -0,0 +1,79 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import database
+from db_pool import ConnectionPool, get_pool
+
+
+def test_connections_are_configured_once(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "p.db"))
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1     # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        assert isinstance(conn.execute("SELECT 1 AS one").fetchone(), sqlite3.Row)
+
+
+def test_connections_are_reused(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "p.db"))
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    stats = pool.stats()
+    assert stats["opened_total"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "p.db"), max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+
+def test_open_transactions_are_rolled_back(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "p.db"))
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")      # never committed
+    with pytest.raises(ZeroDivisionError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (2)")
+            1 / 0
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_closed_pool_refuses_checkouts(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "p.db"))
+    with pool.connection():
+        pass
+    pool.close()
+    assert pool.stats()["open"] == 0
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_registry_shares_one_pool_per_file(tmp_path):
+    path = str(tmp_path / "p.db")
+    assert get_pool(path) is get_pool(str(tmp_path / "." / "p.db"))
+
+
+def test_crud_through_the_pool(db):
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    space_id = database.create_parking_space("A1", "Section A", 2.0)
+    start = datetime.datetime(2030, 1, 1, 9)
+    booking_id = database.create_booking(user_id, space_id, start, start + datetime.timedelta(hours=2),
+                                         "ABC123", "car")
+    assert database.get_booking(booking_id)["space_id"] == space_id
+    assert database.delete_booking(booking_id)
+    assert database.get_booking(booking_id) is None
+    assert get_pool(db).stats()["in_use"] == 0
@@ -0,0 +1,77 @@
+import datetime
+
+import pytest
+
+import database
+
+START = datetime.datetime(2030, 1, 1, 9)
+END = START + datetime.timedelta(hours=3)
+
+
+@pytest.fixture
+def lot(db):
+    user_id = database.create_user("fleet", "pw", "fleet@example.com", "Fleet Co")
+    numbers = {}
+    for section, count in (("A", 6), ("B", 3)):
+        for i in range(1, count + 1):
+            numbers[f"{section}{i}"] = database.create_parking_space(
+                f"{section}{i}", f"Section {section}", 2.0, floor="1", section=section)
+    # A3 is taken for the window
+    database.create_booking(user_id, numbers["A3"], START, END, "OTHER", "car")
+    return user_id, numbers
+
+
+def names(numbers, space_ids):
+    by_id = {v: k for k, v in numbers.items()}
+    return [by_id[i] for i in space_ids]
+
+
+def test_group_takes_the_first_free_spaces(lot):
+    user_id, numbers = lot
+    result = database.create_group_booking(user_id, 4, START, END, section="A")
+    assert names(numbers, result["space_ids"]) == ["A1", "A2", "A4", "A5"]
+    assert len(result["booking_ids"]) == 4
+    assert all(database.get_booking(b)["user_id"] == user_id for b in result["booking_ids"])
+
+
+def test_contiguous_groups_skip_broken_runs(lot):
+    user_id, numbers = lot
+    result = database.create_group_booking(user_id, 3, START, END, contiguous=True)
+    assert names(numbers, result["space_ids"]) == ["A4", "A5", "A6"]
+
+
+def test_groups_are_all_or_nothing(lot):
+    user_id, numbers = lot
+    before = len(database.get_active_bookings())
+    with pytest.raises(ValueError):
+        database.create_group_booking(user_id, 4, START, END, contiguous=True)
+    with pytest.raises(ValueError):
+        database.create_group_booking(user_id, 9, START, END)
+    assert len(database.get_active_bookings()) == before
+
+
+def test_partial_groups_book_what_is_free(lot):
+    user_id, numbers = lot
+    result = database.create_group_booking(user_id, 4, START, END, contiguous=True, allow_partial=True)
+    assert names(numbers, result["space_ids"]) == ["A4", "A5", "A6"]
+    result = database.create_group_booking(user_id, 9, START, END, allow_partial=True)
+    assert names(numbers, result["space_ids"]) == ["A1", "A2", "B1", "B2", "B3"]
+
+
+def test_space_numbers_sort_naturally(db):
+    user_id = database.create_user("fleet", "pw", "fleet@example.com", "Fleet Co")
+    for number in ("C10", "C2", "C1"):
+        database.create_parking_space(number, "Section C", 2.0, floor="1", section="C")
+    result = database.create_group_booking(user_id, 2, START, END, contiguous=True,
+                                           vehicle_plates=["P1", "P2"])
+    spaces = [database.get_parking_space(i)["space_number"] for i in result["space_ids"]]
+    assert spaces == ["C1", "C2"]
+    assert [database.get_booking(b)["vehicle_plate"] for b in result["booking_ids"]] == ["P1", "P2"]
+
+
+def test_group_members_are_announced_after_commit(lot):
+    user_id, _ = lot
+    events = []
+    database.add_booking_listener(lambda event, booking: events.append((event, booking["space_id"])))
+    result = database.create_group_booking(user_id, 2, START, END)
+    assert events == [("created", space_id) for space_id in result["space_ids"]]
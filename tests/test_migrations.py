@@ -0,0 +1,68 @@
+import sqlite3
+
+import migrations
+from db_pool import get_pool
+from migrations import LATEST_VERSION, get_schema_version, migrate
+
+
+def legacy_database(path):
+    """Tables as the original root app.py wrote them"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+    CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT,
+                        email TEXT, is_admin INTEGER DEFAULT 0);
+    CREATE TABLE parking_spots (id INTEGER PRIMARY KEY AUTOINCREMENT, spot_number TEXT, status TEXT,
+                                section TEXT, floor INTEGER);
+    CREATE TABLE bookings (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, spot_id INTEGER,
+                           start_time TEXT, end_time TEXT, status TEXT, payment_status TEXT);
+    INSERT INTO users VALUES (1, 'admin', 'x', 'a@example.com', 1), (2, 'bob', 'y', 'a@example.com', 0),
+                             (3, 'cy', 'z', NULL, 0);
+    INSERT INTO parking_spots VALUES (1, 'A1', 'available', 'A', 1), (2, 'A1', 'booked', 'A', 1),
+                                     (3, 'B1', 'maintenance', 'B', 2);
+    INSERT INTO bookings VALUES
+        (1, 2, 2, '2030-01-01 09:00:00', '2030-01-01 12:00:00', 'active', 'paid'),
+        (2, 3, 1, '2029-01-01 09:00:00', '2029-01-01 10:00:00', 'completed', 'pending'),
+        (3, 3, 1, '2029-02-01 09:00:00', '2029-02-01 10:00:00', 'cancelled', 'pending');
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_database_gets_every_migration_once(tmp_path):
+    path = str(tmp_path / "new.db")
+    assert migrate(path) == list(range(1, LATEST_VERSION + 1))
+    assert migrate(path) == []
+
+    # A new process finds the schema current without re-running anything
+    migrations._migrated_paths.discard(str(tmp_path / "new.db"))
+    assert migrate(path) == []
+    with get_pool(path).connection() as conn:
+        assert get_schema_version(conn) == LATEST_VERSION
+
+
+def test_legacy_tables_are_imported_in_batches(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    legacy_database(path)
+    migrate(path, batch_size=2)
+
+    with get_pool(path).connection() as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert not tables & {"legacy_users", "legacy_bookings", "parking_spots"}
+
+        users = conn.execute("SELECT id, username, email, is_admin FROM users ORDER BY id").fetchall()
+        assert [tuple(u) for u in users] == [
+            (1, "admin", "a@example.com", 1),
+            (2, "bob", "bob@legacy.invalid", 0),      # duplicate email made unique
+            (3, "cy", "cy@legacy.invalid", 0),
+        ]
+
+        spaces = conn.execute("SELECT id, space_number, is_available, status FROM parking_spaces ORDER BY id")
+        assert [tuple(s) for s in spaces] == [
+            (1, "A1", 1, "active"), (2, "A1-2", 0, "active"), (3, "B1", 0, "maintenance"),
+        ]
+
+        bookings = conn.execute("SELECT id, space_id, status FROM bookings ORDER BY id").fetchall()
+        assert [tuple(b) for b in bookings] == [(1, 2, "active"), (2, 1, "completed"), (3, 1, "cancelled")]
+
+        payments = conn.execute("SELECT booking_id, amount, status FROM payments").fetchall()
+        assert [tuple(p) for p in payments] == [(1, 6.0, "completed")]   # 3 hours at the legacy rate
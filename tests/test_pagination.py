@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+import database
+from db_pool import get_pool
+
+T0 = datetime.datetime(2030, 1, 1, 9)
+
+
+@pytest.fixture
+def history(db):
+    ann = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    bob = database.create_user("bob", "pw", "bob@example.com", "Bob")
+    spaces = [database.create_parking_space(f"A{i}", "Lot", 2.0) for i in range(3)]
+    rows = []
+    for i in range(20):
+        # Several bookings share a start time, so ids must break the ties
+        start = T0 + datetime.timedelta(hours=i // 3)
+        rows.append(dict(user_id=ann if i % 4 else bob, space_id=spaces[i % 3], start_time=start,
+                         end_time=start + datetime.timedelta(minutes=30), vehicle_plate="P", vehicle_type="car",
+                         status="cancelled" if i % 5 == 0 else "active"))
+    database.create_bookings_bulk(rows)
+    return ann
+
+
+def walk(fetch_page, size):
+    rows, after = [], None
+    while True:
+        page = fetch_page(size, after)
+        rows.extend(page)
+        if len(page) < size:
+            return rows
+        after = database.booking_cursor(page[-1])
+
+
+def test_user_pages_cover_the_history_newest_first(history):
+    everything = database.get_user_bookings_page(history, limit=1000)
+    assert [(b["start_time"], b["id"]) for b in everything] == \
+        sorted(((b["start_time"], b["id"]) for b in everything), reverse=True)
+    paged = walk(lambda limit, after: database.get_user_bookings_page(history, limit, after), 4)
+    assert [b["id"] for b in paged] == [b["id"] for b in everything]
+    assert [b["id"] for b in database.iter_user_bookings(history, batch_size=3)] == [b["id"] for b in everything]
+
+
+def test_active_pages_cover_active_bookings_oldest_first(history):
+    paged = walk(database.get_active_bookings_page, 4)
+    assert all(b["status"] == "active" for b in paged)
+    assert [(b["start_time"], b["id"]) for b in paged] == sorted((b["start_time"], b["id"]) for b in paged)
+    assert len(paged) == 16
+    assert [b["id"] for b in database.iter_active_bookings(batch_size=5)] == [b["id"] for b in paged]
+
+
+def test_all_bookings_pages_and_counts(history):
+    ids, before = [], None
+    while True:
+        page = database.get_bookings_page(6, before)
+        ids.extend(b["id"] for b in page)
+        if len(page) < 6:
+            break
+        before = page[-1]["id"]
+    assert ids == list(range(20, 0, -1))
+    assert database.get_booking_counts() == {"active": 16, "cancelled": 4, "total": 20}
+
+
+def test_pages_are_index_seeks_without_a_sort(history):
+    with get_pool(database.DB_PATH).connection() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM bookings WHERE user_id = ? AND (start_time, id) < (?, ?) "
+            "ORDER BY start_time DESC, id DESC LIMIT 10", (1, "2030", 5)))
+    assert "idx_bookings_user_start" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_conflict_checks_stay_on_the_overlap_index(history):
+    statements = []
+    with get_pool(database.DB_PATH).connection() as conn:
+        conn.set_trace_callback(statements.append)
+        database._find_conflicts(conn, 1, "2030-01-01 10:00:00", "2030-01-01 11:00:00")
+        conn.set_trace_callback(None)
+        sql = statements[-1]
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+    assert "idx_bookings_space_status_end" in plan
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+import database
+import query_trace
+from query_trace import QueryTracer, TracingConnection, query_shape
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = QueryTracer(slow_threshold_ms=1e9)
+    monkeypatch.setattr(query_trace, "_tracer", tracer)
+    return tracer
+
+
+@pytest.fixture
+def conn(tracer):
+    conn = sqlite3.connect(":memory:", factory=TracingConnection)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO t (name) VALUES (?)", [(f"n{i}",) for i in range(50)])
+    yield conn
+    conn.close()
+
+
+def test_shapes_fold_literals_and_in_lists():
+    assert query_shape("SELECT *  FROM t\n WHERE id = 42 AND name = 'it''s'") == \
+        "SELECT * FROM t WHERE id = ? AND name = ?"
+    assert query_shape("DELETE FROM t WHERE id IN (?, ?, ?)") == query_shape("DELETE FROM t WHERE id IN (?,?)")
+
+
+def test_statements_are_counted_by_shape(tracer, conn):
+    for i in range(5):
+        conn.execute("SELECT name FROM t WHERE id = ?", (i,)).fetchone()
+    conn.execute("SELECT name FROM t WHERE id = 7").fetchall()
+    by_shape = {row["shape"]: row for row in tracer.stats()}
+    lookup = by_shape["SELECT name FROM t WHERE id = ?"]
+    assert lookup["count"] == 6
+    assert lookup["p50_ms"] <= lookup["p95_ms"] <= lookup["p99_ms"] <= lookup["max_ms"]
+    assert not lookup["full_scan"]
+    assert any("USING INTEGER PRIMARY KEY" in step for step in lookup["plan"])
+
+
+def test_full_scans_are_flagged(tracer, conn):
+    list(conn.execute("SELECT id FROM t WHERE name = ?", ("n3",)))
+    (row,) = [r for r in tracer.stats() if r["shape"].startswith("SELECT id FROM t WHERE name")]
+    assert row["full_scan"]
+
+
+def test_unread_rows_are_recorded_when_the_cursor_closes(tracer, conn):
+    cursor = conn.execute("SELECT id FROM t")
+    cursor.fetchone()
+    assert not [r for r in tracer.stats() if r["shape"] == "SELECT id FROM t"]
+    cursor.close()
+    assert [r["count"] for r in tracer.stats() if r["shape"] == "SELECT id FROM t"] == [1]
+
+
+def test_slow_queries_are_logged_with_their_plan(tracer, conn):
+    tracer.slow_threshold_ms = 0
+    conn.execute("SELECT id FROM t WHERE name = 'x'").fetchall()
+    slow = tracer.slow_queries()
+    assert slow[0]["shape"] == "SELECT id FROM t WHERE name = ?"
+    assert slow[0]["full_scan"] and slow[0]["plan"]
+    tracer.reset()
+    assert tracer.stats() == [] and tracer.slow_queries() == []
+
+
+def test_pool_connections_are_traced(db):
+    database.get_all_parking_spaces()
+    shapes = [row["shape"] for row in database.get_query_stats()]
+    assert any("FROM parking_spaces" in shape for shape in shapes)
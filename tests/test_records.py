@@ -0,0 +1,91 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import database
+import records
+from allocation import SpaceFeatures
+
+T0 = datetime.datetime(2030, 1, 1, 9)
+
+
+@pytest.fixture
+def spaces(db):
+    ids = [
+        database.create_parking_space("A1", "Lot", 2.0, floor="L1", section="A", is_accessible=True),
+        database.create_parking_space("A2", "Lot", 3.5, floor="2", section="A", is_ev_charging=True),
+        database.create_parking_space("B1", "Lot", 2.0),
+    ]
+    database.update_parking_space(ids[2], status="maintenance")
+    return ids
+
+
+@pytest.fixture
+def bookings(spaces):
+    user = database.create_user("ann", "pw", "ann@example.com", "Ann", phone="555")
+    for i, space in enumerate(spaces[:2]):
+        database.create_booking(user, space, T0 + datetime.timedelta(hours=i),
+                                T0 + datetime.timedelta(hours=i + 1), "P1", "car")
+    return user
+
+
+def test_record_mode_matches_dict_mode(bookings):
+    as_dicts = database.get_user_bookings(bookings)
+    as_records = database.get_user_bookings(bookings, result="record")
+    assert all(isinstance(r, records.BookingDetail) for r in as_records)
+    assert [r._asdict() for r in as_records] == as_dicts
+    assert as_records[0].username == "ann" and as_records[0].phone == "555"
+
+
+def test_records_carry_no_instance_dict(spaces):
+    space = database.get_all_parking_spaces(result="record")[0]
+    assert isinstance(space, records.ParkingSpace) and isinstance(space, tuple)
+    assert not hasattr(space, "__dict__")
+
+
+def test_columns_mode_types(bookings):
+    columns = database.get_active_bookings(result="columns")
+    assert set(columns) == set(records.BookingDetail._fields)
+    assert columns["id"].dtype == np.int64
+    assert columns["hourly_rate"].dtype == np.float64
+    assert columns["start_time"].dtype == np.dtype("datetime64[s]")
+    assert list(columns["start_time"]) == [np.datetime64(T0), np.datetime64(T0 + datetime.timedelta(hours=1))]
+
+
+def test_empty_columns_keep_their_fields(db):
+    columns = database.get_payments(result="columns")
+    assert set(columns) == set(records.Payment._fields)
+    assert all(len(values) == 0 for values in columns.values())
+
+
+def test_unknown_result_mode(db):
+    with pytest.raises(ValueError):
+        database.get_all_users(result="rows")
+
+
+def test_streaming_rejects_columns(db):
+    with pytest.raises(ValueError):
+        database.iter_active_bookings(result="columns")
+
+
+def test_space_features_from_columns_match_from_rows(spaces):
+    rows = database.get_all_parking_spaces()
+    columns = database.get_all_parking_spaces(result="columns")
+    order = [spaces[2], 999, spaces[0], spaces[1]]
+    for order_arg in (None, order):
+        expected = SpaceFeatures.from_rows(rows, order_arg)
+        actual = SpaceFeatures.from_columns(columns, order_arg)
+        for field in ("space_ids", "floor", "level", "section", "accessible", "ev", "bookable"):
+            assert list(getattr(actual, field)) == list(getattr(expected, field)), field
+    assert list(SpaceFeatures.from_columns(columns, order).bookable) == [False, False, True, True]
+
+
+def test_booking_details_carry_check_in_and_series(bookings):
+    booking_id = database.get_active_bookings()[0]["id"]
+    database.check_in_booking(booking_id, when=T0)
+    columns = database.get_active_bookings(result="columns")
+    assert columns["checked_in_at"].dtype == np.dtype("datetime64[s]")
+    assert columns["checked_in_at"][0] == np.datetime64(T0)
+    assert np.isnat(columns["checked_in_at"][1])
+    assert list(columns["series_id"]) == [None, None]
@@ -0,0 +1,227 @@
+import datetime
+import threading
+
+import numpy as np
+import pytest
+
+import availability
+import database
+import recurrence
+from recurrence import (Recurrence, cancel_series, create_series, extend_series, format_rule,
+                        occurrence_dates, occurrence_windows, parse_rule)
+
+MONDAY = datetime.date(2030, 1, 7)
+
+
+def dates(rule, first=MONDAY, last=MONDAY + datetime.timedelta(days=27), starts_on=MONDAY):
+    return [str(d) for d in occurrence_dates(parse_rule(rule), starts_on, first, last)]
+
+
+def test_rules_round_trip():
+    rule = parse_rule("freq=weekly;interval=2;byday=we,mo;until=2030-12-31;count=5")
+    assert rule == Recurrence("WEEKLY", 2, (0, 2), datetime.date(2030, 12, 31), 5)
+    assert parse_rule(format_rule(rule)) == rule
+    assert format_rule(parse_rule("FREQ=DAILY")) == "FREQ=DAILY"
+
+
+@pytest.mark.parametrize("text", ["FREQ=MONTHLY", "BYMONTH=1", "BYDAY=XX", "INTERVAL=0", "COUNT=0", "FREQ"])
+def test_invalid_rules(text):
+    with pytest.raises(ValueError):
+        parse_rule(text)
+
+
+def test_daily_interval():
+    assert dates("FREQ=DAILY;INTERVAL=3", last=MONDAY + datetime.timedelta(days=9)) == \
+        ["2030-01-07", "2030-01-10", "2030-01-13", "2030-01-16"]
+
+
+def test_daily_by_day():
+    assert dates("FREQ=DAILY;BYDAY=SA,SU", last=MONDAY + datetime.timedelta(days=13)) == \
+        ["2030-01-12", "2030-01-13", "2030-01-19", "2030-01-20"]
+
+
+def test_weekly_interval_counts_weeks_from_the_first_monday():
+    # Starting on a Wednesday: weeks 0 and 2 of the series, Mondays and Wednesdays
+    assert dates("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE", starts_on=MONDAY + datetime.timedelta(days=2)) == \
+        ["2030-01-09", "2030-01-21", "2030-01-23"]
+    # Without BYDAY the weekday of the start date is used
+    assert dates("FREQ=WEEKLY", starts_on=datetime.date(2030, 1, 10)) == \
+        ["2030-01-10", "2030-01-17", "2030-01-24", "2030-01-31"]
+
+
+def test_count_is_numbered_from_the_first_occurrence():
+    rule = "FREQ=DAILY;COUNT=5"
+    assert dates(rule) == ["2030-01-07", "2030-01-08", "2030-01-09", "2030-01-10", "2030-01-11"]
+    # A later window still stops after the fifth occurrence overall
+    assert dates(rule, first=MONDAY + datetime.timedelta(days=3)) == ["2030-01-10", "2030-01-11"]
+
+
+def test_until_and_empty_ranges():
+    assert dates("FREQ=DAILY;UNTIL=20300108") == ["2030-01-07", "2030-01-08"]
+    assert dates("FREQ=DAILY", starts_on=MONDAY + datetime.timedelta(days=60)) == []
+
+
+def test_overnight_windows_end_the_next_day():
+    days = np.array(["2030-01-07", "2030-01-08"], dtype="datetime64[D]")
+    assert occurrence_windows(days, "22:00", "06:00") == [
+        (datetime.datetime(2030, 1, 7, 22), datetime.datetime(2030, 1, 8, 6)),
+        (datetime.datetime(2030, 1, 8, 22), datetime.datetime(2030, 1, 9, 6)),
+    ]
+    assert occurrence_windows(days[:1], "08:00", "08:00")[0][1] == datetime.datetime(2030, 1, 8, 8)
+
+
+# ---- Series in the database ----
+
+TODAY = datetime.date.today()
+
+
+@pytest.fixture
+def lot(db, monkeypatch):
+    monkeypatch.setattr(availability, "_engine", None)
+    user = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    spaces = [database.create_parking_space(f"A{i}", "Lot", 2.0, section="A") for i in range(2)]
+    spaces.append(database.create_parking_space("B0", "Lot", 2.0, section="B"))
+    return user, spaces
+
+
+def series_bookings(series_id):
+    with database.db_connection() as conn:
+        return [dict(row) for row in conn.execute(
+            "SELECT space_id, start_time, end_time, status FROM bookings WHERE series_id = ? ORDER BY start_time",
+            (series_id,))]
+
+
+def test_series_books_its_horizon_on_a_space_free_throughout(lot):
+    user, (a0, a1, _) = lot
+    tomorrow = TODAY + datetime.timedelta(days=1)
+    # a0 is taken on the third occurrence only
+    clash = datetime.datetime.combine(tomorrow + datetime.timedelta(days=2), datetime.time(9))
+    database.create_booking(user, a0, clash, clash + datetime.timedelta(hours=1), "X", "car")
+
+    result = create_series(user, "FREQ=DAILY;COUNT=4", "08:00", "10:00", tomorrow, "P", "car", section="A")
+    assert (result["space_id"], result["inserted"], result["skipped"]) == (a1, 4, 0)
+    rows = series_bookings(result["series_id"])
+    assert [r["start_time"][:10] for r in rows] == \
+        [str(tomorrow + datetime.timedelta(days=i)) for i in range(4)]
+    assert {r["space_id"] for r in rows} == {a1}
+    assert recurrence.get_user_series(user)[0]["materialized_until"] == \
+        str(TODAY + datetime.timedelta(days=recurrence.HORIZON_DAYS))
+
+
+def test_series_without_a_free_space_is_rejected(lot):
+    user, (_, _, b0) = lot
+    tomorrow = TODAY + datetime.timedelta(days=1)
+    start = datetime.datetime.combine(tomorrow, datetime.time(8))
+    database.create_booking(user, b0, start, start + datetime.timedelta(hours=1), "X", "car")
+    with pytest.raises(ValueError):
+        create_series(user, "FREQ=DAILY;COUNT=2", "08:00", "10:00", tomorrow, "P", "car", space_id=b0)
+    assert recurrence.get_user_series(user) == []
+
+
+def test_failed_occurrence_insert_leaves_no_series(lot, monkeypatch):
+    user, spaces = lot
+    events = []
+    database.add_booking_listener(lambda event, booking: events.append(event))
+    insert = database.insert_bookings
+
+    def fail_after_insert(conn, rows, *args):
+        insert(conn, rows, *args)
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(database, "insert_bookings", fail_after_insert)
+    with pytest.raises(RuntimeError):
+        create_series(user, "FREQ=DAILY;COUNT=3", "08:00", "09:00", TODAY + datetime.timedelta(days=1),
+                      "P", "car", space_id=spaces[0])
+    assert recurrence.get_user_series(user) == []
+    assert database.get_user_bookings(user) == [] and events == []
+
+
+def test_series_skip_spaces_under_maintenance(lot):
+    user, (a0, a1, _) = lot
+    availability.get_availability_engine()
+    database.update_parking_space(a0, status="maintenance")
+    result = create_series(user, "FREQ=DAILY;COUNT=2", "08:00", "10:00", TODAY + datetime.timedelta(days=1),
+                           "P", "car", section="A")
+    assert result["space_id"] == a1
+    with pytest.raises(ValueError):
+        create_series(user, "FREQ=DAILY;COUNT=2", "12:00", "13:00", TODAY + datetime.timedelta(days=1),
+                      "P", "car", space_id=a0)
+
+
+def test_extend_moves_the_horizon(lot):
+    user, spaces = lot
+    result = create_series(user, "FREQ=DAILY", "22:00", "06:00", TODAY + datetime.timedelta(days=1),
+                           "P", "car", space_id=spaces[2])
+    assert result["inserted"] == recurrence.HORIZON_DAYS
+    # Overnight occurrences end on the following morning
+    first = series_bookings(result["series_id"])[0]
+    assert first["end_time"][:10] == str(TODAY + datetime.timedelta(days=2))
+
+    later = TODAY + datetime.timedelta(days=3)
+    assert extend_series(later) == {"series": 1, "inserted": 3, "skipped": 0}
+    assert extend_series(later) == {"series": 0, "inserted": 0, "skipped": 0}
+    assert len(series_bookings(result["series_id"])) == recurrence.HORIZON_DAYS + 3
+
+
+def test_extend_records_clashing_occurrences(lot):
+    user, spaces = lot
+    result = create_series(user, "FREQ=DAILY", "08:00", "09:00", TODAY + datetime.timedelta(days=1),
+                           "P", "car", space_id=spaces[0])
+    # Someone else takes the space on the day that enters the horizon next
+    day = TODAY + datetime.timedelta(days=recurrence.HORIZON_DAYS + 1)
+    clash = datetime.datetime.combine(day, datetime.time(8, 30))
+    database.create_booking(user, spaces[0], clash, clash + datetime.timedelta(hours=1), "X", "car")
+
+    assert extend_series(TODAY + datetime.timedelta(days=2)) == {"series": 1, "inserted": 1, "skipped": 1}
+    skips = recurrence.get_series_skips(result["series_id"])
+    assert [s["start_time"] for s in skips] == [f"{day} 08:00:00"]
+    assert skips[0]["reason"] == "Parking space is not available for the requested time period"
+
+
+def test_extend_waits_for_the_space_to_be_active(lot):
+    user, spaces = lot
+    result = create_series(user, "FREQ=DAILY", "08:00", "09:00", TODAY + datetime.timedelta(days=1),
+                           "P", "car", space_id=spaces[0])
+    database.update_parking_space(spaces[0], status="maintenance")
+    later = TODAY + datetime.timedelta(days=2)
+    assert extend_series(later)["series"] == 0
+    database.update_parking_space(spaces[0], status="active")
+    assert extend_series(later) == {"series": 1, "inserted": 2, "skipped": 0}
+    assert len(series_bookings(result["series_id"])) == recurrence.HORIZON_DAYS + 2
+
+
+def test_concurrent_extends_book_each_occurrence_once(lot):
+    user, spaces = lot
+    result = create_series(user, "FREQ=DAILY", "08:00", "09:00", TODAY + datetime.timedelta(days=1),
+                           "P", "car", space_id=spaces[0])
+    later = TODAY + datetime.timedelta(days=3)
+    barrier = threading.Barrier(2)
+    results = []
+
+    def extend():
+        barrier.wait()
+        results.append(extend_series(later))
+
+    threads = [threading.Thread(target=extend) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(r["inserted"] for r in results) == [0, 3]
+    assert sum(r["skipped"] for r in results) == 0
+    assert recurrence.get_series_skips(result["series_id"]) == []
+    assert len(series_bookings(result["series_id"])) == recurrence.HORIZON_DAYS + 3
+
+
+def test_cancel_stops_future_occurrences(lot):
+    user, spaces = lot
+    events = []
+    database.add_booking_listener(lambda event, booking: events.append((event, booking["status"])))
+    result = create_series(user, "FREQ=DAILY;COUNT=3", "08:00", "09:00", TODAY + datetime.timedelta(days=1),
+                           "P", "car", space_id=spaces[0])
+    events.clear()
+    assert cancel_series(result["series_id"]) == 3
+    assert {r["status"] for r in series_bookings(result["series_id"])} == {"cancelled"}
+    assert events == [("updated", "cancelled")] * 3
+    assert recurrence.get_user_series(user)[0]["status"] == "cancelled"
+    assert extend_series(TODAY + datetime.timedelta(days=30))["series"] == 0
@@ -0,0 +1,160 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+import database
+import routing
+from routing import build_routing_table, get_routing_table, load_routing_table
+
+LAYOUT = {
+    "nodes": [
+        {"id": "north", "type": "entrance"},
+        {"id": "south", "type": "entrance"},
+        {"id": "lift", "type": "lift"},
+        {"id": "ramp", "type": "junction"},
+        {"id": "1A", "type": "aisle"},
+        {"id": "1B", "type": "aisle"},
+    ],
+    "edges": [
+        {"from": "north", "to": "ramp", "drive": 10},
+        {"from": "south", "to": "1B", "drive": 4},
+        {"from": "ramp", "to": "1A", "drive": 5, "walk": 20},
+        {"from": "ramp", "to": "1B", "drive": 30, "oneway": True},
+        {"from": "lift", "to": "1A", "walk": 6},
+        {"from": "lift", "to": "1A", "walk": 9},
+    ],
+    "aisles": [
+        {"node": "1A", "floor": "1", "section": "A", "spacing": {"drive": 2, "walk": 1}},
+        {"node": "1B", "spaces": ["B2", "B1"], "spacing": {"drive": 1}},
+    ],
+}
+SPACES = [(1, "A10", "1", "A"), (2, "A2", "1", "A"), (3, "B1", "1", "B"), (4, "B2", "1", "B"), (5, "C1", "2", "C")]
+
+
+@pytest.fixture
+def table():
+    return build_routing_table(LAYOUT, SPACES)
+
+
+def test_drive_times_follow_the_shortest_path(table):
+    # A2 sorts before A10 along the aisle
+    assert table.drive_time(2, "north") == 10 + 5 + 2
+    assert table.drive_time(1, "north") == 10 + 5 + 4
+    # B2 then B1 along 1B, reached from the south gate directly
+    assert table.drive_time(4) == 4 + 1
+    assert table.drive_time(3) == 4 + 2
+    # The ramp to 1B is one way, so 1A is not reachable from the south gate
+    assert math.isinf(table.drive_time(2, "south"))
+    assert math.isinf(table.drive_time(5))
+
+
+def test_walk_times_use_the_cheapest_edge(table):
+    assert table.walk_time(2) == 6 + 1
+    assert table.walk_time(1) == 6 + 2
+    assert math.isinf(table.walk_time(3))
+
+
+def test_ranking_puts_unreachable_spaces_last(table):
+    assert table.rank([5, 1, 2]) == [2, 1, 5]
+    times = table.travel_times([2, 99], entrance="north", walk_weight=2.0)
+    assert times[0] == 17 + 2 * 7 and math.isinf(times[1])
+    with pytest.raises(ValueError):
+        table.travel_times([2], entrance="west")
+
+
+def test_invalid_layouts(table):
+    with pytest.raises(ValueError):
+        build_routing_table({"nodes": [{"id": "a"}, {"id": "a"}]}, SPACES)
+    with pytest.raises(ValueError):
+        build_routing_table({"nodes": [{"id": "a"}], "edges": [{"from": "a", "to": "b", "drive": 1}]}, SPACES)
+    with pytest.raises(ValueError):
+        build_routing_table({"nodes": [{"id": "a"}, {"id": "b"}],
+                             "edges": [{"from": "a", "to": "b", "drive": -1}]}, SPACES)
+
+
+def test_tables_are_cached_on_disk(tmp_path, monkeypatch, table):
+    layout_path = tmp_path / "layout.json"
+    layout_path.write_text(json.dumps(LAYOUT))
+    cache_dir = str(tmp_path / "cache")
+    first = load_routing_table(str(layout_path), SPACES, cache_dir)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    def fail(*args):
+        raise AssertionError("table rebuilt despite a cached copy")
+    monkeypatch.setattr(routing, "build_routing_table", fail)
+    cached = load_routing_table(str(layout_path), SPACES, cache_dir)
+    assert np.array_equal(cached.drive, first.drive) and cached.entrances == table.entrances
+
+
+def test_table_follows_the_space_catalog(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, "_tables", {})
+    layout_path = tmp_path / "layout.json"
+    layout_path.write_text(json.dumps(LAYOUT))
+    a2 = database.create_parking_space("A2", "Lot", 2.0, floor="1", section="A")
+    assert get_routing_table(db, str(tmp_path / "missing.json")) is None
+
+    table = get_routing_table(db, str(layout_path))
+    assert table.drive_time(a2) == 17
+    # Occupancy flips keep the table; a new space replaces it
+    database.update_parking_space(a2, is_available=False)
+    assert get_routing_table(db, str(layout_path)) is table
+    a1 = database.create_parking_space("A1", "Lot", 2.0, floor="1", section="A")
+    table = get_routing_table(db, str(layout_path))
+    assert table.drive_time(a1) == 17 and table.drive_time(a2) == 19
+
+
+def test_only_the_newest_table_per_layout_is_kept(tmp_path):
+    layout_path = tmp_path / "layout.json"
+    layout_path.write_text(json.dumps(LAYOUT))
+    cache_dir = tmp_path / "cache"
+    load_routing_table(str(layout_path), SPACES, str(cache_dir))
+    load_routing_table(str(layout_path), SPACES[:-1], str(cache_dir))
+    other = tmp_path / "other.json"
+    other.write_text(json.dumps(dict(LAYOUT, aisles=LAYOUT["aisles"][:1])))
+    load_routing_table(str(other), SPACES, str(cache_dir))
+    assert len(list(cache_dir.iterdir())) == 2
+    cached = load_routing_table(str(layout_path), SPACES[:-1], str(cache_dir))
+    assert list(cached.space_ids) == [1, 2, 3, 4]
+
+
+def test_table_is_cached_beside_the_database(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, "_tables", {})
+    monkeypatch.setattr(routing, "ROUTING_CACHE_DIR", None)
+    layout_path = tmp_path / "layouts" / "layout.json"
+    layout_path.parent.mkdir()
+    layout_path.write_text(json.dumps(LAYOUT))
+    database.create_parking_space("A2", "Lot", 2.0, floor="1", section="A")
+    get_routing_table(db, str(layout_path))
+    assert len(list((tmp_path / routing.CACHE_DIR_NAME).iterdir())) == 1
+    assert [p.name for p in layout_path.parent.iterdir()] == ["layout.json"]
+
+
+def test_only_changed_spaces_are_reread(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(routing, "_tables", {})
+    layout_path = tmp_path / "layout.json"
+    layout_path.write_text(json.dumps(LAYOUT))
+    a2 = database.create_parking_space("A2", "Lot", 2.0, floor="1", section="A")
+    b1 = database.create_parking_space("B1", "Lot", 2.0, floor="1", section="B")
+    table = get_routing_table(db, str(layout_path))
+
+    full_reads = []
+    read_whole_catalog = routing._read_whole_catalog
+    monkeypatch.setattr(routing, "_read_whole_catalog", lambda conn: full_reads.append(1) or read_whole_catalog(conn))
+    database.update_parking_space(a2, is_available=False)
+    assert get_routing_table(db, str(layout_path)) is table
+    database.update_parking_space(a2, section="B")
+    database.delete_parking_space(b1)
+    table = get_routing_table(db, str(layout_path))
+    assert list(table.space_ids) == [a2] and math.isinf(table.drive_time(a2))
+    assert not full_reads
+
+    # A log trimmed past the cached position falls back to the whole catalog
+    database.update_parking_space(a2, section="A")
+    with database.db_connection() as conn:
+        conn.execute("DELETE FROM space_changes")
+        conn.execute("UPDATE parking_spaces SET floor = '1' WHERE id = ?", (a2,))
+        conn.commit()
+    assert get_routing_table(db, str(layout_path)).drive_time(a2) == 17
+    assert full_reads == [1]
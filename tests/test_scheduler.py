@@ -0,0 +1,130 @@
+import datetime
+
+import pytest
+
+import database
+from scheduler import BookingScheduler
+from waitlist import get_waitlist
+from conftest import clock
+
+T0 = datetime.datetime(2030, 6, 3, 9)
+
+
+at = clock(T0)
+
+
+@pytest.fixture
+def lot(db):
+    users = [database.create_user(f"u{i}", "pw", f"u{i}@example.com", f"User {i}") for i in range(3)]
+    spaces = [database.create_parking_space(f"A{i}", "Lot", 2.0) for i in range(2)]
+    return users, spaces
+
+
+def book(user, space, start, end):
+    return database.create_booking(user, space, at(start), at(end), "P", "car")
+
+
+def status(booking_id):
+    return database.get_booking(booking_id)["status"]
+
+
+def available(space_id):
+    return bool(database.get_parking_space(space_id)["is_available"])
+
+
+def test_bookings_complete_at_their_end(lot):
+    (user, *_), (space, _) = lot
+    first = book(user, space, 0, 2)
+    second = book(user, space, 2, 3)
+    for booking_id in (first, second):
+        database.check_in_booking(booking_id, at(0))
+    scheduler = BookingScheduler(database.DB_PATH)
+    assert scheduler.run_once(at(1)) == {"completed": 0, "no_shows": 0, "expired": 0}
+    assert scheduler.next_due() == at(2)
+
+    assert scheduler.run_once(at(2))["completed"] == 1
+    assert status(first) == "completed"
+    # The back-to-back booking still holds the space
+    assert not available(space)
+    assert scheduler.run_once(at(3))["completed"] == 1
+    assert available(space)
+    assert scheduler.pending() == 0 and scheduler.completed == 2
+
+
+def test_extended_bookings_are_rescheduled(lot):
+    (user, *_), (space, _) = lot
+    booking = book(user, space, 0, 2)
+    database.check_in_booking(booking, at(0))
+    scheduler = BookingScheduler(database.DB_PATH)
+    scheduler.run_once(at(0))
+    database.update_booking(booking, end_time=at(4))
+    assert scheduler.run_once(at(2))["completed"] == 0
+    assert status(booking) == "active" and scheduler.next_due() == at(4)
+    assert scheduler.run_once(at(4))["completed"] == 1
+
+
+def test_no_shows_are_released_to_the_waitlist(lot):
+    (owner, other, waiting), (space, second_space) = lot
+    absent = book(owner, space, 0, 3)
+    present = book(other, second_space, 0, 3)
+    database.check_in_booking(present, at(0))
+    waitlist = get_waitlist(database.DB_PATH)
+    waitlist.join(waiting, at(1), at(3))
+
+    scheduler = BookingScheduler(database.DB_PATH)
+    assert scheduler.run_once(at(0.25))["no_shows"] == 0
+    assert scheduler.run_once(at(0.5))["no_shows"] == 1
+    assert (status(absent), status(present)) == ("cancelled", "active")
+    (booked,) = database.get_user_bookings(waiting)
+    assert (booked["space_id"], booked["status"]) == (space, "active")
+    assert len(waitlist) == 0
+
+
+def test_other_database_files_get_their_own_notifications(lot, monkeypatch, tmp_path):
+    cache = pytest.importorskip("cache")
+    (owner, _, waiting), (space, _) = lot
+    absent = book(owner, space, 0, 3)
+    # From here the file is not database.DB_PATH, like app.py's parking.db
+    own = database.DB_PATH
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "other.db"))
+    waitlist = get_waitlist(own)
+    waitlist.join(waiting, at(1), at(3))
+    events = []
+    database.add_booking_listener(lambda event, booking: events.append((event, booking["id"])), own)
+    generation = cache.get_generation()
+
+    assert BookingScheduler(own).run_once(at(0.5))["no_shows"] == 1
+    # The waitlist reassigns the no-show's time while the update is announced
+    assert sorted(event for event, _ in events) == ["created", "updated"] and ("updated", absent) in events
+    assert len(waitlist) == 0
+    assert cache.get_generation() > generation
+
+
+def test_no_show_release_can_be_disabled(lot):
+    (user, *_), (space, _) = lot
+    booking = book(user, space, 0, 2)
+    scheduler = BookingScheduler(database.DB_PATH, no_show_grace=None)
+    assert scheduler.run_once(at(1))["no_shows"] == 0
+    assert scheduler.run_once(at(2))["completed"] == 1
+    assert status(booking) == "completed"
+
+
+def test_waitlist_requests_expire(lot):
+    (user, *_), _ = lot
+    waitlist = get_waitlist(database.DB_PATH)
+    entry = waitlist.join(user, at(0), at(1))
+    scheduler = BookingScheduler(database.DB_PATH)
+    assert scheduler.run_once(at(1))["expired"] == 1
+    assert [e["id"] for e in waitlist.entries(status="expired")] == [entry]
+    assert len(waitlist) == 0
+
+
+def test_new_rows_are_picked_up_and_batched(lot):
+    (user, *_), spaces = lot
+    scheduler = BookingScheduler(database.DB_PATH, batch_size=2)
+    scheduler.run_once(at(0))
+    bookings = [book(user, spaces[i % 2], i, i + 1) for i in range(5)]
+    for booking_id in bookings:
+        database.check_in_booking(booking_id, at(0))
+    assert scheduler.run_once(at(10))["completed"] == 5
+    assert {status(b) for b in bookings} == {"completed"}
@@ -0,0 +1,73 @@
+import datetime
+import random
+
+import database
+from db_pool import get_pool
+
+STATE_SQL = ("CASE WHEN status = 'active' THEN CASE WHEN is_available THEN 'available' ELSE 'occupied' END "
+             "ELSE status END")
+
+
+def recount(floor=None):
+    """Occupancy counts by scanning parking_spaces"""
+    query = f"SELECT {STATE_SQL}, COUNT(*) FROM parking_spaces"
+    params = []
+    if floor is not None:
+        query += " WHERE floor = ?"
+        params.append(floor)
+    with get_pool(database.DB_PATH).connection() as conn:
+        rows = dict(conn.execute(query + " GROUP BY 1", params).fetchall())
+    counts = {state: rows.get(state, 0) for state in database.SPACE_STATES}
+    counts["total"] = sum(rows.values())
+    return counts
+
+
+def summary(floor=None):
+    result = database.get_occupancy_summary(floor=floor)
+    result.pop("by_floor")
+    return result
+
+
+def test_counters_follow_every_kind_of_space_change(db):
+    rng = random.Random(7)
+    user_id = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    database.create_parking_spaces_bulk(
+        {"space_number": f"S{i}", "location": "Lot", "hourly_rate": 2.0, "floor": str(i % 3), "section": "AB"[i % 2]}
+        for i in range(40)
+    )
+    space_ids = [s["id"] for s in database.get_all_parking_spaces()]
+    start = datetime.datetime(2030, 1, 1, 9)
+    bookings = []
+    for step in range(150):
+        action = rng.random()
+        space_id = rng.choice(space_ids)
+        if action < 0.35:
+            try:
+                bookings.append(database.create_booking(user_id, space_id, start, start + datetime.timedelta(hours=1),
+                                                        "ABC123", "car"))
+            except ValueError:
+                pass
+        elif action < 0.55 and bookings:
+            database.update_booking(bookings.pop(rng.randrange(len(bookings))), status="cancelled")
+        elif action < 0.8:
+            database.update_parking_space(space_id, status=rng.choice(["active", "maintenance", "reserved", "inactive"]))
+        elif action < 0.9:
+            database.update_parking_space(space_id, floor=str(rng.randrange(3)), section=rng.choice("AB"))
+        elif len(space_ids) > 5:
+            database.delete_parking_space(space_id)
+            space_ids.remove(space_id)
+        assert summary() == recount(), f"step {step}"
+    for floor in "012":
+        assert summary(floor) == recount(floor)
+
+
+def test_summary_breaks_counts_down_by_floor(db):
+    database.create_parking_space("A1", "Lot", 2.0, floor="1", section="A")
+    database.create_parking_space("A2", "Lot", 2.0, floor="2", section="A")
+    second = database.create_parking_space("A3", "Lot", 2.0, floor="2", section="B")
+    database.update_parking_space(second, status="maintenance")
+    result = database.get_occupancy_summary()
+    assert result["total"] == 3
+    assert result["by_floor"]["2"]["maintenance"] == 1
+    assert result["by_floor"]["2"]["available"] == 1
+    assert database.get_occupancy_summary(section="B")["total"] == 1
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from components import space_grid  # noqa: E402
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Payloads the component would send to the browser"""
+    payloads = []
+    session = {}
+    monkeypatch.setattr(space_grid, "st", SimpleNamespace(session_state=session))
+    monkeypatch.setattr(space_grid, "_space_grid", lambda **payload: payloads.append(payload) or session.get("reply"))
+    return payloads, session
+
+
+def cells(statuses):
+    return [space_grid.grid_cell(i, f"A{i}", status) for i, status in enumerate(statuses, 1)]
+
+
+def test_first_render_sends_the_whole_lot(sent):
+    payloads, _ = sent
+    space_grid.space_grid(cells(["available", "occupied"]), key="lot")
+    assert payloads[0]["full"] == [[1, "A1", "", "available"], [2, "A2", "", "occupied"]]
+    assert payloads[0]["version"] == 1
+
+
+def test_reruns_send_only_changed_cells(sent):
+    payloads, _ = sent
+    space_grid.space_grid(cells(["available", "occupied"]), key="lot")
+    space_grid.space_grid(cells(["available", "occupied"]), key="lot")
+    assert payloads[1]["full"] is None and payloads[1]["changes"] == []
+    assert payloads[1]["version"] == 1
+
+    space_grid.space_grid(cells(["occupied", "occupied"]), key="lot")
+    assert payloads[2]["full"] is None
+    assert payloads[2]["changes"] == [[1, "A1", "", "occupied"]]
+    assert (payloads[2]["base"], payloads[2]["version"]) == (1, 2)
+
+
+def test_new_layout_or_resync_sends_everything(sent):
+    payloads, session = sent
+    space_grid.space_grid(cells(["available", "occupied"]), key="lot")
+    space_grid.space_grid(cells(["available", "occupied", "available"]), key="lot")
+    assert len(payloads[1]["full"]) == 3
+
+    session["lot"] = {"resync": 1}      # the browser lost its copy
+    space_grid.space_grid(cells(["available", "occupied", "available"]), key="lot")
+    assert len(payloads[2]["full"]) == 3
+    space_grid.space_grid(cells(["available", "occupied", "available"]), key="lot")
+    assert payloads[3]["full"] is None
+
+
+def test_clicked_space_is_returned(sent):
+    _, session = sent
+    session["reply"] = {"selected": 2}
+    assert space_grid.space_grid(cells(["available", "available"]), key="lot") == 2
@@ -0,0 +1,106 @@
+import random
+
+import numpy as np
+import pytest
+
+import database
+from db_pool import get_pool
+from space_index import _STATE_SQL, SpaceIndex, find_space_ids_sql, space_state
+
+FLOORS = ["1", "2", "B1", None]
+SECTIONS = ["A", "B", None]
+QUERIES = [
+    {},
+    {"floor": "1"},
+    {"floor": ["2", "B1"], "section": "A"},
+    {"section": ""},
+    {"state": "available"},
+    {"state": ["occupied", "maintenance"], "ev": True},
+    {"accessible": True, "location": "Lot"},
+    {"floor": []},
+]
+PRICES = [None, (2.0, 3.0), (2.25, 2.25), (0.0, 1.0)]
+
+
+def check(index, path):
+    with get_pool(path).connection() as conn:
+        for filters in QUERIES:
+            for price_range in PRICES:
+                expected = find_space_ids_sql(conn, price_range, **filters)
+                assert np.array_equal(index.find(price_range, **filters), expected), (filters, price_range)
+
+
+def add_space(rng, number):
+    return database.create_parking_space(
+        f"S{number}", rng.choice(["Lot", "Garage"]), rng.choice([1.5, 2.0, 2.25, 2.75, 3.0]),
+        floor=rng.choice(FLOORS), section=rng.choice(SECTIONS),
+        is_accessible=rng.random() < 0.2, is_ev_charging=rng.random() < 0.3)
+
+
+def test_index_matches_sql_through_random_changes(db):
+    rng = random.Random(3)
+    index = SpaceIndex(db, capacity=64)
+    ids = [add_space(rng, i) for i in range(100)]
+    check(index, db)
+
+    for step in range(200):
+        op = rng.random()
+        if op < 0.3:
+            ids.append(add_space(rng, 1000 + step))
+        elif op < 0.45 and ids:
+            database.delete_parking_space(ids.pop(rng.randrange(len(ids))))
+        elif op < 0.8:
+            database.update_parking_space(rng.choice(ids), floor=rng.choice(FLOORS),
+                                          status=rng.choice(["active", "maintenance"]),
+                                          is_available=rng.random() < 0.5)
+        else:
+            # Writes outside database.py are picked up through the change log
+            with get_pool(db).connection() as conn:
+                conn.execute("UPDATE parking_spaces SET hourly_rate = ?, section = ? WHERE id = ?",
+                             (rng.choice([1.5, 2.25, 3.0]), rng.choice(["A", "B"]), rng.choice(ids)))
+                conn.commit()
+        if step % 20 == 0:
+            check(index, db)
+    check(index, db)
+
+
+def test_trimmed_change_log_reloads(db):
+    index = SpaceIndex(db)
+    first = database.create_parking_space("A1", "Lot", 2.0, floor="1")
+    assert list(index.find(floor="1")) == [first]
+    second = database.create_parking_space("A2", "Lot", 2.0, floor="1")
+    database.update_parking_space(first, floor="2")
+    with get_pool(db).connection() as conn:
+        conn.execute("DELETE FROM space_changes")
+        conn.commit()
+    database.create_parking_space("A3", "Lot", 2.0, floor="3")
+    assert list(index.find(floor="1")) == [second]
+    assert index.values("floor") == ["1", "2", "3"]
+
+
+def test_unknown_filters_are_rejected(db):
+    with pytest.raises(ValueError):
+        SpaceIndex(db).find(colour="red")
+
+
+def test_space_listeners_see_committed_writes(db):
+    events = []
+    database.add_space_listener(lambda event, space: events.append((event, space)))
+    space = database.create_parking_space("A1", "Lot", 2.0)
+    database.update_parking_space(space, floor="2")
+    database.create_parking_spaces_bulk([{"space_number": "B1", "location": "Lot", "hourly_rate": 1.0}])
+    database.delete_parking_space(space)
+    assert events == [("created", {"id": space}), ("updated", {"id": space, "floor": "2"}),
+                      ("created", {"id": None, "count": 1}), ("deleted", {"id": space})]
+
+
+def test_space_state_follows_the_sql_rule(db):
+    rng = random.Random(3)
+    ids = [add_space(rng, n) for n in range(6)]
+    database.update_parking_space(ids[1], status="maintenance")
+    database.update_parking_space(ids[2], is_available=False)
+    database.update_parking_space(ids[3], status="inactive", is_available=False)
+    with get_pool(database.DB_PATH).connection() as conn:
+        rows = conn.execute(f"SELECT *, {_STATE_SQL} AS state FROM parking_spaces").fetchall()
+    assert {space_state(dict(row)) for row in rows} == {"available", "occupied", "maintenance", "inactive"}
+    assert all(space_state(dict(row)) == row["state"] for row in rows)
@@ -0,0 +1,122 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pytest
+
+import tariffs
+from tariffs import Tariff, TariffRule, TariffTable, get_tariffs
+from conftest import clock
+
+SUNDAY = datetime.datetime(2030, 1, 6)      # a Sunday; the next day is a Monday
+RULES = {
+    "default": [
+        {"name": "peak", "days": ["mon", "tue", "wed", "thu", "fri"], "start": "07:00", "end": "19:00",
+         "multiplier": 1.5},
+        {"name": "overnight", "start": "22:00", "end": "06:00", "multiplier": 0.5},
+    ],
+    "sections": {"A": [{"name": "peak", "days": ["mon"], "start": "07:00", "end": "19:00", "multiplier": 2.0}]},
+}
+
+
+at = clock(SUNDAY)
+
+
+@pytest.fixture
+def table():
+    return TariffTable.from_dict(RULES)
+
+
+def test_overnight_rules_wrap_past_midnight(table):
+    tariff = table.default
+    # Sunday 21:00 to Monday 02:00: one off-peak hour, then four at half rate
+    assert tariff.weighted_hours(at(21), at(26)) == pytest.approx(1 + 4 * 0.5)
+    assert tariff.period_at(at(23)) == "overnight"
+    assert tariff.period_at(at(24 + 5, 59)) == "overnight"
+    assert tariff.period_at(at(24 + 6)) == "off-peak"
+    assert tariff.multiplier_at(at(24 + 7)) == 1.5
+
+
+def test_sunday_night_runs_into_monday_morning():
+    tariff = Tariff([TariffRule("sunday-night", 0.25, "20:00", "04:00", days=["sun"])])
+    assert tariff.period_at(at(21)) == "sunday-night"
+    # Monday 00:00-04:00 comes from the Sunday rule, wrapped to the start of the week
+    assert tariff.period_at(at(24 + 3)) == "sunday-night"
+    assert tariff.period_at(SUNDAY - datetime.timedelta(days=6, hours=-3)) == "sunday-night"
+    assert tariff.period_at(at(-24 + 3)) == "off-peak"       # Saturday night is not covered
+    assert tariff.weighted_hours(at(19), at(24 + 5)) == pytest.approx(1 + 8 * 0.25 + 1)
+
+
+def test_stays_longer_than_a_week(table):
+    tariff = table.default
+    week = tariff.weighted_hours(at(0), at(24 * 7))
+    assert week == pytest.approx(tariff.week_hours)
+    assert tariff.weighted_hours(at(10), at(24 * 15 + 10)) == pytest.approx(2 * week + tariff.weighted_hours(at(10), at(34)))
+
+
+def test_partial_minutes_are_prorated(table):
+    tariff = table.default
+    assert tariff.weighted_hours(at(21, 59, 30), at(22, 0, 30)) == pytest.approx((30 + 15) / 3600)
+    assert tariff.weighted_hours(at(5), at(5)) == 0.0
+    assert tariff.weighted_hours(at(5), at(4)) == 0.0
+
+
+def test_section_rules_overlay_the_default(table):
+    monday_peak = (at(24 + 8), at(24 + 10))
+    assert table.weighted_hours("A", *monday_peak) == pytest.approx(2 * 2.0)
+    assert table.weighted_hours(None, *monday_peak) == pytest.approx(2 * 1.5)
+    assert table.weighted_hours("Z", *monday_peak) == table.weighted_hours(None, *monday_peak)
+    # Section A keeps the default overnight rule and Tuesday peak
+    assert table.weighted_hours("A", at(48 + 8), at(48 + 9)) == pytest.approx(1.5)
+    assert table.weighted_hours("A", at(22), at(23)) == pytest.approx(0.5)
+
+
+def test_later_rules_win():
+    tariff = Tariff([TariffRule("day", 2.0, "06:00", "18:00"), TariffRule("lunch", 0.0, "12:00", "13:00")])
+    assert tariff.weighted_hours(at(11), at(14)) == pytest.approx(2 + 0 + 2)
+
+
+def test_batch_matches_scalar(table):
+    rng = np.random.default_rng(5)
+    n = 5000
+    starts = np.datetime64(SUNDAY, "s") + rng.integers(0, 21 * 86400, n).astype("timedelta64[s]")
+    ends = starts + rng.integers(-3600, 3 * 86400, n).astype("timedelta64[s]")
+    sections = rng.choice(["A", "Z", None], n)
+    batch = table.weighted_hours_batch(sections, starts, ends)
+    scalar = [table.weighted_hours(s, a.astype(datetime.datetime), b.astype(datetime.datetime))
+              for s, a, b in zip(sections, starts, ends)]
+    np.testing.assert_allclose(batch, scalar, rtol=1e-12, atol=1e-9)
+    assert len(table.weighted_hours_batch([], [], [])) == 0
+
+
+@pytest.mark.parametrize("rule", [
+    {"name": "x", "multiplier": -1},
+    {"name": "x", "multiplier": 1, "days": ["funday"]},
+    {"name": "x", "multiplier": 1, "start": "08:00", "end": "08:00"},
+    {"name": "x", "multiplier": 1, "start": "25:00"},
+    {"name": "x", "multiplier": 1, "start": "8am"},
+    {"multiplier": 1},
+])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        TariffRule.from_dict(rule)
+
+
+def test_tables_reload_when_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(tariffs, "_tables", {})
+    path = tmp_path / "tariffs.json"
+    assert get_tariffs(str(path)).weighted_hours(None, at(8), at(9)) == 1.0      # no file: flat rate
+
+    path.write_text(json.dumps(RULES))
+    first = get_tariffs(str(path))
+    assert get_tariffs(str(path)) is first
+    path.write_text(json.dumps({"default": [{"name": "all", "multiplier": 3}]}))
+    os.utime(path, (0, os.path.getmtime(path) + 10))
+    assert get_tariffs(str(path)).weighted_hours(None, at(8), at(9)) == pytest.approx(3.0)
+
+
+def test_shipped_tariffs_load():
+    table = get_tariffs()
+    assert {"A", "B", "F"} <= set(table.sections)
+    assert table.default.period_at(at(24 + 8)) == "peak"
@@ -0,0 +1,66 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import database
+from timeline import compute_timeline, occupancy_minutes
+from conftest import clock
+
+DAY = datetime.date(2030, 5, 6)
+MIDNIGHT = datetime.datetime.combine(DAY, datetime.time())
+
+
+at = clock(MIDNIGHT)
+
+
+@pytest.fixture
+def lot(db):
+    user = database.create_user("ann", "pw", "ann@example.com", "Ann")
+    a, b, c = (database.create_parking_space(n, "Lot", 2.0) for n in ("A", "B", "C"))
+    database.update_parking_space(c, status="maintenance")
+    rows = [
+        (a, at(9, 15), at(10, 30), "active"),           # 45 min in hour 9, 30 in hour 10
+        (a, at(10, 30), at(11), "completed"),            # back to back: fills hour 10
+        (b, at(-3), at(1), "active"),                    # from the evening before
+        (b, at(23, 30), at(26), "active"),               # into the next day
+        (b, at(12), at(13), "cancelled"),                # does not hold the space
+        (a, at(-48), at(-47), "active"),                 # another day entirely
+    ]
+    database.create_bookings_bulk([
+        dict(user_id=user, space_id=space, start_time=start, end_time=end, vehicle_plate="P",
+             vehicle_type="car", status=status) for space, start, end, status in rows])
+    return a, b, c
+
+
+def test_minutes_per_space_and_hour(lot):
+    timeline = compute_timeline(DAY)
+    assert list(timeline.space_ids) == list(lot)
+    a, b, c = timeline.minutes
+    assert (a[9], a[10], a[11]) == (45, 60, 0)
+    assert (b[0], b[1], b[12], b[23]) == (60, 0, 0, 30)
+    assert a.sum() == 105 and c.sum() == 0
+
+
+def test_states_counts_and_summary(lot):
+    timeline = compute_timeline(DAY.isoformat())
+    assert list(timeline.states(9)) == ["occupied", "available", "maintenance"]
+    counts = timeline.occupied_counts()
+    assert (counts[0], counts[9], counts[12], counts[23]) == (1, 1, 0, 1)
+    assert timeline.utilisation()[10] == pytest.approx(60 / 120)
+    assert timeline.summary(0) == {"total": 3, "available": 1, "occupied": 1, "maintenance": 1}
+
+
+def test_overlapping_bookings_never_exceed_an_hour():
+    day_start = np.datetime64("2030-05-06T00:00:00")
+    starts = np.array(["2030-05-06T08:00:00", "2030-05-06T08:30:00", "2030-05-06T08:59:30"], dtype="datetime64[s]")
+    ends = np.array(["2030-05-06T09:00:00", "2030-05-06T09:00:00", "2030-05-06T09:00:10"], dtype="datetime64[s]")
+    minutes = occupancy_minutes(np.array([0, 0, 1]), starts, ends, day_start, 2)
+    assert minutes.dtype == np.uint8
+    # Partial minutes round up
+    assert (minutes[0, 8], minutes[1, 8], minutes[1, 9]) == (60, 1, 1)
+
+
+def test_empty_day(db):
+    timeline = compute_timeline(DAY)
+    assert len(timeline) == 0 and list(timeline.utilisation()) == [0] * 24
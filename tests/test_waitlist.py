@@ -0,0 +1,149 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import database
+from waitlist import Waitlist
+from conftest import clock
+
+T0 = datetime.datetime(2030, 6, 3, 9)
+NOW = T0 - datetime.timedelta(days=1)
+
+
+at = clock(T0)
+
+
+def hours(start, end):
+    return at(start), at(end)
+
+
+@pytest.fixture
+def lot(db):
+    users = [database.create_user(f"u{i}", "pw", f"u{i}@example.com", f"User {i}") for i in range(5)]
+    standard = database.create_parking_space("A1", "Lot", 2.0)
+    ev = database.create_parking_space("E1", "Lot", 3.0, is_ev_charging=True)
+    return users, standard, ev
+
+
+def book(user, space, start, end):
+    return database.create_booking(user, space, *hours(start, end), "P", "car")
+
+
+def test_freed_space_goes_to_the_best_request(lot):
+    (owner, low, high, later, *_), standard, _ = lot
+    booking = book(owner, standard, 0, 4)
+    waitlist = Waitlist(database.DB_PATH)
+    first = waitlist.join(low, *hours(0, 4))
+    second = waitlist.join(high, *hours(0, 4), priority=5)
+    waitlist.join(later, *hours(0, 4))
+    assert len(waitlist) == 3
+
+    database.update_booking(booking, status="cancelled")
+    (match,) = waitlist.release(booking, now=NOW)
+    assert (match["waitlist_id"], match["user_id"], match["space_id"]) == (second, high, standard)
+    assert database.get_booking(match["booking_id"])["status"] == "active"
+    assert len(waitlist) == 2
+    assert [e["id"] for e in waitlist.entries(status="booked")] == [second]
+    assert waitlist.entries(user_id=low)[0]["id"] == first
+
+
+def test_several_windows_fit_into_one_release(lot):
+    (owner, a, b, c, _), standard, _ = lot
+    booking = book(owner, standard, 0, 8)
+    waitlist = Waitlist(database.DB_PATH)
+    waitlist.join(a, *hours(0, 3))
+    waitlist.join(b, *hours(2, 5))      # overlaps a's window once a is booked
+    waitlist.join(c, *hours(5, 8))
+    database.update_booking(booking, status="cancelled")
+    matches = waitlist.release(booking, now=NOW)
+    assert sorted(m["user_id"] for m in matches) == [a, c]
+    assert len(waitlist) == 1
+
+
+def test_only_the_remaining_window_is_offered(lot):
+    (owner, a, b, *_), standard, _ = lot
+    booking = book(owner, standard, 0, 4)
+    waitlist = Waitlist(database.DB_PATH)
+    waitlist.join(a, *hours(0, 2))
+    waitlist.join(b, *hours(2, 4))
+    database.update_booking(booking, status="completed")
+    # Completed at 02:00: the 00:00-02:00 window is over and stays queued
+    assert [m["user_id"] for m in waitlist.release(booking, now=T0 + datetime.timedelta(hours=2))] == [b]
+    assert len(waitlist) == 1
+
+
+def test_special_requests_need_a_matching_space(lot):
+    (owner, a, b, *_), standard, ev = lot
+    waitlist = Waitlist(database.DB_PATH)
+    wants_ev = waitlist.join(a, *hours(0, 2), space_class="ev")
+    standard_booking = book(owner, standard, 0, 2)
+    database.update_booking(standard_booking, status="cancelled")
+    assert waitlist.release(standard_booking, now=NOW) == []
+
+    # On an EV space the EV request beats an equal-priority standard one
+    waitlist.join(b, *hours(0, 2))
+    ev_booking = book(owner, ev, 0, 2)
+    database.update_booking(ev_booking, status="cancelled")
+    assert [m["waitlist_id"] for m in waitlist.release(ev_booking, now=NOW)] == [wants_ev]
+
+
+def test_nothing_is_offered_for_active_bookings_or_maintenance(lot):
+    (owner, a, *_), standard, _ = lot
+    booking = book(owner, standard, 0, 2)
+    waitlist = Waitlist(database.DB_PATH)
+    waitlist.join(a, *hours(0, 2))
+    assert waitlist.release(booking, now=NOW) == []
+    database.update_booking(booking, status="cancelled")
+    database.update_parking_space(standard, status="maintenance")
+    assert waitlist.release(booking, now=NOW) == []
+    assert len(waitlist) == 1
+
+
+def test_leave_expire_and_reload(lot):
+    (_, a, b, c, _), _, _ = lot
+    waitlist = Waitlist(database.DB_PATH)
+    gone = waitlist.join(a, *hours(0, 2))
+    waitlist.join(b, *hours(0, 2))
+    kept = waitlist.join(c, *hours(10, 12))
+    assert waitlist.leave(gone) and not waitlist.leave(gone)
+    assert waitlist.expire(now=T0 + datetime.timedelta(hours=3)) == 1
+    assert len(waitlist) == 1
+    assert Waitlist(database.DB_PATH).load() == 1
+    assert [e["id"] for e in waitlist.entries()] == [kept]
+    with pytest.raises(ValueError):
+        waitlist.join(a, *hours(2, 1))
+    with pytest.raises(ValueError):
+        waitlist.join(a, *hours(0, 1), space_class="valet")
+
+
+def test_booking_listener_reassigns_cancellations(lot):
+    (owner, a, *_), standard, _ = lot
+    waitlist = Waitlist(database.DB_PATH)
+    database.add_booking_listener(waitlist.handle_booking_event)
+    waitlist.join(a, *hours(0, 2))
+    booking = book(owner, standard, 0, 2)
+    database.update_booking(booking, status="cancelled")
+    assert [b["user_id"] for b in database.get_user_bookings(a)] == [a]
+
+
+def test_busy_retry_keeps_claimed_requests_queued(lot, monkeypatch):
+    (owner, a, *_), standard, _ = lot
+    booking = book(owner, standard, 0, 4)
+    waitlist = Waitlist(database.DB_PATH)
+    entry = waitlist.join(a, *hours(0, 4))
+    attempts = []
+    reassign = Waitlist._reassign
+
+    def busy_once(self, conn, *args):
+        match = reassign(self, conn, *args)
+        attempts.append(match)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return match
+
+    monkeypatch.setattr(Waitlist, "_reassign", busy_once)
+    database.update_booking(booking, status="cancelled")
+    (match,) = waitlist.release(booking, now=NOW)
+    assert match["waitlist_id"] == entry and attempts[0]["waitlist_id"] == entry
+    assert len(waitlist) == 0
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import get_pool
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def wq(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with get_pool(path).connection() as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+        conn.commit()
+    queue = WriteQueue(path, backoff=0.001)
+    yield queue
+    queue.close(timeout=5)
+
+
+def values(queue):
+    with get_pool(queue.path).connection() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM t"))
+
+
+def insert(value):
+    return lambda conn: conn.execute("INSERT INTO t (value) VALUES (?)", (value,)).lastrowid
+
+
+def test_write_returns_the_committed_result(wq):
+    assert wq.write(insert("a")) == 1
+    assert values(wq) == ["a"]
+
+
+def test_a_failing_request_rolls_back_alone(wq):
+    gate = threading.Event()
+    # Hold the writer so the next requests are committed as one batch
+    blocker = wq.submit(lambda conn: gate.wait(5))
+    futures = [wq.submit(insert(v)) for v in ("a", "a", "b")]
+    gate.set()
+    blocker.result(5)
+    assert futures[0].result(5) and futures[2].result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(5)
+    assert values(wq) == ["a", "b"]
+    stats = wq.stats()
+    assert stats["writes"] == 4 and stats["failed"] == 1 and stats["max_batch"] >= 3
+
+
+def test_busy_batches_are_retried(wq):
+    attempts = []
+
+    def flaky(conn):
+        attempts.append(1)
+        conn.execute("INSERT INTO t (value) VALUES ('x')")
+        if len(attempts) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return len(attempts)
+
+    assert wq.write(flaky) == 3
+    # The rolled-back attempts left nothing behind
+    assert values(wq) == ["x"]
+    assert wq.stats()["retries"] == 2
+
+
+def test_after_commit_runs_once_for_committed_writes(wq):
+    attempts, committed = [], []
+
+    def flaky(conn):
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise sqlite3.OperationalError("database is locked")
+        return insert("x")(conn)
+
+    assert wq.write(flaky, after_commit=committed.append) == 1
+    assert committed == [1] and len(attempts) == 2
+
+    with pytest.raises(sqlite3.IntegrityError):
+        wq.write(insert("x"), after_commit=committed.append)
+    assert committed == [1]
+
+    def broken(result):
+        raise RuntimeError("callback failed")
+    # A failing callback is logged; the write still reports its result
+    assert wq.write(insert("y"), after_commit=broken) == 2
+
+
+def test_retries_are_bounded(tmp_path):
+    queue = WriteQueue(str(tmp_path / "busy.db"), retries=2, backoff=0.001)
+    try:
+        def busy(conn):
+            raise sqlite3.OperationalError("database is busy")
+        with pytest.raises(sqlite3.OperationalError):
+            queue.write(busy)
+        assert queue.stats()["retries"] == 2
+    finally:
+        queue.close(timeout=5)
+
+
+def test_closed_queue_rejects_writes(wq):
+    wq.write(insert("a"))
+    wq.close(timeout=5)
+    with pytest.raises(RuntimeError):
+        wq.submit(insert("b"))